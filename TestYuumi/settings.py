@@ -89,7 +89,9 @@ MIDDLEWARE = [
 
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
-    "cache_middleware.LowercaseURLMiddleware",
+    # Requêtes SQL, cache, gabarits, durée : Server-Timing + log (voir members/instrumentation.py)
+    "members.instrumentation.MesuresRequeteMiddleware",
+    "members.cache_middleware.LowercaseURLMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -119,6 +121,7 @@ TEMPLATES = [
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "members.context_processors.menu_context",
+                "members.context_processors.csrf_page",
                 'members.context_processors.ai_agent_visible', 
                 'members.context_processors.premium_context',
                 'members.context_processors.native_context',
@@ -214,10 +217,31 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+
+# Sitemaps pré-générés par `python manage.py generer_sitemaps` (voir
+# members/sitemaps.py) et domaine des URL qu'ils contiennent
+SITEMAPS_ROOT = Path(os.environ.get("SITEMAPS_ROOT", BASE_DIR / "sitemaps"))
+SITEMAP_DOMAINE = os.environ.get("SITEMAP_DOMAINE", "yuumi-shop.com")
 # Limite uploads : 1 Mo max par fichier
 DATA_UPLOAD_MAX_MEMORY_SIZE = 1 * 1024 * 1024
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
 
+# Conversion WebP / variantes des images en arrière-plan (members/images.py).
+# IMAGES_SYNCHRONE=True : traitement immédiat après le commit, sans pool
+# de threads (tests, scripts).
+IMAGES_WORKERS = int(os.environ.get("IMAGES_WORKERS", "2"))
+IMAGES_SYNCHRONE = os.environ.get("IMAGES_SYNCHRONE", "False").lower() in ("true", "1", "yes")
+
+# Agent IA (members/ai_agent/client.py, views._etapes_agent_ia).
+# MISTRAL_WORKERS : threads du pool des appels Mistral lances en parallele.
+# AGENT_IA_EXTRACTION_SPECULATIVE : pendant l'appel web, extraction sur la
+# requete brute et prechargement des candidats ; un appel d'extraction de
+# plus par requete web, pour gagner la phase base de donnees.
+MISTRAL_WORKERS = int(os.environ.get("MISTRAL_WORKERS", "8"))
+AGENT_IA_EXTRACTION_SPECULATIVE = os.environ.get(
+    "AGENT_IA_EXTRACTION_SPECULATIVE", "False"
+).lower() in ("true", "1", "yes")
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
@@ -275,6 +299,9 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': BASE_DIR / 'django_errors.log',
         },
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django': {
@@ -282,9 +309,21 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        # Une ligne JSON par requête (SQL, cache, gabarits, durée) :
+        # LOG_MESURES=INFO pour l'activer
+        'members.instrumentation': {
+            'handlers': ['console'],
+            'level': os.environ.get('LOG_MESURES', 'WARNING'),
+            'propagate': False,
+        },
     },
 }
 
+# En-tête Server-Timing sur chaque réponse (voir members/instrumentation.py).
+# Il expose le nombre de requêtes SQL et les temps de rendu à n'importe
+# quel visiteur : actif en DEBUG, sinon sur demande explicite.
+SERVER_TIMING = os.environ.get("SERVER_TIMING", str(DEBUG)).lower() in ("true", "1", "yes")
+
 # -------------------------------------------------------------------
 # Authentification
 # -------------------------------------------------------------------
@@ -5,25 +5,9 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 # ── Sitemap ────────────────────────────────────────────────
-from django.contrib.sitemaps.views import sitemap
-from members.sitemaps import (
-    StaticSitemap,
-    CitySitemap,
-    CategorySitemap,
-    SuperCategorySitemap,
-    StoreSitemap,
-    CategoriesVilleSitemap,
-)
+from members import sitemaps
 # ✅ NOUVEAU — API biométrie
 from members.api_views import biometric_token_obtain, biometric_login
-sitemaps = {
-    "static":            StaticSitemap(),
-    "villes":            CitySitemap(),
-    "categories":        CategorySitemap(),
-    "supercategories":   SuperCategorySitemap(),
-    "commerces":         StoreSitemap(),
-    "categories_ville":  CategoriesVilleSitemap(),
-}
 # ───────────────────────────────────────────────────────────
 urlpatterns = [
     path("admin-yuumi-7896u/", admin.site.urls),
@@ -36,8 +20,10 @@ urlpatterns = [
     path("api/token/", biometric_token_obtain, name="api-token"),
     # Étape 2 : login biométrique → échanger le token contre une session
     path("api/biometric-login/", biometric_login, name="api-biometric-login"),
-    # Sitemap Google
-    path("sitemap.xml", sitemap, {"sitemaps": sitemaps}, name="sitemap"),
+    # Sitemap Google : index + sections paginées (?p=N), pré-générés par
+    # `python manage.py generer_sitemaps` (voir members/sitemaps.py)
+    path("sitemap.xml", sitemaps.index, name="sitemap"),
+    path("sitemap-<str:section>.xml", sitemaps.section, name="sitemap-section"),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
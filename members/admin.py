@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Count, Q
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
 
 import nested_admin
 
@@ -18,6 +19,8 @@ from .models import (
     StoreGalerieImage,
     CityCategoryHighlight,
     CityCategoryItem,
+    City,
+    Departement,
     PageView,
     StoreStats,
     StoreClickStats,
@@ -26,6 +29,7 @@ from .models import (
     CategorieIntermediaire,
     UserPremium,
     AIUsageLog,
+    ImageJob,
 )
 
 from .forms import StoreForm
@@ -161,34 +165,37 @@ class StoreAdmin(SimpleHistoryAdmin, nested_admin.NestedModelAdmin):
 
 @admin.register(StoreStats)
 class StoreStatsAdmin(admin.ModelAdmin):
+    # Lit les agrégats journaliers (StoreDailyStats, voir statistiques.py) :
+    # à jour au dernier lancement de agreger_statistiques.
 
     list_display = (
         "nom",
         "ville",
         "categorie",
         "total_views",
-        "views_last_24h",
+        "views_last_7_days",
     )
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs.annotate(
-            total_views_count=Count("pageviews"),
-            views_24h_count=Count(
-                "pageviews",
+            total_views_count=Coalesce(Sum("stats_journalieres__vues"), 0),
+            views_7d_count=Coalesce(Sum(
+                "stats_journalieres__vues",
                 filter=Q(
-                    pageviews__timestamp__gte=timezone.now() - timedelta(hours=24)
+                    stats_journalieres__date__gt=timezone.localdate() - timedelta(days=7)
                 )
-            )
+            ), 0),
         )
 
     def total_views(self, obj):
         return obj.total_views_count
     total_views.admin_order_field = "total_views_count"
 
-    def views_last_24h(self, obj):
-        return obj.views_24h_count
-    views_last_24h.admin_order_field = "views_24h_count"
+    def views_last_7_days(self, obj):
+        return obj.views_7d_count
+    views_last_7_days.short_description = "Vues (7 jours)"
+    views_last_7_days.admin_order_field = "views_7d_count"
 
 
 # ===========================================================
@@ -197,6 +204,7 @@ class StoreStatsAdmin(admin.ModelAdmin):
 
 @admin.register(StoreClickStats)
 class StoreClickStatsAdmin(admin.ModelAdmin):
+    # Totaux lus dans StoreDailyStats (voir statistiques.py)
 
     list_display = (
         "nom",
@@ -214,10 +222,10 @@ class StoreClickStatsAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs.annotate(
-            c_itineraire=Count("clicks", filter=Q(clicks__type_click="itineraire")),
-            c_site=Count("clicks", filter=Q(clicks__type_click="site")),
-            c_instagram=Count("clicks", filter=Q(clicks__type_click="instagram")),
-            c_facebook=Count("clicks", filter=Q(clicks__type_click="facebook")),
+            c_itineraire=Coalesce(Sum("stats_journalieres__clics_itineraire"), 0),
+            c_site=Coalesce(Sum("stats_journalieres__clics_site"), 0),
+            c_instagram=Coalesce(Sum("stats_journalieres__clics_instagram"), 0),
+            c_facebook=Coalesce(Sum("stats_journalieres__clics_facebook"), 0),
         )
 
     def clicks_itineraire(self, obj):
@@ -285,6 +293,19 @@ class CityCategoryItemInline(admin.TabularInline):
     extra = 1
 
 
+@admin.register(Departement)
+class DepartementAdmin(admin.ModelAdmin):
+    list_display = ("nom", "slug")
+    search_fields = ("nom", "slug")
+
+
+@admin.register(City)
+class CityAdmin(admin.ModelAdmin):
+    list_display = ("nom", "departement", "slug")
+    list_filter = ("departement",)
+    search_fields = ("nom", "slug")
+
+
 @admin.register(CityCategoryHighlight)
 class CityCategoryHighlightAdmin(admin.ModelAdmin):
     list_display = ("ville", "departement")
@@ -308,3 +329,9 @@ class AIUsageLogAdmin(admin.ModelAdmin):
     list_display = ("user", "date", "request_count")
     list_filter = ("date",)
     search_fields = ("user__username",)
+
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ("modele", "objet_id", "champ", "statut", "tentatives", "cree_le", "modifie_le")
+    list_filter = ("statut", "modele")
+    readonly_fields = ("modele", "objet_id", "champ", "fichier_source", "tentatives", "erreur", "cree_le", "modifie_le")
@@ -0,0 +1,333 @@
+# members/ai_agent/bench.py
+#
+# Banc de mesure HORS LIGNE du pipeline de l'agent IA (commande
+# `python manage.py bench_agent_ia`). Contrairement a mesure_cout_ia.py, qui
+# rejoue des prompts recopies contre l'API reelle, on fait tourner ici le
+# VRAI pipeline (_etapes_agent_ia de views.py : cache, client.py, prompts,
+# recherche en base, validation) contre le faux serveur Mistral de
+# faux_mistral.py. Les reponses du modele sont celles enregistrees dans
+# CORPUS ; seules leur latence (LATENCES_MS) et la taille des prompts sont
+# simulees.
+#
+# Mesures, sur un corpus de requetes francaises realistes joue plusieurs
+# fois (la 1re passe part d'un cache vide) :
+# - latence p50 / p95 du pipeline complet, de chaque appel LLM et de la
+#   phase base de donnees (de l'evenement "intention" a "candidats") ;
+# - nombre de requetes SQL (total et phase base) ;
+# - taille des prompts (tokens estimes) par etape ;
+# - taux de succes des deux niveaux de cache (voir cache.py).
+#
+# Tout tourne dans une transaction annulee a la fin (commerces de test,
+# utilisateur, compteurs de quota) et avec un cache local en memoire : le
+# banc ne laisse aucune trace, ni en base ni dans Redis.
+
+import os
+import re
+import time
+from contextlib import contextmanager
+
+VILLE = "Bancville"
+DEPARTEMENT = "Banc-d'Essai"
+
+# Latences observees en prod (ordre de grandeur), en millisecondes
+LATENCES_MS = {
+    "understand_intent": 2500,
+    "understand_intent_fallback": 1200,
+    "extract_search_params": 800,
+    "recommend_stores": 1800,
+}
+
+CATEGORIES = [
+    ("Boulangerie", "Alimentation"),
+    ("Charcuterie", "Alimentation"),
+    ("Épicerie fine", "Alimentation"),
+    ("Chocolaterie", "Alimentation"),
+    ("Fleuriste", "Maison & déco"),
+    ("Jardinerie", "Maison & déco"),
+    ("Librairie", "Culture & loisirs"),
+    ("Restaurant", "Restauration"),
+    ("Bar", "Restauration"),
+    ("Salon de thé", "Restauration"),
+]
+
+# Produits au catalogue des commerces de chaque categorie (preuve forte)
+PRODUITS = {
+    "charcuterie": ["Foie gras mi-cuit", "Jambon de pays", "Terrine de campagne"],
+    "epicerie-fine": ["Foie gras entier", "Huile d'olive", "Confiture artisanale"],
+    "chocolaterie": ["Ballotin de pralines", "Tablette noir 70%"],
+    "fleuriste": ["Bouquet de roses", "Plante verte"],
+    "jardinerie": ["Outils de jardin", "Graines potageres"],
+    "librairie": ["Roman policier", "Bande dessinee"],
+}
+
+
+def parametres(categories=(), idees=(), ouvert=False, rayon=None, **drapeaux):
+    """Reponse enregistree de extract_search_params (format du JSON Schema)."""
+    params = {
+        "categories": list(categories),
+        "idees_produits": list(idees),
+        "ouvert_maintenant": ouvert,
+        "hors_sujet": drapeaux.get("hors_sujet", False),
+        "categorie_absente": drapeaux.get("categorie_absente", False),
+        "besoin_clarification": drapeaux.get("besoin_clarification", False),
+        "questions_clarification": drapeaux.get("questions_clarification", []),
+    }
+    if rayon is not None:
+        params["rayon_km"] = rayon
+    return params
+
+
+# Requetes jouees, avec la reponse du modele a chaque etape. "intention" :
+# texte de l'agent web, pour les requetes qui le declenchent
+# (needs_web_search). Des formulations differentes d'une meme demande
+# donnent les memes parametres : c'est ce que mesure le cache 2e niveau.
+CORPUS = [
+    {"requete": "foie gras", "params": parametres(
+        ["charcuterie", "epicerie-fine"], ["foie gras"])},
+    {"requete": "du foie gras svp", "params": parametres(
+        ["charcuterie", "epicerie-fine"], ["foie gras"])},
+    {"requete": "une boulangerie ouverte maintenant", "params": parametres(
+        ["boulangerie"], ouvert=True)},
+    {"requete": "un bouquet de roses pour ma femme", "params": parametres(
+        ["fleuriste"], ["bouquet de roses"])},
+    {"requete": "un cadeau pour ma mère qui aime le jardinage", "params": parametres(
+        ["jardinerie", "fleuriste", "librairie"], ["outils de jardin", "plante", "livre de jardinage"])},
+    {"requete": "des chocolats pour la fête des pères", "params": parametres(
+        ["chocolaterie"], ["chocolat", "pralines"])},
+    {"requete": "un restaurant pas loin", "params": parametres(
+        ["restaurant"], rayon=2.0)},
+    {"requete": "un bar sympa ce soir", "params": parametres(
+        ["bar"], ouvert=True)},
+    {"requete": "que faire sous la pluie ce week-end ?", "params": parametres(
+        ["librairie", "salon-de-the"], ["jeux de societe", "livre"]),
+     "intention": "Activites d'interieur par temps de pluie : lecture, salon de the."},
+    {"requete": "un roman policier à offrir", "params": parametres(
+        ["librairie"], ["roman policier"])},
+    {"requete": "un cadeau", "params": parametres(
+        besoin_clarification=True,
+        questions_clarification=[{"question": "Pour qui ?", "options": ["Ami(e)", "Parent", "Je ne sais pas"]}])},
+    {"requete": "une armurerie", "params": parametres(categorie_absente=True)},
+]
+
+
+def creer_donnees(par_categorie=8):
+    """Categories et commerces de test (a appeler dans une transaction annulee)."""
+    from datetime import time as heure
+
+    from django.utils.text import slugify
+
+    from members.models import Category, Product, ProductFamily, Store, SuperCategory
+
+    familles = {}
+    magasins = 0
+    for nom, famille in CATEGORIES:
+        if famille not in familles:
+            familles[famille], _ = SuperCategory.objects.get_or_create(
+                slug=f"bench-{slugify(famille)}", defaults={"name": famille},
+            )
+        categorie = Category.objects.create(name=nom, super_categorie=familles[famille])
+        produits = PRODUITS.get(categorie.slug, [])
+        for i in range(par_categorie):
+            # Un commerce sur deux ouvert en continu, pour "ouvert maintenant"
+            horaires = {}
+            if i % 2 == 0:
+                for jour in ("lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"):
+                    horaires[f"{jour}_matin_ouverture"] = heure(0, 0)
+                    horaires[f"{jour}_matin_fermeture"] = heure(23, 59)
+            store = Store.objects.create(
+                nom=f"{nom} {i + 1}", ville=VILLE, ville_precise=VILLE,
+                departement=DEPARTEMENT, categorie=categorie,
+                descriptionpetite=f"{nom} de quartier, produits locaux et conseils.",
+                addressemaps=f"{i + 1} rue du Banc",
+                latitude=45.9 + i * 0.001, longitude=6.13,   # pas de geocodage
+                **horaires,
+            )
+            if produits and i % 3 != 2:
+                famille_produits = ProductFamily.objects.create(store=store, nom=nom)
+                for produit in produits:
+                    Product.objects.create(family=famille_produits, nom=produit)
+            magasins += 1
+    return magasins
+
+
+def repondeur(corpus):
+    """repondeur(etape, corps) du faux serveur, qui rejoue le corpus."""
+    par_requete = {entree["requete"]: entree for entree in corpus}
+
+    def entree_de(corps):
+        for message in corps.get("messages", []):
+            if message.get("role") == "user" and message.get("content") in par_requete:
+                return par_requete[message["content"]]
+        return par_requete.get(corps.get("inputs"))
+
+    def repondre(etape, corps):
+        entree = entree_de(corps) or {}
+        if etape in ("understand_intent", "understand_intent_fallback"):
+            return entree.get("intention") or "Recherche d'un commerce local."
+        if etape == "extract_search_params":
+            return entree.get("params") or parametres(hors_sujet=True)
+        # recommend_stores : les premiers candidats de la liste du prompt
+        texte = "".join(str(m.get("content", "")) for m in corps.get("messages", []))
+        ids = [int(i) for i in re.findall(r"- ID (\d+) :", texte)][:5]
+        return {
+            "intention": "besoin",
+            "message": "Voici une selection de commerces.",
+            "pistes": [{"angle": "Notre selection", "resultats": [
+                {"id": i, "confiance": "deduit", "justification": "A confirmer sur place."}
+                for i in ids
+            ]}],
+            "aucun_resultat": not ids,
+        }
+
+    return repondre
+
+
+@contextmanager
+def faux_mistral(corpus, echelle_latence=1.0):
+    """
+    Demarre le faux serveur et y branche client.py (MISTRAL_SERVER_URL, cle
+    factice, agent d'intention fictif) ; retablit tout en sortie.
+    """
+    from . import client as client_mod
+    from .faux_mistral import demarrer
+
+    latences = {etape: ms * echelle_latence for etape, ms in LATENCES_MS.items()}
+    url, arreter = demarrer(repondeur(corpus), latences)
+    anciens = {cle: os.environ.get(cle) for cle in ("MISTRAL_SERVER_URL", "MISTRAL_API_KEY")}
+    ancien_agent = client_mod._INTENT_AGENT_ID
+    os.environ["MISTRAL_SERVER_URL"] = url
+    os.environ["MISTRAL_API_KEY"] = "cle-banc-de-mesure"
+    client_mod._INTENT_AGENT_ID = "agent-banc-de-mesure"
+    client_mod._client = None
+    try:
+        yield url
+    finally:
+        client_mod._client = None
+        client_mod._INTENT_AGENT_ID = ancien_agent
+        for cle, valeur in anciens.items():
+            if valeur is None:
+                os.environ.pop(cle, None)
+            else:
+                os.environ[cle] = valeur
+        arreter()
+
+
+def percentile(valeurs, p):
+    """Percentile p (0-100) par interpolation lineaire ; None si vide."""
+    if not valeurs:
+        return None
+    valeurs = sorted(valeurs)
+    rang = (len(valeurs) - 1) * p / 100
+    bas = int(rang)
+    haut = min(bas + 1, len(valeurs) - 1)
+    return valeurs[bas] + (valeurs[haut] - valeurs[bas]) * (rang - bas)
+
+
+def _resume(series):
+    return {
+        nom: {
+            "n": len(valeurs),
+            "p50": round(percentile(valeurs, 50), 1),
+            "p95": round(percentile(valeurs, 95), 1),
+        }
+        for nom, valeurs in sorted(series.items()) if valeurs
+    }
+
+
+def _niveau_cache(cache, entree):
+    """Niveau de cache qui servira cette requete : "requete", "parametres" ou None."""
+    from .cache import cle_parametres, cle_requete
+
+    if cache.get(cle_requete(entree["requete"], DEPARTEMENT, VILLE)) is not None:
+        return "requete"
+    params = entree["params"]
+    cacheable = not (
+        params.get("hors_sujet") or params.get("categorie_absente")
+        or params.get("besoin_clarification") or params.get("rayon_km")
+    )
+    if cacheable and cache.get(cle_parametres(params, DEPARTEMENT, VILLE)) is not None:
+        return "parametres"
+    return None
+
+
+def _jouer(user, entree, durees, requetes_sql, tokens):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from members.views import _etapes_agent_ia
+
+    from .client import collecter_mesures
+
+    demande = {
+        "user_query": entree["requete"], "departement": DEPARTEMENT, "ville": VILLE,
+        "user_lat": 45.9, "user_lng": 6.13, "history": [],
+    }
+    reperes = {}
+    with collecter_mesures() as mesures, CaptureQueriesContext(connection) as requetes:
+        debut = time.perf_counter()
+        for evenement, _donnees in _etapes_agent_ia(user, demande):
+            reperes[evenement] = (time.perf_counter(), len(requetes.captured_queries))
+        fin = time.perf_counter()
+
+    durees["pipeline"].append((fin - debut) * 1000)
+    requetes_sql["pipeline"].append(len(requetes.captured_queries))
+    if "intention" in reperes and "candidats" in reperes:
+        durees["base"].append((reperes["candidats"][0] - reperes["intention"][0]) * 1000)
+        requetes_sql["base"].append(reperes["candidats"][1] - reperes["intention"][1])
+    for mesure in mesures:
+        durees[mesure["etape"]].append(mesure["duree_ms"])
+        if mesure["tokens_entree"] is not None:
+            tokens[mesure["etape"]].append(mesure["tokens_entree"])
+
+
+def executer(passes=2, echelle_latence=1.0, par_categorie=8, corpus=None):
+    """
+    Joue le corpus `passes` fois et renvoie le rapport (dict) : latences,
+    requetes SQL et tokens (p50 / p95 par etape), succes du cache par passe.
+    """
+    from collections import defaultdict
+
+    from django.contrib.auth import get_user_model
+    from django.core.cache import cache
+    from django.db import transaction
+    from django.test.utils import override_settings
+
+    from members.models import UserPremium
+
+    corpus = corpus or CORPUS
+    durees, requetes_sql, tokens = defaultdict(list), defaultdict(list), defaultdict(list)
+    caches = []
+
+    cache_local = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                               "LOCATION": "yuumi-bench-agent-ia"}}
+    with override_settings(CACHES=cache_local), faux_mistral(corpus, echelle_latence):
+        with transaction.atomic():
+            magasins = creer_donnees(par_categorie)
+            user = get_user_model().objects.create_user("bench-agent-ia")
+            UserPremium.objects.create(user=user)
+            cache.clear()
+            for _ in range(passes):
+                succes = {"requete": 0, "parametres": 0}
+                for entree in corpus:
+                    niveau = _niveau_cache(cache, entree)
+                    if niveau:
+                        succes[niveau] += 1
+                    _jouer(user, entree, durees, requetes_sql, tokens)
+                caches.append(succes)
+            cache.clear()
+            transaction.set_rollback(True)
+
+    total = len(corpus) * passes
+    return {
+        "requetes": len(corpus),
+        "passes": passes,
+        "commerces": magasins,
+        "latences_ms": _resume(durees),
+        "requetes_sql": _resume(requetes_sql),
+        "tokens_prompt": _resume(tokens),
+        "cache": {
+            "par_passe": caches,
+            "taux_requete": round(sum(c["requete"] for c in caches) / total, 3),
+            "taux_parametres": round(sum(c["parametres"] for c in caches) / total, 3),
+        },
+    }
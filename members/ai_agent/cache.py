@@ -0,0 +1,67 @@
+# members/ai_agent/cache.py
+#
+# Cache des reponses de l'agent IA, a deux niveaux (cache partage Redis) :
+#
+# 1. cle_requete : la requete brute (minuscules) + ville. Un hit evite TOUS
+#    les appels LLM.
+# 2. cle_parametres : la SORTIE normalisee de extract_search_params
+#    (categories triees, idees_produits normalisees comme l'index de
+#    recherche - sans accents, sans mots vides, racinisees -, ouvert
+#    maintenant, ville). "foie gras", "du foie gras" et "foie gras svp"
+#    donnent les memes parametres : seul l'appel d'extraction est paye, la
+#    recommandation (l'appel le plus long) est reutilisee.
+#
+# Une reponse "ouvert maintenant" n'est plus exclue du cache : elle est
+# gardee jusqu'a la prochaine ouverture/fermeture parmi les candidats, et
+# au plus DUREE_MAX_OUVERT (un commerce hors candidats peut ouvrir entre
+# temps et devrait alors apparaitre).
+
+import hashlib
+import json
+
+DUREE_RESULTAT = 60 * 60 * 6
+DUREE_MAX_OUVERT = 60 * 15
+
+PREFIXE_REQUETE = "yuumi_ai:"
+PREFIXE_PARAMETRES = "yuumi_ai:params:"
+
+
+def _empreinte(texte):
+    return hashlib.sha256(texte.encode("utf-8")).hexdigest()
+
+
+def cle_requete(user_query, departement, ville):
+    return PREFIXE_REQUETE + _empreinte(
+        f"{user_query.lower()}|{departement.lower()}|{ville.lower()}"
+    )
+
+
+def parametres_normalises(params, departement, ville):
+    """Forme canonique des parametres extraits : ce qui determine la reponse."""
+    from members.recherche import normaliser
+
+    idees = {" ".join(normaliser(idee)) for idee in params.get("idees_produits") or []}
+    return {
+        "categories": sorted(set(params.get("categories") or [])),
+        "idees_produits": sorted(idee for idee in idees if idee),
+        "ouvert_maintenant": bool(params.get("ouvert_maintenant", False)),
+        "departement": departement.lower(),
+        "ville": ville.lower(),
+    }
+
+
+def cle_parametres(params, departement, ville):
+    normalises = parametres_normalises(params, departement, ville)
+    return PREFIXE_PARAMETRES + _empreinte(json.dumps(normalises, sort_keys=True))
+
+
+def duree_ouvert_maintenant(stores, moment=None):
+    """
+    Secondes pendant lesquelles une reponse "ouvert maintenant" reste
+    exacte pour ces candidats : jusqu'a la prochaine transition (ouverture
+    ou fermeture) de l'un d'eux, bornee a DUREE_MAX_OUVERT. 0 = ne pas
+    mettre en cache.
+    """
+    from members.horaires import secondes_avant_transition
+
+    return secondes_avant_transition(stores, DUREE_MAX_OUVERT, moment)
@@ -3,7 +3,12 @@
 import os
 import json
 import logging
+import threading
+import time
+import contextvars
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 from .schema import PARAMETER_SCHEMA, build_json_schema, build_recommendation_schema
 
@@ -52,18 +57,137 @@ _INTENT_FALLBACK_INSTRUCTIONS = (
 )
 
 
+# Pool de connexions HTTP du client partage : assez de connexions
+# keep-alive pour les appels simultanes des threads d'un worker (requetes
+# + appels en parallele, voir en_parallele), fermees apres 60 s d'inactivite.
+MISTRAL_CONNEXIONS_MAX = 20
+MISTRAL_KEEPALIVE_S = 60
+
+_client = None
+_client_verrou = threading.Lock()
+
+
 def _get_client():
     """
-    Cree un client Mistral. Fonction separee pour pouvoir la simuler
-    facilement dans des tests plus tard, et pour centraliser la lecture
-    de la cle API a un seul endroit.
+    Client Mistral PARTAGE par tout le processus. Avant, chaque appel
+    (understand_intent, extract_search_params, recommend_stores) creait un
+    client neuf : nouveau pool HTTP, nouvelle poignee de main TLS, soit
+    100 a 300 ms de plus par appel. Ici, un seul client (httpx.Client,
+    thread-safe) garde ses connexions ouvertes d'un appel a l'autre.
+
+    Fonction separee pour pouvoir la simuler facilement dans les tests, et
+    pour centraliser la lecture de la cle API a un seul endroit.
     """
-    from mistralai.client import Mistral
+    global _client
+
+    if _client is not None:
+        return _client
+
+    with _client_verrou:
+        if _client is None:
+            import httpx
+            from mistralai.client import Mistral
+
+            api_key = os.environ.get("MISTRAL_API_KEY")
+            if not api_key:
+                raise RuntimeError("MISTRAL_API_KEY absente de l'environnement.")
+            http = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=MISTRAL_CONNEXIONS_MAX,
+                    max_keepalive_connections=MISTRAL_CONNEXIONS_MAX,
+                    keepalive_expiry=MISTRAL_KEEPALIVE_S,
+                ),
+                timeout=MISTRAL_REQUEST_TIMEOUT_MS / 1000,
+            )
+            # MISTRAL_SERVER_URL : autre serveur compatible (faux serveur local
+            # du banc de mesure, voir faux_mistral.py) ; API publique sinon.
+            _client = Mistral(
+                api_key=api_key,
+                client=http,
+                server_url=os.environ.get("MISTRAL_SERVER_URL") or None,
+            )
+    return _client
+
 
-    api_key = os.environ.get("MISTRAL_API_KEY")
-    if not api_key:
-        raise RuntimeError("MISTRAL_API_KEY absente de l'environnement.")
-    return Mistral(api_key=api_key)
+# -----------------------------------------------------------------
+# Instrumentation : duree et tokens de chaque appel Mistral, dans les logs
+# (logger members.ai_agent.client, niveau INFO) et, a l'interieur d'un bloc
+# collecter_mesures(), dans une liste que l'appelant peut exploiter (vue,
+# commande de bench...).
+# -----------------------------------------------------------------
+
+_mesures = contextvars.ContextVar("yuumi_ai_mesures", default=None)
+
+
+@contextmanager
+def collecter_mesures():
+    """
+    with collecter_mesures() as mesures: ... -> mesures recoit un dict par
+    appel Mistral : {etape, duree_ms, tokens_entree, tokens_sortie, succes}.
+    Les appels lances via en_parallele sont aussi collectes (le contexte
+    est recopie dans le thread).
+    """
+    mesures = []
+    jeton = _mesures.set(mesures)
+    try:
+        yield mesures
+    finally:
+        _mesures.reset(jeton)
+
+
+def _mesurer(etape, appel, **kwargs):
+    debut = time.perf_counter()
+    reponse = None
+    try:
+        reponse = appel(**kwargs)
+        return reponse
+    finally:
+        usage = getattr(reponse, "usage", None)
+        mesure = {
+            "etape": etape,
+            "duree_ms": round((time.perf_counter() - debut) * 1000, 1),
+            "tokens_entree": getattr(usage, "prompt_tokens", None),
+            "tokens_sortie": getattr(usage, "completion_tokens", None),
+            "succes": reponse is not None,
+        }
+        logger.info(
+            "Mistral %(etape)s : %(duree_ms)s ms, tokens %(tokens_entree)s -> "
+            "%(tokens_sortie)s, succes=%(succes)s", mesure,
+        )
+        mesures = _mesures.get()
+        if mesures is not None:
+            mesures.append(mesure)
+
+
+# -----------------------------------------------------------------
+# Appels concurrents. Les fonctions d'appel ci-dessous sont synchrones (le
+# pipeline de la vue l'est) ; en_parallele lance un appel dans un pool de
+# threads (settings.MISTRAL_WORKERS) qui partage le client, et donc le pool
+# de connexions, ci-dessus. Utile seulement si le thread appelant a autre
+# chose a faire pendant ce temps (extraction speculative de la vue).
+# A reserver aux appels reseau : l'ORM d'un autre thread n'utilise pas la
+# meme connexion (ni la meme transaction) que la requete.
+# -----------------------------------------------------------------
+
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        from django.conf import settings
+
+        _pool = ThreadPoolExecutor(
+            max_workers=settings.MISTRAL_WORKERS,
+            thread_name_prefix="yuumi-mistral",
+        )
+    return _pool
+
+
+def en_parallele(fonction, *args, **kwargs):
+    """Lance fonction(*args, **kwargs) dans le pool ; renvoie un Future."""
+    contexte = contextvars.copy_context()
+    return _executor().submit(contexte.run, fonction, *args, **kwargs)
 
 
 def _get_or_create_intent_agent(client):
@@ -120,35 +244,78 @@ def _is_web_search_quota_error(exception):
     return "429" in message and "web_search" in message
 
 
-def get_categories_block():
+# Catalogue des categories pour le prompt d'extraction, garde dans le cache
+# partage (Redis) : {"version": empreinte du texte, "bloc": texte}. Les
+# signaux Category / SuperCategory (members/signals.py) suppriment la cle ;
+# l'appel suivant la reconstruit. Le prompt systeme complet est ensuite
+# memorise par version dans chaque worker : entre deux modifications de
+# categories, il reste identique octet pour octet, ce qui permet au cache de
+# prefixe Mistral (prompt_cache_key) de jouer a chaque appel.
+CLE_CATALOGUE_CATEGORIES = "yuumi_ai:categories"
+DUREE_CATALOGUE_CATEGORIES = 60 * 60 * 24   # filet de securite : les signaux invalident avant
+
+_prompt_memorise = None   # (version, prompt)
+
+
+def invalider_catalogue_categories():
+    from django.core.cache import cache
+
+    cache.delete(CLE_CATALOGUE_CATEGORIES)
+
+
+def _catalogue_categories():
     """
-    Reconstruit la liste des categories reelles depuis la base de donnees,
-    A CHAQUE APPEL - jamais une liste figee en dur dans le code.
+    Liste des categories reelles (jamais une liste figee en dur dans le
+    code), lue dans le cache partage ou reconstruite depuis la base.
     """
+    import hashlib
+    from django.core.cache import cache
     from members.models import Category
 
+    catalogue = cache.get(CLE_CATALOGUE_CATEGORIES)
+    if catalogue is not None:
+        return catalogue
+
     categories = (
         Category.objects
-        .select_related("super_categorie")
-        .order_by("super_categorie__name", "name")
+        .order_by("super_categorie__name", "name", "slug")
         .values_list("slug", "name", "super_categorie__name")
     )
-
-    lignes = [
+    bloc = "\n".join(
         f"- {slug} ({name}, famille: {super_name or 'Autres'})"
         for slug, name, super_name in categories
-    ]
-    return "\n".join(lignes)
+    )
+    catalogue = {
+        "version": hashlib.sha256(bloc.encode("utf-8")).hexdigest()[:16],
+        "bloc": bloc,
+    }
+    cache.set(CLE_CATALOGUE_CATEGORIES, catalogue, DUREE_CATALOGUE_CATEGORIES)
+    return catalogue
+
+
+def get_categories_block():
+    return _catalogue_categories()["bloc"]
 
 
 def build_system_prompt():
     """
     Genere le prompt systeme pour l'appel d'extraction (etape 2a : intention
     generale -> categories + parametres de filtre), a partir du schema de
-    parametres et de la liste de categories reelles.
+    parametres et de la liste de categories reelles. Memorise par version du
+    catalogue : reconstruit seulement apres une modification de categories.
     """
-    categories_block = get_categories_block()
+    global _prompt_memorise
+
+    catalogue = _catalogue_categories()
+    if _prompt_memorise is not None and _prompt_memorise[0] == catalogue["version"]:
+        return _prompt_memorise[1]
+
+    prompt = _construire_system_prompt(catalogue["bloc"])
+    _prompt_memorise = (catalogue["version"], prompt)
+    return prompt
+
 
+def _construire_system_prompt(categories_block):
     parametres_block = "\n".join(
         f"- {p['field']} ({p['type']}) : {p['description']}"
         for p in PARAMETER_SCHEMA
@@ -267,7 +434,8 @@ def understand_intent(user_query):
         client = _get_client()
         agent_id = _get_or_create_intent_agent(client)
 
-        response = client.beta.conversations.start(
+        response = _mesurer(
+            "understand_intent", client.beta.conversations.start,
             agent_id=agent_id,
             inputs=user_query,
             timeout_ms=MISTRAL_REQUEST_TIMEOUT_MS,
@@ -317,7 +485,8 @@ def _understand_intent_fallback(client, user_query):
         if client is None:
             client = _get_client()
 
-        response = client.chat.complete(
+        response = _mesurer(
+            "understand_intent_fallback", client.chat.complete,
             model=MISTRAL_MODEL,
             messages=[
                 {"role": "system", "content": _INTENT_FALLBACK_INSTRUCTIONS},
@@ -385,7 +554,8 @@ def extract_search_params(user_query, intent_text=None, history=None):
                 "content": "Analyse cette requete et produis le JSON structure selon le schema fourni.",
             })
 
-        response = client.chat.complete(
+        response = _mesurer(
+            "extract_search_params", client.chat.complete,
             model=MISTRAL_MODEL,
             prompt_cache_key="yuumi-extract-search-params",
             messages=messages,
@@ -591,7 +761,8 @@ def recommend_stores(user_query, stores_list, store_ids_par_produit=None,
     try:
         client = _get_client()
 
-        response = client.chat.complete(
+        response = _mesurer(
+            "recommend_stores", client.chat.complete,
             model=MISTRAL_MODEL,
             prompt_cache_key="yuumi-recommend-stores",
             messages=[
@@ -0,0 +1,134 @@
+# members/ai_agent/faux_mistral.py
+#
+# Faux serveur Mistral, local et sans reseau, pour le banc de mesure de
+# l'agent IA (voir bench.py et la commande bench_agent_ia). Il repond aux
+# trois routes utilisees par client.py, au format de l'API reelle :
+#
+#   POST /v1/conversations      understand_intent (agent web)
+#   POST /v1/chat/completions   extract_search_params, recommend_stores,
+#                               fallback d'intention
+#
+# Les reponses sont REJOUEES : repondeur(etape, corps) fournit le contenu
+# (texte ou dict JSON), enregistre a l'avance par requete dans le corpus.
+# Chaque etape attend une latence configurable avant de repondre, et
+# l'usage (tokens) est estime a partir de la taille des messages (environ
+# 4 caracteres par token), pour que les mesures de taille de prompt
+# suivent les evolutions de client.py.
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CARACTERES_PAR_TOKEN = 4
+
+
+def estimer_tokens(texte):
+    return max(1, len(texte) // CARACTERES_PAR_TOKEN)
+
+
+def etape_de(chemin, corps):
+    """Etape du pipeline correspondant a un appel (voir client.py)."""
+    if chemin.startswith("/v1/conversations"):
+        return "understand_intent"
+    cle = corps.get("prompt_cache_key")
+    if cle == "yuumi-extract-search-params":
+        return "extract_search_params"
+    if cle == "yuumi-recommend-stores":
+        return "recommend_stores"
+    return "understand_intent_fallback"
+
+
+def _texte_entree(corps):
+    if "messages" in corps:
+        return "".join(str(m.get("content", "")) for m in corps["messages"])
+    return str(corps.get("inputs", ""))
+
+
+def _reponse_chat(contenu, tokens_entree):
+    texte = contenu if isinstance(contenu, str) else json.dumps(contenu, ensure_ascii=False)
+    tokens_sortie = estimer_tokens(texte)
+    return {
+        "id": uuid.uuid4().hex,
+        "object": "chat.completion",
+        "model": "faux-mistral",
+        "created": int(time.time()),
+        "usage": {
+            "prompt_tokens": tokens_entree,
+            "completion_tokens": tokens_sortie,
+            "total_tokens": tokens_entree + tokens_sortie,
+        },
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": texte},
+        }],
+    }
+
+
+def _reponse_conversation(contenu, tokens_entree):
+    tokens_sortie = estimer_tokens(contenu)
+    return {
+        "object": "conversation.response",
+        "conversation_id": uuid.uuid4().hex,
+        "outputs": [{
+            "object": "entry",
+            "type": "message.output",
+            "role": "assistant",
+            "id": uuid.uuid4().hex,
+            "created_at": "2026-01-01T00:00:00Z",
+            "content": contenu,
+        }],
+        "usage": {
+            "prompt_tokens": tokens_entree,
+            "completion_tokens": tokens_sortie,
+            "total_tokens": tokens_entree + tokens_sortie,
+        },
+    }
+
+
+def demarrer(repondeur, latences=None, latence_defaut_ms=0):
+    """
+    Lance le serveur dans un thread, sur un port libre de 127.0.0.1.
+    repondeur(etape, corps) -> contenu de la reponse ; latences : {etape:
+    millisecondes}. Renvoie (url, arreter).
+    """
+    latences = latences or {}
+
+    class Gestionnaire(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive, comme l'API reelle
+
+        def do_POST(self):
+            longueur = int(self.headers.get("Content-Length") or 0)
+            corps = json.loads(self.rfile.read(longueur) or b"{}")
+            etape = etape_de(self.path, corps)
+            time.sleep(latences.get(etape, latence_defaut_ms) / 1000)
+
+            contenu = repondeur(etape, corps)
+            tokens_entree = estimer_tokens(_texte_entree(corps))
+            if etape == "understand_intent":
+                reponse = _reponse_conversation(contenu, tokens_entree)
+            else:
+                reponse = _reponse_chat(contenu, tokens_entree)
+
+            donnees = json.dumps(reponse).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(donnees)))
+            self.end_headers()
+            self.wfile.write(donnees)
+
+        def log_message(self, *args):
+            pass
+
+    serveur = ThreadingHTTPServer(("127.0.0.1", 0), Gestionnaire)
+    serveur.daemon_threads = True
+    thread = threading.Thread(target=serveur.serve_forever, daemon=True)
+    thread.start()
+
+    def arreter():
+        serveur.shutdown()
+        serveur.server_close()
+
+    return f"http://127.0.0.1:{serveur.server_port}", arreter
@@ -0,0 +1,49 @@
+# members/ai_agent/flux.py
+#
+# Diffusion en Server-Sent Events des etapes de l'agent IA (voir
+# ai_search_agent_flux et _etapes_agent_ia dans views.py).
+#
+# Le site est servi en WSGI (gunicorn, workers synchrones). La reponse est
+# donc un generateur SYNCHRONE : le serveur envoie chaque evenement des que
+# le pipeline le produit, alors qu'un iterateur asynchrone serait consomme
+# d'une traite par Django avant le premier octet. Le pipeline tourne dans
+# le thread de la requete, comme la vue JSON : le worker reste occupe le
+# temps des appels LLM, ni plus ni moins qu'avec ai_search_agent.
+#
+# Format : "event: <nom>\ndata: <json>\n\n". Une erreur inattendue du
+# pipeline devient un evenement "resultat" fallback_to_tree, comme les
+# autres echecs techniques de l'agent.
+
+import json
+import logging
+
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+REPONSE_INDISPONIBLE = {
+    "fallback_to_tree": True,
+    "message": "La recherche intelligente est temporairement indisponible.",
+}
+
+
+def evenement_sse(evenement, donnees):
+    return f"event: {evenement}\ndata: {json.dumps(donnees, ensure_ascii=False)}\n\n"
+
+
+def diffuser(etapes):
+    """Evenements SSE produits par etapes, un par un, au fil du pipeline."""
+    try:
+        for evenement, donnees in etapes:
+            yield evenement_sse(evenement, donnees)
+    except Exception:
+        logger.exception("Agent IA (flux) : erreur inattendue")
+        yield evenement_sse("resultat", REPONSE_INDISPONIBLE)
+
+
+def reponse_flux(etapes):
+    reponse = StreamingHttpResponse(diffuser(etapes), content_type="text/event-stream")
+    reponse["Cache-Control"] = "no-cache"
+    # Nginx : ne pas bufferiser, sinon le flux n'arrive qu'a la fin
+    reponse["X-Accel-Buffering"] = "no"
+    return reponse
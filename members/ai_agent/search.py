@@ -22,16 +22,11 @@ def _ordonner_par_pertinence(queryset):
     plus pertinents pouvaient etre tronques avant meme d'atteindre l'IA.
 
     On utilise les clics (intention reelle : itineraire, appel, site...) comme
-    proxy de qualite/popularite. distinct=True evite la multiplication de
-    lignes due a la jointure.
+    proxy de qualite/popularite, via Store.score_popularite : colonne indexee
+    recalculee par agreger_statistiques (clics et vues recents, voir
+    members/statistiques.py). Plus aucun COUNT sur la table Click par requete.
     """
-    from django.db.models import Count
-
-    return (
-        queryset
-        .annotate(nb_clics=Count("clicks", distinct=True))
-        .order_by("-nb_clics", "nom")
-    )
+    return queryset.order_by("-score_popularite", "nom")
 
 
 def _filtrer_ouvert_maintenant(queryset, ouvert_maintenant):
@@ -54,8 +49,26 @@ def _filtrer_ouvert_maintenant(queryset, ouvert_maintenant):
     return queryset.filter(build_open_now_filter())
 
 
+def _filtrer_zone(queryset, zone):
+    """
+    Restreint aux commerces situes dans le rayon demande (rayon_km extrait
+    par l'IA), si le frontend a transmis la position de l'utilisateur.
+    zone = (lat, lng, rayon_km) ou None. Comme le filtre "ouvert maintenant",
+    applique AVANT le plafonnement des candidats. Prefiltre par cellules
+    geohash indexees, puis distance exacte (voir members/geo.py).
+    """
+    if zone is None:
+        return queryset
+
+    from members.geo import filtrer_par_rayon
+
+    lat, lng, rayon_km = zone
+    return filtrer_par_rayon(queryset, lat, lng, rayon_km)
+
+
 def find_matching_stores(categories_slugs, departement, ville,
-                         ouvert_maintenant=False, limit=MAX_CANDIDATES_TO_LLM):
+                         ouvert_maintenant=False, limit=MAX_CANDIDATES_TO_LLM,
+                         zone=None):
     """
     Cherche les commerces reels qui correspondent aux categories extraites
     et a la ville de l'utilisateur.
@@ -65,6 +78,7 @@ def find_matching_stores(categories_slugs, departement, ville,
     fin de la chaine. Le filtre "ouvert maintenant" est applique ICI, en SQL,
     AVANT ce decoupage.
     """
+    from members.annuaire import filtre_ville
     from members.models import Store
 
     if not categories_slugs:
@@ -74,67 +88,79 @@ def find_matching_stores(categories_slugs, departement, ville,
         Store.objects
         .filter(
             categorie__slug__in=categories_slugs,
-            departement__iexact=departement,
-            ville__iexact=ville,
+            **filtre_ville(departement, ville),
         )
         .select_related("categorie")
     )
 
     queryset = _filtrer_ouvert_maintenant(queryset, ouvert_maintenant)
+    queryset = _filtrer_zone(queryset, zone)
     return _ordonner_par_pertinence(queryset)
 
 
+def _ordonner_par_score(queryset, scores):
+    """
+    Trie par pertinence textuelle (score de l'index de recherche, voir
+    members/recherche.py), puis par popularite et par nom a score egal.
+    """
+    from django.db.models import Case, FloatField, Value, When
+
+    if not scores:
+        return queryset
+    pertinence = Case(
+        *[When(id=store_id, then=Value(score)) for store_id, score in scores.items()],
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return (
+        queryset
+        .annotate(pertinence=pertinence)
+        .order_by("-pertinence", "-score_popularite", "nom")
+    )
+
+
 def find_stores_by_product(idees_produits, departement, ville,
-                           ouvert_maintenant=False):
+                           ouvert_maintenant=False, zone=None):
     """
     Cherche les commerces qui vendent REELLEMENT un produit correspondant
     aux idees generiques extraites par l'IA (ex: "foie gras", "bouquet de
     roses"). C'est le tier CONFIRME : ces commerces seront marques [CONFIRME]
     dans le prompt de recommandation.
 
-    Match elargi (correctif "plafond de qualite") : on matche desormais sur
-    le nom du produit ET sur le nom de sa famille de produits (ProductFamily),
-    pas seulement Product.nom. Un commerce ayant une famille "Foies gras &
-    terrines" ressort donc, meme si aucun produit unitaire ne s'appelle
-    exactement "foie gras". Les deux sont des declarations de catalogue du
-    commercant, donc un signal fort (= confirme).
+    Match elargi (correctif "plafond de qualite") : on matche sur le nom du
+    produit ET sur le nom de sa famille de produits (ProductFamily). Un
+    commerce ayant une famille "Foies gras & terrines" ressort donc, meme si
+    aucun produit unitaire ne s'appelle exactement "foie gras". Les deux sont
+    des declarations de catalogue du commercant, donc un signal fort
+    (= confirme).
+
+    Passe par l'index de recherche (plus de icontains sur les tables
+    produits) : tri par pertinence, puis par clics.
 
     Renvoie un queryset Store (distinct, pas de doublons si plusieurs
     produits/familles du meme commerce matchent).
     """
-    from members.models import Store, Product
-    from django.db.models import Q
+    from members.models import Store
+    from members.recherche import TYPES_CATALOGUE, scores_par_commerce
 
     if not idees_produits:
         return Store.objects.none()
 
-    q = Q()
-    for idee in idees_produits:
-        q |= Q(nom__icontains=idee) | Q(family__nom__icontains=idee)
-
-    store_ids = (
-        Product.objects
-        .filter(q)
-        .filter(
-            family__store__departement__iexact=departement,
-            family__store__ville__iexact=ville,
-        )
-        .values_list("family__store_id", flat=True)
-        .distinct()
-    )
+    scores = scores_par_commerce(idees_produits, TYPES_CATALOGUE, departement, ville)
 
     queryset = (
         Store.objects
-        .filter(id__in=store_ids)
+        .filter(id__in=list(scores))
         .select_related("categorie")
     )
 
     queryset = _filtrer_ouvert_maintenant(queryset, ouvert_maintenant)
-    return _ordonner_par_pertinence(queryset)
+    queryset = _filtrer_zone(queryset, zone)
+    return _ordonner_par_score(queryset, scores)
 
 
 def find_stores_by_description(idees_produits, departement, ville,
-                               ouvert_maintenant=False):
+                               ouvert_maintenant=False, zone=None):
     """
     Tier intermediaire (correctif "elargir le match") : commerces dont la
     DESCRIPTION (petite ou grande) mentionne explicitement le produit demande,
@@ -144,28 +170,137 @@ def find_stores_by_description(idees_produits, departement, ville,
     fromages" est un candidat legitime, meme sans Product "foie gras" en base.
     C'est un signal plus faible que le catalogue (Product/ProductFamily), donc
     ces commerces NE sont PAS marques [CONFIRME] : l'IA les presentera en
-    "deduit", en s'appuyant sur la description.
+    "deduit", en s'appuyant sur la description. Une mention dans la
+    description courte pese plus que dans la longue.
 
     Renvoie un queryset Store.
     """
     from members.models import Store
-    from django.db.models import Q
+    from members.recherche import TYPES_DESCRIPTION, scores_par_commerce
 
     if not idees_produits:
         return Store.objects.none()
 
-    q = Q()
-    for idee in idees_produits:
-        q |= Q(descriptionpetite__icontains=idee) | Q(descriptiongrande__icontains=idee)
+    scores = scores_par_commerce(idees_produits, TYPES_DESCRIPTION, departement, ville)
 
     queryset = (
         Store.objects
-        .filter(q, departement__iexact=departement, ville__iexact=ville)
+        .filter(id__in=list(scores))
         .select_related("categorie")
     )
 
     queryset = _filtrer_ouvert_maintenant(queryset, ouvert_maintenant)
-    return _ordonner_par_pertinence(queryset)
+    queryset = _filtrer_zone(queryset, zone)
+    return _ordonner_par_score(queryset, scores)
+
+
+def _score_pondere(entrees):
+    """
+    Sous-requete : somme des scores des entrees du commerce, ponderes par
+    leur source (POIDS), comme scores_par_commerce.
+    """
+    from django.db.models import Case, F, FloatField, Subquery, Sum, Value, When
+    from members.recherche import POIDS
+
+    poids = Case(
+        *[When(type=type_entree, then=Value(p)) for type_entree, p in POIDS.items()],
+        output_field=FloatField(),
+    )
+    return Subquery(
+        entrees.order_by().values("store").annotate(total=Sum(F("score") * poids)).values("total"),
+        output_field=FloatField(),
+    )
+
+
+TIER_PRODUIT = 0
+TIER_DESCRIPTION = 1
+TIER_CATEGORIE = 2
+
+
+def selectionner_candidats(categories_slugs, idees_produits, departement, ville,
+                           ouvert_maintenant=False, zone=None,
+                           limit=MAX_CANDIDATES_TO_LLM):
+    """
+    Moteur de selection des candidats de l'agent IA, en une passe : meme
+    resultat que l'enchainement find_stores_by_product / _by_description /
+    find_matching_stores + combine_store_querysets, mais en UNE requete
+    Store : la correspondance dans l'index plein texte (catalogue ET
+    descriptions, entrees_correspondantes) y entre en sous-requetes.
+
+    Chaque commerce recoit un rang de tier (colonne SQL "tier") :
+      0 = catalogue (preuve forte, [CONFIRME]), 1 = description, 2 = categorie.
+    Un commerce trouve par plusieurs voies garde son meilleur tier (pas de
+    doublon). Tri : tier, pertinence textuelle, popularite, nom ; plafond
+    limit applique en SQL.
+
+    Regle du filet categorie : pour une demande de produit precis, le tier 2
+    ne sert QUE s'il n'y a aucune preuve directe (tiers 0/1). Comme le tri
+    commence par le tier, il suffit d'ecarter les lignes de tier 2 des
+    qu'une ligne de tier 0/1 est presente.
+
+    Renvoie un dict :
+      candidats : {store_id: Store}, dans l'ordre de pertinence (les ID
+                  renvoyes par l'IA se valident par simple lookup) ;
+      ids_confirmes : ID des candidats trouves par catalogue ;
+      produit_sans_match_confirme : produit demande mais seul le filet
+                  categorie a repondu.
+    """
+    from django.db.models import Case, Exists, IntegerField, OuterRef, Q, Value, When
+    from django.db.models.functions import Coalesce
+    from members.annuaire import filtre_ville
+    from members.models import Store
+    from members.recherche import TYPES_CATALOGUE, TYPES_DESCRIPTION, entrees_correspondantes
+
+    condition = Q()
+    tier = Value(TIER_CATEGORIE)
+    pertinence = Value(0.0)
+    entrees = None
+    if idees_produits:
+        entrees = entrees_correspondantes(idees_produits, TYPES_CATALOGUE + TYPES_DESCRIPTION)
+    if entrees is not None:
+        # Tier et pertinence calcules en SQL a partir de la condition de
+        # recherche elle-meme (sous-requetes correlees sur le commerce) :
+        # la requete ne grossit pas avec le nombre de candidats.
+        du_commerce = entrees.filter(store=OuterRef("pk"))
+        catalogue = du_commerce.filter(type__in=TYPES_CATALOGUE)
+        description = du_commerce.filter(type__in=TYPES_DESCRIPTION)
+        condition |= Exists(du_commerce) & Q(**filtre_ville(departement, ville))
+        # Case : la premiere clause qui matche l'emporte -> meilleur tier ;
+        # Coalesce : score catalogue prioritaire sur le score description.
+        tier = Case(
+            When(Exists(catalogue), then=Value(TIER_PRODUIT)),
+            When(Exists(description), then=Value(TIER_DESCRIPTION)),
+            default=Value(TIER_CATEGORIE),
+            output_field=IntegerField(),
+        )
+        pertinence = Coalesce(_score_pondere(catalogue), _score_pondere(description), Value(0.0))
+    if categories_slugs:
+        condition |= Q(
+            categorie__slug__in=categories_slugs,
+            **filtre_ville(departement, ville),
+        )
+    if not condition:
+        return {"candidats": {}, "ids_confirmes": set(), "produit_sans_match_confirme": False}
+
+    queryset = (
+        Store.objects
+        .filter(condition)
+        .select_related("categorie")
+        .annotate(tier=tier, pertinence=pertinence)
+    )
+    queryset = _filtrer_ouvert_maintenant(queryset, ouvert_maintenant)
+    queryset = _filtrer_zone(queryset, zone)
+    lignes = list(queryset.order_by("tier", "-pertinence", "-score_popularite", "nom")[:limit])
+
+    preuve_directe = bool(lignes) and lignes[0].tier != TIER_CATEGORIE
+    if preuve_directe:
+        lignes = [store for store in lignes if store.tier != TIER_CATEGORIE]
+
+    return {
+        "candidats": {store.id: store for store in lignes},
+        "ids_confirmes": {store.id for store in lignes if store.tier == TIER_PRODUIT},
+        "produit_sans_match_confirme": bool(idees_produits) and not preuve_directe,
+    }
 
 
 def combine_store_querysets(*querysets, limit=MAX_CANDIDATES_TO_LLM):
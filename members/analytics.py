@@ -0,0 +1,182 @@
+# members/analytics.py
+#
+# Ingestion des statistiques (PageView, Click) par lots.
+#
+# Avant, chaque affichage de fiche faisait un exists() (dédoublonnage sur
+# 20 s) + un INSERT, et chaque clic un INSERT : autant d'écritures
+# synchrones sur la base principale pendant les pics de trafic. Désormais :
+#
+# - le dédoublonnage "même session, même commerce, 20 s" se fait dans Redis
+#   (cache.add = SET NX avec expiration) ;
+# - l'événement est ajouté à une liste Redis (RPUSH, O(1)) ;
+# - `python manage.py vider_analytics` (cron, toutes les minutes) vide la
+#   liste par lots et écrit en bulk_create.
+#
+# Si le cache n'est pas Redis (django-redis absent ou autre backend) ou si
+# Redis ne répond pas, on retombe sur une écriture directe : aucune
+# statistique n'est perdue, et une panne de Redis ne fait pas échouer la
+# page. Si la base est injoignable pendant la vidange, le lot revient en
+# tête de file et la vidange s'arrête. Un lot refusé pour ses données est
+# repris événement par événement ; ceux qui échouent encore vont dans
+# CLE_REJETS (journalisés), sans bloquer les suivants, et
+# `python manage.py rejouer_analytics` les remet en file une fois la cause
+# corrigée.
+
+import json
+import logging
+
+from django.core.cache import cache
+from django.db import DatabaseError, DataError, IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+CLE_FILE = "yuumi_analytics:evenements"
+CLE_REJETS = "yuumi_analytics:rejets"
+PREFIXE_VUE = "yuumi_analytics:vue:"
+FENETRE_VUE = 20          # secondes : une vue par session et par commerce
+TAILLE_LOT = 1000
+
+
+def _redis():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    except Exception:
+        return None
+
+
+def _creer(evenements):
+    """bulk_create des événements, en ignorant les commerces supprimés depuis."""
+    from .models import Click, PageView, Store
+
+    ids = {e["store_id"] for e in evenements}
+    existants = set(Store.objects.filter(id__in=ids).values_list("id", flat=True))
+
+    vues, clics = [], []
+    for e in evenements:
+        if e["store_id"] not in existants:
+            continue
+        moment = parse_datetime(e["ts"])
+        if e["type"] == "vue":
+            vues.append(PageView(
+                store_id=e["store_id"], session_id=e["session_id"],
+                ip_address=e["ip"], timestamp=moment,
+            ))
+        else:
+            clics.append(Click(
+                store_id=e["store_id"], type_click=e["type_click"], created_at=moment,
+            ))
+
+    with transaction.atomic():
+        PageView.objects.bulk_create(vues, batch_size=TAILLE_LOT)
+        Click.objects.bulk_create(clics, batch_size=TAILLE_LOT)
+    return len(vues) + len(clics)
+
+
+def _publier(evenement):
+    evenement["ts"] = timezone.now().isoformat()
+    r = _redis()
+    if r is not None:
+        from redis.exceptions import RedisError
+
+        try:
+            r.rpush(CLE_FILE, json.dumps(evenement))
+            return
+        except RedisError:
+            logger.warning("Redis indisponible : événement %s écrit directement", evenement["type"], exc_info=True)
+    _creer([evenement])
+
+
+def enregistrer_vue(store_id, session_id, ip):
+    """Une vue de fiche, sauf si la même session l'a vue il y a moins de 20 s."""
+    try:
+        nouvelle = cache.add(f"{PREFIXE_VUE}{store_id}:{session_id}", 1, FENETRE_VUE)
+    except Exception:
+        # Cache injoignable : la vue est comptée, sans dédoublonnage
+        logger.warning("Dédoublonnage des vues indisponible", exc_info=True)
+        nouvelle = True
+    if not nouvelle:
+        return False
+    _publier({"type": "vue", "store_id": store_id, "session_id": session_id, "ip": ip})
+    return True
+
+
+def enregistrer_clic(store_id, type_click):
+    _publier({"type": "clic", "store_id": store_id, "type_click": type_click})
+
+
+def _panne_base(erreur):
+    """Erreur de la base elle-même (connexion, serveur), pas d'un événement."""
+    return isinstance(erreur, DatabaseError) and not isinstance(erreur, (DataError, IntegrityError))
+
+
+def _remettre(r, bruts):
+    """Remet des événements en tête de file, dans leur ordre."""
+    r.lpush(CLE_FILE, *reversed(bruts))
+    logger.error("vider_file : base indisponible, %s événement(s) remis en file", len(bruts))
+
+
+def _creer_un_par_un(r, bruts):
+    """
+    Reprise d'un lot refusé : chaque événement seul. Ceux qui échouent
+    encore sur leurs propres données (JSON invalide, valeur refusée par la
+    base...) partent dans CLE_REJETS pour ne pas bloquer la file.
+    """
+    total = 0
+    for i, brut in enumerate(bruts):
+        try:
+            total += _creer([json.loads(brut)])
+        except Exception as erreur:
+            if _panne_base(erreur):
+                _remettre(r, bruts[i:])
+                raise
+            r.rpush(CLE_REJETS, brut)
+            logger.exception("vider_file : événement rejeté, mis de côté dans %s : %r", CLE_REJETS, brut)
+    return total
+
+
+def vider_file(taille_lot=TAILLE_LOT):
+    """
+    Écrit en base tous les événements en attente, par lots. Chaque lot est
+    retiré de la liste de façon atomique (LRANGE + LTRIM dans un MULTI).
+    Base injoignable : le lot est remis en file et l'erreur remonte. Lot
+    refusé pour ses données : repris événement par événement (voir
+    _creer_un_par_un). Renvoie le nombre de lignes créées.
+    """
+    r = _redis()
+    if r is None:
+        return 0
+
+    total = 0
+    while True:
+        pipe = r.pipeline(transaction=True)
+        pipe.lrange(CLE_FILE, 0, taille_lot - 1)
+        pipe.ltrim(CLE_FILE, taille_lot, -1)
+        bruts, _ = pipe.execute()
+        if not bruts:
+            return total
+        try:
+            total += _creer([json.loads(b) for b in bruts])
+        except Exception as erreur:
+            if _panne_base(erreur):
+                _remettre(r, bruts)
+                raise
+            logger.warning("vider_file : lot de %s événements refusé, reprise un par un", len(bruts), exc_info=True)
+            total += _creer_un_par_un(r, bruts)
+
+
+def rejouer_rejets():
+    """
+    Remet en tête de file, dans leur ordre, les événements de CLE_REJETS
+    (après correction de leur cause). Renvoie leur nombre.
+    """
+    r = _redis()
+    if r is None:
+        return 0
+    total = 0
+    # RPOPLPUSH : chaque événement passe d'une liste à l'autre d'un bloc
+    while r.rpoplpush(CLE_REJETS, CLE_FILE) is not None:
+        total += 1
+    return total
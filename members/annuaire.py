@@ -0,0 +1,133 @@
+# members/annuaire.py
+#
+# Annuaire des départements et villes où Yuumi a des commerces, calculé
+# une fois et stocké dans le cache partagé (Redis).
+#
+# main, changer_ville, le menu (navigation.py), les autocomplétions
+# département / ville et les sitemaps des villes refaisaient chacun un
+# DISTINCT (departement, ville) sur tout Store, puis les mêmes
+# .strip().title() et tris casefold en Python, à chaque requête. Ici :
+#
+# - construire() lit une seule fois le référentiel des villes (City,
+#   Departement) et prépare toutes les formes utiles : correspondances en
+#   minuscules (URL, cookies -> nom en base), liste d'affichage triée pour
+#   les sélecteurs et ids des villes ;
+# - annuaire() : un get dans le cache, O(1) pour les appelants ;
+# - filtre_ville() : les pages d'une ville filtrent Store sur sa clé
+#   étrangère city (égalité d'entiers, indexée) au lieu de
+#   departement__iexact / ville__iexact (UPPER(col) = UPPER(?), sans index) ;
+# - l'annuaire porte un numéro de version, recopié dans chaque arbre du
+#   menu : le supprimer (invalider_annuaire, voir signals.py : commerce
+#   créé / supprimé / déplacé, et City.pour : nouvelle ville) périme aussi
+#   tout le menu.
+
+import time
+
+from django.core.cache import cache
+
+CLE_ANNUAIRE = "yuumi_annuaire"
+DUREE_ANNUAIRE = 60 * 60 * 6   # filet de sécurité : les signaux invalident avant
+
+
+def invalider_annuaire():
+    cache.delete(CLE_ANNUAIRE)
+
+
+def construire():
+    from django.db.models import Exists, OuterRef
+
+    from .models import City, Store
+
+    departements, villes, ids, affichage = {}, {}, {}, {}
+    lignes = (
+        City.objects
+        .annotate(a_commerces=Exists(Store.objects.filter(city=OuterRef("pk"))))
+        .values_list("pk", "slug", "nom", "departement__slug", "departement__nom", "a_commerces")
+    )
+    for pk, cle_ville, ville, cle, departement, a_commerces in lignes:
+        # Toutes les villes ont un id (mise en avant d'une ville encore sans
+        # commerce) ; seules celles qui ont des commerces sont listées
+        ids.setdefault(cle, {})[cle_ville] = pk
+        if not a_commerces:
+            continue
+        departements[cle] = departement
+        villes.setdefault(cle, {})[cle_ville] = ville
+
+        # Forme affichée par main / changer_ville
+        dep_titre, ville_titre = departement.strip().title(), ville.strip().title()
+        affichage.setdefault(dep_titre, set()).add(ville_titre)
+
+    return {
+        # time_ns : valeur qui ne peut pas recroiser celle d'un arbre périmé
+        "version": time.time_ns(),
+        "departements": departements,
+        "villes": villes,
+        "ids": ids,
+        "affichage": {
+            dep: sorted(noms, key=str.casefold)
+            for dep, noms in sorted(affichage.items(), key=lambda x: x[0].casefold())
+        },
+    }
+
+
+def annuaire(en_cache=None):
+    """
+    L'annuaire, construit au besoin. en_cache : résultat d'un get_many qui
+    incluait CLE_ANNUAIRE (un seul aller-retour pour l'appelant).
+    """
+    valeur = en_cache.get(CLE_ANNUAIRE) if en_cache is not None else cache.get(CLE_ANNUAIRE)
+    if valeur is None:
+        valeur = construire()
+        cache.set(CLE_ANNUAIRE, valeur, DUREE_ANNUAIRE)
+    return valeur
+
+
+def departements_villes():
+    """{Département: [Villes]} titrés et triés, pour les sélecteurs de ville."""
+    return annuaire()["affichage"]
+
+
+def departements():
+    """Départements tels qu'en base, triés."""
+    return sorted(annuaire()["departements"].values())
+
+
+def villes(departement=""):
+    """Villes telles qu'en base, triées ; toutes si departement est vide."""
+    index = annuaire()["villes"]
+    if departement:
+        noms = index.get(departement.lower(), {}).values()
+    else:
+        noms = (ville for par_ville in index.values() for ville in par_ville.values())
+    return sorted(set(noms))
+
+
+def emplacements():
+    """[(departement, ville)] telles qu'en base, une fois chacun, triés."""
+    index = annuaire()
+    return sorted(
+        (index["departements"][cle], ville)
+        for cle, par_ville in index["villes"].items()
+        for ville in par_ville.values()
+    )
+
+
+def filtre_ville(departement, ville, champ="city"):
+    """
+    Filtre ORM sur la clé étrangère champ (Store.city, "store__city"...)
+    pour une ville, un département entier (ville vide) ou toutes les villes
+    d'un nom (departement vide). Emplacement inconnu ou vide : aucun
+    résultat.
+    """
+    index = annuaire()["ids"]
+    cle, cle_ville = departement.lower(), ville.lower()
+    if departement and ville:
+        trouves = [index.get(cle, {}).get(cle_ville)]
+    elif departement:
+        trouves = list(index.get(cle, {}).values())
+    else:
+        trouves = [par_ville.get(cle_ville) for par_ville in index.values()]
+    trouves = [pk for pk in trouves if pk is not None]
+    if len(trouves) == 1:
+        return {champ: trouves[0]}
+    return {f"{champ}__in": trouves}
@@ -1,5 +1,6 @@
 from dal import autocomplete
 from django.contrib.auth.mixins import LoginRequiredMixin
+from . import annuaire
 from .models import Store
 
 
@@ -8,23 +9,13 @@ from .models import Store
 # Sans ça, n'importe qui peut énumérer tous les départements/villes/catégories en base.
 class DepartementAutocomplete(LoginRequiredMixin, autocomplete.Select2ListView):
     def get_list(self):
-        return list(
-            Store.objects.order_by('departement')
-            .values_list('departement', flat=True)
-            .distinct()
-        )
+        return annuaire.departements()
 
 
 # 🔹 Autocomplétion ville (filtrée par département)
 class VilleAutocomplete(LoginRequiredMixin, autocomplete.Select2ListView):
     def get_list(self):
-        qs = Store.objects.order_by('ville')
-        departement = self.forwarded.get('departement', None)
-
-        if departement:
-            qs = qs.filter(departement__iexact=departement)
-
-        return list(qs.values_list('ville', flat=True).distinct())
+        return annuaire.villes(self.forwarded.get('departement') or "")
 
 
 # 🔹 Autocomplétion catégorie
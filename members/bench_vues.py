@@ -0,0 +1,196 @@
+# members/bench_vues.py
+#
+# Banc de mesure des vues publiques (commande `python manage.py bench_vues`)
+# sur les données en base, idéalement le jeu synthétique de
+# donnees_synthetiques.py à pleine échelle.
+#
+# Chaque scénario (accueil, pages d'une ville, catégorie, fiche, carte et
+# ses données, recherche de produits, sitemap...) est joué avec le client
+# de test de Django, donc toute la pile : middlewares, menu
+# (menu_context), cache des pages, gabarits. Par scénario :
+# - à froid (caches vidés) : latence, requêtes SQL, taille de la réponse ;
+# - à chaud (PASSES requêtes suivantes) : latence p50 / p95, requêtes SQL ;
+# - pic de mémoire Python d'une requête à froid (tracemalloc, mesurée à
+#   part : tracemalloc ralentit tout le reste).
+#
+# Le rapport est un dict JSON stable (mêmes clés d'une version à l'autre) :
+# comparer() en tire les écarts entre deux rapports.
+#
+# Tout tourne dans une transaction annulée à la fin (sessions, vues
+# enregistrées, éventuel jeu synthétique généré pour l'occasion) et avec un
+# cache local en mémoire, comme members/ai_agent/bench.py : rien ne reste
+# en base ni dans Redis. Les allers-retours Redis ne sont donc pas comptés.
+# L'agent IA a son propre banc (bench_agent_ia).
+
+import time
+import tracemalloc
+from urllib.parse import quote
+
+from .ai_agent.bench import percentile
+
+PASSES = 5
+
+
+def scenarios():
+    """[(nom, url)] construits à partir de la ville la plus fournie."""
+    from django.db.models import Count
+    from django.urls import reverse
+
+    from .models import Product, Store
+    from .tuiles import resume
+
+    ligne = (
+        Store.objects.filter(city__isnull=False, categorie__isnull=False)
+        .values("city").annotate(n=Count("id")).order_by("-n").first()
+    )
+    if ligne is None:
+        return []
+    commerces = Store.objects.filter(city=ligne["city"]).select_related("categorie__super_categorie")
+    store = commerces.filter(families__products__isnull=False).first() or commerces.first()
+    categorie = (
+        commerces.values("categorie__slug").annotate(n=Count("id")).order_by("-n").first()["categorie__slug"]
+    )
+    departement, ville = store.departement.lower(), store.ville.lower()
+    produit = Product.objects.filter(family__store=store).values_list("nom", flat=True).first() or store.nom
+    centre = resume(departement)["centre"] or [store.latitude or 46.5, store.longitude or 2.5]
+    lat, lng = centre
+    emprise = f"{lng - 0.1},{lat - 0.1},{lng + 0.1},{lat + 0.1}"
+
+    args = [departement, ville]
+    return [
+        ("accueil", reverse("main")),
+        ("commerces_ville", reverse("stores", args=args)),
+        ("categorie", reverse("by_category", args=args + [categorie])),
+        ("categorie_ouvert", reverse("by_category", args=args + [categorie]) + "?ouvert=1"),
+        ("categorie_proximite", reverse("by_category", args=args + [categorie]) + f"?lat={lat}&lng={lng}&distance=5"),
+        ("categories_ville", reverse("categories_ville", args=args)),
+        ("super_categorie", reverse("by_super_category", args=args + [store.categorie.super_categorie.slug])),
+        ("fiche", reverse("store_details", args=args + [store.slug])),
+        ("carte", reverse("map-view", args=[departement])),
+        ("carte_donnees", reverse("map-data", args=[departement])),
+        ("carte_groupes", reverse("map-groupes", args=[departement]) + f"?z=13&bbox={emprise}"),
+        ("recherche_produit", reverse("search-product") + f"?q={quote(produit.split()[0])}&ville={quote(ville)}"),
+        ("sitemap", reverse("sitemap")),
+        ("sitemap_commerces", reverse("sitemap-section", args=["commerces"])),
+    ]
+
+
+def _requete(client, url):
+    debut = time.perf_counter()
+    response = client.get(url, secure=True)
+    duree = (time.perf_counter() - debut) * 1000
+    contenu = b"".join(response.streaming_content) if response.streaming else response.content
+    return response, duree, len(contenu)
+
+
+def _scenario(client, cache, url, passes):
+    cache.clear()
+    response, duree, taille = _requete(client, url)
+    froid = {
+        "ms": round(duree, 1),
+        "requetes": response.mesures["requetes"],
+        "octets": taille,
+    }
+
+    durees, requetes = [], []
+    for _ in range(passes):
+        chaud, duree, _taille = _requete(client, url)
+        durees.append(duree)
+        requetes.append(chaud.mesures["requetes"])
+
+    cache.clear()
+    tracemalloc.start()
+    try:
+        _requete(client, url)
+        pic = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "url": url,
+        "statut": response.status_code,
+        "froid": froid,
+        "chaud": {
+            "p50_ms": round(percentile(durees, 50), 1) if durees else None,
+            "p95_ms": round(percentile(durees, 95), 1) if durees else None,
+            "requetes": max(requetes) if requetes else None,
+        },
+        "memoire_pic_ko": round(pic / 1024),
+    }
+
+
+def volumes():
+    from .models import City, Click, PageView, Product, Store
+
+    return {
+        "villes": City.objects.count(),
+        "commerces": Store.objects.count(),
+        "produits": Product.objects.count(),
+        "vues": PageView.objects.count(),
+        "clics": Click.objects.count(),
+    }
+
+
+def executer(passes=PASSES, synthetique=None, seulement=None):
+    """
+    Joue les scénarios et renvoie le rapport (dict). synthetique : arguments
+    de donnees_synthetiques.generer, pour un jeu généré dans la transaction
+    annulée ; seulement : noms des scénarios à jouer (tous par défaut).
+    """
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.db import connection, transaction
+    from django.test import Client
+    from django.test.utils import override_settings
+    from django.utils import timezone
+
+    from .donnees_synthetiques import generer
+
+    cache_local = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                               "LOCATION": "yuumi-bench-vues"}}
+    hotes = [*settings.ALLOWED_HOSTS, "testserver"]
+    resultats = {}
+    with override_settings(CACHES=cache_local, ALLOWED_HOSTS=hotes):
+        with transaction.atomic():
+            if synthetique:
+                generer(**synthetique)
+            quantites = volumes()
+            client = Client()
+            for nom, url in scenarios():
+                if seulement and nom not in seulement:
+                    continue
+                resultats[nom] = _scenario(client, cache, url, passes)
+            cache.clear()
+            transaction.set_rollback(True)
+
+    return {
+        "date": timezone.now().isoformat(timespec="seconds"),
+        "base": connection.vendor,
+        "passes": passes,
+        "volumes": quantites,
+        "scenarios": resultats,
+    }
+
+
+def comparer(avant, apres):
+    """
+    {scenario: {mesure: (avant, apres)}} pour les scénarios communs aux
+    deux rapports : froid_ms, chaud_p50_ms, chaud_p95_ms, requetes_froid,
+    requetes_chaud, memoire_pic_ko.
+    """
+    def mesures(s):
+        return {
+            "froid_ms": s["froid"]["ms"],
+            "chaud_p50_ms": s["chaud"]["p50_ms"],
+            "chaud_p95_ms": s["chaud"]["p95_ms"],
+            "requetes_froid": s["froid"]["requetes"],
+            "requetes_chaud": s["chaud"]["requetes"],
+            "memoire_pic_ko": s["memoire_pic_ko"],
+        }
+
+    ecarts = {}
+    for nom, scenario in apres["scenarios"].items():
+        if nom in avant["scenarios"]:
+            ancien, nouveau = mesures(avant["scenarios"][nom]), mesures(scenario)
+            ecarts[nom] = {cle: (ancien[cle], nouveau[cle]) for cle in nouveau}
+    return ecarts
@@ -16,7 +16,9 @@ class NoCacheHTMLMiddleware:
         response = self.get_response(request)
 
         content_type = response.get("Content-Type", "")
-        if "text/html" in content_type:
+        # Réponses avec ETag (voir revalidation.py) : "private, no-cache",
+        # le navigateur les garde mais les revalide à chaque fois
+        if "text/html" in content_type and not response.has_header("ETag"):
             response["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
             response["Pragma"] = "no-cache"
             response["Expires"] = "0"
@@ -0,0 +1,212 @@
+# members/cache_pages.py
+#
+# Cache serveur des pages publiques pour les visiteurs ANONYMES (villes,
+# catégories, fiches commerce), dans le cache partagé (Redis).
+#
+# Ces pages étaient recalculées (requêtes + gabarits) pour chaque visiteur
+# et chaque robot d'indexation, alors qu'elles sont identiques pour tous
+# les anonymes. Le navigateur, lui, ne garde toujours rien
+# (NoCacheHTMLMiddleware) : seul le serveur réutilise le rendu.
+#
+# - Clé : chemin + paramètres GET autorisés par la vue + variante app
+#   native (User-Agent) + COOKIES_DE_PAGE. Une requête qui porte un autre
+#   paramètre (lat/lng d'une recherche par distance...) n'est pas cachée.
+# - Invalidation par ÉTIQUETTES, comme le menu (navigation.py) : chaque
+#   page mémorise la version de l'étiquette de sa ville et de l'étiquette
+#   globale ; supprimer une étiquette (voir signals.py) périme d'un coup
+#   toutes les pages qui la portent. Un seul get_many lit la page et ses
+#   deux étiquettes.
+# - Jeton CSRF : la page est rendue avec un marqueur à la place du jeton
+#   (context processor csrf_page), remplacé à chaque service par le jeton
+#   de la requête en cours.
+# - Durée : DUREE_PAGE au plus, moins quand la page affiche un état
+#   "ouvert / fermé" (limiter_duree).
+# - Effets de bord de la vue à rejouer même sur un succès du cache
+#   (statistiques de vues d'une fiche) : donnees_page + sur_hit.
+#
+# Les mêmes étiquettes (plus département, tout contenu et utilisateur)
+# servent aux ETag des requêtes conditionnelles : voir revalidation.py.
+
+import hashlib
+import time
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .utils import is_native_request
+
+PREFIXE_PAGE = "yuumi_page:"
+PREFIXE_ETIQUETTE = "yuumi_page_etiquette:"
+ETIQUETTE_GLOBALE = PREFIXE_ETIQUETTE + "*"
+# Tout commerce, partout : réponses qui ne dépendent pas d'une ville (recherche)
+ETIQUETTE_CONTENU = PREFIXE_ETIQUETTE + "contenu"
+DUREE_PAGE = 60 * 60
+DUREE_OUVERT = 60 * 15   # liste "ouvert maintenant" : un commerce absent peut ouvrir
+DUREE_ETIQUETTE = 60 * 60 * 24
+
+MARQUEUR_CSRF = "__yuumi_csrf_token__"
+
+# Cookies lus côté serveur par les pages cachées : aucun aujourd'hui (la
+# ville vient de l'URL). Tout cookie qui change le HTML doit figurer ici.
+COOKIES_DE_PAGE = ()
+
+# Paramètres de suivi (liens partagés) : sans effet sur le rendu, ignorés
+PARAMETRES_IGNORES = ("fbclid", "gclid")
+
+
+def etiquette_ville(departement, ville):
+    return f"{PREFIXE_ETIQUETTE}{departement.lower()}|{ville.lower()}"
+
+
+def etiquette_departement(departement):
+    return f"{PREFIXE_ETIQUETTE}{departement.lower()}"
+
+
+def etiquette_utilisateur(user_id):
+    return f"{PREFIXE_ETIQUETTE}utilisateur|{user_id}"
+
+
+def invalider_ville(departement, ville):
+    """Périme toutes les pages en cache de cette ville (et de son département)."""
+    if departement and ville:
+        cache.delete_many([
+            etiquette_ville(departement, ville),
+            etiquette_departement(departement),
+            ETIQUETTE_CONTENU,
+        ])
+
+
+def invalider_utilisateur(user_id):
+    """Périme ce qui dépend des favoris / notes / listes d'un compte (revalidation.py)."""
+    cache.delete(etiquette_utilisateur(user_id))
+
+
+def invalider_tout():
+    """Périme toutes les pages en cache (catégories, super catégories...)."""
+    cache.delete(ETIQUETTE_GLOBALE)
+
+
+def _emplacement(objet):
+    """(departement, ville) des pages qui affichent cet objet, ou None."""
+    from .models import CityCategoryHighlight, Store
+
+    nom = objet._meta.model_name
+    if nom in ("store", "citycategoryhighlight"):
+        return objet.departement, objet.ville
+    if nom == "citycategoryitem":
+        lignes = CityCategoryHighlight.objects.filter(pk=objet.highlight_id)
+    elif nom == "product":
+        lignes = Store.objects.filter(families=objet.family_id)
+    else:   # famille de produits, images : rattachées à un commerce
+        lignes = Store.objects.filter(pk=objet.store_id)
+    return lignes.values_list("departement", "ville").first()
+
+
+def invalider_pour(objet):
+    """Périme les pages qui affichent cet objet (voir signals.py)."""
+    if objet._meta.model_name in ("category", "supercategory", "categorieintermediaire"):
+        invalider_tout()
+        return
+    emplacement = _emplacement(objet)
+    if emplacement:
+        invalider_ville(*emplacement)
+
+
+def limiter_duree(request, secondes):
+    """À appeler dans la vue : la page ne doit pas rester en cache plus de secondes."""
+    request._yuumi_duree_page = min(getattr(request, "_yuumi_duree_page", DUREE_PAGE), secondes)
+
+
+def donnees_page(request, **donnees):
+    """À appeler dans la vue : données gardées avec la page, passées à sur_hit."""
+    request._yuumi_donnees_page = donnees
+
+
+def _cle_page(request, parametres):
+    elements = [request.path.lower(), "app" if is_native_request(request) else "web"]
+    elements += [f"{nom}={request.GET.getlist(nom)}" for nom in parametres if nom in request.GET]
+    elements += [f"{nom}={request.COOKIES.get(nom, '')}" for nom in COOKIES_DE_PAGE]
+    return PREFIXE_PAGE + hashlib.sha256("|".join(elements).encode("utf-8")).hexdigest()
+
+
+def _cachable(request, parametres):
+    user = getattr(request, "user", None)
+    if request.method not in ("GET", "HEAD") or user is None or user.is_authenticated:
+        return False
+    for nom in request.GET:
+        if nom not in parametres and nom not in PARAMETRES_IGNORES and not nom.startswith("utm_"):
+            return False
+    # Messages en attente (après une redirection) : page propre à ce visiteur
+    return len(get_messages(request)) == 0
+
+
+def versions_etiquettes(en_cache, cles):
+    """Version de chaque étiquette ; une étiquette absente en reçoit une neuve."""
+    versions = []
+    for cle in cles:
+        version = en_cache.get(cle)
+        if version is None:
+            # time_ns : valeur qui ne peut pas recroiser celle d'une page périmée
+            version = time.time_ns()
+            cache.set(cle, version, DUREE_ETIQUETTE)
+        versions.append(version)
+    return versions
+
+
+def _servir(request, page):
+    reponse = HttpResponse(
+        page["contenu"].replace(MARQUEUR_CSRF, get_token(request)),
+        content_type=page["content_type"],
+    )
+    reponse["X-Yuumi-Cache"] = "HIT"
+    return reponse
+
+
+def page_anonyme(parametres=(), sur_hit=None):
+    """
+    Décorateur des vues publiques /<departement>/<ville>/... : rendu
+    partagé par tous les visiteurs anonymes. parametres : paramètres GET
+    qui font varier la page. sur_hit(request, donnees) : effets de bord à
+    rejouer quand la page vient du cache (voir donnees_page).
+    """
+    def decorateur(vue):
+        @wraps(vue)
+        def _vue(request, *args, **kwargs):
+            if not _cachable(request, parametres):
+                return vue(request, *args, **kwargs)
+
+            cle = _cle_page(request, parametres)
+            etiquettes = [ETIQUETTE_GLOBALE, etiquette_ville(kwargs["departement"], kwargs["ville"])]
+            en_cache = cache.get_many([cle] + etiquettes)
+            versions = versions_etiquettes(en_cache, etiquettes)
+
+            page = en_cache.get(cle)
+            if page is not None and page["versions"] == versions:
+                if sur_hit is not None:
+                    sur_hit(request, page["donnees"])
+                return _servir(request, page)
+
+            request._yuumi_page_en_cache = True
+            try:
+                reponse = vue(request, *args, **kwargs)
+            finally:
+                request._yuumi_page_en_cache = False
+            if reponse.streaming:
+                return reponse
+            contenu = reponse.content.decode(reponse.charset)
+            duree = getattr(request, "_yuumi_duree_page", DUREE_PAGE)
+            if reponse.status_code == 200 and not reponse.cookies and duree > 0:
+                cache.set(cle, {
+                    "versions": versions,
+                    "contenu": contenu,
+                    "content_type": reponse["Content-Type"],
+                    "donnees": getattr(request, "_yuumi_donnees_page", {}),
+                }, duree)
+                reponse["X-Yuumi-Cache"] = "MISS"
+            reponse.content = contenu.replace(MARQUEUR_CSRF, get_token(request))
+            return reponse
+        return _vue
+    return decorateur
@@ -0,0 +1,115 @@
+# members/carte.py
+#
+# Données de la carte d'un département (vue map_data,
+# /carte/<departement>/donnees.json), séparées de la page HTML.
+#
+# map_view construisait auparavant un dict par commerce (instance complète,
+# select_related, résolution de photo_small.url, reverse() de l'URL) et
+# l'inlinait dans le HTML : taille de page et temps de rendu croissaient
+# avec le département, pour chaque visiteur. Ici :
+#
+# - une seule charge utile PARTAGÉE par département, en colonnes (listes
+#   parallèles : ids, lat, lng, indice de catégorie, indice de ville, slug,
+#   nom, photo) : les valeurs répétées se compressent bien ;
+# - URL et photo reconstruites côté client (modele_url, media) ;
+# - JSON compact et sa version gzip calculés une fois par version, dans le
+#   cache partagé, périmés par les étiquettes du département et globale
+#   (cache_pages.py, signals.py) ;
+# - favoris et commerces masqués (défavoris premium) : inlinés dans la page
+#   (map_view) et superposés par le client, jamais dans les données
+#   partagées.
+
+import gzip
+import json
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from .annuaire import filtre_ville
+from .cache_pages import ETIQUETTE_GLOBALE, etiquette_departement, versions_etiquettes
+
+PREFIXE_CARTE = "yuumi_carte:"
+DUREE_CARTE = 60 * 60 * 24
+DECIMALES = 5   # ~1 m au sol : assez pour un marqueur
+
+
+def construire(departement):
+    """Charge utile en colonnes des commerces placés sur la carte du département."""
+    from .models import Category, Store
+
+    lignes = list(
+        Store.objects
+        .filter(
+            **filtre_ville(departement, ""),
+            latitude__isnull=False, longitude__isnull=False, categorie__isnull=False,
+        )
+        .order_by("pk")
+        .values_list("pk", "nom", "slug", "ville", "latitude", "longitude",
+                     "categorie_id", "photo_small", "photo")
+    )
+    categorie_ids = sorted({ligne[6] for ligne in lignes})
+    categories = list(
+        Category.objects
+        .filter(pk__in=categorie_ids)
+        .values(
+            "pk",
+            "slug",
+            "name",
+            "super_categorie__slug",
+            "super_categorie__name",
+            "icon_perso",
+            "categorie_intermediaire__name",
+            "categorie_intermediaire__slug",
+        )
+        .order_by("super_categorie__name", "categorie_intermediaire__name", "name")
+    )
+    rang_categorie = {c.pop("pk"): i for i, c in enumerate(categories)}
+
+    villes, rang_ville = [], {}
+    colonnes = {cle: [] for cle in ("ids", "lat", "lng", "categorie", "ville", "slug", "nom", "photo")}
+    for pk, nom, slug, ville, lat, lng, categorie_id, photo_small, photo in lignes:
+        ville = quote(ville.lower())
+        if ville not in rang_ville:
+            rang_ville[ville] = len(villes)
+            villes.append(ville)
+        colonnes["ids"].append(pk)
+        colonnes["lat"].append(round(lat, DECIMALES))
+        colonnes["lng"].append(round(lng, DECIMALES))
+        colonnes["categorie"].append(rang_categorie[categorie_id])
+        colonnes["ville"].append(rang_ville[ville])
+        colonnes["slug"].append(slug)
+        colonnes["nom"].append(nom)
+        colonnes["photo"].append(photo_small or photo or "")
+
+    return {
+        # /<departement>/__ville__/__slug__/ : même URL que Store.get_absolute_url
+        "modele_url": reverse("store_details", args=[departement.lower(), "__ville__", "__slug__"]),
+        "media": default_storage.url(""),
+        "categories": categories,
+        "villes": villes,
+        **colonnes,
+    }
+
+
+def donnees_carte(departement):
+    """{"json": bytes, "gzip": bytes} de la carte, depuis le cache si à jour."""
+    cle = PREFIXE_CARTE + departement.lower()
+    etiquettes = [ETIQUETTE_GLOBALE, etiquette_departement(departement)]
+    en_cache = cache.get_many([cle] + etiquettes)
+    versions = versions_etiquettes(en_cache, etiquettes)
+
+    entree = en_cache.get(cle)
+    if entree is None or entree["versions"] != versions:
+        contenu = json.dumps(
+            construire(departement), separators=(",", ":"), ensure_ascii=False
+        ).encode("utf-8")
+        entree = {
+            "versions": versions,
+            "json": contenu,
+            # mtime=0 : même version, mêmes octets
+            "gzip": gzip.compress(contenu, mtime=0),
+        }
+        cache.set(cle, entree, DUREE_CARTE)
+    return entree
@@ -1,6 +1,4 @@
-import unicodedata
-from urllib.parse import unquote
-from .models import Store, Category, SuperCategory
+from .navigation import navigation_pour_requete
 
 def menu_context(request):
     """
@@ -12,116 +10,27 @@ def menu_context(request):
     Si l'URL ne contient pas de ville (pages neutres comme /notre-projet/,
     /mes-favoris/, etc.), on utilise les cookies yuumi_departement et
     yuumi_ville comme fallback pour maintenir le contexte de navigation.
-    """
-    # Découpe du chemin
-    path_parts = [unquote(p) for p in request.path.strip("/").split("/") if p]
-
-    departement = ""
-    ville = ""
-    categories = []
-
-    # Départements existants — clé lowercase, valeur réelle en base
-    deps_map = {
-        d.lower(): d
-        for d in Store.objects.values_list("departement", flat=True).distinct()
-    }
-
-    # Cas : /carte/<departement>/
-    if len(path_parts) >= 2 and path_parts[0] == "carte" and path_parts[1] in deps_map:
-        departement = deps_map[path_parts[1]]
-
-    # Cas : /<departement>/<ville>/...
-    elif len(path_parts) >= 2 and path_parts[0] in deps_map:
-        departement = deps_map[path_parts[0]]
-        villes_map = {
-            v.lower(): v
-            for v in Store.objects.filter(
-                departement=departement
-            ).values_list("ville", flat=True).distinct()
-        }
-        ville = villes_map.get(path_parts[1], path_parts[1])
-
-    # -------------------------------------------------------
-    # 🍪 Fallback cookie : si l'URL ne contient pas de ville,
-    # on récupère la dernière ville visitée depuis le cookie.
-    # -------------------------------------------------------
-    if not ville:
-        cookie_dep   = request.COOKIES.get("yuumi_departement", "")
-        cookie_ville = request.COOKIES.get("yuumi_ville", "")
-        if cookie_dep.lower() in deps_map and cookie_ville:
-            departement = deps_map[cookie_dep.lower()]
-            ville = cookie_ville
-
-    # -----------------------------------------
-    # 📌 Récupération des commerces concernés
-    # -----------------------------------------
-    qs = Store.objects.none()
 
-    if departement and ville:
-        qs = Store.objects.filter(
-            departement__iexact=departement,
-            ville__iexact=ville
-        )
-    elif departement:
-        qs = Store.objects.filter(
-            departement__iexact=departement
-        )
-
-    # -----------------------------------------
-    # 📌 menu_categories (compatibilité)
-    # -----------------------------------------
-    if qs.exists():
-        categories = list(
-            qs.values_list("categorie__name", flat=True).distinct()
-        )
-        categories = [c for c in categories if c]
-        
-    # -----------------------------------------
-    # 📌 menu_supercategories (100% dynamique)
-    # -----------------------------------------
-    menu_supercategories = {}
-    for super_cat in SuperCategory.objects.all():
-        menu_supercategories[super_cat.name] = {
-            "items": []
-        }
-    for store in qs.select_related("categorie__super_categorie", "categorie__categorie_intermediaire"):
-        if not store.categorie or not store.categorie.super_categorie:
-            continue
-        super_cat = store.categorie.super_categorie
-        cat_inter = store.categorie.categorie_intermediaire
-
-        if cat_inter:
-            existing = next((i for i in menu_supercategories[super_cat.name]["items"] if i.get("type") == "inter" and i["obj"] == cat_inter), None)
-            if not existing:
-                menu_supercategories[super_cat.name]["items"].append({
-                    "type": "inter",
-                    "obj": cat_inter,
-                    "name": cat_inter.name,
-                    "cats": []
-                })
-                existing = menu_supercategories[super_cat.name]["items"][-1]
-            if store.categorie not in existing["cats"]:
-                existing["cats"].append(store.categorie)
-        else:
-            existing = next((i for i in menu_supercategories[super_cat.name]["items"] if i.get("type") == "direct" and i["obj"] == store.categorie), None)
-            if not existing:
-                menu_supercategories[super_cat.name]["items"].append({
-                    "type": "direct",
-                    "obj": store.categorie,
-                    "name": store.categorie.name,
-                })
-
-    for super_cat_name in menu_supercategories:
-        menu_supercategories[super_cat_name]["items"].sort(
-            key=lambda x: unicodedata.normalize("NFD", x["name"].lower()).encode("ascii", "ignore").decode()
-        )
+    L'arbre est précalculé par emplacement et lu dans le cache partagé
+    (voir navigation.py), puis mémorisé sur la requête : une page qui rend
+    plusieurs templates ne paie qu'un seul aller-retour Redis.
+    """
+    contexte = getattr(request, "_yuumi_menu_context", None)
+    if contexte is None:
+        contexte = navigation_pour_requete(request)
+        request._yuumi_menu_context = contexte
+    return contexte
 
-    return {
-        "menu_categories": categories,
-        "menu_supercategories": menu_supercategories,
-        "menu_departement": departement,
-        "menu_ville": ville,
-    }
+def csrf_page(request):
+    """
+    Pendant le rendu d'une page destinée au cache des pages anonymes (voir
+    cache_pages.py), remplace le jeton CSRF par un marqueur : le vrai jeton
+    est inséré à chaque service de la page.
+    """
+    if getattr(request, "_yuumi_page_en_cache", False):
+        from .cache_pages import MARQUEUR_CSRF
+        return {"csrf_token": MARQUEUR_CSRF}
+    return {}
 
 def ai_agent_visible(request):
     """
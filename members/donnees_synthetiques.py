@@ -0,0 +1,349 @@
+# members/donnees_synthetiques.py
+#
+# Jeu de données synthétique à grande échelle (commande
+# `python manage.py generer_donnees_synthetiques`), pour mesurer les vues
+# publiques sur un catalogue de la taille visée (50 000 commerces,
+# 1 million de produits, 10 millions de vues) au lieu des quelques lignes
+# des tests. Voir bench_vues.py pour le banc de mesure.
+#
+# - départements et villes inventés (aucune collision avec de vraies
+#   villes), commerces répartis très inégalement entre les villes (loi de
+#   puissance) comme en réalité ;
+# - hiérarchie super catégorie / catégorie intermédiaire / catégorie
+#   réaliste, réutilisée si elle existe déjà ;
+# - horaires par type de commerce, dont des créneaux qui passent minuit
+#   (bars) et des commerces sans horaires ;
+# - familles et produits, vues et clics étalés sur JOURS, concentrés sur
+#   les commerces populaires ;
+# - tout est écrit en bulk_create, par lots : ni save(), ni signaux, ni
+#   historique. Les champs calculés par save() (ville du référentiel,
+#   horaires compilés et créneaux, cellule geohash) sont donc remplis ici,
+#   puis l'index de recherche, les statistiques journalières et la
+#   popularité sont recalculés en une fois et les caches périmés.
+#
+# Les commerces générés ont un slug préfixé par PREFIXE : purger() les
+# retrouve (avec tout ce qui en dépend) sans toucher aux vrais.
+
+import random
+from datetime import time, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+PREFIXE = "synth-"
+TAILLE_LOT = 5000
+JOURS = 90
+
+# Bornes des départements inventés (France métropolitaine)
+LATITUDES = (43.0, 50.5)
+LONGITUDES = (-1.5, 7.5)
+
+RACINES = [
+    "Vernaise", "Loirance", "Morvelle", "Sarthois", "Brémontais", "Aubrac", "Calvane",
+    "Durancel", "Gévaudois", "Lirançon", "Orvaise", "Quercelle", "Rouvergne", "Valdorne",
+    "Ternois", "Cévenol", "Argonnais", "Béthanie", "Corbière", "Morinie",
+]
+QUALIFICATIFS = ["", "Haute-", "Basse-", "Petite-", "Grande-"]
+DEBUTS_VILLE = ["Saint-", "Sainte-", "Mont-", "Val-", "Bourg-", "Villeneuve-", "", "", ""]
+NOYAUX_VILLE = [
+    "Aubin", "Brice", "Crépin", "Denis", "Étienne", "Florent", "Gervais", "Hilaire",
+    "Julien", "Laurent", "Marcel", "Nazaire", "Omer", "Pierre", "Quentin", "Rémy",
+    "Sauveur", "Thibault", "Urbain", "Vivien", "Marly", "Chaumont", "Roche", "Fontaine",
+]
+SUFFIXES_VILLE = ["", "", "", "-sur-Loire", "-les-Bains", "-en-Forêt", "-le-Vieux", "-d'en-Haut"]
+
+# Horaires types : {jours: [(ouverture, fermeture), (ouverture, fermeture)]}
+# (matin, après-midi). fermeture <= ouverture : le créneau passe minuit.
+HORAIRES = {
+    "commerce": {("mardi", "mercredi", "jeudi", "vendredi", "samedi"): [(time(9), time(12)), (time(14), time(19))]},
+    "boulangerie": {
+        ("mardi", "mercredi", "jeudi", "vendredi", "samedi"): [(time(6, 30), time(13)), (time(15, 30), time(19, 30))],
+        ("dimanche",): [(time(7), time(12, 30)), None],
+    },
+    "continu": {("lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi"): [(time(8), time(20)), None]},
+    "restaurant": {("mardi", "mercredi", "jeudi", "vendredi", "samedi"): [(time(12), time(14)), (time(19), time(22, 30))]},
+    "nuit": {
+        ("mercredi", "jeudi"): [None, (time(18), time(1))],
+        ("vendredi", "samedi"): [None, (time(18), time(2))],
+    },
+    "tous_les_jours": {
+        ("lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"): [(time(7), time(22)), None],
+    },
+}
+
+# (super catégorie, [(catégorie intermédiaire ou None, [(catégorie, horaires)])], vocabulaire)
+CATALOGUE = [
+    ("Alimentation", [
+        ("Commerces de bouche", [("Boulangerie", "boulangerie"), ("Boucherie", "commerce"), ("Fromagerie", "commerce")]),
+        (None, [("Épicerie fine", "commerce"), ("Caviste", "commerce"), ("Primeur", "continu")]),
+    ], ["Pain", "Terrine", "Confiture", "Fromage", "Vin", "Miel", "Huile", "Chocolat", "Biscuit", "Jambon"]),
+    ("Restauration", [
+        ("Restaurants", [("Restaurant", "restaurant"), ("Pizzeria", "restaurant")]),
+        ("Bars", [("Bar", "nuit"), ("Bar à cocktails", "nuit")]),
+        (None, [("Salon de thé", "commerce")]),
+    ], ["Menu", "Plat", "Dessert", "Cocktail", "Bière", "Thé", "Pizza", "Salade", "Formule", "Planche"]),
+    ("Maison & déco", [
+        (None, [("Fleuriste", "commerce"), ("Jardinerie", "continu"), ("Quincaillerie", "commerce")]),
+    ], ["Bouquet", "Plante", "Vase", "Outil", "Graines", "Pot", "Bougie", "Coussin", "Lampe", "Tapis"]),
+    ("Culture & loisirs", [
+        (None, [("Librairie", "commerce"), ("Disquaire", "commerce"), ("Jeux de société", "commerce")]),
+    ], ["Roman", "Bande dessinée", "Vinyle", "Jeu", "Puzzle", "Carnet", "Affiche", "Guide", "Album", "Livre"]),
+    ("Services", [
+        (None, [("Pharmacie", "continu"), ("Laverie", "tous_les_jours"), ("Coiffeur", "commerce")]),
+    ], ["Soin", "Crème", "Lavage", "Coupe", "Brushing", "Séchage", "Savon", "Shampoing", "Baume", "Sérum"]),
+]
+QUALITES = ["maison", "artisanal", "bio", "de saison", "du terroir", "à l'ancienne", "premium", "local"]
+
+
+def _noms_uniques(aleatoire, nombre, *parties):
+    """nombre noms distincts, assemblés à partir des listes parties."""
+    from itertools import product
+
+    candidats = sorted({"".join(morceaux) for morceaux in product(*parties)})
+    noms = aleatoire.sample(candidats, min(nombre, len(candidats)))
+    # Au-delà des combinaisons possibles : mêmes noms numérotés
+    noms += [f"{candidats[i % len(candidats)]}-{i // len(candidats) + 1}" for i in range(nombre - len(noms))]
+    return noms
+
+
+def _poids_zipf(nombre, exposant, aleatoire):
+    """Poids cumulés d'une loi de puissance, dans un ordre aléatoire."""
+    poids = [1 / (rang + 1) ** exposant for rang in range(nombre)]
+    aleatoire.shuffle(poids)
+    cumules, total = [], 0.0
+    for p in poids:
+        total += p
+        cumules.append(total)
+    return cumules
+
+
+def _categories():
+    """[(Category, horaires, vocabulaire)], créées au besoin."""
+    from django.utils.text import slugify
+
+    from .models import CategorieIntermediaire, Category, SuperCategory
+
+    resultat = []
+    for ordre, (nom_super, groupes, vocabulaire) in enumerate(CATALOGUE):
+        sc, _ = SuperCategory.objects.get_or_create(
+            slug=slugify(nom_super), defaults={"name": nom_super, "ordre": ordre},
+        )
+        for nom_inter, categories in groupes:
+            inter = None
+            if nom_inter:
+                inter, _ = CategorieIntermediaire.objects.get_or_create(
+                    slug=slugify(nom_inter), defaults={"name": nom_inter, "super_categorie": sc},
+                )
+            for nom, horaires in categories:
+                categorie, _ = Category.objects.get_or_create(
+                    slug=slugify(nom), super_categorie=sc,
+                    defaults={"name": nom, "categorie_intermediaire": inter},
+                )
+                resultat.append((categorie, horaires, vocabulaire))
+    return resultat
+
+
+def _villes(aleatoire, departements, villes_par_departement):
+    """[(City, lat, lng)] : départements et villes inventés."""
+    from .models import City, Departement, cle_emplacement
+
+    noms_dep = _noms_uniques(aleatoire, departements, QUALIFICATIFS, RACINES)
+    villes = []
+    for nom_dep in noms_dep:
+        departement, _ = Departement.objects.get_or_create(
+            slug=cle_emplacement(nom_dep), defaults={"nom": nom_dep},
+        )
+        centre = (aleatoire.uniform(*LATITUDES), aleatoire.uniform(*LONGITUDES))
+        noms = _noms_uniques(aleatoire, villes_par_departement, DEBUTS_VILLE, NOYAUX_VILLE, SUFFIXES_VILLE)
+        for nom in noms:
+            city, _ = City.objects.get_or_create(
+                departement=departement, slug=cle_emplacement(nom), defaults={"nom": nom},
+            )
+            villes.append((city, centre[0] + aleatoire.uniform(-0.4, 0.4), centre[1] + aleatoire.uniform(-0.5, 0.5)))
+    return villes
+
+
+def _horaires(modele):
+    champs = {}
+    for jours, creneaux in HORAIRES[modele].items():
+        for jour in jours:
+            for periode, creneau in zip(("matin", "apresmidi"), creneaux):
+                if creneau:
+                    champs[f"{jour}_{periode}_ouverture"], champs[f"{jour}_{periode}_fermeture"] = creneau
+    return champs
+
+
+def _commerces(aleatoire, nombre, villes, categories, journal):
+    """Crée les commerces par lots ; renvoie [(pk, vocabulaire)]."""
+    from .geo import encoder_geohash
+    from .horaires import compiler_horaires, tranches_journalieres
+    from .models import Store, StoreOpeningInterval
+
+    poids_villes = _poids_zipf(len(villes), 1.1, aleatoire)
+    numero_depart = Store.objects.filter(slug__startswith=PREFIXE).count()
+    crees = []
+    for debut in range(0, nombre, TAILLE_LOT):
+        lot = []
+        for numero in range(debut, min(debut + TAILLE_LOT, nombre)):
+            city, lat, lng = aleatoire.choices(villes, cum_weights=poids_villes)[0]
+            categorie, modele, vocabulaire = aleatoire.choice(categories)
+            lat, lng = round(lat + aleatoire.gauss(0, 0.01), 6), round(lng + aleatoire.gauss(0, 0.01), 6)
+            store = Store(
+                nom=f"{categorie.name} {aleatoire.choice(NOYAUX_VILLE)} {numero_depart + numero + 1}",
+                slug=f"{PREFIXE}{numero_depart + numero + 1}",
+                city=city, departement=city.departement.nom, ville=city.nom, ville_precise=city.nom,
+                categorie=categorie,
+                descriptionpetite=f"{categorie.name} de quartier à {city.nom}.",
+                descriptiongrande=(
+                    f"{categorie.name} indépendante : {', '.join(aleatoire.sample(vocabulaire, 3)).lower()} "
+                    f"{aleatoire.choice(QUALITES)}, conseils et accueil."
+                ),
+                addressemaps=f"{aleatoire.randint(1, 120)} rue {aleatoire.choice(NOYAUX_VILLE)}, {city.nom}",
+                latitude=lat, longitude=lng, geo_cell=encoder_geohash(lat, lng),
+                # Un commerce sur dix sans horaires renseignés
+                **(_horaires(modele) if aleatoire.random() > 0.1 else {}),
+            )
+            store.horaires_compiles = compiler_horaires(store)
+            lot.append((store, vocabulaire))
+
+        Store.objects.bulk_create([store for store, _ in lot])
+        StoreOpeningInterval.objects.bulk_create([
+            StoreOpeningInterval(store=store, debut=d, fin=f)
+            for store, _ in lot
+            for d, f in tranches_journalieres(store.horaires_compiles)
+        ], batch_size=TAILLE_LOT)
+        crees.extend((store.pk, vocabulaire) for store, vocabulaire in lot)
+        journal(f"{len(crees)} commerces")
+    return crees
+
+
+def _produits(aleatoire, commerces, nombre, journal):
+    from .models import Product, ProductFamily
+
+    if not commerces or not nombre:
+        return 0
+    moyenne = nombre / len(commerces)
+    crees = 0
+    for debut in range(0, len(commerces), TAILLE_LOT // 10):
+        familles, contenus, en_attente = [], [], 0
+        for pk, vocabulaire in commerces[debut:debut + TAILLE_LOT // 10]:
+            # Catalogues très inégaux : beaucoup de petits, quelques gros
+            n = min(nombre - crees - en_attente, round(aleatoire.expovariate(1 / moyenne)))
+            if n <= 0:
+                continue
+            noms_familles = aleatoire.sample(vocabulaire, min(n, aleatoire.randint(1, 4)))
+            for f, nom_famille in enumerate(noms_familles):
+                familles.append(ProductFamily(store_id=pk, nom=f"{nom_famille}s"))
+                contenus.append([
+                    f"{nom_famille} {aleatoire.choice(QUALITES)} n°{i + 1}"
+                    for i in range(f, n, len(noms_familles))
+                ])
+            en_attente += n
+        ProductFamily.objects.bulk_create(familles, batch_size=TAILLE_LOT)
+        produits = [
+            Product(family=famille, nom=nom)
+            for famille, noms in zip(familles, contenus)
+            for nom in noms
+        ]
+        Product.objects.bulk_create(produits, batch_size=TAILLE_LOT)
+        crees += len(produits)
+        journal(f"{crees} produits")
+    return crees
+
+
+def _evenements(aleatoire, commerces, vues, clics, jours, journal):
+    from .models import Click, PageView
+
+    if not commerces:
+        return
+    ids = [pk for pk, _ in commerces]
+    poids = _poids_zipf(len(ids), 0.9, aleatoire)
+    maintenant = timezone.now()
+    secondes = jours * 24 * 3600
+    types = [valeur for valeur, _ in Click.TYPE_CHOICES]
+
+    for modele, nombre, libelle in ((PageView, vues, "vues"), (Click, clics, "clics")):
+        for debut in range(0, nombre, TAILLE_LOT):
+            taille = min(TAILLE_LOT, nombre - debut)
+            stores = aleatoire.choices(ids, cum_weights=poids, k=taille)
+            instants = [maintenant - timedelta(seconds=aleatoire.randrange(secondes)) for _ in range(taille)]
+            if modele is PageView:
+                lignes = [
+                    PageView(store_id=s, session_id=f"{PREFIXE}{aleatoire.randrange(nombre // 3 + 1)}", timestamp=t)
+                    for s, t in zip(stores, instants)
+                ]
+            else:
+                lignes = [
+                    Click(store_id=s, type_click=aleatoire.choice(types), created_at=t)
+                    for s, t in zip(stores, instants)
+                ]
+            modele.objects.bulk_create(lignes)
+            journal(f"{debut + taille} {libelle}")
+
+
+def _finaliser(journal):
+    """Ce que save() et les signaux auraient fait : index, statistiques, caches."""
+    from .annuaire import invalider_annuaire
+    from .cache_pages import invalider_tout
+    from .recherche import reconstruire_index
+    from .statistiques import agreger, calculer_popularite, premier_jour_brut
+
+    with transaction.atomic():
+        journal(f"{reconstruire_index()} entrées d'index de recherche")
+    depuis = premier_jour_brut()
+    if depuis:
+        journal(f"{agreger(depuis, timezone.localdate())} lignes de statistiques")
+    journal(f"{calculer_popularite()} scores de popularité")
+    invalider_annuaire()
+    invalider_tout()
+
+
+def generer(commerces=50000, produits=1000000, vues=10000000, clics=1000000,
+            departements=20, villes_par_departement=25, jours=JOURS, graine=1,
+            journal=lambda message: None):
+    """
+    Génère le jeu de données (voir l'en-tête) ; journal(message) suit la
+    progression. Renvoie {departements, villes, categories, commerces,
+    produits, vues, clics} créés.
+    """
+    aleatoire = random.Random(graine)
+    categories = _categories()
+    villes = _villes(aleatoire, departements, villes_par_departement)
+    crees = _commerces(aleatoire, commerces, villes, categories, journal)
+    nb_produits = _produits(aleatoire, crees, produits, journal)
+    _evenements(aleatoire, crees, vues, clics, jours, journal)
+    _finaliser(journal)
+    return {
+        "departements": departements,
+        "villes": len(villes),
+        "categories": len(categories),
+        "commerces": len(crees),
+        "produits": nb_produits,
+        "vues": vues if crees else 0,
+        "clics": clics if crees else 0,
+    }
+
+
+def purger(journal=lambda message: None):
+    """
+    Supprime les commerces générés (et, en cascade, produits, vues, clics,
+    statistiques), puis les villes et départements restés vides. Sans
+    historique : ces commerces n'en ont jamais eu.
+    """
+    from django.test.utils import override_settings
+
+    from .models import City, Departement, Store
+
+    supprimes = 0
+    with override_settings(SIMPLE_HISTORY_ENABLED=False):
+        while True:
+            lot = list(Store.objects.filter(slug__startswith=PREFIXE).values_list("pk", flat=True)[:TAILLE_LOT // 5])
+            if not lot:
+                break
+            Store.objects.filter(pk__in=lot).delete()
+            supprimes += len(lot)
+            journal(f"{supprimes} commerces supprimés")
+    City.objects.filter(stores__isnull=True, mises_en_avant__isnull=True).delete()
+    Departement.objects.filter(villes__isnull=True).delete()
+    _finaliser(journal)
+    return supprimes
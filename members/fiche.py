@@ -0,0 +1,132 @@
+# members/fiche.py
+#
+# Chargement de la fiche commerce (vue store_details) en un nombre FIXE de
+# requêtes, quelle que soit la taille du catalogue.
+#
+# Avant : store.families.all() était lu deux fois (formsets, puis lignes du
+# catalogue), chaque famille relançait family.products.all(), le gabarit
+# comptait et relisait store.images et store.galerie_images plusieurs fois,
+# store.categorie et store.owner étaient chargés à la demande, et les
+# favoris / défavoris de l'utilisateur étaient entièrement matérialisés
+# pour un simple test d'appartenance. Ici :
+#
+# - charger_commerce : le commerce (catégorie, propriétaire) + familles,
+#   produits, images et galerie en prefetch -> 5 requêtes, fixes ;
+# - relations_utilisateur : favori, défavori et note en UNE requête
+#   (sous-requêtes EXISTS), les listes d'envies en une autre ;
+# - elements_revalidation : ce que l'ETag de la fiche ajoute aux étiquettes
+#   (revalidation.py), sans SQL tant que la ville n'a pas changé.
+
+import time
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
+from django.shortcuts import get_object_or_404
+
+from .annuaire import filtre_ville
+
+PRODUITS_PAR_LIGNE = 4
+
+PREFIXE_HORAIRES = "yuumi_fiche_horaires:"
+SEMAINE = 60 * 60 * 24 * 7
+
+
+def charger_commerce(departement, ville, slug):
+    """Le commerce de la fiche, relations affichées préchargées (ou 404)."""
+    from .models import ProductFamily, Store
+
+    commerces = (
+        Store.objects
+        .select_related("categorie", "owner")
+        .prefetch_related(
+            Prefetch("families", queryset=ProductFamily.objects.prefetch_related("products")),
+            "images",
+            "galerie_images",
+        )
+    )
+    return get_object_or_404(commerces, slug=slug, **filtre_ville(departement, ville))
+
+
+def lignes_catalogue(store):
+    """[{family, rows}] : produits de chaque famille par lignes de 4 (complétées par None)."""
+    familles = []
+    for family in store.families.all():
+        products = list(family.products.all())
+        rows = [products[i:i + PRODUITS_PAR_LIGNE] for i in range(0, len(products), PRODUITS_PAR_LIGNE)]
+        if rows:
+            rows[-1].extend([None] * (PRODUITS_PAR_LIGNE - len(rows[-1])))
+        familles.append({"family": family, "rows": rows})
+    return familles
+
+
+def relations_utilisateur(user, store, premium):
+    """
+    {is_favorite, is_unfavorite, user_wishlists, store_note_text} pour la
+    fiche. Listes d'envies et note : réservées aux comptes premium.
+    """
+    from .models import Store, StoreNote, WishlistStore
+
+    relations = {
+        "is_favorite": False,
+        "is_unfavorite": False,
+        "user_wishlists": [],
+        "store_note_text": "",
+    }
+    if not user.is_authenticated:
+        return relations
+
+    Favori = type(user).favoris.through
+    Defavori = type(user).unfavoris.through
+    drapeaux = {
+        "favori": Exists(Favori.objects.filter(user_id=user.pk, store_id=OuterRef("pk"))),
+        "defavori": Exists(Defavori.objects.filter(user_id=user.pk, store_id=OuterRef("pk"))),
+    }
+    if premium:
+        drapeaux["note"] = Subquery(
+            StoreNote.objects.filter(user_id=user.pk, store_id=OuterRef("pk")).values("text")[:1]
+        )
+    ligne = Store.objects.filter(pk=store.pk).values(**drapeaux).get()
+    relations["is_favorite"] = ligne["favori"]
+    relations["is_unfavorite"] = ligne["defavori"]
+
+    if premium:
+        relations["store_note_text"] = ligne["note"] or ""
+        listes = user.wishlists.annotate(
+            has_store=Exists(WishlistStore.objects.filter(wishlist_id=OuterRef("pk"), store_id=store.pk))
+        )
+        relations["user_wishlists"] = [
+            {"id": w.id, "name": w.name, "has_store": w.has_store} for w in listes
+        ]
+    return relations
+
+
+def elements_revalidation(request, versions, departement, ville, slug):
+    """
+    [id, minute de la prochaine ouverture / fermeture] du commerce, pour
+    l'ETag de la fiche : l'état "ouvert / fermé" affiché change sans qu'aucun
+    signal ne parte. None si le commerce n'existe pas (la vue fera le 404).
+    """
+    from .cache_pages import DUREE_ETIQUETTE, etiquette_ville
+    from .horaires import secondes_avant_transition
+    from .models import Store
+
+    # Clé datée par la version de l'étiquette de la ville : toute
+    # modification d'un commerce de la ville la périme (voir signals.py)
+    version = versions[etiquette_ville(departement, ville)]
+    cle = f"{PREFIXE_HORAIRES}{version}:{departement.lower()}|{ville.lower()}|{slug}"
+    ligne = cache.get(cle)
+    if ligne is None:
+        ligne = (
+            Store.objects
+            .filter(slug=slug, **filtre_ville(departement, ville))
+            .values("pk", "horaires_compiles")
+            .first()
+        )
+        if ligne is None:
+            return None
+        cache.set(cle, ligne, DUREE_ETIQUETTE)
+
+    secondes = secondes_avant_transition([Store(horaires_compiles=ligne["horaires_compiles"])], SEMAINE)
+    # Instant de la transition, stable d'une requête à l'autre jusqu'à elle
+    transition = int(time.time() + secondes) // 60 if secondes < SEMAINE else ""
+    return [ligne["pk"], transition]
@@ -7,8 +7,7 @@ from django.core.exceptions import ValidationError
 from dal import autocomplete
 from .models import Store, ProductFamily, Product, StoreSuggestion
 from django.utils.safestring import mark_safe
-from .utils import convert_to_webp, resize_and_convert
-from django.utils.text import slugify
+from .utils import convert_to_webp
 
 # -------------------------------
 # Formulaire famille
@@ -122,16 +121,9 @@ class StoreForm(forms.ModelForm):
 
 
     def save(self, commit=True):
+        # La nouvelle photo est enregistrée telle quelle : Store.save()
+        # planifie le redimensionnement et les variantes (voir images.py).
         store = super().save(commit=False)
-        if 'photo' in self.changed_data and self.cleaned_data.get('photo'):
-            nom = slugify(store.nom)
-            ville = slugify(store.ville)
-            categorie = slugify(store.categorie.categorie_singulier or store.categorie.name) if store.categorie else "commerce"
-            store.photo = resize_and_convert(
-                self.cleaned_data['photo'],
-                name=f"{nom}-{categorie}-a-{ville}",
-                max_width=1200,
-            )
         if commit:
             store.save()
         return store
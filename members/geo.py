@@ -0,0 +1,175 @@
+# members/geo.py
+#
+# Index spatial des commerces : chaque Store porte une cellule geohash
+# (Store.geo_cell, indexée), calculée dès que latitude/longitude sont connues.
+#
+# Un filtre "dans un rayon de X km" se fait alors en deux temps :
+# 1. préfiltre SQL : cellules qui recouvrent la boîte englobante du cercle
+#    (recherche par index) + bornes lat/lng de la boîte ;
+# 2. distance exacte (haversine) calculée en un seul passage sur les seuls
+#    survivants, à partir de tuples (id, lat, lng) — jamais d'objets Store.
+#
+# Le tri "les plus proches" reste en SQL (distance équirectangulaire, exacte
+# à quelques mètres près à l'échelle d'un département), ce qui garde la
+# pagination côté base.
+
+import math
+
+from django.db.models import ExpressionWrapper, F, FloatField
+
+RAYON_TERRE_KM = 6371.0
+KM_PAR_DEGRE = math.pi * RAYON_TERRE_KM / 180
+
+# Précision 5 : cellules d'environ 4,9 km x 4,9 km (3,4 km de large en France)
+PRECISION_CELLULE = 5
+# Au-delà, la liste IN (...) coûte plus qu'elle ne rapporte : bornes seules
+MAX_CELLULES = 120
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encoder_geohash(lat, lng, precision=PRECISION_CELLULE):
+    """Geohash standard (base32) du point, sur precision caractères."""
+    lat_min, lat_max = -90.0, 90.0
+    lng_min, lng_max = -180.0, 180.0
+    cellule = []
+    bits = 0
+    nb_bits = 0
+    pair = True   # les bits pairs découpent la longitude
+    while len(cellule) < precision:
+        if pair:
+            milieu = (lng_min + lng_max) / 2
+            if lng >= milieu:
+                bits = (bits << 1) | 1
+                lng_min = milieu
+            else:
+                bits <<= 1
+                lng_max = milieu
+        else:
+            milieu = (lat_min + lat_max) / 2
+            if lat >= milieu:
+                bits = (bits << 1) | 1
+                lat_min = milieu
+            else:
+                bits <<= 1
+                lat_max = milieu
+        pair = not pair
+        nb_bits += 1
+        if nb_bits == 5:
+            cellule.append(_BASE32[bits])
+            bits = 0
+            nb_bits = 0
+    return "".join(cellule)
+
+
+def taille_cellule(precision=PRECISION_CELLULE):
+    """(hauteur, largeur) d'une cellule en degrés."""
+    bits = 5 * precision
+    bits_lng = (bits + 1) // 2
+    bits_lat = bits // 2
+    return 180.0 / (1 << bits_lat), 360.0 / (1 << bits_lng)
+
+
+def boite_englobante(lat, lng, rayon_km):
+    """(lat_min, lat_max, lng_min, lng_max) du carré qui contient le cercle."""
+    delta_lat = rayon_km / KM_PAR_DEGRE
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    delta_lng = rayon_km / (KM_PAR_DEGRE * cos_lat)
+    return (
+        max(lat - delta_lat, -90.0),
+        min(lat + delta_lat, 90.0),
+        max(lng - delta_lng, -180.0),
+        min(lng + delta_lng, 180.0),
+    )
+
+
+def cellules_couvrantes(boite, precision=PRECISION_CELLULE):
+    """
+    Cellules geohash qui recouvrent la boîte, ou None si elles sont trop
+    nombreuses (le préfiltre se limite alors aux bornes lat/lng).
+    """
+    lat_min, lat_max, lng_min, lng_max = boite
+    haut, large = taille_cellule(precision)
+    i_lat = range(math.floor((lat_min + 90) / haut), math.floor((lat_max + 90) / haut) + 1)
+    i_lng = range(math.floor((lng_min + 180) / large), math.floor((lng_max + 180) / large) + 1)
+    if len(i_lat) * len(i_lng) > MAX_CELLULES:
+        return None
+    return sorted({
+        encoder_geohash(
+            min(-90 + (i + 0.5) * haut, 90.0),
+            min(-180 + (j + 0.5) * large, 180.0),
+            precision,
+        )
+        for i in i_lat
+        for j in i_lng
+    })
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Distance à vol d'oiseau entre deux points GPS, en km (formule haversine,
+    approximation sphérique de la Terre — largement suffisante à l'échelle
+    d'une ville).
+    """
+    lat1_r, lng1_r, lat2_r, lng2_r = map(math.radians, [lat1, lng1, lat2, lng2])
+    dlat = lat2_r - lat1_r
+    dlng = lng2_r - lng1_r
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_r) * math.cos(lat2_r) * math.sin(dlng / 2) ** 2
+    return RAYON_TERRE_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def prefiltrer_boite(queryset, lat, lng, rayon_km):
+    """Préfiltre SQL : cellules (index) puis bornes exactes de la boîte."""
+    boite = boite_englobante(lat, lng, rayon_km)
+    cellules = cellules_couvrantes(boite)
+    if cellules is not None:
+        queryset = queryset.filter(geo_cell__in=cellules)
+    return queryset.filter(
+        latitude__range=(boite[0], boite[1]),
+        longitude__range=(boite[2], boite[3]),
+    )
+
+
+def distances_dans_rayon(queryset, lat, lng, rayon_km):
+    """
+    {store_id: distance_km} des commerces du queryset situés à rayon_km au
+    plus du point. Une seule requête (id, lat, lng) sur les survivants du
+    préfiltre, distance exacte calculée d'une traite en Python.
+    """
+    lignes = prefiltrer_boite(queryset, lat, lng, rayon_km).values_list(
+        "id", "latitude", "longitude"
+    )
+    lat_r = math.radians(lat)
+    lng_r = math.radians(lng)
+    cos_lat = math.cos(lat_r)
+    borne = math.sin(rayon_km / (2 * RAYON_TERRE_KM)) ** 2   # haversine du rayon
+
+    resultat = {}
+    for store_id, s_lat, s_lng in lignes:
+        s_lat_r = math.radians(s_lat)
+        a = (
+            math.sin((s_lat_r - lat_r) / 2) ** 2
+            + cos_lat * math.cos(s_lat_r) * math.sin((math.radians(s_lng) - lng_r) / 2) ** 2
+        )
+        if a <= borne:
+            resultat[store_id] = RAYON_TERRE_KM * 2 * math.asin(math.sqrt(a))
+    return resultat
+
+
+def filtrer_par_rayon(queryset, lat, lng, rayon_km):
+    """Restreint le queryset aux commerces situés dans le rayon."""
+    return queryset.filter(id__in=list(distances_dans_rayon(queryset, lat, lng, rayon_km)))
+
+
+def trier_par_proximite(queryset, lat, lng):
+    """
+    Tri "les plus proches d'abord", en SQL (distance équirectangulaire au
+    carré, suffisante pour ordonner). Les commerces sans coordonnées passent
+    en fin de liste.
+    """
+    k = math.cos(math.radians(lat))
+    d_lat = F("latitude") - lat
+    d_lng = (F("longitude") - lng) * k
+    return queryset.annotate(
+        distance_approx=ExpressionWrapper(d_lat * d_lat + d_lng * d_lng, output_field=FloatField())
+    ).order_by(F("distance_approx").asc(nulls_last=True), "nom")
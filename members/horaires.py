@@ -0,0 +1,180 @@
+# members/horaires.py
+#
+# Forme compilée des horaires d'un commerce.
+#
+# Les 28 TimeField de Store (4 par jour) sont pratiques pour la saisie, mais
+# impossibles à indexer : savoir si un commerce est ouvert demandait de
+# comparer champ par champ, en Python (fiche commerce) comme en SQL (filtre
+# "ouvert maintenant"). On les compile ici UNE fois, au save(), en une liste
+# triée d'intervalles [debut, fin) exprimés en minutes de la semaine
+# (0 = lundi 00h00, 10080 = lundi suivant 00h00).
+#
+# Cette liste est la seule source de vérité pour is_open_now,
+# get_opening_status et build_open_now_filter (voir views.py) : les trois
+# lisent la même forme compilée et restent donc cohérents entre eux.
+
+from bisect import bisect_right
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+JOURS = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+PERIODES = ["matin", "apresmidi"]
+
+MINUTES_PAR_JOUR = 24 * 60
+MINUTES_PAR_SEMAINE = 7 * MINUTES_PAR_JOUR
+
+FUSEAU = ZoneInfo("Europe/Paris")
+
+CHAMPS_HORAIRES = [
+    f"{jour}_{periode}_{borne}"
+    for jour in JOURS
+    for periode in PERIODES
+    for borne in ("ouverture", "fermeture")
+]
+
+
+def _en_minutes(t):
+    return t.hour * 60 + t.minute
+
+
+def _fusionner(intervalles):
+    """Trie et fusionne les intervalles qui se chevauchent ou se touchent."""
+    fusion = []
+    for debut, fin in sorted(intervalles):
+        if fusion and debut <= fusion[-1][1]:
+            fusion[-1][1] = max(fusion[-1][1], fin)
+        else:
+            fusion.append([debut, fin])
+    return fusion
+
+
+def compiler_horaires(store):
+    """
+    Transforme les champs horaires d'un Store (ou de n'importe quel objet qui
+    porte les mêmes attributs, ex: modèle historique dans une migration) en
+    liste triée et fusionnée d'intervalles [debut, fin) en minutes de la
+    semaine.
+
+    Reprend exactement la sémantique historique :
+    - un créneau n'est pris en compte que si ouverture ET fermeture sont
+      renseignées ;
+    - bornes inclusives (ouvert de 9h00 à 12h00 inclus -> [540, 721)) ;
+    - fermeture <= ouverture = créneau qui chevauche minuit (ex: bar 22h-2h),
+      qui se prolonge donc sur le lendemain. Le créneau du dimanche soir est
+      coupé en deux et reboucle sur le lundi 00h00.
+    """
+    bruts = []
+    for idx, jour in enumerate(JOURS):
+        base = idx * MINUTES_PAR_JOUR
+        for periode in PERIODES:
+            ouverture = getattr(store, f"{jour}_{periode}_ouverture", None)
+            fermeture = getattr(store, f"{jour}_{periode}_fermeture", None)
+            if ouverture is None or fermeture is None:
+                continue
+
+            debut = base + _en_minutes(ouverture)
+            fin = base + _en_minutes(fermeture) + 1
+            if fermeture <= ouverture:
+                fin += MINUTES_PAR_JOUR
+
+            if fin <= MINUTES_PAR_SEMAINE:
+                bruts.append((debut, fin))
+            else:
+                bruts.append((debut, MINUTES_PAR_SEMAINE))
+                bruts.append((0, fin - MINUTES_PAR_SEMAINE))
+
+    return _fusionner(bruts)
+
+
+def tranches_journalieres(intervalles):
+    """
+    Découpe les intervalles compilés aux frontières de jour. C'est la forme
+    stockée dans la table StoreOpeningInterval : une tranche ne dépasse
+    jamais 24h, ce qui permet de borner la recherche "ouvert à la minute M"
+    à une seule plage d'index sur debut (voir build_open_now_filter).
+    """
+    tranches = []
+    for debut, fin in intervalles:
+        while debut < fin:
+            fin_du_jour = (debut // MINUTES_PAR_JOUR + 1) * MINUTES_PAR_JOUR
+            coupure = min(fin, fin_du_jour)
+            tranches.append((debut, coupure))
+            debut = coupure
+    return tranches
+
+
+def minute_de_la_semaine(moment=None):
+    """Minute de la semaine (heure de Paris) pour moment, ou pour maintenant."""
+    if moment is None:
+        moment = datetime.now(tz=FUSEAU)
+    elif moment.tzinfo is not None:
+        moment = moment.astimezone(FUSEAU)
+    return moment.weekday() * MINUTES_PAR_JOUR + moment.hour * 60 + moment.minute
+
+
+def _intervalle_contenant(intervalles, minute):
+    idx = bisect_right(intervalles, minute, key=lambda iv: iv[0]) - 1
+    if idx >= 0 and intervalles[idx][1] > minute:
+        return intervalles[idx]
+    return None
+
+
+def est_ouvert(intervalles, minute):
+    """True si la minute de la semaine tombe dans un des intervalles (O(log n))."""
+    return _intervalle_contenant(intervalles, minute) is not None
+
+
+def prochaine_fermeture(intervalles, minute):
+    """
+    Minute (exclue) où se termine le créneau en cours, ou None si fermé.
+    Un créneau qui finit pile en fin de semaine et reprend lundi 00h00 est
+    traité comme un seul créneau : la valeur renvoyée dépasse alors 10080.
+    """
+    courant = _intervalle_contenant(intervalles, minute)
+    if courant is None:
+        return None
+    fin = courant[1]
+    if fin == MINUTES_PAR_SEMAINE and intervalles[0][0] == 0:
+        fin = MINUTES_PAR_SEMAINE + intervalles[0][1]
+    return fin
+
+
+def prochaine_ouverture(intervalles, minute):
+    """
+    Minute de la prochaine ouverture strictement après minute, ou None si
+    aucun horaire. Si elle tombe la semaine suivante, la valeur renvoyée
+    dépasse 10080 (on garde ainsi le décalage en jours exploitable).
+    """
+    if not intervalles:
+        return None
+    idx = bisect_right(intervalles, minute, key=lambda iv: iv[0])
+    if idx < len(intervalles):
+        return intervalles[idx][0]
+    return intervalles[0][0] + MINUTES_PAR_SEMAINE
+
+
+def prochaine_transition(intervalles, minute):
+    """
+    Minute de la prochaine ouverture ou fermeture après minute (même
+    convention que ci-dessus, peut dépasser 10080), ou None sans horaires.
+    """
+    fermeture = prochaine_fermeture(intervalles, minute)
+    return fermeture if fermeture is not None else prochaine_ouverture(intervalles, minute)
+
+
+def secondes_avant_transition(stores, maximum, moment=None):
+    """
+    Secondes avant la prochaine ouverture ou fermeture de l'un des
+    commerces, bornées à maximum : durée pendant laquelle un affichage
+    "ouvert / fermé" de ces commerces reste exact. 0 = déjà périmé.
+    """
+    if moment is None:
+        moment = datetime.now(tz=FUSEAU)
+    minute = minute_de_la_semaine(moment)
+    duree = maximum
+    for store in stores:
+        transition = prochaine_transition(store.horaires_compiles, minute)
+        if transition is not None:
+            # La minute en cours est déjà entamée de moment.second secondes
+            duree = min(duree, (transition - minute) * 60 - moment.second)
+    return max(duree, 0)
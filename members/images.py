@@ -0,0 +1,221 @@
+# members/images.py
+#
+# Traitement des images en arrière-plan (conversion WebP + variantes).
+#
+# Avant, chaque save() convertissait dans le thread de la requête : la photo
+# d'un commerce était décodée trois fois (1200/600/300 px, LANCZOS + WebP),
+# et une galerie de plusieurs photos pouvait dépasser le timeout de 30 s
+# d'un worker Gunicorn. Désormais :
+#
+# - le save() enregistre le fichier envoyé tel quel et crée un ImageJob ;
+# - après le commit, le job part dans un pool de threads (IMAGES_WORKERS) ;
+# - le worker décode l'original une seule fois, produit toutes les largeurs
+#   par réduction progressive (voir utils.produire_variantes), puis
+#   remplace les champs par les fichiers WebP ;
+# - tant que ce n'est pas fait, les templates affichent l'original (photo
+#   sans photo_medium/photo_small : le repli existe déjà dans les templates).
+#
+# La table ImageJob garde la trace de chaque traitement : un job perdu
+# (redémarrage du serveur pendant le traitement) est repris par
+# `python manage.py traiter_images`.
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .utils import produire_variantes
+
+logger = logging.getLogger(__name__)
+
+MAX_TENTATIVES = 3
+# Un job "en cours" depuis plus longtemps a été interrompu (worker arrêté)
+DELAI_JOB_PERDU = timedelta(minutes=10)
+
+# Modèles dont les images apparaissent dans le menu de navigation en cache
+MODELES_MENU = {"members.SuperCategory", "members.CategorieIntermediaire", "members.Category"}
+
+
+def _base(fichier):
+    return os.path.splitext(os.path.basename(fichier.name))[0]
+
+
+def _variantes_store(store, fichier):
+    ville = slugify(store.ville)
+    nom = slugify(store.nom)
+    cat = slugify(store.categorie.categorie_singulier or store.categorie.name) if store.categorie else "commerce"
+    return [
+        ("photo", 1200, f"{nom}-{cat}-a-{ville}"),
+        ("photo_medium", 600, f"{cat}-{nom}-a-{ville}"),
+        ("photo_small", 300, f"{nom}-{ville}"),
+    ]
+
+
+def _conversion_simple(champ):
+    """Conversion WebP sans redimensionnement, nom d'origine conservé."""
+    def variantes(instance, fichier):
+        return [(champ, None, _base(fichier))]
+    return variantes
+
+
+# (modèle, champ source) -> fonction (instance, fichier) -> [(champ cible, largeur, nom)]
+PIPELINES = {
+    ("members.Store", "photo"): _variantes_store,
+    ("members.StoreImage", "image"): _conversion_simple("image"),
+    ("members.StoreGalerieImage", "image"): _conversion_simple("image"),
+    ("members.SuperCategory", "image"): _conversion_simple("image"),
+    ("members.CategorieIntermediaire", "image"): _conversion_simple("image"),
+    ("members.Category", "image"): _conversion_simple("image"),
+    ("members.Category", "icon_perso"): _conversion_simple("icon_perso"),
+}
+
+
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(
+            max_workers=getattr(settings, "IMAGES_WORKERS", 2),
+            thread_name_prefix="yuumi-images",
+        )
+    return _pool
+
+
+def planifier_variantes(instance, champ):
+    """
+    Crée le job de traitement de instance.<champ> et le lance après le
+    commit de la transaction en cours (le worker doit voir le fichier et la
+    ligne en base). À appeler après super().save().
+    """
+    from .models import ImageJob
+
+    fichier = getattr(instance, champ)
+    if not fichier:
+        return None
+    job = ImageJob.objects.create(
+        modele=instance._meta.label,
+        objet_id=instance.pk,
+        champ=champ,
+        fichier_source=fichier.name,
+    )
+    transaction.on_commit(lambda: lancer_job(job.pk))
+    return job
+
+
+def lancer_job(job_id):
+    if getattr(settings, "IMAGES_SYNCHRONE", False):
+        traiter_job(job_id)
+    else:
+        _executor().submit(_traiter_dans_worker, job_id)
+
+
+def _traiter_dans_worker(job_id):
+    close_old_connections()
+    try:
+        traiter_job(job_id)
+    except Exception:
+        logger.exception("Traitement d'image %s : erreur inattendue", job_id)
+    finally:
+        # Chaque thread du pool a sa propre connexion : on la rend
+        connection.close()
+
+
+def traiter_job(job_id):
+    """
+    Exécute un job en attente. Renvoie True s'il a été pris par cet appel.
+    La prise est atomique (UPDATE ... WHERE statut = en_attente) : deux
+    workers ne traitent jamais le même job.
+    """
+    from .models import ImageJob
+
+    pris = ImageJob.objects.filter(pk=job_id, statut=ImageJob.EN_ATTENTE).update(
+        statut=ImageJob.EN_COURS, tentatives=F("tentatives") + 1, modifie_le=timezone.now(),
+    )
+    if not pris:
+        return False
+
+    job = ImageJob.objects.get(pk=job_id)
+    try:
+        _executer(job)
+    except Exception as e:
+        logger.error("Traitement d'image %s (%s.%s #%s) : %s",
+                     job.pk, job.modele, job.champ, job.objet_id, e, exc_info=True)
+        job.statut = ImageJob.ECHEC if job.tentatives >= MAX_TENTATIVES else ImageJob.EN_ATTENTE
+        job.erreur = str(e)[:1000]
+    else:
+        job.statut = ImageJob.TERMINE
+        job.erreur = ""
+    job.save(update_fields=["statut", "erreur", "modifie_le"])
+    return True
+
+
+def _executer(job):
+    modele = apps.get_model(job.modele)
+    instance = modele.objects.filter(pk=job.objet_id).first()
+    # Objet supprimé ou image remplacée depuis : un job plus récent s'en charge
+    if instance is None or getattr(instance, job.champ).name != job.fichier_source:
+        return
+
+    source = getattr(instance, job.champ)
+    variantes = PIPELINES[(job.modele, job.champ)](instance, source)
+    with source.open("rb"):
+        contenus = produire_variantes(source, [largeur for _, largeur, _ in variantes])
+
+    nouveaux = {}
+    for champ, largeur, nom in variantes:
+        field = instance._meta.get_field(champ)
+        nom_fichier = field.generate_filename(instance, f"{nom}.webp")
+        nouveaux[champ] = field.storage.save(nom_fichier, ContentFile(contenus[largeur]))
+
+    # Mise à jour conditionnelle : si l'image a changé pendant le traitement,
+    # on jette notre travail plutôt que d'écraser la nouvelle.
+    remplace = modele.objects.filter(
+        pk=instance.pk, **{job.champ: job.fichier_source}
+    ).update(**nouveaux)
+
+    storage = source.storage
+    if remplace:
+        if job.fichier_source not in nouveaux.values():
+            storage.delete(job.fichier_source)
+        if job.modele in MODELES_MENU:
+            from .navigation import invalider_navigation
+            invalider_navigation()
+        # Pages anonymes en cache : elles pointent vers l'image d'origine
+        from .cache_pages import invalider_pour
+        invalider_pour(instance)
+        if job.modele == "members.Store":
+            # Photos des marqueurs de la carte (voir tuiles.py)
+            from .tuiles import invalider_tuiles
+            invalider_tuiles(instance.departement)
+    else:
+        for nom_fichier in nouveaux.values():
+            storage.delete(nom_fichier)
+
+
+def reprendre_jobs(limite=None):
+    """
+    Traite dans le processus courant les jobs en attente, y compris ceux
+    restés "en cours" trop longtemps (worker interrompu). Renvoie le nombre
+    de jobs traités.
+    """
+    from .models import ImageJob
+
+    ImageJob.objects.filter(
+        statut=ImageJob.EN_COURS,
+        modifie_le__lt=timezone.now() - DELAI_JOB_PERDU,
+    ).update(statut=ImageJob.EN_ATTENTE)
+
+    ids = ImageJob.objects.filter(statut=ImageJob.EN_ATTENTE).order_by("cree_le").values_list("id", flat=True)
+    if limite:
+        ids = ids[:limite]
+    return sum(1 for job_id in list(ids) if traiter_job(job_id))
@@ -0,0 +1,186 @@
+# members/instrumentation.py
+#
+# Mesures par requête HTTP : nombre de requêtes SQL et temps passé en base,
+# succès / échecs du cache, temps de rendu des gabarits, durée totale.
+#
+# MesuresRequeteMiddleware les expose :
+# - dans l'en-tête Server-Timing (onglet Réseau du navigateur), si
+#   settings.SERVER_TIMING (par défaut : seulement en DEBUG) :
+#     sql;dur=12.4;desc="9 requetes", cache;desc="3 hits, 1 miss",
+#     gabarit;dur=8.0, total;dur=41.7
+# - dans un log JSON par requête (logger members.instrumentation, INFO) ;
+# - sur la réponse (response.mesures), pour les tests : BudgetRequetesMixin
+#   permet d'y affirmer un budget de requêtes par vue, pour qu'un N+1
+#   introduit dans une vue fasse échouer la CI.
+#
+# Les compteurs vivent dans une ContextVar : seul le travail fait dans le
+# thread de la requête est compté (pas les pools de l'agent IA).
+
+import contextvars
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_mesures = contextvars.ContextVar("yuumi_mesures_requete", default=None)
+
+_ABSENT = object()
+_installe = False
+
+
+def mesures_courantes():
+    """Compteurs de la requête en cours, ou None hors de mesurer()."""
+    return _mesures.get()
+
+
+def _chronometrer_sql(execute, sql, params, many, context):
+    mesures = _mesures.get()
+    if mesures is None:
+        return execute(sql, params, many, context)
+    debut = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        mesures["requetes"] += 1
+        mesures["sql_ms"] += (time.perf_counter() - debut) * 1000
+
+
+def _compter_cache(succes, echecs):
+    mesures = _mesures.get()
+    if mesures is not None:
+        mesures["cache_succes"] += succes
+        mesures["cache_echecs"] += echecs
+
+
+def _instrumenter_cache(cache):
+    """Enveloppe get / get_many d'une instance de cache (une seule fois)."""
+    if getattr(cache, "_yuumi_instrumente", False):
+        return
+    get, get_many = cache.get, cache.get_many
+
+    def get_compte(key, default=None, *args, **kwargs):
+        valeur = get(key, _ABSENT, *args, **kwargs)
+        trouve = valeur is not _ABSENT
+        _compter_cache(int(trouve), int(not trouve))
+        return valeur if trouve else default
+
+    def get_many_compte(keys, *args, **kwargs):
+        keys = list(keys)
+        trouves = get_many(keys, *args, **kwargs)
+        _compter_cache(len(trouves), len(keys) - len(trouves))
+        return trouves
+
+    cache.get = get_compte
+    cache.get_many = get_many_compte
+    cache._yuumi_instrumente = True
+
+
+def installer():
+    """Chronométrage du rendu des gabarits (une fois par processus)."""
+    global _installe
+    if _installe:
+        return
+    from django.template.backends.django import Template
+
+    rendre = Template.render
+
+    def render_mesure(self, context=None, request=None):
+        mesures = _mesures.get()
+        # Gabarits rendus à l'intérieur d'un autre : déjà comptés
+        if mesures is None or mesures["_rendus_en_cours"]:
+            return rendre(self, context, request)
+        mesures["_rendus_en_cours"] += 1
+        debut = time.perf_counter()
+        try:
+            return rendre(self, context, request)
+        finally:
+            mesures["_rendus_en_cours"] -= 1
+            mesures["gabarit_ms"] += (time.perf_counter() - debut) * 1000
+
+    Template.render = render_mesure
+    _installe = True
+
+
+@contextmanager
+def mesurer():
+    """
+    with mesurer() as mesures: ... -> mesures : {requetes, sql_ms,
+    cache_succes, cache_echecs, gabarit_ms, total_ms} du bloc.
+    """
+    installer()
+    for alias in caches:
+        _instrumenter_cache(caches[alias])
+    mesures = {
+        "requetes": 0, "sql_ms": 0.0, "cache_succes": 0, "cache_echecs": 0,
+        "gabarit_ms": 0.0, "total_ms": 0.0, "_rendus_en_cours": 0,
+    }
+    jeton = _mesures.set(mesures)
+    debut = time.perf_counter()
+    try:
+        with ExitStack() as pile:
+            for connexion in connections.all():
+                pile.enter_context(connexion.execute_wrapper(_chronometrer_sql))
+            yield mesures
+    finally:
+        mesures["total_ms"] = (time.perf_counter() - debut) * 1000
+        del mesures["_rendus_en_cours"]
+        _mesures.reset(jeton)
+
+
+def server_timing(mesures):
+    # Valeur d'en-tête HTTP : ASCII uniquement
+    return ", ".join([
+        f'sql;dur={mesures["sql_ms"]:.1f};desc="{mesures["requetes"]} requetes"',
+        f'cache;desc="{mesures["cache_succes"]} hits, {mesures["cache_echecs"]} miss"',
+        f'gabarit;dur={mesures["gabarit_ms"]:.1f}',
+        f'total;dur={mesures["total_ms"]:.1f}',
+    ])
+
+
+class MesuresRequeteMiddleware:
+    """Mesure chaque requête (voir l'en-tête du module)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with mesurer() as mesures:
+            response = self.get_response(request)
+
+        correspondance = getattr(request, "resolver_match", None)
+        vue = correspondance.view_name if correspondance else ""
+        response.mesures = dict(mesures, vue=vue)
+        if getattr(settings, "SERVER_TIMING", False):
+            response["Server-Timing"] = server_timing(mesures)
+        logger.info(json.dumps({
+            "vue": vue,
+            "methode": request.method,
+            "chemin": request.path,
+            "statut": response.status_code,
+            **{cle: round(valeur, 1) if isinstance(valeur, float) else valeur
+               for cle, valeur in mesures.items()},
+        }, ensure_ascii=False))
+        return response
+
+
+class BudgetRequetesMixin:
+    """
+    Pour les TestCase qui passent par self.client :
+
+        response = self.client.get(url)
+        self.assertBudgetRequetes(response, 12)
+    """
+
+    def assertBudgetRequetes(self, response, maximum):
+        mesures = response.mesures
+        self.assertLessEqual(
+            mesures["requetes"], maximum,
+            f"{mesures['vue'] or 'vue inconnue'} : {mesures['requetes']} requêtes SQL "
+            f"pour un budget de {maximum} (N+1 ?)",
+        )
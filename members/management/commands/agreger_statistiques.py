@@ -0,0 +1,46 @@
+# members/management/commands/agreger_statistiques.py
+#
+# Met à jour StoreDailyStats à partir des PageView / Click bruts (voir
+# members/statistiques.py), puis recalcule Store.score_popularite.
+#
+# Par défaut : reprise incrémentale depuis la veille du dernier jour
+# agrégé, et scores recalculés pour les seuls commerces de ces jours-là
+# (tous au premier passage de la journée). À lancer en cron après
+# vider_analytics :
+#
+#   */5 * * * *  cd /srv/yuumi && python manage.py vider_analytics && python manage.py agreger_statistiques
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from members.statistiques import agreger, debut_reprise, mettre_a_jour_popularite, premier_jour_brut
+
+
+class Command(BaseCommand):
+    help = "Agrège les vues et clics par commerce et par jour (StoreDailyStats)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--depuis", help="Recalcule à partir de cette date (AAAA-MM-JJ).")
+        parser.add_argument("--tout", action="store_true", help="Recalcule tout l'historique.")
+
+    def handle(self, *args, **options):
+        if options["tout"]:
+            depuis = premier_jour_brut()
+            total = agreger(depuis, timezone.localdate()) if depuis else 0
+            # Recalcul complet des scores aussi
+            depuis = None
+        elif options["depuis"]:
+            try:
+                depuis = date.fromisoformat(options["depuis"])
+            except ValueError:
+                raise CommandError("--depuis attend une date AAAA-MM-JJ.")
+            total = agreger(depuis, timezone.localdate())
+        else:
+            depuis = debut_reprise()
+            total = agreger(depuis, timezone.localdate()) if depuis else 0
+        populaires = mettre_a_jour_popularite(depuis)
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} ligne(s) de statistiques écrites, {populaires} score(s) de popularité mis à jour."
+        ))
@@ -0,0 +1,65 @@
+# members/management/commands/bench_agent_ia.py
+#
+# Banc de mesure hors ligne du pipeline de l'agent IA, contre un faux
+# serveur Mistral local (voir members/ai_agent/bench.py). Aucun appel a
+# l'API reelle, aucune trace en base ni dans Redis.
+#
+# Lancer :  python manage.py bench_agent_ia [--passes 2] [--echelle-latence 1] [--json]
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from members.ai_agent.bench import executer
+
+
+class Command(BaseCommand):
+    help = "Mesure latence, requêtes SQL, taille des prompts et cache de l'agent IA, hors ligne."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--passes", type=int, default=2,
+                            help="Nombre de passages du corpus (le 1er part d'un cache vide).")
+        parser.add_argument("--echelle-latence", type=float, default=1.0,
+                            help="Multiplie les latences simulées du modèle (0 : aucune).")
+        parser.add_argument("--commerces", type=int, default=8,
+                            help="Commerces de test par catégorie.")
+        parser.add_argument("--json", action="store_true", help="Rapport brut en JSON.")
+
+    def handle(self, *args, **options):
+        if options["passes"] < 1:
+            raise CommandError("--passes attend un entier positif.")
+        rapport = executer(
+            passes=options["passes"],
+            echelle_latence=options["echelle_latence"],
+            par_categorie=options["commerces"],
+        )
+        if options["json"]:
+            self.stdout.write(json.dumps(rapport, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(
+            f"{rapport['requetes']} requête(s) x {rapport['passes']} passe(s), "
+            f"{rapport['commerces']} commerces de test"
+        )
+        for titre, cle, unite in (
+            ("Latence", "latences_ms", "ms"),
+            ("Requêtes SQL", "requetes_sql", ""),
+            ("Taille des prompts", "tokens_prompt", "tokens"),
+        ):
+            self.stdout.write(f"\n{titre}")
+            for etape, stats in rapport[cle].items():
+                self.stdout.write(
+                    f"  {etape:<28} n={stats['n']:<4} p50={stats['p50']:>9} {unite}"
+                    f"  p95={stats['p95']:>9} {unite}"
+                )
+        cache = rapport["cache"]
+        self.stdout.write("\nCache")
+        for numero, succes in enumerate(cache["par_passe"], start=1):
+            self.stdout.write(
+                f"  passe {numero} : {succes['requete']} succès requête, "
+                f"{succes['parametres']} succès paramètres"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Taux de succès : requête {cache['taux_requete']:.0%}, "
+            f"paramètres {cache['taux_parametres']:.0%}"
+        ))
@@ -0,0 +1,75 @@
+# members/management/commands/bench_vues.py
+#
+# Banc de mesure des vues publiques sur les données en base (voir
+# members/bench_vues.py) : latence à froid et à chaud, requêtes SQL, taille
+# des réponses, pic de mémoire. Aucune trace en base ni dans Redis.
+#
+# Lancer :  python manage.py bench_vues [--passes 5] [--sortie rapport.json] [--comparer ancien.json]
+#           python manage.py bench_vues --synthetique 5000   (jeu généré puis annulé)
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from members.bench_vues import PASSES, comparer, executer
+
+
+class Command(BaseCommand):
+    help = "Mesure latence, requêtes SQL et mémoire des vues publiques."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--passes", type=int, default=PASSES,
+                            help="Requêtes à chaud par scénario, après la requête à froid.")
+        parser.add_argument("--scenario", action="append", dest="scenarios",
+                            help="Ne joue que ce scénario (répétable).")
+        parser.add_argument("--synthetique", type=int, metavar="COMMERCES",
+                            help="Génère d'abord ce nombre de commerces synthétiques (annulés ensuite).")
+        parser.add_argument("--sortie", help="Écrit le rapport JSON dans ce fichier.")
+        parser.add_argument("--comparer", help="Rapport JSON précédent, pour afficher les écarts.")
+        parser.add_argument("--json", action="store_true", help="Rapport brut en JSON.")
+
+    def handle(self, *args, **options):
+        if options["passes"] < 1:
+            raise CommandError("--passes attend un entier positif.")
+        avant = None
+        if options["comparer"]:
+            try:
+                with open(options["comparer"], encoding="utf-8") as fichier:
+                    avant = json.load(fichier)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Rapport illisible : {e}")
+
+        synthetique = None
+        if options["synthetique"]:
+            n = options["synthetique"]
+            synthetique = {"commerces": n, "produits": n * 20, "vues": n * 200, "clics": n * 20}
+        rapport = executer(passes=options["passes"], synthetique=synthetique, seulement=options["scenarios"])
+        if not rapport["scenarios"]:
+            raise CommandError("Aucun commerce rattaché à une ville et une catégorie : rien à mesurer.")
+
+        if options["sortie"]:
+            with open(options["sortie"], "w", encoding="utf-8") as fichier:
+                json.dump(rapport, fichier, ensure_ascii=False, indent=2)
+        if options["json"]:
+            self.stdout.write(json.dumps(rapport, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(", ".join(f"{valeur} {cle}" for cle, valeur in rapport["volumes"].items()))
+        self.stdout.write(
+            f"\n{'scénario':<22} {'statut':>6} {'froid':>9} {'req':>4} {'p50':>8} {'p95':>8} {'req':>4} {'mémoire':>9}"
+        )
+        for nom, s in rapport["scenarios"].items():
+            self.stdout.write(
+                f"{nom:<22} {s['statut']:>6} {s['froid']['ms']:>7}ms {s['froid']['requetes']:>4} "
+                f"{s['chaud']['p50_ms']:>6}ms {s['chaud']['p95_ms']:>6}ms {s['chaud']['requetes']:>4} "
+                f"{s['memoire_pic_ko']:>6} Ko"
+            )
+
+        if avant is not None:
+            self.stdout.write("\nÉcarts avec le rapport précédent")
+            for nom, ecarts in comparer(avant, rapport).items():
+                morceaux = [
+                    f"{cle} {ancien} -> {nouveau}"
+                    for cle, (ancien, nouveau) in ecarts.items() if ancien != nouveau
+                ]
+                self.stdout.write(f"  {nom:<22} {', '.join(morceaux) or 'identique'}")
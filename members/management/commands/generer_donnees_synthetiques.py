@@ -0,0 +1,57 @@
+# members/management/commands/generer_donnees_synthetiques.py
+#
+# Génère un jeu de données synthétique à grande échelle (départements,
+# villes, catégories, commerces avec horaires, produits, vues, clics), voir
+# members/donnees_synthetiques.py. À lancer sur une base de mesure, pas en
+# production. Compter plusieurs dizaines de minutes à pleine échelle.
+#
+# Lancer :  python manage.py generer_donnees_synthetiques [--commerces 50000] [--produits 1000000]
+#                  [--vues 10000000] [--clics 1000000] [--graine 1]
+#           python manage.py generer_donnees_synthetiques --purger
+
+from django.core.management.base import BaseCommand, CommandError
+
+from members.donnees_synthetiques import JOURS, generer, purger
+
+
+class Command(BaseCommand):
+    help = "Génère (ou supprime) un jeu de données synthétique à grande échelle."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--commerces", type=int, default=50000)
+        parser.add_argument("--produits", type=int, default=1000000)
+        parser.add_argument("--vues", type=int, default=10000000)
+        parser.add_argument("--clics", type=int, default=1000000)
+        parser.add_argument("--departements", type=int, default=20)
+        parser.add_argument("--villes", type=int, default=25, help="Villes par département.")
+        parser.add_argument("--jours", type=int, default=JOURS, help="Période couverte par les vues et clics.")
+        parser.add_argument("--graine", type=int, default=1, help="Même graine, mêmes données.")
+        parser.add_argument("--purger", action="store_true",
+                            help="Supprime les données générées au lieu d'en créer.")
+
+    def handle(self, *args, **options):
+        def journal(message):
+            self.stdout.write(f"  {message}")
+
+        if options["purger"]:
+            supprimes = purger(journal)
+            self.stdout.write(self.style.SUCCESS(f"{supprimes} commerce(s) synthétique(s) supprimé(s)."))
+            return
+
+        nombres = ("commerces", "produits", "vues", "clics", "departements", "villes", "jours")
+        if any(options[cle] < 0 for cle in nombres) or options["departements"] < 1 or options["villes"] < 1:
+            raise CommandError("Les volumes attendent des entiers positifs.")
+        crees = generer(
+            commerces=options["commerces"],
+            produits=options["produits"],
+            vues=options["vues"],
+            clics=options["clics"],
+            departements=options["departements"],
+            villes_par_departement=options["villes"],
+            jours=max(options["jours"], 1),
+            graine=options["graine"],
+            journal=journal,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            ", ".join(f"{valeur} {cle}" for cle, valeur in crees.items()) + " générés."
+        ))
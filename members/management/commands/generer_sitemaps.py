@@ -0,0 +1,25 @@
+# members/management/commands/generer_sitemaps.py
+#
+# Pré-génère l'index des sitemaps et toutes les pages de ses sections dans
+# settings.SITEMAPS_ROOT (voir members/sitemaps.py) : les robots reçoivent
+# ces fichiers tels quels, sans requête SQL. À lancer en cron :
+#
+#   15 * * * *  cd /srv/yuumi && python manage.py generer_sitemaps
+
+from django.core.management.base import BaseCommand
+
+from members.sitemaps import generer
+
+
+class Command(BaseCommand):
+    help = "Écrit l'index des sitemaps et ses pages dans SITEMAPS_ROOT."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dossier", help="Dossier de sortie (SITEMAPS_ROOT par défaut).")
+
+    def handle(self, *args, **options):
+        def journal(message):
+            self.stdout.write(f"  {message}")
+
+        pages = generer(options["dossier"], journal=journal)
+        self.stdout.write(self.style.SUCCESS(f"{pages} fichier(s) de sitemap écrit(s)."))
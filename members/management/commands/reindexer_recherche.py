@@ -0,0 +1,21 @@
+# members/management/commands/reindexer_recherche.py
+#
+# Reconstruit entièrement l'index de recherche (voir members/recherche.py).
+# Utile après un import en masse (bulk_create / update ne déclenchent pas les
+# signaux qui maintiennent l'index au fil de l'eau).
+#
+# Lancer :  python manage.py reindexer_recherche
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from members.recherche import reconstruire_index
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche (produits, familles, descriptions)."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = reconstruire_index()
+        self.stdout.write(self.style.SUCCESS(f"{total} entrées indexées."))
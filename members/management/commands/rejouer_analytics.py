@@ -0,0 +1,23 @@
+# members/management/commands/rejouer_analytics.py
+#
+# Remet en file les événements (vues, clics) que vider_analytics a mis de
+# côté dans Redis (members.analytics.CLE_REJETS), puis vide la file. À
+# lancer à la main une fois la cause du rejet corrigée ; un événement qui
+# échoue encore retourne dans les rejets.
+#
+# Lancer :  python manage.py rejouer_analytics
+
+from django.core.management.base import BaseCommand
+
+from members.analytics import rejouer_rejets, vider_file
+
+
+class Command(BaseCommand):
+    help = "Remet en file les statistiques rejetées par vider_analytics et les écrit en base."
+
+    def handle(self, *args, **options):
+        remis = rejouer_rejets()
+        total = vider_file()
+        self.stdout.write(self.style.SUCCESS(
+            f"{remis} événement(s) remis en file, {total} événement(s) enregistré(s)."
+        ))
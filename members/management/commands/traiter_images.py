@@ -0,0 +1,23 @@
+# members/management/commands/traiter_images.py
+#
+# Traite les images en attente (voir members/images.py) dans le processus
+# courant : jobs jamais lancés, en échec temporaire, ou interrompus par un
+# redémarrage du serveur. À lancer après un déploiement, ou en cron.
+#
+# Lancer :  python manage.py traiter_images [--limite N]
+
+from django.core.management.base import BaseCommand
+
+from members.images import reprendre_jobs
+
+
+class Command(BaseCommand):
+    help = "Traite les images en attente de conversion (WebP et variantes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limite", type=int, default=None,
+                            help="Nombre maximum de jobs à traiter.")
+
+    def handle(self, *args, **options):
+        total = reprendre_jobs(limite=options["limite"])
+        self.stdout.write(self.style.SUCCESS(f"{total} image(s) traitée(s)."))
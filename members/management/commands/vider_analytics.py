@@ -0,0 +1,21 @@
+# members/management/commands/vider_analytics.py
+#
+# Écrit en base (bulk_create) les vues et clics mis en file dans Redis par
+# members/analytics.py. À lancer en cron, par exemple toutes les minutes :
+#
+#   * * * * *  cd /srv/yuumi && python manage.py vider_analytics
+
+from django.core.management.base import BaseCommand
+
+from members.analytics import TAILLE_LOT, vider_file
+
+
+class Command(BaseCommand):
+    help = "Écrit en base les statistiques (vues, clics) en attente dans Redis."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--taille-lot", type=int, default=TAILLE_LOT)
+
+    def handle(self, *args, **options):
+        total = vider_file(taille_lot=options["taille_lot"])
+        self.stdout.write(self.style.SUCCESS(f"{total} événement(s) enregistré(s)."))
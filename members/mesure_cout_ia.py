@@ -8,6 +8,10 @@ Usage :
     python3 mesure_cout_ia.py
 
 Necessite : pip install mistralai --break-system-packages (ou dans un venv)
+
+Pour mesurer latence, requetes SQL, taille des prompts et cache du VRAI
+pipeline, sans appel a l'API ni cout : python manage.py bench_agent_ia
+(voir members/ai_agent/bench.py).
 """
 
 import os
@@ -0,0 +1,111 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copie figée de members/horaires.py (compiler_horaires,
+# tranches_journalieres) telle qu'à cette migration : le code vivant peut
+# changer, cette migration doit toujours compiler de la même façon.
+JOURS = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+PERIODES = ["matin", "apresmidi"]
+MINUTES_PAR_JOUR = 24 * 60
+MINUTES_PAR_SEMAINE = 7 * MINUTES_PAR_JOUR
+
+
+def _en_minutes(t):
+    return t.hour * 60 + t.minute
+
+
+def _fusionner(intervalles):
+    fusion = []
+    for debut, fin in sorted(intervalles):
+        if fusion and debut <= fusion[-1][1]:
+            fusion[-1][1] = max(fusion[-1][1], fin)
+        else:
+            fusion.append([debut, fin])
+    return fusion
+
+
+def compiler_horaires(store):
+    bruts = []
+    for idx, jour in enumerate(JOURS):
+        base = idx * MINUTES_PAR_JOUR
+        for periode in PERIODES:
+            ouverture = getattr(store, f"{jour}_{periode}_ouverture")
+            fermeture = getattr(store, f"{jour}_{periode}_fermeture")
+            if ouverture is None or fermeture is None:
+                continue
+
+            debut = base + _en_minutes(ouverture)
+            fin = base + _en_minutes(fermeture) + 1
+            if fermeture <= ouverture:
+                fin += MINUTES_PAR_JOUR
+
+            if fin <= MINUTES_PAR_SEMAINE:
+                bruts.append((debut, fin))
+            else:
+                bruts.append((debut, MINUTES_PAR_SEMAINE))
+                bruts.append((0, fin - MINUTES_PAR_SEMAINE))
+
+    return _fusionner(bruts)
+
+
+def tranches_journalieres(intervalles):
+    tranches = []
+    for debut, fin in intervalles:
+        while debut < fin:
+            fin_du_jour = (debut // MINUTES_PAR_JOUR + 1) * MINUTES_PAR_JOUR
+            coupure = min(fin, fin_du_jour)
+            tranches.append((debut, coupure))
+            debut = coupure
+    return tranches
+
+
+def compiler_horaires_existants(apps, schema_editor):
+    Store = apps.get_model("members", "Store")
+    StoreOpeningInterval = apps.get_model("members", "StoreOpeningInterval")
+
+    creneaux = []
+    for store in Store.objects.all().iterator():
+        store.horaires_compiles = compiler_horaires(store)
+        Store.objects.filter(pk=store.pk).update(horaires_compiles=store.horaires_compiles)
+        creneaux.extend(
+            StoreOpeningInterval(store_id=store.pk, debut=debut, fin=fin)
+            for debut, fin in tranches_journalieres(store.horaires_compiles)
+        )
+    StoreOpeningInterval.objects.bulk_create(creneaux, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0042_userpremium_billing_period_userpremium_tier_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalstore',
+            name='horaires_compiles',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='horaires_compiles',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.CreateModel(
+            name='StoreOpeningInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('debut', models.PositiveIntegerField()),
+                ('fin', models.PositiveIntegerField()),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='creneaux', to='members.store')),
+            ],
+            options={
+                'verbose_name': "Créneau d'ouverture",
+                'verbose_name_plural': "Créneaux d'ouverture",
+                'indexes': [models.Index(fields=['debut', 'fin', 'store'], name='creneau_debut_fin_idx')],
+            },
+        ),
+        migrations.RunPython(compiler_horaires_existants, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:39
+
+from django.db import migrations, models
+
+# Copie figée de members/geo.encoder_geohash (précision 5) telle qu'à cette
+# migration : le code vivant peut changer, cette migration doit toujours
+# calculer les mêmes cellules.
+PRECISION_CELLULE = 5
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encoder_geohash(lat, lng, precision=PRECISION_CELLULE):
+    lat_min, lat_max = -90.0, 90.0
+    lng_min, lng_max = -180.0, 180.0
+    cellule = []
+    bits = 0
+    nb_bits = 0
+    pair = True   # les bits pairs découpent la longitude
+    while len(cellule) < precision:
+        if pair:
+            milieu = (lng_min + lng_max) / 2
+            if lng >= milieu:
+                bits = (bits << 1) | 1
+                lng_min = milieu
+            else:
+                bits <<= 1
+                lng_max = milieu
+        else:
+            milieu = (lat_min + lat_max) / 2
+            if lat >= milieu:
+                bits = (bits << 1) | 1
+                lat_min = milieu
+            else:
+                bits <<= 1
+                lat_max = milieu
+        pair = not pair
+        nb_bits += 1
+        if nb_bits == 5:
+            cellule.append(_BASE32[bits])
+            bits = 0
+            nb_bits = 0
+    return "".join(cellule)
+
+
+def calculer_cellules(apps, schema_editor):
+    Store = apps.get_model("members", "Store")
+    for store_id, lat, lng in Store.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).values_list("id", "latitude", "longitude").iterator():
+        Store.objects.filter(pk=store_id).update(geo_cell=encoder_geohash(lat, lng))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0043_store_horaires_compiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalstore',
+            name='geo_cell',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='geo_cell',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(calculer_cellules, migrations.RunPython.noop),
+    ]
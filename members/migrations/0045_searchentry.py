@@ -0,0 +1,134 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:43
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+TABLE_FTS = "members_searchentry_fts"
+GIN_NAME = "recherche_contenu_gin"
+
+# Table FTS5 "external content" : le texte reste dans members_searchentry,
+# les triggers répercutent chaque insert/update/delete dans l'index.
+SQLITE_FTS = [
+    f"CREATE VIRTUAL TABLE {TABLE_FTS} USING fts5("
+    f"contenu, content='members_searchentry', content_rowid='id')",
+    f"CREATE TRIGGER {TABLE_FTS}_ai AFTER INSERT ON members_searchentry BEGIN "
+    f"INSERT INTO {TABLE_FTS}(rowid, contenu) VALUES (new.id, new.contenu); END",
+    f"CREATE TRIGGER {TABLE_FTS}_ad AFTER DELETE ON members_searchentry BEGIN "
+    f"INSERT INTO {TABLE_FTS}({TABLE_FTS}, rowid, contenu) VALUES ('delete', old.id, old.contenu); END",
+    f"CREATE TRIGGER {TABLE_FTS}_au AFTER UPDATE ON members_searchentry BEGIN "
+    f"INSERT INTO {TABLE_FTS}({TABLE_FTS}, rowid, contenu) VALUES ('delete', old.id, old.contenu); "
+    f"INSERT INTO {TABLE_FTS}(rowid, contenu) VALUES (new.id, new.contenu); END",
+]
+
+
+def creer_index_plein_texte(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        SearchEntry = apps.get_model("members", "SearchEntry")
+        schema_editor.add_index(
+            SearchEntry, GinIndex(SearchVector("contenu", config="simple"), name=GIN_NAME)
+        )
+    elif vendor == "sqlite":
+        for sql in SQLITE_FTS:
+            schema_editor.execute(sql)
+
+
+def supprimer_index_plein_texte(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {GIN_NAME}")
+    elif vendor == "sqlite":
+        for suffixe in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {TABLE_FTS}_{suffixe}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE_FTS}")
+
+
+# Copie figée de la normalisation et de reconstruire_index de
+# members/recherche.py telles qu'à cette migration : le code vivant peut
+# changer, cette migration doit toujours remplir l'index de la même façon.
+MOTS_VIDES = {
+    "a", "au", "aux", "avec", "ce", "ces", "d", "dans", "de", "des", "du",
+    "en", "et", "l", "la", "le", "les", "mon", "ou", "par", "pas", "pour",
+    "sa", "sans", "ses", "son", "sur", "un", "une",
+}
+
+_MOT = re.compile(r"[a-z0-9]+")
+
+
+def _raciniser(mot):
+    if len(mot) > 4 and mot.endswith("eaux"):
+        mot = mot[:-1]
+    elif len(mot) > 4 and mot.endswith("aux"):
+        mot = mot[:-3] + "al"
+    elif len(mot) > 3 and mot[-1] in "sx":
+        mot = mot[:-1]
+    if len(mot) > 4 and mot.endswith("e"):
+        mot = mot[:-1]
+    return mot
+
+
+def _contenu_indexe(texte):
+    if not texte:
+        return ""
+    sans_accents = unicodedata.normalize("NFD", texte.lower()).encode("ascii", "ignore").decode()
+    mots = _MOT.findall(sans_accents)
+    return " ".join(_raciniser(m) for m in mots if m not in MOTS_VIDES and len(m) > 1)
+
+
+def remplir_index(apps, schema_editor):
+    SearchEntry = apps.get_model("members", "SearchEntry")
+    Store = apps.get_model("members", "Store")
+    ProductFamily = apps.get_model("members", "ProductFamily")
+    Product = apps.get_model("members", "Product")
+
+    entrees = []
+    for store_id, petite, grande in Store.objects.values_list(
+        "id", "descriptionpetite", "descriptiongrande"
+    ).iterator():
+        for type_entree, texte in (("description", petite), ("description_longue", grande)):
+            contenu = _contenu_indexe(texte)
+            if contenu:
+                entrees.append(SearchEntry(store_id=store_id, type=type_entree, source_id=store_id, contenu=contenu))
+    for famille_id, store_id, nom in ProductFamily.objects.values_list("id", "store_id", "nom").iterator():
+        contenu = _contenu_indexe(nom)
+        if contenu:
+            entrees.append(SearchEntry(store_id=store_id, type="famille", source_id=famille_id, contenu=contenu))
+    for produit_id, store_id, nom in Product.objects.values_list("id", "family__store_id", "nom").iterator():
+        contenu = _contenu_indexe(nom)
+        if contenu:
+            entrees.append(SearchEntry(store_id=store_id, type="produit", source_id=produit_id, contenu=contenu))
+
+    SearchEntry.objects.bulk_create(entrees, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0044_store_geo_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('produit', 'Produit'), ('famille', 'Famille de produits'), ('description', 'Description courte'), ('description_longue', 'Description longue')], max_length=20)),
+                ('source_id', models.PositiveBigIntegerField()),
+                ('contenu', models.TextField()),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entrees_recherche', to='members.store')),
+            ],
+            options={
+                'verbose_name': 'Entrée de recherche',
+                'verbose_name_plural': 'Entrées de recherche',
+                'indexes': [models.Index(fields=['type', 'source_id'], name='recherche_source_idx')],
+            },
+        ),
+        migrations.RunPython(creer_index_plein_texte, supprimer_index_plein_texte),
+        migrations.RunPython(remplir_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0045_searchentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modele', models.CharField(max_length=60)),
+                ('objet_id', models.PositiveBigIntegerField()),
+                ('champ', models.CharField(max_length=30)),
+                ('fichier_source', models.CharField(max_length=255)),
+                ('statut', models.CharField(choices=[('en_attente', 'En attente'), ('en_cours', 'En cours'), ('termine', 'Terminé'), ('echec', 'Échec')], default='en_attente', max_length=12)),
+                ('tentatives', models.PositiveSmallIntegerField(default=0)),
+                ('erreur', models.TextField(blank=True)),
+                ('cree_le', models.DateTimeField(auto_now_add=True)),
+                ('modifie_le', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': "Traitement d'image",
+                'verbose_name_plural': "Traitements d'images",
+                'indexes': [models.Index(fields=['statut', 'cree_le'], name='imagejob_statut_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0046_imagejob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='click',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='pageview',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
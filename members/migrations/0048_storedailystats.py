@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0047_analytics_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('vues', models.PositiveIntegerField(default=0)),
+                ('clics', models.PositiveIntegerField(default=0)),
+                ('clics_itineraire', models.PositiveIntegerField(default=0)),
+                ('clics_site', models.PositiveIntegerField(default=0)),
+                ('clics_instagram', models.PositiveIntegerField(default=0)),
+                ('clics_facebook', models.PositiveIntegerField(default=0)),
+                ('clics_telephone', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Statistique journalière',
+                'verbose_name_plural': 'Statistiques journalières',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='click',
+            index=models.Index(fields=['created_at'], name='click_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pageview',
+            index=models.Index(fields=['timestamp'], name='pageview_timestamp_idx'),
+        ),
+        migrations.AddField(
+            model_name='storedailystats',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats_journalieres', to='members.store'),
+        ),
+        migrations.AddIndex(
+            model_name='storedailystats',
+            index=models.Index(fields=['date'], name='stats_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='storedailystats',
+            constraint=models.UniqueConstraint(fields=('store', 'date'), name='stats_store_date_unique'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-17 22:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0048_storedailystats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalstore',
+            name='score_popularite',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='score_popularite',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='store',
+            index=models.Index(fields=['-score_popularite', 'nom'], name='store_popularite_idx'),
+        ),
+    ]
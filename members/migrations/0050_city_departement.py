@@ -0,0 +1,99 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def remplir_villes(apps, schema_editor):
+    """
+    Référentiel à partir des chaînes existantes : une ville par
+    (departement, ville) en minuscules, avec la première graphie rencontrée,
+    reprise ensuite par tous les commerces et mises en avant de la ville.
+    """
+    Departement = apps.get_model("members", "Departement")
+    City = apps.get_model("members", "City")
+    Store = apps.get_model("members", "Store")
+    CityCategoryHighlight = apps.get_model("members", "CityCategoryHighlight")
+
+    departements, villes = {}, {}
+
+    def ville_de(departement, ville):
+        cle_dep, cle_ville = (departement or "").strip().lower(), (ville or "").strip().lower()
+        if not cle_dep or not cle_ville:
+            return None
+        if cle_dep not in departements:
+            departements[cle_dep] = Departement.objects.create(nom=departement.strip(), slug=cle_dep)
+        if (cle_dep, cle_ville) not in villes:
+            villes[cle_dep, cle_ville] = City.objects.create(
+                departement=departements[cle_dep], nom=ville.strip(), slug=cle_ville
+            )
+        return villes[cle_dep, cle_ville]
+
+    for modele in (Store, CityCategoryHighlight):
+        for pk, departement, ville in modele.objects.order_by("pk").values_list("pk", "departement", "ville").iterator():
+            city = ville_de(departement, ville)
+            if city is not None:
+                modele.objects.filter(pk=pk).update(
+                    city=city, departement=city.departement.nom, ville=city.nom
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0049_store_score_popularite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=255)),
+                ('slug', models.CharField(help_text='Nom en minuscules, tel que dans les URL', max_length=255)),
+            ],
+            options={
+                'verbose_name': 'Ville',
+                'verbose_name_plural': 'Villes',
+                'ordering': ['nom'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Departement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=255)),
+                ('slug', models.CharField(help_text='Nom en minuscules, tel que dans les URL', max_length=255, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Département',
+                'verbose_name_plural': 'Départements',
+                'ordering': ['nom'],
+            },
+        ),
+        migrations.AddField(
+            model_name='citycategoryhighlight',
+            name='city',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='mises_en_avant', to='members.city'),
+        ),
+        migrations.AddField(
+            model_name='historicalstore',
+            name='city',
+            field=models.ForeignKey(blank=True, db_constraint=False, editable=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='members.city'),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='city',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='stores', to='members.city'),
+        ),
+        migrations.AddField(
+            model_name='city',
+            name='departement',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='villes', to='members.departement'),
+        ),
+        migrations.AddConstraint(
+            model_name='city',
+            constraint=models.UniqueConstraint(fields=('departement', 'slug'), name='city_departement_slug_unique'),
+        ),
+        migrations.RunPython(remplir_villes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0050_city_departement'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='click',
+            name='click_created_at_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='pageview',
+            name='pageview_timestamp_idx',
+        ),
+        migrations.AlterField(
+            model_name='store',
+            name='city',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='stores', to='members.city'),
+        ),
+        migrations.AddIndex(
+            model_name='click',
+            index=models.Index(fields=['created_at', 'store', 'type_click'], name='click_date_store_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pageview',
+            index=models.Index(fields=['timestamp', 'store'], name='pageview_timestamp_store_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='store',
+            index=models.Index(fields=['city', 'categorie'], name='store_ville_categorie_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storesuggestion',
+            index=models.Index(fields=['ip_address', 'created_at'], name='suggestion_ip_date_idx'),
+        ),
+    ]
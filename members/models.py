@@ -1,12 +1,15 @@
 import threading
 
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
-from .utils import convert_to_webp, resize_and_convert
+from .images import planifier_variantes
+from .horaires import CHAMPS_HORAIRES, compiler_horaires, tranches_journalieres
+from .geo import encoder_geohash
 from simple_history.models import HistoricalRecords
 
 
@@ -37,13 +40,14 @@ class SuperCategory(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        if self.pk:
+        # Conversion WebP en arrière-plan (voir images.py)
+        image_changee = bool(self.image)
+        if self.pk and self.image:
             ancien = SuperCategory.objects.filter(pk=self.pk).values("image").first()
-            if ancien and self.image and ancien["image"] != self.image.name:
-                self.image = convert_to_webp(self.image)
-        elif self.image:
-            self.image = convert_to_webp(self.image)
+            image_changee = not ancien or ancien["image"] != self.image.name
         super().save(*args, **kwargs)
+        if image_changee:
+            planifier_variantes(self, "image")
 
     def __str__(self):
         return self.name
@@ -78,13 +82,14 @@ class CategorieIntermediaire(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
-        if self.pk:
+        # Conversion WebP en arrière-plan (voir images.py)
+        image_changee = bool(self.image)
+        if self.pk and self.image:
             ancien = CategorieIntermediaire.objects.filter(pk=self.pk).values("image").first()
-            if ancien and self.image and ancien["image"] != self.image.name:
-                self.image = convert_to_webp(self.image)
-        elif self.image:
-            self.image = convert_to_webp(self.image)
+            image_changee = not ancien or ancien["image"] != self.image.name
         super().save(*args, **kwargs)
+        if image_changee:
+            planifier_variantes(self, "image")
     
     def __str__(self):
          return self.name
@@ -133,16 +138,18 @@ class Category(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        # Conversion WebP en arrière-plan (voir images.py)
+        a_traiter = []
+        ancien = None
         if self.pk:
             ancien = Category.objects.filter(pk=self.pk).values("image", "icon_perso").first()
-            if ancien:
-                if self.image and ancien["image"] != self.image.name:
-                    self.image = convert_to_webp(self.image)
-                if self.icon_perso and ancien["icon_perso"] != self.icon_perso.name:
-                    self.icon_perso = convert_to_webp(self.icon_perso)
-        elif self.image:
-            self.image = convert_to_webp(self.image)
+        for champ in ("image", "icon_perso"):
+            fichier = getattr(self, champ)
+            if fichier and (not ancien or ancien[champ] != fichier.name):
+                a_traiter.append(champ)
         super().save(*args, **kwargs)
+        for champ in a_traiter:
+            planifier_variantes(self, champ)
 
     def __str__(self):
         return self.name
@@ -155,6 +162,82 @@ class Category(models.Model):
 _url_validator = URLValidator(schemes=['http', 'https'])
 
 
+# ===========================================================
+# 🔹 Départements et villes (référentiel)
+# ===========================================================
+
+def cle_emplacement(nom):
+    """Clé d'un département ou d'une ville : le nom en minuscules, tel que dans les URL."""
+    return (nom or "").strip().lower()
+
+
+class Departement(models.Model):
+    nom = models.CharField(max_length=255)
+    slug = models.CharField(
+        max_length=255,
+        unique=True,
+        help_text="Nom en minuscules, tel que dans les URL",
+    )
+
+    class Meta:
+        verbose_name = "Département"
+        verbose_name_plural = "Départements"
+        ordering = ["nom"]
+
+    def __str__(self):
+        return self.nom
+
+
+class City(models.Model):
+    departement = models.ForeignKey(
+        Departement,
+        on_delete=models.PROTECT,
+        related_name="villes",
+    )
+    nom = models.CharField(max_length=255)
+    slug = models.CharField(
+        max_length=255,
+        help_text="Nom en minuscules, tel que dans les URL",
+    )
+
+    class Meta:
+        verbose_name = "Ville"
+        verbose_name_plural = "Villes"
+        ordering = ["nom"]
+        constraints = [
+            models.UniqueConstraint(fields=["departement", "slug"], name="city_departement_slug_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.nom} ({self.departement.nom})"
+
+    @classmethod
+    def pour(cls, departement, ville):
+        """
+        La ville (departement, ville) du référentiel, créée au besoin avec
+        cette graphie ; None si l'un des deux noms est vide.
+        """
+        cle_departement, cle_ville = cle_emplacement(departement), cle_emplacement(ville)
+        if not cle_departement or not cle_ville:
+            return None
+        city = (
+            cls.objects.select_related("departement")
+            .filter(departement__slug=cle_departement, slug=cle_ville)
+            .first()
+        )
+        if city is None:
+            dep, _ = Departement.objects.get_or_create(
+                slug=cle_departement, defaults={"nom": departement.strip()}
+            )
+            city, _ = cls.objects.get_or_create(
+                departement=dep, slug=cle_ville, defaults={"nom": ville.strip()}
+            )
+            # Nouvelle ville : l'annuaire (ids des filtres) doit la connaître
+            from .annuaire import invalider_annuaire
+            invalider_annuaire()
+        return city
+
+
 # ===========================================================
 # 🔹 Commerces
 # ===========================================================
@@ -165,6 +248,18 @@ class Store(models.Model):
     ville = models.CharField(max_length=255)
     departement = models.CharField(max_length=255)
     ville_precise = models.CharField(max_length=255)
+    # Ville du référentiel, déduite de (departement, ville) à chaque save() :
+    # les pages d'une ville filtrent sur cette clé (voir annuaire.filtre_ville).
+    # Pas d'index propre : store_ville_categorie_idx commence par elle.
+    city = models.ForeignKey(
+        City,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=False,
+        related_name="stores",
+    )
 
     last_claim_request = models.DateTimeField(null=True, blank=True)
     horaires_updated_at = models.DateTimeField(null=True, blank=True)
@@ -250,10 +345,22 @@ class Store(models.Model):
     dimanche_apresmidi_ouverture = models.TimeField(null=True, blank=True)
     dimanche_apresmidi_fermeture = models.TimeField(null=True, blank=True)
 
+    # Forme compilée des horaires ci-dessus (voir horaires.py), recalculée
+    # à chaque save() : liste triée d'intervalles [debut, fin) en minutes
+    # de la semaine. Ne jamais la modifier à la main.
+    horaires_compiles = models.JSONField(default=list, blank=True, editable=False)
+
     # Slug & géolocalisation
     slug = models.SlugField(max_length=255, unique=True, blank=True)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    # Cellule geohash de (latitude, longitude) : préfiltre des recherches par
+    # rayon (voir geo.py). Vide tant que le commerce n'est pas géocodé.
+    geo_cell = models.CharField(max_length=12, blank=True, default="", db_index=True, editable=False)
+    # Popularité récente (clics + vues, décroissance exponentielle) recalculée
+    # par agreger_statistiques (voir statistiques.py). Sert au classement des
+    # candidats de l'agent IA. Ne jamais la modifier à la main.
+    score_popularite = models.FloatField(default=0.0, editable=False)
 
     # Propriétaire
     owner = models.OneToOneField(
@@ -271,6 +378,13 @@ class Store(models.Model):
         verbose_name = "Commerce"
         verbose_name_plural = "Commerces"
         ordering = ["nom"]
+        # Chemins d'accès chauds, vérifiés par EXPLAIN dans tests_index.py :
+        # pages d'une ville (city), d'une catégorie dans une ville
+        # (city, categorie), candidats de l'agent IA (popularité).
+        indexes = [
+            models.Index(fields=["-score_popularite", "nom"], name="store_popularite_idx"),
+            models.Index(fields=["city", "categorie"], name="store_ville_categorie_idx"),
+        ]
 
     def _generate_unique_slug(self):
         base = slugify(self.nom) or "commerce"
@@ -291,52 +405,98 @@ class Store(models.Model):
                 Store.objects.filter(pk=self.pk).update(
                     latitude=location.latitude,
                     longitude=location.longitude,
+                    geo_cell=encoder_geohash(location.latitude, location.longitude),
                 )
+                # update() n'envoie aucun signal : carte et pages en cache
+                from .cache_pages import invalider_pour
+                from .tuiles import invalider_tuiles
+                invalider_pour(self)
+                invalider_tuiles(self.departement)
         except Exception:
             pass
 
-    def _generate_photo_variants(self):
-        ville = slugify(self.ville)
-        nom = slugify(self.nom)
-        cat = slugify(self.categorie.categorie_singulier or self.categorie.name) if self.categorie else "commerce"
-        
-        original = self.photo
-        
-        self.photo = resize_and_convert(
-                original,
-                name=f"{nom}-{cat}-a-{ville}",
-                max_width=1200,
-        )
-        self.photo_medium = resize_and_convert(
-                original,
-                name=f"{cat}-{nom}-a-{ville}",
-                max_width=600,
-        )
-        self.photo_small = resize_and_convert(
-                original,
-                name=f"{nom}-{ville}",
-                max_width=300,
-        )
+    def _synchroniser_creneaux(self):
+        """
+        Réécrit les lignes StoreOpeningInterval du commerce à partir de
+        horaires_compiles (quelques lignes par commerce au plus).
+        """
+        StoreOpeningInterval.objects.filter(store=self).delete()
+        StoreOpeningInterval.objects.bulk_create([
+            StoreOpeningInterval(store=self, debut=debut, fin=fin)
+            for debut, fin in tranches_journalieres(self.horaires_compiles)
+        ])
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = self._generate_unique_slug()
 
+        # Recompilation des horaires, sauf si on sauvegarde explicitement
+        # d'autres champs (ex: save(update_fields=["last_claim_request"])).
+        update_fields = kwargs.get("update_fields")
+        horaires_concernes = update_fields is None or any(
+            champ in CHAMPS_HORAIRES for champ in update_fields
+        )
+        if horaires_concernes:
+            self.horaires_compiles = compiler_horaires(self)
+            if update_fields is not None:
+                kwargs["update_fields"] = list(update_fields) + ["horaires_compiles"]
+
+        # Référentiel des villes : departement et ville reprennent la graphie
+        # de la ville déjà connue (une seule forme par ville en base)
+        if update_fields is None or {"departement", "ville"} & set(update_fields):
+            self.city = City.pour(self.departement, self.ville)
+            if self.city is not None:
+                self.departement, self.ville = self.city.departement.nom, self.city.nom
+            if update_fields is not None:
+                kwargs["update_fields"] = list(kwargs["update_fields"]) + ["city", "departement", "ville"]
+
         adresse_changee = False
+        photo_changee = False
+        horaires_changes = horaires_concernes and (
+            self.pk is not None or bool(self.horaires_compiles)
+        )
         if self.pk:
-            ancien = Store.objects.filter(pk=self.pk).values("addressemaps", "photo").first()
+            ancien = Store.objects.filter(pk=self.pk).values(
+                "addressemaps", "photo", "horaires_compiles"
+            ).first()
+            if ancien and ancien["horaires_compiles"] == self.horaires_compiles:
+                horaires_changes = False
             if ancien and ancien["addressemaps"] != self.addressemaps:
                 adresse_changee = True
                 self.latitude = None
                 self.longitude = None
 
             if self.photo and ancien and ancien["photo"] != self.photo.name:
-                self._generate_photo_variants()
+                photo_changee = True
         elif self.photo:
-            self._generate_photo_variants()
+            photo_changee = True
+
+        # Nouvelle photo : les variantes seront produites en arrière-plan
+        # (voir images.py). D'ici là, les templates affichent l'original.
+        if photo_changee and update_fields is not None:
+            photo_changee = "photo" in update_fields
+        if photo_changee:
+            self.photo_medium = None
+            self.photo_small = None
+
+        if self.latitude is not None and self.longitude is not None:
+            self.geo_cell = encoder_geohash(self.latitude, self.longitude)
+        else:
+            self.geo_cell = ""
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = list(update_fields) + ["geo_cell"]
+        if photo_changee and update_fields is not None:
+            kwargs["update_fields"] = list(kwargs["update_fields"]) + ["photo_medium", "photo_small"]
 
         super().save(*args, **kwargs)
 
+        if horaires_changes:
+            self._synchroniser_creneaux()
+
+        if photo_changee:
+            planifier_variantes(self, "photo")
+
         if self.addressemaps and (adresse_changee or self.latitude is None):
             t = threading.Thread(target=self._geocode)
             t.daemon = True
@@ -346,12 +506,44 @@ class Store(models.Model):
         return f"{self.nom} ({self.ville}, {self.departement})"
 
     def get_absolute_url(self):
+        # Forme canonique en minuscules : celle vers laquelle
+        # LowercaseURLMiddleware redirige, celle des sitemaps et de la carte
         return reverse(
             "store_details",
-            args=[self.departement, self.ville, self.slug],
+            args=[self.departement.lower(), self.ville.lower(), self.slug],
         )
 
 
+# ===========================================================
+# 🔹 Créneaux d'ouverture (index "ouvert maintenant")
+# ===========================================================
+
+class StoreOpeningInterval(models.Model):
+    """
+    Copie indexée de Store.horaires_compiles, découpée par jour : une ligne
+    par tranche [debut, fin) en minutes de la semaine. Répond à "quels
+    commerces sont ouverts à la minute M" par une seule plage d'index
+    (voir build_open_now_filter). Maintenue par Store.save().
+    """
+    store = models.ForeignKey(
+        Store,
+        on_delete=models.CASCADE,
+        related_name="creneaux",
+    )
+    debut = models.PositiveIntegerField()
+    fin = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name = "Créneau d'ouverture"
+        verbose_name_plural = "Créneaux d'ouverture"
+        indexes = [
+            models.Index(fields=["debut", "fin", "store"], name="creneau_debut_fin_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} : {self.debut}-{self.fin}"
+
+
 # ===========================================================
 # 🔹 Images supplémentaires
 # ===========================================================
@@ -370,9 +562,10 @@ class StoreImage(models.Model):
         return f"Image de {self.store.nom}"
 
     def save(self, *args, **kwargs):
-        if self.image and not self.image.name.endswith('.webp'):
-            self.image = convert_to_webp(self.image)
+        a_convertir = bool(self.image) and not self.image.name.endswith('.webp')
         super().save(*args, **kwargs)
+        if a_convertir:
+            planifier_variantes(self, "image")
 
 
 # ===========================================================
@@ -419,6 +612,43 @@ class Product(models.Model):
         return f"{self.nom} ({self.family.nom})"
 
 
+# ===========================================================
+# 🔹 Index de recherche (produits, familles, descriptions)
+# ===========================================================
+
+class SearchEntry(models.Model):
+    """
+    Un texte cherchable (nom de produit, de famille, description) sous forme
+    normalisée (voir recherche.py). Interrogé via l'index plein texte du
+    moteur : GIN sur PostgreSQL, FTS5 sur SQLite. Maintenu par les signaux.
+    """
+    TYPE_CHOICES = [
+        ("produit", "Produit"),
+        ("famille", "Famille de produits"),
+        ("description", "Description courte"),
+        ("description_longue", "Description longue"),
+    ]
+
+    store = models.ForeignKey(
+        Store,
+        on_delete=models.CASCADE,
+        related_name="entrees_recherche",
+    )
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    source_id = models.PositiveBigIntegerField()
+    contenu = models.TextField()
+
+    class Meta:
+        verbose_name = "Entrée de recherche"
+        verbose_name_plural = "Entrées de recherche"
+        indexes = [
+            models.Index(fields=["type", "source_id"], name="recherche_source_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.source_id} : {self.contenu[:50]}"
+
+
 # ===========================================================
 # 🔹 Favoris utilisateurs
 # ===========================================================
@@ -444,11 +674,25 @@ User.add_to_class(
 class CityCategoryHighlight(models.Model):
     departement = models.CharField(max_length=100)
     ville = models.CharField(max_length=100)
+    city = models.ForeignKey(
+        City,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="mises_en_avant",
+    )
 
     class Meta:
         verbose_name = "Mise en avant ville/catégorie"
         verbose_name_plural = "Mises en avant ville/catégorie"
 
+    def save(self, *args, **kwargs):
+        self.city = City.pour(self.departement, self.ville)
+        if self.city is not None:
+            self.departement, self.ville = self.city.departement.nom, self.city.nom
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.ville} ({self.departement})"
 
@@ -490,9 +734,51 @@ class StoreGalerieImage(models.Model):
         return f"Galerie image de {self.store.nom}"
 
     def save(self, *args, **kwargs):
-        if self.image and not self.image.name.endswith('.webp'):
-            self.image = convert_to_webp(self.image)
+        a_convertir = bool(self.image) and not self.image.name.endswith('.webp')
         super().save(*args, **kwargs)
+        if a_convertir:
+            planifier_variantes(self, "image")
+
+
+# ===========================================================
+# 🔹 Traitements d'images (conversion WebP, variantes)
+# ===========================================================
+
+class ImageJob(models.Model):
+    """
+    Traitement d'une image en arrière-plan (voir images.py) : une ligne par
+    fichier envoyé, pour savoir ce qui reste à faire après un redémarrage.
+    """
+    EN_ATTENTE = "en_attente"
+    EN_COURS = "en_cours"
+    TERMINE = "termine"
+    ECHEC = "echec"
+    STATUT_CHOICES = [
+        (EN_ATTENTE, "En attente"),
+        (EN_COURS, "En cours"),
+        (TERMINE, "Terminé"),
+        (ECHEC, "Échec"),
+    ]
+
+    modele = models.CharField(max_length=60)
+    objet_id = models.PositiveBigIntegerField()
+    champ = models.CharField(max_length=30)
+    fichier_source = models.CharField(max_length=255)
+    statut = models.CharField(max_length=12, choices=STATUT_CHOICES, default=EN_ATTENTE)
+    tentatives = models.PositiveSmallIntegerField(default=0)
+    erreur = models.TextField(blank=True)
+    cree_le = models.DateTimeField(auto_now_add=True)
+    modifie_le = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Traitement d'image"
+        verbose_name_plural = "Traitements d'images"
+        indexes = [
+            models.Index(fields=["statut", "cree_le"], name="imagejob_statut_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.modele}.{self.champ} #{self.objet_id} ({self.statut})"
 
 
 # ===========================================================
@@ -509,7 +795,16 @@ class PageView(models.Model):
     )
     session_id = models.CharField(max_length=100)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # default (et non auto_now_add) : l'heure réelle de la vue est fournie
+    # par l'ingestion différée (voir analytics.py)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # Agrégation journalière (statistiques.py) : plage de dates groupée
+        # par commerce, lue dans l'index seul
+        indexes = [
+            models.Index(fields=["timestamp", "store"], name="pageview_timestamp_store_idx"),
+        ]
 
 
 class StoreStats(Store):
@@ -538,7 +833,49 @@ class Click(models.Model):
 
     store = models.ForeignKey("Store", on_delete=models.CASCADE, related_name="clicks")
     type_click = models.CharField(max_length=20, choices=TYPE_CHOICES, default="site")
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # Agrégation journalière par commerce et type, lue dans l'index seul
+        indexes = [
+            models.Index(fields=["created_at", "store", "type_click"], name="click_date_store_type_idx"),
+        ]
+
+
+class StoreDailyStats(models.Model):
+    """
+    Statistiques agrégées par commerce et par jour (heure de Paris), tenues à
+    jour par `python manage.py agreger_statistiques` à partir des PageView et
+    Click bruts. L'admin et le classement de l'agent IA lisent cette table :
+    leur coût dépend du nombre de commerces et de jours, plus du nombre
+    d'événements.
+    """
+    store = models.ForeignKey(
+        "Store",
+        on_delete=models.CASCADE,
+        related_name="stats_journalieres",
+    )
+    date = models.DateField()
+    vues = models.PositiveIntegerField(default=0)
+    clics = models.PositiveIntegerField(default=0)
+    clics_itineraire = models.PositiveIntegerField(default=0)
+    clics_site = models.PositiveIntegerField(default=0)
+    clics_instagram = models.PositiveIntegerField(default=0)
+    clics_facebook = models.PositiveIntegerField(default=0)
+    clics_telephone = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Statistique journalière"
+        verbose_name_plural = "Statistiques journalières"
+        constraints = [
+            models.UniqueConstraint(fields=["store", "date"], name="stats_store_date_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["date"], name="stats_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.store_id} — {self.date}"
 
 
 class StoreSuggestion(models.Model):
@@ -613,6 +950,10 @@ class StoreSuggestion(models.Model):
         verbose_name = "Suggestion"
         verbose_name_plural = "Suggestions"
         ordering = ["-created_at"]
+        # Délai entre deux suggestions d'une même adresse IP (suggest_*)
+        indexes = [
+            models.Index(fields=["ip_address", "created_at"], name="suggestion_ip_date_idx"),
+        ]
 
 # ===========================================================
 # 🔹 Tokens FCM (Push Notifications Firebase)
@@ -0,0 +1,187 @@
+# members/navigation.py
+#
+# Arbre de navigation (menu des super catégories) précalculé par
+# (departement, ville) et stocké dans le cache partagé (Redis).
+#
+# menu_context tourne à CHAQUE rendu de template : auparavant il refaisait
+# un DISTINCT departement sur tout Store, un DISTINCT ville, un exists(), un
+# DISTINCT catégories, SuperCategory.objects.all(), puis parcourait tous les
+# commerces de la ville avec des next() linéaires. Ici :
+#
+# - l'INDEX des départements + villes connus (en minuscules -> valeur en
+#   base) est l'annuaire partagé (annuaire.py) ; un ARBRE par emplacement
+#   est construit une fois puis mis en cache ;
+# - une requête ne coûte qu'un get_many (annuaire + arbres candidats, en un
+#   aller-retour Redis) ;
+# - l'annuaire porte un numéro de version, recopié dans chaque arbre : un
+#   arbre dont la version ne correspond plus est reconstruit. Il suffit donc
+#   de supprimer l'annuaire pour invalider tout le menu (voir signals.py) ;
+# - un arbre n'est rangé que sous un emplacement connu de l'annuaire (clés
+#   département / ville de l'annuaire) : une ville inconnue, venue de l'URL
+#   ou d'un cookie, n'a aucun commerce et partage l'arbre vide. Les arbres
+#   sont des dicts et listes simples (noms, slugs, URL d'icône), jamais des
+#   instances de modèles.
+
+import unicodedata
+from urllib.parse import unquote
+
+from django.core.cache import cache
+
+from .annuaire import CLE_ANNUAIRE, annuaire, filtre_ville, invalider_annuaire
+
+# "arbres" : les anciennes entrées "arbre" contenaient des instances de modèles
+PREFIXE_ARBRE = "yuumi_menu:arbres:"
+DUREE_CACHE = 60 * 60 * 6   # filet de sécurité : les signaux invalident avant
+
+
+def _cle_arbre(cle_departement, cle_ville):
+    # Clés de l'annuaire (en minuscules). Le séparateur "|" n'apparaît dans
+    # aucun nom de ville ou de département.
+    return f"{PREFIXE_ARBRE}{cle_departement}|{cle_ville}"
+
+
+def _cle_tri(nom):
+    return unicodedata.normalize("NFD", nom.lower()).encode("ascii", "ignore").decode()
+
+
+def invalider_navigation():
+    """Oublie l'annuaire : tous les arbres en cache deviennent périmés d'un coup."""
+    invalider_annuaire()
+
+
+def _categorie(cat):
+    return {
+        "nom": str(cat),
+        "slug": cat.slug,
+        "icone": cat.icon_perso.url if cat.icon_perso else "",
+    }
+
+
+def construire_arbre(departement, ville):
+    """
+    Arbre du menu pour un emplacement, tel que master.html le parcourt :
+    {super_cat: {"items": [...]}} avec des items "inter" (name, cats) ou
+    "direct" (name, categorie), triés sans tenir compte des accents. Une
+    catégorie est un dict {nom, slug, icone}.
+    """
+    from .models import Category, Store, SuperCategory
+
+    if departement:
+        qs = Store.objects.filter(**filtre_ville(departement, ville))
+    else:
+        qs = Store.objects.none()
+
+    # Une ligne par catégorie présente (et non plus une par commerce)
+    categories = list(
+        Category.objects.filter(id__in=qs.values("categorie_id"))
+        .select_related("super_categorie", "categorie_intermediaire")
+    )
+
+    menu_supercategories = {sc.name: {"items": []} for sc in SuperCategory.objects.all()}
+    intermediaires = {}
+    for cat in categories:
+        items = menu_supercategories.setdefault(cat.super_categorie.name, {"items": []})["items"]
+        cat_inter = cat.categorie_intermediaire
+        if cat_inter:
+            item = intermediaires.get(cat_inter.pk)
+            if item is None:
+                item = {"type": "inter", "name": cat_inter.name, "cats": []}
+                intermediaires[cat_inter.pk] = item
+                items.append(item)
+            item["cats"].append(_categorie(cat))
+        else:
+            items.append({"type": "direct", "name": cat.name, "categorie": _categorie(cat)})
+
+    for bloc in menu_supercategories.values():
+        bloc["items"].sort(key=lambda x: _cle_tri(x["name"]))
+
+    return {
+        "menu_categories": [c.name for c in categories if c.name],
+        "menu_supercategories": menu_supercategories,
+    }
+
+
+def _emplacements_candidats(path_parts, request):
+    """
+    Emplacements possibles pour la requête, avant même de lire l'index :
+    clés lues en un seul get_many. Seul l'emplacement validé par l'annuaire
+    est ensuite écrit (voir navigation_pour_requete).
+    """
+    candidats = []
+    if len(path_parts) >= 2:
+        if path_parts[0] == "carte":
+            candidats.append((path_parts[1], ""))
+        else:
+            candidats.append((path_parts[0], path_parts[1]))
+    cookie_dep = request.COOKIES.get("yuumi_departement", "")
+    cookie_ville = request.COOKIES.get("yuumi_ville", "")
+    if cookie_dep and cookie_ville:
+        candidats.append((cookie_dep.lower(), cookie_ville.lower()))
+    candidats.append(("", ""))
+    return candidats
+
+
+def navigation_pour_requete(request):
+    """
+    Résout (departement, ville) comme le faisait menu_context (URL puis
+    cookies en fallback) et renvoie le contexte du menu. Un seul get_many
+    sur le cache quand tout est chaud.
+    """
+    path_parts = [unquote(p) for p in request.path.strip("/").split("/") if p]
+
+    cles = [CLE_ANNUAIRE] + [_cle_arbre(d, v) for d, v in _emplacements_candidats(path_parts, request)]
+    en_cache = cache.get_many(cles)
+
+    index = annuaire(en_cache)
+    deps_map = index["departements"]
+
+    departement = ""
+    ville = ""
+    # Emplacement validé : clés de l'annuaire, seules utilisées pour le cache
+    cle_dep = ""
+    cle_ville = ""
+
+    # Cas : /carte/<departement>/
+    if len(path_parts) >= 2 and path_parts[0] == "carte" and path_parts[1] in deps_map:
+        cle_dep = path_parts[1]
+        departement = deps_map[cle_dep]
+
+    # Cas : /<departement>/<ville>/...
+    elif len(path_parts) >= 2 and path_parts[0] in deps_map:
+        cle_dep = path_parts[0]
+        departement = deps_map[cle_dep]
+        villes_map = index["villes"].get(cle_dep, {})
+        ville = villes_map.get(path_parts[1], path_parts[1])
+        if path_parts[1] in villes_map:
+            cle_ville = path_parts[1]
+
+    # Fallback cookie : dernière ville visitée
+    if not ville:
+        cookie_dep = request.COOKIES.get("yuumi_departement", "").lower()
+        cookie_ville = request.COOKIES.get("yuumi_ville", "")
+        if cookie_dep in deps_map and cookie_ville:
+            villes_map = index["villes"].get(cookie_dep, {})
+            cle_dep = cookie_dep
+            departement = deps_map[cle_dep]
+            ville = villes_map.get(cookie_ville.lower(), cookie_ville)
+            if cookie_ville.lower() in villes_map:
+                cle_ville = cookie_ville.lower()
+
+    # Ville inconnue de l'annuaire : aucun commerce, même arbre que sans
+    # emplacement ; une valeur arbitraire ne crée jamais de clé de cache
+    if ville and not cle_ville:
+        cle_dep = ""
+
+    cle = _cle_arbre(cle_dep, cle_ville)
+    arbre = en_cache.get(cle)
+    if arbre is None or arbre.get("version") != index["version"]:
+        arbre = construire_arbre(cle_dep, cle_ville)
+        arbre["version"] = index["version"]
+        cache.set(cle, arbre, DUREE_CACHE)
+
+    return {
+        "menu_categories": arbre["menu_categories"],
+        "menu_supercategories": arbre["menu_supercategories"],
+        "menu_departement": departement,
+        "menu_ville": ville,
+    }
@@ -0,0 +1,45 @@
+# members/outils_tests.py
+#
+# Outils communs aux tests de members (members/tests_*.py) : réglage de
+# stockage sans manifeste collectstatic et fabriques de commerces. Pas de
+# TestCase ici : le module n'est pas collecté par le lanceur de tests.
+
+from members.models import Category, Product, ProductFamily, Store, SuperCategory
+
+# Pas de manifeste collectstatic en test : @override_settings(STORAGES=STOCKAGE_TEST)
+STOCKAGE_TEST = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+def creer_commerce(nom="Le Comptoir", departement="Haute-Savoie", ville="Annecy", **champs):
+    """
+    Store minimal, rattaché à sa ville par save(). champs complète ou
+    remplace les valeurs par défaut (categorie, descriptionpetite, horaires...).
+    """
+    valeurs = {
+        "ville_precise": ville,
+        "descriptionpetite": "Commerce de quartier.",
+        "addressemaps": "1 rue du Test",
+        # Coordonnées fixes : pas de thread de géocodage au save()
+        "latitude": 45.9,
+        "longitude": 6.13,
+    }
+    valeurs.update(champs)
+    return Store.objects.create(nom=nom, departement=departement, ville=ville, **valeurs)
+
+
+def commerce_avec_catalogue(familles=3, produits=4):
+    """Épicerie fine d'Annecy avec familles x produits au catalogue."""
+    sc = SuperCategory.objects.create(name="Alimentation", slug="alimentation")
+    categorie = Category.objects.create(name="Épicerie fine", super_categorie=sc)
+    store = creer_commerce(
+        departement="haute-savoie", ville="annecy", ville_precise="Annecy",
+        descriptionpetite="Épicerie fine", categorie=categorie,
+    )
+    for f in range(familles):
+        famille = ProductFamily.objects.create(store=store, nom=f"Famille {f}")
+        for p in range(produits):
+            Product.objects.create(family=famille, nom=f"Produit {f}-{p}")
+    return store
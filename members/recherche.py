@@ -0,0 +1,357 @@
+# members/recherche.py
+#
+# Index de recherche plein texte (catalogue produits + descriptions).
+#
+# Avant : search_product, find_stores_by_product et find_stores_by_description
+# enchaînaient des icontains (LIKE '%x%') sur Product.nom, ProductFamily.nom,
+# descriptionpetite et descriptiongrande -> parcours séquentiel de tables
+# entières à chaque recherche et à chaque appel de l'agent IA.
+#
+# Ici, chaque texte cherchable devient une ligne SearchEntry dont le contenu
+# est déjà normalisé (minuscules, sans accents, mots vides retirés,
+# racinisation légère du français). La recherche passe par un index :
+# - PostgreSQL : SearchVector / GIN (config "simple", la normalisation est
+#   faite ici, pas par PostgreSQL) ;
+# - SQLite (dev) : table virtuelle FTS5 tenue à jour par des triggers ;
+# - autre moteur : repli sur un contains sur le contenu normalisé.
+# Les tables / index spécifiques sont créés par la migration 0045.
+#
+# L'index est maintenu au fil de l'eau par les signaux (signals.py) sur
+# Store, ProductFamily et Product ; `python manage.py reindexer_recherche`
+# le reconstruit entièrement (après un import en masse par exemple).
+
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import FloatField, Func, Q
+
+from .annuaire import filtre_ville
+
+TYPE_PRODUIT = "produit"
+TYPE_FAMILLE = "famille"
+TYPE_DESCRIPTION = "description"
+TYPE_DESCRIPTION_LONGUE = "description_longue"
+
+TYPES_CATALOGUE = (TYPE_PRODUIT, TYPE_FAMILLE)
+TYPES_DESCRIPTION = (TYPE_DESCRIPTION, TYPE_DESCRIPTION_LONGUE)
+
+# Poids de chaque source dans le score d'un commerce : un produit au
+# catalogue pèse plus qu'une mention dans la description longue.
+POIDS = {
+    TYPE_PRODUIT: 1.0,
+    TYPE_FAMILLE: 0.8,
+    TYPE_DESCRIPTION: 0.6,
+    TYPE_DESCRIPTION_LONGUE: 0.4,
+}
+
+LIMITE_RESULTATS = 300
+
+TABLE_FTS = "members_searchentry_fts"
+
+MOTS_VIDES = {
+    "a", "au", "aux", "avec", "ce", "ces", "d", "dans", "de", "des", "du",
+    "en", "et", "l", "la", "le", "les", "mon", "ou", "par", "pas", "pour",
+    "sa", "sans", "ses", "son", "sur", "un", "une",
+}
+
+_MOT = re.compile(r"[a-z0-9]+")
+
+
+# -----------------------------------------------------------------
+# Normalisation
+# -----------------------------------------------------------------
+
+def _sans_accents(texte):
+    return unicodedata.normalize("NFD", texte).encode("ascii", "ignore").decode()
+
+
+def raciniser(mot):
+    """
+    Racinisation légère du français : pluriels (s, x, -aux, -eaux) puis e
+    final (féminins). Appliquée à l'identique à l'indexation et à la
+    requête : "Foies gras" et "foie gras" donnent les mêmes racines.
+    """
+    if len(mot) > 4 and mot.endswith("eaux"):
+        mot = mot[:-1]
+    elif len(mot) > 4 and mot.endswith("aux"):
+        mot = mot[:-3] + "al"
+    elif len(mot) > 3 and mot[-1] in "sx":
+        mot = mot[:-1]
+    if len(mot) > 4 and mot.endswith("e"):
+        mot = mot[:-1]
+    return mot
+
+
+def normaliser(texte):
+    """Liste des racines d'un texte (sans accents, sans mots vides)."""
+    if not texte:
+        return []
+    mots = _MOT.findall(_sans_accents(texte.lower()))
+    return [raciniser(m) for m in mots if m not in MOTS_VIDES and len(m) > 1]
+
+
+def contenu_indexe(texte):
+    return " ".join(normaliser(texte))
+
+
+# -----------------------------------------------------------------
+# Construction de l'index
+# -----------------------------------------------------------------
+
+def entrees_commerce(store):
+    """(type, source_id, contenu) des descriptions d'un commerce."""
+    return [
+        (TYPE_DESCRIPTION, store.pk, contenu_indexe(store.descriptionpetite)),
+        (TYPE_DESCRIPTION_LONGUE, store.pk, contenu_indexe(store.descriptiongrande)),
+    ]
+
+
+def _remplacer(type_entree, source_id, store_id, contenu):
+    from .models import SearchEntry
+
+    SearchEntry.objects.filter(type=type_entree, source_id=source_id).delete()
+    if contenu:
+        SearchEntry.objects.create(
+            store_id=store_id, type=type_entree, source_id=source_id, contenu=contenu,
+        )
+
+
+def indexer_commerce(store):
+    for type_entree, source_id, contenu in entrees_commerce(store):
+        _remplacer(type_entree, source_id, store.pk, contenu)
+
+
+def indexer_famille(famille):
+    from .models import SearchEntry
+
+    _remplacer(TYPE_FAMILLE, famille.pk, famille.store_id, contenu_indexe(famille.nom))
+    # Les produits suivent leur famille si elle change de commerce
+    SearchEntry.objects.filter(
+        type=TYPE_PRODUIT,
+        source_id__in=famille.products.values("id"),
+    ).exclude(store_id=famille.store_id).update(store_id=famille.store_id)
+
+
+def indexer_produit(produit):
+    store_id = produit.family.store_id
+    _remplacer(TYPE_PRODUIT, produit.pk, store_id, contenu_indexe(produit.nom))
+
+
+def desindexer(type_entree, source_id):
+    from .models import SearchEntry
+
+    SearchEntry.objects.filter(type=type_entree, source_id=source_id).delete()
+
+
+def reconstruire_index(apps=None):
+    """
+    Vide et reconstruit tout l'index. apps : registre de modèles (celui d'une
+    migration), ou le registre courant par défaut.
+    """
+    if apps is None:
+        from django.apps import apps
+
+    SearchEntry = apps.get_model("members", "SearchEntry")
+    Store = apps.get_model("members", "Store")
+    ProductFamily = apps.get_model("members", "ProductFamily")
+    Product = apps.get_model("members", "Product")
+
+    SearchEntry.objects.all().delete()
+
+    entrees = []
+    for store in Store.objects.only("id", "descriptionpetite", "descriptiongrande").iterator():
+        entrees.extend(
+            SearchEntry(store_id=store.pk, type=t, source_id=s, contenu=c)
+            for t, s, c in entrees_commerce(store) if c
+        )
+    for famille_id, store_id, nom in ProductFamily.objects.values_list("id", "store_id", "nom").iterator():
+        contenu = contenu_indexe(nom)
+        if contenu:
+            entrees.append(SearchEntry(store_id=store_id, type=TYPE_FAMILLE, source_id=famille_id, contenu=contenu))
+    for produit_id, store_id, nom in Product.objects.values_list("id", "family__store_id", "nom").iterator():
+        contenu = contenu_indexe(nom)
+        if contenu:
+            entrees.append(SearchEntry(store_id=store_id, type=TYPE_PRODUIT, source_id=produit_id, contenu=contenu))
+
+    SearchEntry.objects.bulk_create(entrees, batch_size=1000)
+    return len(entrees)
+
+
+# -----------------------------------------------------------------
+# Recherche
+# -----------------------------------------------------------------
+
+def _groupes(termes):
+    """
+    Une requête = plusieurs termes (OU), chaque terme = plusieurs racines (ET).
+    "bouquet de roses" -> [["bouquet", "rose"]] : comme l'ancien icontains
+    sur la phrase, toutes les racines du terme doivent être présentes.
+    """
+    groupes = []
+    for terme in termes:
+        racines = normaliser(terme)
+        if racines and racines not in groupes:
+            groupes.append(racines)
+    return groupes
+
+
+_fts5_disponible = None
+
+
+def _sqlite_fts5():
+    global _fts5_disponible
+    if _fts5_disponible is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE_FTS]
+            )
+            _fts5_disponible = cursor.fetchone() is not None
+    return _fts5_disponible
+
+
+def _requete_postgresql(groupes):
+    from django.contrib.postgres.search import SearchQuery
+
+    # Préfixes (:*) : "chocolat" trouve aussi "chocolaterie", comme avant
+    expression = " | ".join(
+        "(" + " & ".join(f"{racine}:*" for racine in groupe) + ")" for groupe in groupes
+    )
+    return SearchQuery(expression, search_type="raw", config="simple")
+
+
+def _requete_sqlite(groupes):
+    return " OR ".join(
+        "(" + " AND ".join(f'"{racine}"*' for racine in groupe) + ")" for groupe in groupes
+    )
+
+
+def _condition_repli(groupes):
+    q = Q()
+    for groupe in groupes:
+        q_groupe = Q()
+        for racine in groupe:
+            q_groupe &= Q(contenu__contains=racine)
+        q |= q_groupe
+    return q
+
+
+class _ScoreFts5(Func):
+    """-bm25 d'une entrée pour une requête FTS5 (sous-requête corrélée sur son id)."""
+
+    template = f"(SELECT -bm25({TABLE_FTS}) FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %(expressions)s)"
+    arg_joiner = " AND rowid = "
+    output_field = FloatField()
+
+
+def _lignes_postgresql(entrees, groupes, limite):
+    from django.contrib.postgres.search import SearchRank, SearchVector
+
+    requete = _requete_postgresql(groupes)
+    vecteur = SearchVector("contenu", config="simple")   # même expression que l'index GIN
+    return list(
+        entrees.annotate(vecteur=vecteur, score=SearchRank(vecteur, requete))
+        .filter(vecteur=requete)
+        .order_by("-score")
+        .values_list("store_id", "source_id", "type", "score")[:limite]
+    )
+
+
+def _lignes_sqlite(entrees, groupes, limite):
+    expression = _requete_sqlite(groupes)
+    sous_requete, params = entrees.values("id").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, -bm25({TABLE_FTS}) FROM {TABLE_FTS} "
+            f"WHERE {TABLE_FTS} MATCH %s AND rowid IN ({sous_requete}) "
+            f"ORDER BY 2 DESC LIMIT %s",
+            [expression, *params, limite],
+        )
+        scores = dict(cursor.fetchall())
+    return [
+        (store_id, source_id, type_entree, scores[entree_id])
+        for entree_id, store_id, source_id, type_entree in entrees.filter(
+            id__in=list(scores)
+        ).values_list("id", "store_id", "source_id", "type")
+    ]
+
+
+def _lignes_repli(entrees, groupes, limite):
+    return [
+        (store_id, source_id, type_entree, 1.0)
+        for store_id, source_id, type_entree in entrees.filter(_condition_repli(groupes)).values_list(
+            "store_id", "source_id", "type"
+        )[:limite]
+    ]
+
+
+def rechercher(termes, types, departement="", ville="", limite=LIMITE_RESULTATS):
+    """
+    Entrées d'index correspondant à au moins un des termes, triées par
+    pertinence : liste de (store_id, source_id, type, score). Le score est
+    celui du moteur (ts_rank, bm25) : il ne sert qu'à comparer les résultats
+    d'une même recherche entre eux.
+    """
+    from .models import SearchEntry
+
+    groupes = _groupes(termes)
+    if not groupes:
+        return []
+
+    entrees = SearchEntry.objects.filter(type__in=types)
+    if departement or ville:
+        entrees = entrees.filter(**filtre_ville(departement, ville, "store__city"))
+
+    if connection.vendor == "postgresql":
+        lignes = _lignes_postgresql(entrees, groupes, limite)
+    elif connection.vendor == "sqlite" and _sqlite_fts5():
+        lignes = _lignes_sqlite(entrees, groupes, limite)
+    else:
+        lignes = _lignes_repli(entrees, groupes, limite)
+
+    lignes.sort(key=lambda ligne: -ligne[3])
+    return lignes
+
+
+def scores_par_commerce(termes, types, departement="", ville=""):
+    """
+    {store_id: score} : somme des scores des entrées trouvées, pondérés par
+    leur source (POIDS). Un commerce qui a plusieurs produits correspondants
+    passe devant celui qui n'en a qu'un.
+    """
+    scores = {}
+    for store_id, _source_id, type_entree, score in rechercher(termes, types, departement, ville):
+        scores[store_id] = scores.get(store_id, 0.0) + float(score) * POIDS[type_entree]
+    return scores
+
+
+def entrees_correspondantes(termes, types):
+    """
+    Même correspondance que rechercher(), mais sous forme de queryset
+    SearchEntry annoté "score" (ts_rank, bm25, 1.0 en repli) : la condition
+    reste en SQL et se combine dans d'autres requêtes (sous-requêtes
+    corrélées sur store), sans aller-retour par une liste d'ID. None si les
+    termes ne contiennent aucune racine cherchable.
+    """
+    from django.db.models import F, Value
+    from django.db.models.expressions import RawSQL
+
+    from .models import SearchEntry
+
+    groupes = _groupes(termes)
+    if not groupes:
+        return None
+
+    entrees = SearchEntry.objects.filter(type__in=types)
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.search import SearchRank, SearchVector
+
+        requete = _requete_postgresql(groupes)
+        vecteur = SearchVector("contenu", config="simple")
+        return entrees.annotate(vecteur=vecteur, score=SearchRank(vecteur, requete)).filter(vecteur=requete)
+    if connection.vendor == "sqlite" and _sqlite_fts5():
+        expression = _requete_sqlite(groupes)
+        return entrees.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {TABLE_FTS} WHERE {TABLE_FTS} MATCH %s", [expression]),
+        ).annotate(score=_ScoreFts5(Value(expression), F("id")))
+    return entrees.filter(_condition_repli(groupes)).annotate(score=Value(1.0, output_field=FloatField()))
@@ -0,0 +1,114 @@
+# members/revalidation.py
+#
+# Requêtes conditionnelles (ETag / Last-Modified) sur la fiche commerce,
+# la carte d'un département et la recherche de produits : un client qui a
+# déjà la réponse (app Capacitor, robots d'indexation, retour arrière du
+# navigateur) la revalide et reçoit un 304 vide tant que rien de ce
+# qu'elle affiche n'a changé.
+#
+# La version du contenu réutilise les étiquettes du cache des pages
+# (cache_pages.py), déjà périmées par les signaux à chaque modification :
+# étiquette globale + étiquettes propres à la vue (ville, département, tout
+# contenu), version du menu (annuaire.py) et, pour un compte connecté,
+# son étiquette (favoris, défavoris, notes, listes, premium). Calculer
+# l'ETag ne coûte qu'un get_many Redis, sans SQL ni gabarit.
+#
+# - ETag : empreinte de ces versions + variante app / web + cookie CSRF
+#   (une page revalidée garde le jeton qu'elle contient) + éléments propres
+#   à la vue (fiche : prochaine ouverture / fermeture du commerce).
+# - Last-Modified : la plus récente des versions (time_ns de création de
+#   l'étiquette, donc postérieure à la modification qui l'a périmée).
+# - Cache-Control "private, no-cache" : le client garde la réponse mais la
+#   revalide à chaque usage, rien de périmé n'est affiché
+#   (NoCacheHTMLMiddleware laisse ces réponses telles quelles).
+# - partage=True (données de la carte, carte.py) : réponse identique pour
+#   tous, ETag sans compte ni cookie, "public, no-cache" ; une réponse
+#   compressée par la vue reçoit un ETag faible.
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .annuaire import CLE_ANNUAIRE
+from .cache_pages import ETIQUETTE_GLOBALE, etiquette_utilisateur, versions_etiquettes
+from .utils import is_native_request
+
+
+def _empreinte(morceaux):
+    return quote_etag(hashlib.sha256("|".join(map(str, morceaux)).encode("utf-8")).hexdigest()[:32])
+
+
+def _etag(request, versions, version_menu, elements):
+    from .ai_agent.access import is_premium_user
+
+    user = request.user
+    return _empreinte([
+        "app" if is_native_request(request) else "web",
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+        # Premium qui expire : aucun signal, l'ETag change quand même
+        f"{user.pk}:{is_premium_user(user)}" if user.is_authenticated else "anonyme",
+        version_menu,
+        *versions,
+        *elements,
+    ])
+
+
+def revalider(etiquettes, elements=None, sur_304=None, partage=False):
+    """
+    Décorateur : ETag / Last-Modified et réponse 304.
+
+    etiquettes(request, *args, **kwargs) -> clés d'étiquettes (cache_pages)
+    dont dépend la réponse, en plus de l'étiquette globale.
+    elements(request, versions, *args, **kwargs) -> valeurs ajoutées à
+    l'ETag ({clé: version} des étiquettes), ou None : pas de revalidation.
+    sur_304(request, elements) : effets de bord à rejouer sur un 304.
+    partage : réponse indépendante du visiteur (ni compte, ni menu, ni CSRF).
+    """
+    def decorateur(vue):
+        @wraps(vue)
+        def _vue(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return vue(request, *args, **kwargs)
+            # Messages en attente : réponse propre à cet affichage
+            if not partage and len(get_messages(request)):
+                return vue(request, *args, **kwargs)
+
+            cles = [ETIQUETTE_GLOBALE, *etiquettes(request, *args, **kwargs)]
+            if not partage and request.user.is_authenticated:
+                cles.append(etiquette_utilisateur(request.user.pk))
+            en_cache = cache.get_many(cles if partage else cles + [CLE_ANNUAIRE])
+            versions = versions_etiquettes(en_cache, cles)
+            index = en_cache.get(CLE_ANNUAIRE)
+
+            extra = []
+            if elements is not None:
+                extra = elements(request, dict(zip(cles, versions)), *args, **kwargs)
+                if extra is None:
+                    return vue(request, *args, **kwargs)
+
+            if partage:
+                etag = _empreinte([*versions, *extra])
+            else:
+                etag = _etag(request, versions, index["version"] if index else "", extra)
+            modifie = max(versions) // 10 ** 9
+            reponse = get_conditional_response(request, etag=etag, last_modified=modifie)
+            if reponse is None:
+                reponse = vue(request, *args, **kwargs)
+                if reponse.status_code != 200 or reponse.streaming:
+                    return reponse
+            elif sur_304 is not None and reponse.status_code == 304:
+                sur_304(request, extra)
+
+            if reponse.has_header("Content-Encoding"):
+                etag = "W/" + etag   # même contenu, autre encodage
+            reponse.headers.setdefault("ETag", etag)
+            reponse.headers.setdefault("Last-Modified", http_date(modifie))
+            reponse["Cache-Control"] = "public, no-cache" if partage else "private, no-cache"
+            return reponse
+        return _vue
+    return decorateur
@@ -0,0 +1,204 @@
+# members/signals.py
+#
+# Maintenance des données dérivées : invalidation du menu de navigation,
+# du catalogue de catégories de l'agent IA, des pages anonymes mises en
+# cache et des ETag, mise à jour de l'index de recherche. Branché dans
+# MembersConfig.ready().
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import recherche
+from .ai_agent.client import invalider_catalogue_categories
+from .cache_pages import invalider_pour, invalider_utilisateur, invalider_ville
+from .models import (
+    CategorieIntermediaire, Category, CityCategoryHighlight, CityCategoryItem,
+    Product, ProductFamily, Store, StoreGalerieImage, StoreImage, StoreNote,
+    SuperCategory, UserPremium, Wishlist, WishlistStore,
+)
+from .navigation import invalider_navigation
+from .tuiles import invalider_tuiles
+
+# Champs d'un Store qui influencent l'annuaire des villes et le menu : un
+# save() qui n'en change aucun (description, horaires, last_claim_request...)
+# ne vide pas le cache.
+CHAMPS_STORE_NAVIGATION = ("departement", "ville", "categorie_id")
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def store_modifie(sender, instance, signal, **kwargs):
+    # Valeurs d'avant le save : voir memoriser_emplacement plus bas
+    precedent = getattr(instance, "_yuumi_valeurs_precedentes", None)
+    if signal is post_save and precedent is not None and all(
+        precedent[champ] == getattr(instance, champ) for champ in CHAMPS_STORE_NAVIGATION
+    ):
+        return
+    # Annuaire (annuaire.py) et, avec lui, tous les arbres du menu
+    invalider_navigation()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=CategorieIntermediaire)
+@receiver(post_delete, sender=CategorieIntermediaire)
+@receiver(post_save, sender=SuperCategory)
+@receiver(post_delete, sender=SuperCategory)
+def categorie_modifiee(sender, **kwargs):
+    invalider_navigation()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SuperCategory)
+@receiver(post_delete, sender=SuperCategory)
+def catalogue_categories_modifie(sender, **kwargs):
+    # Liste des catégories du prompt de l'agent IA (voir ai_agent/client.py)
+    invalider_catalogue_categories()
+
+
+# -----------------------------------------------------------------
+# Cache des pages anonymes (voir cache_pages.py) : toute modification
+# périme les pages de la ville concernée ; catégories : toutes les pages.
+# -----------------------------------------------------------------
+
+# Champs d'un Store affichés par les marqueurs de la carte (voir tuiles.py)
+CHAMPS_STORE_CARTE = ("departement", "ville", "slug", "nom", "latitude", "longitude",
+                      "categorie_id", "photo", "photo_small")
+
+
+def _valeur_carte(instance, champ):
+    valeur = getattr(instance, champ)
+    return (valeur.name or "") if champ.startswith("photo") else valeur
+
+
+@receiver(pre_save, sender=Store)
+def memoriser_emplacement(sender, instance, **kwargs):
+    # Commerce qui change de ville : les pages de l'ancienne ville aussi ;
+    # valeurs précédentes des marqueurs : seul un changement visible sur la
+    # carte périme ses groupes
+    instance._yuumi_valeurs_precedentes = (
+        Store.objects.filter(pk=instance.pk).values(*CHAMPS_STORE_CARTE).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def store_modifie_pages(sender, instance, **kwargs):
+    precedent = getattr(instance, "_yuumi_valeurs_precedentes", None)
+    if precedent and (precedent["departement"], precedent["ville"]) != (instance.departement, instance.ville):
+        invalider_ville(precedent["departement"], precedent["ville"])
+    invalider_pour(instance)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def store_modifie_carte(sender, instance, signal, **kwargs):
+    precedent = getattr(instance, "_yuumi_valeurs_precedentes", None)
+    if signal is post_save and precedent is not None and all(
+        (precedent[champ] or "") == (_valeur_carte(instance, champ) or "") for champ in CHAMPS_STORE_CARTE
+    ):
+        return
+    invalider_tuiles(instance.departement)
+    if precedent and precedent["departement"] != instance.departement:
+        invalider_tuiles(precedent["departement"])
+
+
+@receiver(post_save, sender=ProductFamily)
+@receiver(post_delete, sender=ProductFamily)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=StoreImage)
+@receiver(post_delete, sender=StoreImage)
+@receiver(post_save, sender=StoreGalerieImage)
+@receiver(post_delete, sender=StoreGalerieImage)
+@receiver(post_save, sender=CityCategoryHighlight)
+@receiver(post_delete, sender=CityCategoryHighlight)
+@receiver(post_save, sender=CityCategoryItem)
+@receiver(post_delete, sender=CityCategoryItem)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=CategorieIntermediaire)
+@receiver(post_delete, sender=CategorieIntermediaire)
+@receiver(post_save, sender=SuperCategory)
+@receiver(post_delete, sender=SuperCategory)
+def contenu_de_page_modifie(sender, instance, **kwargs):
+    invalider_pour(instance)
+
+
+# -----------------------------------------------------------------
+# Requêtes conditionnelles (voir revalidation.py) : ce qu'un compte voit
+# de plus qu'un anonyme (favoris, défavoris, notes, listes, premium).
+# -----------------------------------------------------------------
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=User.favoris.through)
+@receiver(m2m_changed, sender=User.unfavoris.through)
+def favoris_modifies(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        invalider_utilisateur(instance.pk)
+        return
+    # store.favorited_by.add(...) : instance est le commerce
+    if pk_set is None:
+        pk_set = sender.objects.filter(store_id=instance.pk).values_list("user_id", flat=True)
+    for user_id in pk_set:
+        invalider_utilisateur(user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=StoreNote)
+@receiver(post_delete, sender=StoreNote)
+@receiver(post_save, sender=Wishlist)
+@receiver(post_delete, sender=Wishlist)
+@receiver(post_save, sender=UserPremium)
+@receiver(post_delete, sender=UserPremium)
+def compte_modifie(sender, instance, **kwargs):
+    invalider_utilisateur(instance.pk if sender is User else instance.user_id)
+
+
+@receiver(post_save, sender=WishlistStore)
+@receiver(post_delete, sender=WishlistStore)
+def liste_modifiee(sender, instance, **kwargs):
+    user_id = Wishlist.objects.filter(pk=instance.wishlist_id).values_list("user_id", flat=True).first()
+    if user_id is not None:
+        invalider_utilisateur(user_id)
+
+
+# -----------------------------------------------------------------
+# Index de recherche (voir recherche.py)
+# -----------------------------------------------------------------
+
+CHAMPS_STORE_RECHERCHE = {"descriptionpetite", "descriptiongrande"}
+
+
+@receiver(post_save, sender=Store)
+def indexer_commerce(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not CHAMPS_STORE_RECHERCHE.intersection(update_fields):
+        return
+    recherche.indexer_commerce(instance)
+
+
+@receiver(post_save, sender=ProductFamily)
+def indexer_famille(sender, instance, **kwargs):
+    recherche.indexer_famille(instance)
+
+
+@receiver(post_delete, sender=ProductFamily)
+def desindexer_famille(sender, instance, **kwargs):
+    recherche.desindexer(recherche.TYPE_FAMILLE, instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def indexer_produit(sender, instance, **kwargs):
+    recherche.indexer_produit(instance)
+
+
+@receiver(post_delete, sender=Product)
+def desindexer_produit(sender, instance, **kwargs):
+    recherche.desindexer(recherche.TYPE_PRODUIT, instance.pk)
@@ -1,9 +1,90 @@
 # members/sitemaps.py
-
+#
+# Sitemaps du site : un index (/sitemap.xml) qui pointe vers une section
+# par type de page (/sitemap-<section>.xml), chacune découpée en pages de
+# TAILLE_PAGE URL (?p=2, ?p=3...).
+#
+# L'ancien /sitemap.xml unique parcourait tout Store trois fois par visite
+# d'un robot (catégories, super-catégories, fiches) et construisait tout le
+# XML en mémoire. Ici :
+#
+# - combinaisons() : les couples ville / catégorie et ville /
+#   super-catégorie viennent d'un DISTINCT (city, categorie), à la portée
+#   de l'index store_ville_categorie_idx, calculé une fois et rangé dans le
+#   cache avec le numéro de version de l'annuaire (annuaire.py) : tout ce
+#   qui périme l'annuaire (commerce déplacé, catégorie modifiée) périme
+#   aussi les combinaisons ;
+# - StoreSitemap lit les fiches page par page (LIMIT / OFFSET sur la clé
+#   primaire), lastmod = dernière entrée de l'historique du commerce
+#   (HistoricalStore), à défaut horaires_updated_at ;
+# - generer() (commande `python manage.py generer_sitemaps`, en cron)
+#   écrit l'index et toutes les pages dans settings.SITEMAPS_ROOT ; les
+#   vues index / section servent ces fichiers en flux (FileResponse) et ne
+#   calculent une page à la demande que si son fichier n'existe pas encore.
+
+import os
+import types
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps import views as vues_sitemaps
+from django.core.cache import cache
+from django.http import FileResponse
 from django.urls import reverse
-
-from .models import Store, Category, SuperCategory
+from django.views.decorators.http import condition
+
+from .annuaire import DUREE_ANNUAIRE, annuaire, emplacements
+from .models import Store
+
+TAILLE_PAGE = 5000
+CLE_COMBINAISONS = "yuumi_sitemap_combinaisons"
+FICHIER_INDEX = "sitemap.xml"
+
+
+def combinaisons():
+    """
+    {"categories": [(departement, ville, slug)], "super_categories": [...]}
+    triés, pour les villes qui ont des commerces de la catégorie.
+    """
+    index = annuaire()
+    valeur = cache.get(CLE_COMBINAISONS)
+    if valeur is None or valeur["version"] != index["version"]:
+        valeur = construire_combinaisons(index)
+        cache.set(CLE_COMBINAISONS, valeur, DUREE_ANNUAIRE)
+    return valeur
+
+
+def construire_combinaisons(index):
+    noms = {}
+    for cle, par_ville in index["ids"].items():
+        for cle_ville, pk in par_ville.items():
+            ville = index["villes"].get(cle, {}).get(cle_ville)
+            if ville is not None:
+                noms[pk] = (index["departements"][cle], ville)
+
+    categories, super_categories = set(), set()
+    lignes = (
+        Store.objects
+        .filter(city__isnull=False, categorie__isnull=False)
+        .values_list("city_id", "categorie__slug", "categorie__super_categorie__slug")
+        .order_by()
+        .distinct()
+    )
+    for city_id, cat_slug, super_slug in lignes:
+        if city_id not in noms:
+            continue
+        if cat_slug:
+            categories.add((*noms[city_id], cat_slug))
+        if super_slug:
+            super_categories.add((*noms[city_id], super_slug))
+
+    return {
+        "version": index["version"],
+        "categories": sorted(categories),
+        "super_categories": sorted(super_categories),
+    }
 
 
 # ============================================================
@@ -13,6 +94,7 @@ from .models import Store, Category, SuperCategory
 class StaticSitemap(Sitemap):
     changefreq = "monthly"
     priority = 0.5
+    limit = TAILLE_PAGE
 
     def items(self):
         return [
@@ -37,15 +119,10 @@ class StaticSitemap(Sitemap):
 class CitySitemap(Sitemap):
     changefreq = "daily"
     priority = 0.7
+    limit = TAILLE_PAGE
 
     def items(self):
-        combos = (
-            Store.objects
-            .values_list("departement", "ville")
-            .distinct()
-            .order_by("departement", "ville")
-        )
-        return list(combos)
+        return emplacements()
 
     def location(self, item):
         departement, ville = item
@@ -59,19 +136,10 @@ class CitySitemap(Sitemap):
 class CategorySitemap(Sitemap):
     changefreq = "weekly"
     priority = 0.6
+    limit = TAILLE_PAGE
 
     def items(self):
-        combos = set()
-        qs = (
-            Store.objects
-            .select_related("categorie")
-            .exclude(categorie=None)
-            .values_list("departement", "ville", "categorie__slug")
-        )
-        for dep, ville, cat_slug in qs:
-            if cat_slug:
-                combos.add((dep, ville, cat_slug))
-        return sorted(combos)
+        return combinaisons()["categories"]
 
     def location(self, item):
         departement, ville, cat_slug = item
@@ -85,20 +153,10 @@ class CategorySitemap(Sitemap):
 class SuperCategorySitemap(Sitemap):
     changefreq = "weekly"
     priority = 0.6
+    limit = TAILLE_PAGE
 
     def items(self):
-        combos = set()
-        qs = (
-            Store.objects
-            .select_related("categorie__super_categorie")
-            .exclude(categorie=None)
-            .exclude(categorie__super_categorie=None)
-            .values_list("departement", "ville", "categorie__super_categorie__slug")
-        )
-        for dep, ville, super_slug in qs:
-            if super_slug:
-                combos.add((dep, ville, super_slug))
-        return sorted(combos)
+        return combinaisons()["super_categories"]
 
     def location(self, item):
         departement, ville, super_slug = item
@@ -112,15 +170,38 @@ class SuperCategorySitemap(Sitemap):
 class StoreSitemap(Sitemap):
     changefreq = "weekly"
     priority = 0.8
+    limit = TAILLE_PAGE
 
     def items(self):
-        return Store.objects.all().order_by("departement", "ville", "slug")
+        from django.db.models import OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+
+        derniere_version = (
+            Store.history.model.objects
+            .filter(id=OuterRef("pk"))
+            .order_by("-history_date")
+            .values("history_date")[:1]
+        )
+        return (
+            Store.objects
+            .order_by("pk")
+            .annotate(modifie_le=Coalesce(Subquery(derniere_version), "horaires_updated_at"))
+            .values("pk", "departement", "ville", "slug", "modifie_le")
+        )
 
-    def location(self, obj):
-        return obj.get_absolute_url().lower()
+    def location(self, item):
+        # Mêmes arguments que Store.get_absolute_url
+        return reverse(
+            "store_details", args=[item["departement"].lower(), item["ville"].lower(), item["slug"]],
+        )
+
+    def lastmod(self, item):
+        return item["modifie_le"]
 
-    def lastmod(self, obj):
-        return obj.horaires_updated_at
+    def get_latest_lastmod(self):
+        # L'index calculé à la demande s'en passe : le calculer relirait
+        # toutes les fiches. generer() le renseigne page par page.
+        return None
 
 
 # ============================================================
@@ -130,15 +211,123 @@ class StoreSitemap(Sitemap):
 class CategoriesVilleSitemap(Sitemap):
     changefreq = "weekly"
     priority = 0.5
+    limit = TAILLE_PAGE
 
     def items(self):
-        return list(
-            Store.objects
-            .values_list("departement", "ville")
-            .distinct()
-            .order_by("departement", "ville")
-        )
+        return emplacements()
 
     def location(self, item):
         departement, ville = item
         return reverse("categories_ville", args=[departement.lower(), ville.lower()])
+
+
+SITEMAPS = {
+    "static":            StaticSitemap,
+    "villes":            CitySitemap,
+    "categories":        CategorySitemap,
+    "supercategories":   SuperCategorySitemap,
+    "commerces":         StoreSitemap,
+    "categories_ville":  CategoriesVilleSitemap,
+}
+
+
+# ============================================================
+# Fichiers pré-générés
+# ============================================================
+
+def _dossier():
+    return Path(getattr(settings, "SITEMAPS_ROOT", settings.BASE_DIR / "sitemaps"))
+
+
+def _nom_page(section, page):
+    return f"sitemap-{section}-{page}.xml"
+
+
+def _ecrire(dossier, nom, contenu):
+    """Écriture atomique : un robot ne lit jamais un fichier à moitié écrit."""
+    temporaire = dossier / f".{nom}.tmp"
+    temporaire.write_text(contenu, encoding="utf-8")
+    os.replace(temporaire, dossier / nom)
+
+
+def generer(dossier=None, journal=None):
+    """
+    Écrit l'index et toutes les pages des sections dans dossier
+    (settings.SITEMAPS_ROOT par défaut), supprime les pages qui n'existent
+    plus. Renvoie le nombre de pages écrites, index compris.
+    """
+    from django.contrib.sitemaps.views import SitemapIndexItem
+    from django.template.loader import render_to_string
+
+    dossier = Path(dossier) if dossier else _dossier()
+    dossier.mkdir(parents=True, exist_ok=True)
+    protocole = "https"
+    domaine = getattr(settings, "SITEMAP_DOMAINE", "yuumi-shop.com")
+    site = types.SimpleNamespace(domain=domaine, name=domaine)
+
+    entrees, ecrits = [], set()
+    for section, classe in SITEMAPS.items():
+        sitemap = classe()
+        adresse = f"{protocole}://{domaine}{reverse('sitemap-section', kwargs={'section': section})}"
+        for page in sitemap.paginator.page_range:
+            # Renseigné par get_urls seulement si tous les éléments de la
+            # page ont un lastmod
+            sitemap.latest_lastmod = None
+            urls = sitemap.get_urls(page=page, site=site, protocol=protocole)
+            nom = _nom_page(section, page)
+            _ecrire(dossier, nom, render_to_string("sitemap.xml", {"urlset": urls}))
+            ecrits.add(nom)
+            entrees.append(SitemapIndexItem(
+                adresse if page == 1 else f"{adresse}?p={page}",
+                sitemap.latest_lastmod,
+            ))
+            if journal:
+                journal(f"{nom} : {len(urls)} URL")
+
+    # L'index en dernier : il ne pointe que vers des pages déjà écrites
+    _ecrire(dossier, FICHIER_INDEX, render_to_string("sitemap_index.xml", {"sitemaps": entrees}))
+    for ancien in dossier.glob("sitemap-*.xml"):
+        if ancien.name not in ecrits:
+            ancien.unlink()
+    return len(ecrits) + 1
+
+
+def _fichier(section=None, page="1"):
+    """Chemin du fichier pré-généré pour cette URL, None s'il n'existe pas."""
+    if section is None:
+        nom = FICHIER_INDEX
+    elif section in SITEMAPS and page.isdigit():
+        nom = _nom_page(section, int(page))
+    else:
+        return None
+    chemin = _dossier() / nom
+    return chemin if chemin.is_file() else None
+
+
+def _date_fichier(request, section=None):
+    chemin = _fichier(section, request.GET.get("p", "1"))
+    if chemin is None:
+        return None
+    return datetime.fromtimestamp(chemin.stat().st_mtime, tz=timezone.utc)
+
+
+def _servir(chemin):
+    return FileResponse(open(chemin, "rb"), content_type="application/xml")
+
+
+@vues_sitemaps.x_robots_tag
+@condition(last_modified_func=_date_fichier)
+def index(request):
+    chemin = _fichier()
+    if chemin is not None:
+        return _servir(chemin)
+    return vues_sitemaps.index(request, SITEMAPS, sitemap_url_name="sitemap-section")
+
+
+@vues_sitemaps.x_robots_tag
+@condition(last_modified_func=_date_fichier)
+def section(request, section):
+    chemin = _fichier(section, request.GET.get("p", "1"))
+    if chemin is not None:
+        return _servir(chemin)
+    return vues_sitemaps.sitemap(request, SITEMAPS, section=section)
@@ -0,0 +1,182 @@
+# members/statistiques.py
+#
+# Agrégation journalière des statistiques (StoreDailyStats).
+#
+# Les événements bruts (PageView, Click) ne sont plus relus par les écrans :
+# `python manage.py agreger_statistiques` les résume par commerce et par
+# jour, et l'admin lit ce résumé. La même commande en dérive ensuite
+# Store.score_popularite, colonne indexée qui classe les candidats de
+# l'agent IA (un tri sur index plutôt qu'un COUNT des clics par requête).
+# L'agrégation d'un jour est recalculée en entier (idempotente) : relancer
+# la commande ne compte jamais deux fois un événement.
+#
+# Le score d'un commerce ne dépend que de ses lignes d'agrégat et de la
+# date du jour (âge en jours) : tant que le jour n'a pas changé, seuls les
+# commerces dont les jours repris ont des lignes peuvent voir leur score
+# bouger. mettre_a_jour_popularite ne recalcule donc tout (décroissance,
+# sortie de fenêtre) qu'au premier passage de la journée, puis seulement
+# ces commerces-là.
+
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+TYPES_CLICS = ["itineraire", "site", "instagram", "facebook", "telephone"]
+
+# Popularité : une vue pèse un cinquième de clic, l'activité d'il y a un
+# mois compte moitié moins que celle d'aujourd'hui, au-delà de 6 mois rien.
+POIDS_VUE = 0.2
+DEMI_VIE_JOURS = 30
+FENETRE_POPULARITE = 180
+
+# Date (ISO) du dernier recalcul complet des scores
+CLE_POPULARITE = "yuumi_stats:popularite_du"
+DUREE_POPULARITE = 2 * 24 * 3600
+
+
+def _debut_du_jour(jour):
+    return timezone.make_aware(datetime.combine(jour, time.min))
+
+
+def agreger(depuis, jusqu_a):
+    """
+    Recalcule les lignes StoreDailyStats des jours [depuis, jusqu_a] (dates
+    locales, heure de Paris) à partir des événements bruts. Renvoie le
+    nombre de lignes écrites.
+    """
+    from .models import Click, PageView, StoreDailyStats
+
+    debut = _debut_du_jour(depuis)
+    fin = _debut_du_jour(jusqu_a + timedelta(days=1))
+
+    lignes = {}
+
+    def ligne(store_id, jour):
+        cle = (store_id, jour)
+        if cle not in lignes:
+            lignes[cle] = StoreDailyStats(store_id=store_id, date=jour)
+        return lignes[cle]
+
+    vues = (
+        PageView.objects
+        .filter(timestamp__gte=debut, timestamp__lt=fin, store__isnull=False)
+        .annotate(jour=TruncDate("timestamp"))
+        .values("store_id", "jour")
+        .annotate(n=Count("id"))
+    )
+    for v in vues:
+        ligne(v["store_id"], v["jour"]).vues = v["n"]
+
+    clics = (
+        Click.objects
+        .filter(created_at__gte=debut, created_at__lt=fin)
+        .annotate(jour=TruncDate("created_at"))
+        .values("store_id", "jour", "type_click")
+        .annotate(n=Count("id"))
+    )
+    for c in clics:
+        stats = ligne(c["store_id"], c["jour"])
+        stats.clics += c["n"]
+        if c["type_click"] in TYPES_CLICS:
+            champ = f"clics_{c['type_click']}"
+            setattr(stats, champ, getattr(stats, champ) + c["n"])
+
+    with transaction.atomic():
+        StoreDailyStats.objects.filter(date__gte=depuis, date__lte=jusqu_a).delete()
+        StoreDailyStats.objects.bulk_create(lignes.values(), batch_size=1000)
+    return len(lignes)
+
+
+def premier_jour_brut():
+    """Date locale du plus ancien événement brut, ou None."""
+    from .models import Click, PageView
+
+    candidats = [
+        PageView.objects.aggregate(m=Min("timestamp"))["m"],
+        Click.objects.aggregate(m=Min("created_at"))["m"],
+    ]
+    candidats = [c for c in candidats if c is not None]
+    return timezone.localdate(min(candidats)) if candidats else None
+
+
+def debut_reprise():
+    """
+    Premier jour à recalculer : la veille du dernier jour agrégé (les
+    événements arrivent en différé, voir analytics.py), tout l'historique
+    au premier lancement, None sans aucun événement.
+    """
+    from .models import StoreDailyStats
+
+    dernier = StoreDailyStats.objects.aggregate(m=Max("date"))["m"]
+    return dernier - timedelta(days=1) if dernier else premier_jour_brut()
+
+
+def agreger_incremental():
+    """Reprend de debut_reprise() à aujourd'hui."""
+    depuis = debut_reprise()
+    if depuis is None:
+        return 0
+    return agreger(depuis, timezone.localdate())
+
+
+def calculer_popularite(apps=None, depuis=None):
+    """
+    Recalcule Store.score_popularite à partir de l'agrégat : somme sur les
+    FENETRE_POPULARITE derniers jours de (clics + POIDS_VUE x vues), chaque
+    jour pondéré par 0,5 ^ (âge / DEMI_VIE_JOURS). Seuls les commerces dont
+    le score change sont écrits (bulk_update, sans historique ni signaux).
+    apps : registre de modèles (celui d'une migration), ou le registre
+    courant par défaut. depuis : ne recalcule que les commerces qui ont des
+    lignes à partir de cette date (voir mettre_a_jour_popularite). Renvoie
+    le nombre de commerces mis à jour.
+    """
+    if apps is None:
+        from django.apps import apps
+
+    Store = apps.get_model("members", "Store")
+    StoreDailyStats = apps.get_model("members", "StoreDailyStats")
+
+    aujourd_hui = timezone.localdate()
+    scores = {}
+    lignes = StoreDailyStats.objects.filter(
+        date__gt=aujourd_hui - timedelta(days=FENETRE_POPULARITE)
+    )
+    if depuis is not None:
+        lignes = lignes.filter(
+            store_id__in=StoreDailyStats.objects.filter(date__gte=depuis).values("store_id")
+        )
+    lignes = lignes.values_list("store_id", "date", "vues", "clics")
+    for store_id, jour, vues, clics in lignes.iterator():
+        poids = 0.5 ** ((aujourd_hui - jour).days / DEMI_VIE_JOURS)
+        scores[store_id] = scores.get(store_id, 0.0) + (clics + POIDS_VUE * vues) * poids
+
+    a_ecrire = []
+    if depuis is not None:
+        actuels = Store.objects.filter(id__in=list(scores))
+    else:
+        actuels = Store.objects.filter(Q(id__in=list(scores)) | ~Q(score_popularite=0))
+    actuels = actuels.values_list("id", "score_popularite")
+    for store_id, actuel in actuels.iterator():
+        nouveau = round(scores.get(store_id, 0.0), 3)
+        if nouveau != actuel:
+            a_ecrire.append(Store(id=store_id, score_popularite=nouveau))
+    Store.objects.bulk_update(a_ecrire, ["score_popularite"], batch_size=1000)
+    return len(a_ecrire)
+
+
+def mettre_a_jour_popularite(depuis=None):
+    """
+    calculer_popularite limité aux commerces repris depuis depuis, si un
+    recalcul complet a déjà eu lieu aujourd'hui ; recalcul complet sinon
+    (ou sans depuis). Cache perdu : recalcul complet, jamais de score faux.
+    """
+    aujourd_hui = timezone.localdate()
+    if depuis is not None and cache.get(CLE_POPULARITE) == aujourd_hui.isoformat():
+        return calculer_popularite(depuis=depuis)
+    total = calculer_popularite()
+    cache.set(CLE_POPULARITE, aujourd_hui.isoformat(), DUREE_POPULARITE)
+    return total
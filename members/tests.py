@@ -94,7 +94,7 @@ class StoreModelTest(TestCase):
         store = make_store()
         url = store.get_absolute_url()
         self.assertIn(store.slug, url)
-        self.assertIn(store.ville, url)
+        self.assertIn(store.ville.lower(), url)
 
     def test_owner_null_ne_supprime_pas_store(self):
         """Supprimer le propriétaire ne doit pas supprimer le commerce (SET_NULL)."""
@@ -11,15 +11,20 @@
 # contre les fixtures. Un test verifie aussi le cablage du prompt cote client.
 
 import json
+from io import StringIO
 from datetime import time
 from types import SimpleNamespace
 from unittest.mock import patch
 
-from django.test import TestCase, RequestFactory
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
 
-from members.models import Store, Category, SuperCategory, ProductFamily, Product, Click
+from members.models import Store, Category, SuperCategory, ProductFamily, Product, Click, UserPremium
+from members.annuaire import annuaire
 from members.views import ai_search_agent
 
 from members.ai_agent.search import (
@@ -27,6 +32,7 @@ from members.ai_agent.search import (
     find_stores_by_product,
     find_stores_by_description,
     combine_store_querysets,
+    selectionner_candidats,
 )
 from members.ai_agent.client import needs_web_search
 
@@ -111,6 +117,8 @@ class SearchLayerTests(TestCase):
     def test_tri_par_clics(self):
         a = make_store("AAA Commerce", self.cat_epicerie, clicks=0)
         b = make_store("ZZZ Commerce", self.cat_epicerie, clicks=5)
+        # Le tri lit Store.score_popularite, calcule par agreger_statistiques
+        call_command("agreger_statistiques", stdout=StringIO())
         res = list(find_matching_stores([self.cat_epicerie.slug], DEPT, VILLE))
         # Malgre l'ordre alphabetique (AAA avant ZZZ), ZZZ (5 clics) passe 1er.
         self.assertEqual(res[0], b)
@@ -142,6 +150,81 @@ class SearchLayerTests(TestCase):
         self.assertEqual(len(capped), 1)
 
 
+class SelectionCandidatsTests(TestCase):
+    """selectionner_candidats : tiers fusionnes en une passe."""
+
+    def setUp(self):
+        self.cat_epicerie = make_category("Épicerie fine")
+        self.cat_charcuterie = make_category("Charcuterie")
+
+    def test_tiers_dedoublonnes_et_ordonnes(self):
+        catalogue = make_store("ZZZ Catalogue", self.cat_charcuterie,
+                               desc="Foie gras de canard.")
+        add_product(catalogue, "Foie gras maison")
+        description = make_store("AAA Description", self.cat_epicerie,
+                                 desc="Épicerie fine proposant foie gras et vins.")
+        make_store("Categorie seule", self.cat_epicerie)
+
+        annuaire()   # ids des villes, en cache partage (voir annuaire.py)
+        # Recherche dans l'index et tiers dans la meme requete Store
+        with self.assertNumQueries(1):
+            selection = selectionner_candidats(
+                [self.cat_epicerie.slug], ["foie gras"], DEPT, VILLE
+            )
+        # Catalogue avant description malgre l'alphabet, une seule fois chacun ;
+        # preuve directe -> pas de filet categorie.
+        self.assertEqual(list(selection["candidats"]), [catalogue.id, description.id])
+        self.assertEqual(selection["ids_confirmes"], {catalogue.id})
+        self.assertFalse(selection["produit_sans_match_confirme"])
+
+    def test_requete_independante_du_nombre_de_candidats(self):
+        def sql():
+            with CaptureQueriesContext(connection) as requetes:
+                selection = selectionner_candidats(
+                    [self.cat_epicerie.slug], ["foie gras"], DEPT, VILLE
+                )
+            return selection, requetes[-1]["sql"]
+
+        un = make_store("Un", self.cat_charcuterie)
+        add_product(un, "Foie gras")
+        annuaire()
+        _selection, sql_un = sql()
+
+        for i in range(5):
+            add_product(make_store(f"Autre {i}", self.cat_charcuterie), "Foie gras")
+        # Plus de produits correspondants -> plus pertinent
+        deux = make_store("Deux", self.cat_charcuterie)
+        add_product(deux, "Foie gras entier")
+        add_product(deux, "Bloc de foie gras")
+        selection, sql_six = sql()
+
+        self.assertEqual(len(selection["candidats"]), 7)
+        self.assertEqual(next(iter(selection["candidats"])), deux.id)
+        self.assertEqual(sql_un, sql_six)
+
+    def test_filet_categorie_sans_preuve_directe(self):
+        s = make_store("Categorie seule", self.cat_epicerie)
+        selection = selectionner_candidats([self.cat_epicerie.slug], ["caviar"], DEPT, VILLE)
+        self.assertEqual(list(selection["candidats"]), [s.id])
+        self.assertEqual(selection["ids_confirmes"], set())
+        self.assertTrue(selection["produit_sans_match_confirme"])
+
+    def test_demande_categorie_et_plafond(self):
+        for i in range(3):
+            make_store(f"Epicerie {i}", self.cat_epicerie)
+        selection = selectionner_candidats([self.cat_epicerie.slug], [], DEPT, VILLE, limit=2)
+        self.assertEqual(len(selection["candidats"]), 2)
+        self.assertFalse(selection["produit_sans_match_confirme"])
+
+    def test_ouvert_maintenant_avant_plafond(self):
+        make_store("AAA Ferme", self.cat_epicerie, open_now=False)
+        ouvert = make_store("ZZZ Ouvert", self.cat_epicerie, open_now=True)
+        selection = selectionner_candidats(
+            [self.cat_epicerie.slug], [], DEPT, VILLE, ouvert_maintenant=True, limit=1
+        )
+        self.assertEqual(list(selection["candidats"]), [ouvert.id])
+
+
 # =====================================================================
 #  2. HEURISTIQUE WEB
 # =====================================================================
@@ -188,6 +271,9 @@ class ViewOrchestrationTests(TestCase):
         cache.clear()
         self.factory = RequestFactory()
         self.user = get_user_model().objects.create_user(username="prem", password="x")
+        # yuumi_plus_required filtre avant la vue : sans abonnement actif,
+        # redirection vers la page premium
+        UserPremium.objects.create(user=self.user)
 
         self.cat_epicerie = make_category("Épicerie fine")
         self.cat_charcuterie = make_category("Charcuterie")
@@ -223,6 +309,43 @@ class ViewOrchestrationTests(TestCase):
         base.update(kw)
         return base
 
+    # ---- Flux SSE : etapes intermediaires avant le resultat
+    def test_etapes_intermediaires_du_flux(self):
+        from members.views import _etapes_agent_ia
+        s = make_store("Fleurs de Lys", self.cat_fleuriste)
+        self.m_extract.return_value = self._params(categories=[self.cat_fleuriste.slug])
+        demande = {
+            "user_query": "un fleuriste", "departement": DEPT, "ville": VILLE,
+            "user_lat": None, "user_lng": None, "history": [],
+        }
+        etapes = list(_etapes_agent_ia(self.user, demande))
+        self.assertEqual([e for e, _ in etapes], ["intention", "candidats", "resultat"])
+        self.assertEqual([c["id"] for c in etapes[1][1]], [s.id])
+        self.assertEqual(etapes[2][1]["pistes"][0]["resultats"][0]["id"], s.id)
+
+    # ---- Flux SSE : chaque evenement part avant l'etape suivante
+    def test_flux_progressif(self):
+        from members.views import ai_search_agent_flux
+        make_store("Fleurs de Lys", self.cat_fleuriste)
+        self.m_extract.return_value = self._params(categories=[self.cat_fleuriste.slug])
+        req = self.factory.post(
+            "/agent-ia/flux/", {"query": "un fleuriste", "departement": DEPT, "ville": VILLE}
+        )
+        req.user = self.user
+        resp = ai_search_agent_flux(req)
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        # Rien n'est calcule avant la lecture du flux
+        self.m_extract.assert_not_called()
+
+        morceaux = iter(resp.streaming_content)
+        self.assertTrue(next(morceaux).startswith(b"event: intention"))
+        self.assertTrue(next(morceaux).startswith(b"event: candidats"))
+        # Les candidats sont envoyes avant l'appel de recommandation
+        self.m_recommend.assert_not_called()
+        self.assertTrue(next(morceaux).startswith(b"event: resultat"))
+        self.m_recommend.assert_called_once()
+        self.assertEqual(list(morceaux), [])
+
     # ---- Scenario "Famille Mary" : produit precis, AUCUN match catalogue/desc
     def test_foie_gras_sans_match_utilise_filet_categorie_et_flag(self):
         honey = make_store(
@@ -308,9 +431,32 @@ class ViewOrchestrationTests(TestCase):
             categories=[self.cat_fleuriste.slug], idees_produits=[]
         )
         make_store("Fleurs & Co", self.cat_fleuriste)
-        self._post("un fleuriste a offrir vu la météo")
+        with patch("members.ai_agent.client.en_parallele") as m_parallele:
+            self._post("un fleuriste a offrir vu la météo")
         self.m_understand.assert_called_once()
-        self.assertEqual(self.m_extract.call_args.args[1], "intention libre")
+        # Sans extraction speculative (par defaut) : un seul appel d'extraction,
+        # et l'intention est demandee directement, sans passer par le pool
+        self.assertEqual([c.args[1] for c in self.m_extract.call_args_list], ["intention libre"])
+        m_parallele.assert_not_called()
+
+    # ---- Web : intention en parallele, extraction speculative + prefetch
+    @override_settings(AGENT_IA_EXTRACTION_SPECULATIVE=True)
+    def test_web_extraction_speculative_reutilise_la_selection(self):
+        from members import views
+        s = make_store("Fleurs & Co", self.cat_fleuriste)
+        self.m_extract.return_value = self._params(categories=[self.cat_fleuriste.slug])
+        demande = {
+            "user_query": "un fleuriste vu la météo", "departement": DEPT, "ville": VILLE,
+            "user_lat": None, "user_lng": None, "history": [],
+        }
+        with patch.object(views, "_selection_agent_ia", wraps=views._selection_agent_ia) as m_sel:
+            etapes = list(views._etapes_agent_ia(self.user, demande))
+        self.m_understand.assert_called_once()
+        # Extraction speculative (sans intention) puis finale (avec)
+        self.assertEqual([c.args[1] for c in self.m_extract.call_args_list], [None, "intention libre"])
+        # Memes parametres -> la selection prechargee est reutilisee
+        self.assertEqual(m_sel.call_count, 1)
+        self.assertEqual(etapes[-1][1]["pistes"][0]["resultats"][0]["id"], s.id)
 
     # ---- Cache : 2e appel identique servi sans LLM ni quota
     def test_cache_hit_evite_llm_et_quota(self):
@@ -325,16 +471,52 @@ class ViewOrchestrationTests(TestCase):
         self.assertEqual(self.m_register.call_count, 1)     # quota non reconsomme
 
     # ---- "Ouvert maintenant" : jamais mis en cache
-    def test_ouvert_maintenant_non_cache(self):
-        make_store("Resto", self.cat_fleuriste, open_now=True)
-        self.m_extract.return_value = self._params(
-            categories=[self.cat_fleuriste.slug], idees_produits=[], ouvert_maintenant=True
-        )
-        self._post("un resto ouvert maintenant")
-        self._post("un resto ouvert maintenant")
-        self.assertEqual(self.m_recommend.call_count, 2)   # recalcule a chaque fois
-        # Le contexte open-now est bien transmis a recommend_stores.
-        self.assertTrue(self.m_recommend.call_args.kwargs["ouvert_maintenant"])
+    def test_ouvert_maintenant_cache_jusqu_a_la_transition(self):
+        from datetime import datetime, timedelta
+        from members.ai_agent.cache import DUREE_MAX_OUVERT, duree_ouvert_maintenant
+        from members.horaires import FUSEAU
+
+        # Ouvert le lundi 9h-12h ; il est lundi 11h55m30s -> ferme dans
+        # quelques minutes, avant le plafond DUREE_MAX_OUVERT
+        store = make_store("Resto", self.cat_fleuriste)
+        store.lundi_matin_ouverture, store.lundi_matin_fermeture = time(9, 0), time(12, 0)
+        store.save()
+        moment = datetime(2024, 1, 1, 11, 55, 30, tzinfo=FUSEAU)
+        fenetre = duree_ouvert_maintenant([store], moment)
+        self.assertTrue(0 < fenetre < DUREE_MAX_OUVERT)
+
+        # Une seule horloge pour les horaires et pour l'expiration du cache
+        ecoule = {"secondes": 0}
+
+        class Maintenant(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return (moment + timedelta(seconds=ecoule["secondes"])).astimezone(tz)
+
+        horloge = SimpleNamespace(time=lambda: 1_700_000_000 + ecoule["secondes"])
+        cache_local = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with override_settings(CACHES=cache_local), \
+                patch("members.horaires.datetime", Maintenant), \
+                patch("django.core.cache.backends.base.time", horloge), \
+                patch("django.core.cache.backends.locmem.time", horloge):
+            cache.clear()
+            self.m_extract.return_value = self._params(
+                categories=[self.cat_fleuriste.slug], idees_produits=[], ouvert_maintenant=True
+            )
+            _resp, data = self._post("un resto ouvert maintenant")
+            self.assertEqual([r["id"] for p in data["pistes"] for r in p["resultats"]], [store.id])
+            # Le contexte open-now est bien transmis a recommend_stores.
+            self.assertTrue(self.m_recommend.call_args.kwargs["ouvert_maintenant"])
+
+            # Avant la fermeture : la reponse en cache est reutilisee, sans LLM
+            ecoule["secondes"] = fenetre - 5
+            self._post("un resto ouvert maintenant")
+            self.assertEqual((self.m_extract.call_count, self.m_recommend.call_count), (1, 1))
+
+            # Apres la fermeture : la reponse a expire, tout est recalcule
+            ecoule["secondes"] = fenetre + 1
+            self._post("un resto ouvert maintenant")
+            self.assertEqual(self.m_extract.call_count, 2)
 
 
 # =====================================================================
@@ -390,3 +572,148 @@ class PromptWiringTests(TestCase):
         with patch.object(client_mod, "_get_client", self._fake_client):
             client_mod.recommend_stores("resto", [], set())
         self.assertNotIn("OUVERT MAINTENANT", self._system_prompt())
+
+
+class CatalogueCategoriesTests(TestCase):
+    """Bloc categories en cache partage, prompt d'extraction memorise."""
+
+    def setUp(self):
+        from members.ai_agent.client import invalider_catalogue_categories
+        invalider_catalogue_categories()
+        self.cat = make_category("Fleuriste")
+
+    def test_prompt_stable_sans_requete(self):
+        from members.ai_agent.client import build_system_prompt
+        premier = build_system_prompt()
+        self.assertIn(f"- {self.cat.slug} (Fleuriste", premier)
+        with self.assertNumQueries(0):
+            second = build_system_prompt()
+        self.assertIs(second, premier)
+
+    def test_modification_categorie_invalide(self):
+        from members.ai_agent.client import build_system_prompt
+        avant = build_system_prompt()
+        make_category("Caviste")
+        apres = build_system_prompt()
+        self.assertNotEqual(avant, apres)
+        self.assertIn("(Caviste", apres)
+
+
+class CacheResultatsTests(TestCase):
+    """Cle de 2e niveau (parametres normalises) et duree "ouvert maintenant"."""
+
+    def _params(self, **kw):
+        base = {"categories": ["epicerie-fine"], "idees_produits": ["foie gras"],
+                "ouvert_maintenant": False}
+        base.update(kw)
+        return base
+
+    def test_formulations_equivalentes_meme_cle(self):
+        from members.ai_agent.cache import cle_parametres
+        ref = cle_parametres(self._params(), DEPT, VILLE)
+        for params in [
+            self._params(idees_produits=["du Foie Gras"]),
+            self._params(idees_produits=["foies gras", "foie gras"]),
+            self._params(categories=["epicerie-fine", "epicerie-fine"]),
+        ]:
+            self.assertEqual(cle_parametres(params, DEPT, VILLE.upper()), ref)
+        self.assertNotEqual(cle_parametres(self._params(ouvert_maintenant=True), DEPT, VILLE), ref)
+        self.assertNotEqual(cle_parametres(self._params(idees_produits=["caviar"]), DEPT, VILLE), ref)
+
+    def test_duree_jusqu_a_la_prochaine_transition(self):
+        from datetime import datetime
+        from members.ai_agent.cache import DUREE_MAX_OUVERT, duree_ouvert_maintenant
+        from members.horaires import FUSEAU
+
+        lundi = 0
+        # Ouvert lundi 9h-12h ; il est lundi 11h55m30s -> ferme dans 4 min 30 s
+        store = SimpleNamespace(horaires_compiles=[[lundi + 9 * 60, lundi + 12 * 60]])
+        moment = datetime(2024, 1, 1, 11, 55, 30, tzinfo=FUSEAU)   # un lundi
+        self.assertEqual(duree_ouvert_maintenant([store], moment), 4 * 60 + 30)
+        # Transition lointaine ou sans horaires : plafond
+        loin = SimpleNamespace(horaires_compiles=[[lundi, 7 * 24 * 60]])
+        sans = SimpleNamespace(horaires_compiles=[])
+        self.assertEqual(duree_ouvert_maintenant([loin, sans], moment), DUREE_MAX_OUVERT)
+
+
+class FluxSSETests(TestCase):
+    def test_format_et_ordre_des_evenements(self):
+        from members.ai_agent.flux import diffuser
+
+        self.assertEqual(list(diffuser(iter([
+            ("candidats", [{"id": 1, "nom": "Épicerie"}]),
+            ("resultat", {"pistes": []}),
+        ]))), [
+            'event: candidats\ndata: [{"id": 1, "nom": "Épicerie"}]\n\n',
+            'event: resultat\ndata: {"pistes": []}\n\n',
+        ])
+
+    def test_erreur_du_pipeline_devient_fallback(self):
+        from members.ai_agent.flux import diffuser
+
+        def etapes():
+            yield "intention", {}
+            raise RuntimeError("Mistral indisponible")
+
+        with self.assertLogs("members.ai_agent.flux", level="ERROR"):
+            morceaux = list(diffuser(etapes()))
+        self.assertEqual(len(morceaux), 2)
+        self.assertIn('"fallback_to_tree": true', morceaux[1])
+
+
+class ClientMistralTests(TestCase):
+    def tearDown(self):
+        from members.ai_agent import client as client_mod
+        client_mod._client = None
+
+    def test_client_partage(self):
+        from members.ai_agent import client as client_mod
+        client_mod._client = None
+        with patch.dict("os.environ", {"MISTRAL_API_KEY": "cle-de-test"}):
+            premier = client_mod._get_client()
+            self.assertIs(client_mod._get_client(), premier)
+
+    def test_mesures_collectees_y_compris_en_parallele(self):
+        from members.ai_agent import client as client_mod
+        reponse = SimpleNamespace(
+            usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30),
+            choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps({
+                "intention": "besoin", "message": "m", "pistes": [], "aucun_resultat": True,
+            })))],
+        )
+        faux = SimpleNamespace(chat=SimpleNamespace(complete=lambda **kw: reponse))
+        with patch.object(client_mod, "_get_client", return_value=faux):
+            with client_mod.collecter_mesures() as mesures:
+                client_mod.recommend_stores("resto", [], set())
+                client_mod.en_parallele(client_mod.recommend_stores, "resto", [], set()).result()
+        self.assertEqual([m["etape"] for m in mesures], ["recommend_stores"] * 2)
+        self.assertEqual((mesures[0]["tokens_entree"], mesures[0]["tokens_sortie"]), (120, 30))
+        self.assertTrue(mesures[0]["succes"])
+
+
+class BancDeMesureTests(TestCase):
+    def test_faux_serveur_au_format_mistral(self):
+        from members.ai_agent import client as client_mod
+        from members.ai_agent.bench import CORPUS, faux_mistral
+
+        with faux_mistral(CORPUS, echelle_latence=0):
+            with client_mod.collecter_mesures() as mesures:
+                params = client_mod.extract_search_params("foie gras")
+                intention = client_mod.understand_intent("que faire sous la pluie ce week-end ?")
+        self.assertEqual(params["idees_produits"], ["foie gras"])
+        self.assertIn("pluie", intention)
+        self.assertTrue(all(m["succes"] and m["tokens_entree"] for m in mesures))
+        self.assertIsNone(client_mod._client)
+
+    def test_rapport_hors_ligne(self):
+        from members.ai_agent.bench import CORPUS, executer
+
+        rapport = executer(passes=2, echelle_latence=0, par_categorie=2)
+        self.assertEqual(rapport["latences_ms"]["pipeline"]["n"], 2 * len(CORPUS))
+        self.assertIn("recommend_stores", rapport["tokens_prompt"])
+        self.assertIn("base", rapport["requetes_sql"])
+        # "du foie gras svp" reprend la recommandation de "foie gras"
+        self.assertEqual(rapport["cache"]["par_passe"][0], {"requete": 0, "parametres": 1})
+        self.assertGreater(rapport["cache"]["par_passe"][1]["requete"], 0)
+        # Rien ne reste en base
+        self.assertFalse(Store.objects.exists())
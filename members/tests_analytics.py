@@ -0,0 +1,105 @@
+# members/tests_analytics.py
+#
+# Ingestion différée des statistiques : dédoublonnage dans Redis, aucune
+# écriture SQL au moment de la vue, écriture par lots à la vidange.
+#
+# Lancer :  python manage.py test members.tests_analytics
+
+from io import StringIO
+from unittest.mock import Mock, patch
+
+import redis
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase
+
+from members.analytics import (
+    CLE_FILE, CLE_REJETS, PREFIXE_VUE, _redis, enregistrer_clic, enregistrer_vue, vider_file,
+)
+from members.models import Click, PageView, Store
+
+
+class IngestionTests(TestCase):
+    def setUp(self):
+        self.redis = _redis()
+        self.redis.delete(CLE_FILE, CLE_REJETS)
+        self.store = Store.objects.create(
+            nom="Le Fournil", ville="Annecy", ville_precise="Annecy",
+            departement="Haute-Savoie", descriptionpetite="Boulangerie",
+            addressemaps="1 rue du Test", latitude=45.9, longitude=6.13,
+        )
+        cache.delete(f"{PREFIXE_VUE}{self.store.id}:session-a")
+        cache.delete(f"{PREFIXE_VUE}{self.store.id}:session-b")
+
+    def tearDown(self):
+        self.redis.delete(CLE_FILE, CLE_REJETS)
+
+    def test_aucune_ecriture_sql_a_la_vue(self):
+        with self.assertNumQueries(0):
+            self.assertTrue(enregistrer_vue(self.store.id, "session-a", "1.2.3.4"))
+            self.assertFalse(enregistrer_vue(self.store.id, "session-a", "1.2.3.4"))   # < 20 s
+            self.assertTrue(enregistrer_vue(self.store.id, "session-b", None))
+            enregistrer_clic(self.store.id, "telephone")
+        self.assertEqual(self.redis.llen(CLE_FILE), 3)
+
+    def test_vidange_par_lots(self):
+        enregistrer_vue(self.store.id, "session-a", "1.2.3.4")
+        for _ in range(5):
+            enregistrer_clic(self.store.id, "site")
+        enregistrer_clic(999999, "site")   # commerce supprimé entre-temps : ignoré
+
+        call_command("vider_analytics", "--taille-lot", "2", stdout=StringIO())
+        self.assertEqual(PageView.objects.filter(store=self.store, ip_address="1.2.3.4").count(), 1)
+        self.assertEqual(Click.objects.filter(store=self.store, type_click="site").count(), 5)
+        self.assertEqual(self.redis.llen(CLE_FILE), 0)
+
+    def test_evenement_invalide_mis_de_cote(self):
+        enregistrer_clic(self.store.id, "site")
+        self.redis.rpush(CLE_FILE, "{pas du json")
+        enregistrer_clic(self.store.id, "telephone")
+
+        with self.assertLogs("members.analytics", "ERROR"):
+            self.assertEqual(vider_file(taille_lot=10), 2)
+        # Les bons événements du lot sont écrits, la file n'est pas bloquée
+        self.assertEqual(Click.objects.filter(store=self.store).count(), 2)
+        self.assertEqual(self.redis.llen(CLE_FILE), 0)
+        self.assertEqual(self.redis.lrange(CLE_REJETS, 0, -1), [b"{pas du json"])
+
+    def test_redis_injoignable(self):
+        injoignable = Mock(rpush=Mock(side_effect=redis.exceptions.ConnectionError("refusée")))
+        cache_injoignable = Mock(add=Mock(side_effect=redis.exceptions.ConnectionError("refusée")))
+        with patch("members.analytics._redis", return_value=injoignable), \
+                patch("members.analytics.cache", cache_injoignable), \
+                self.assertLogs("members.analytics", "WARNING"):
+            enregistrer_clic(self.store.id, "site")
+            self.assertTrue(enregistrer_vue(self.store.id, "session-a", "1.2.3.4"))
+        # Écriture directe : rien n'est perdu
+        self.assertEqual(Click.objects.filter(store=self.store).count(), 1)
+        self.assertEqual(PageView.objects.filter(store=self.store).count(), 1)
+
+    def test_base_injoignable_lot_remis_en_file(self):
+        enregistrer_clic(self.store.id, "site")
+        enregistrer_clic(self.store.id, "telephone")
+        avant = self.redis.lrange(CLE_FILE, 0, -1)
+
+        with patch("members.analytics._creer", side_effect=OperationalError("connexion perdue")), \
+                self.assertLogs("members.analytics", "ERROR"), \
+                self.assertRaises(OperationalError):
+            vider_file(taille_lot=10)
+        # Rien n'est rejeté pour une panne de la base : tout attend la prochaine vidange
+        self.assertEqual(self.redis.lrange(CLE_FILE, 0, -1), avant)
+        self.assertEqual(self.redis.llen(CLE_REJETS), 0)
+
+        self.assertEqual(vider_file(taille_lot=10), 2)
+        self.assertEqual(Click.objects.filter(store=self.store).count(), 2)
+
+    def test_rejouer_les_rejets(self):
+        enregistrer_clic(self.store.id, "site")
+        self.redis.rpush(CLE_REJETS, self.redis.lpop(CLE_FILE))
+
+        sortie = StringIO()
+        call_command("rejouer_analytics", stdout=sortie)
+        self.assertIn("1 événement(s) remis en file, 1 événement(s) enregistré(s)", sortie.getvalue())
+        self.assertEqual(Click.objects.filter(store=self.store, type_click="site").count(), 1)
+        self.assertEqual(self.redis.llen(CLE_REJETS), 0)
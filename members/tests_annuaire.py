@@ -0,0 +1,72 @@
+# members/tests_annuaire.py
+#
+# Annuaire des départements / villes (members/annuaire.py) : formes
+# servies aux sélecteurs, autocomplétions et sitemaps, lecture sans
+# requête SQL une fois en cache, rafraîchi seulement quand un commerce
+# apparaît, disparaît ou change d'emplacement.
+#
+# Lancer :  python manage.py test members.tests_annuaire
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from members import annuaire
+from members.autocomplete import VilleAutocomplete
+from members.sitemaps import CitySitemap
+from members.outils_tests import STOCKAGE_TEST, creer_commerce
+
+
+@override_settings(STORAGES=STOCKAGE_TEST)
+class AnnuaireTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = creer_commerce("Chez Paul")
+        creer_commerce("Le Zinc", departement="haute-savoie", ville="thônes")
+        creer_commerce("Da Mario", ville="annecy")
+        creer_commerce("Le Bouchon", departement="Rhône", ville="Lyon")
+
+    def test_formes(self):
+        self.assertEqual(annuaire.departements_villes(), {
+            "Haute-Savoie": ["Annecy", "Thônes"],
+            "Rhône": ["Lyon"],
+        })
+        self.assertEqual(annuaire.departements(), ["Haute-Savoie", "Rhône"])
+        self.assertEqual(annuaire.villes("HAUTE-SAVOIE"), ["Annecy", "thônes"])
+        # Une entrée par emplacement, quelle que soit la graphie en base
+        self.assertEqual(annuaire.emplacements(), [
+            ("Haute-Savoie", "Annecy"), ("Haute-Savoie", "thônes"), ("Rhône", "Lyon"),
+        ])
+        self.assertEqual(
+            [CitySitemap().location(e) for e in CitySitemap().items()][:1],
+            ["/haute-savoie/annecy/tous-les-commerces/"],
+        )
+
+    def test_autocompletion(self):
+        vue = VilleAutocomplete()
+        vue.forwarded = {"departement": "rhône"}
+        self.assertEqual(vue.get_list(), ["Lyon"])
+
+    def test_lecture_sans_sql(self):
+        annuaire.departements_villes()
+        with self.assertNumQueries(0):
+            annuaire.departements_villes()
+            annuaire.villes("haute-savoie")
+            annuaire.emplacements()
+        response = self.client.get("/changer-de-ville/", secure=True)
+        self.assertContains(response, "Thônes")
+
+    def test_rafraichissement(self):
+        version = annuaire.annuaire()["version"]
+        self.store.descriptionpetite = "Autre description"
+        self.store.save()
+        self.assertEqual(annuaire.annuaire()["version"], version)
+
+        self.store.ville = "Seynod"
+        self.store.save()
+        self.assertIn("Seynod", annuaire.departements_villes()["Haute-Savoie"])
+
+        phare = creer_commerce("Le Phare", departement="Finistère", ville="Brest")
+        self.assertEqual(annuaire.villes("finistère"), ["Brest"])
+        phare.departement, phare.ville = "Morbihan", "Lorient"
+        phare.save()
+        self.assertEqual(annuaire.villes("finistère"), [])
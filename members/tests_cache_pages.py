@@ -0,0 +1,95 @@
+# members/tests_cache_pages.py
+#
+# Cache des pages anonymes (members/cache_pages.py) : rendu réutilisé sans
+# base ni gabarit, jeton CSRF propre à chaque service, invalidation par
+# ville sur modification d'un commerce / produit / catégorie, pages exclues
+# (connecté, paramètres non prévus).
+#
+# Lancer :  python manage.py test members.tests_cache_pages
+
+import re
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from members.cache_pages import MARQUEUR_CSRF
+from members.models import Category, Product, ProductFamily, SuperCategory
+from members.outils_tests import STOCKAGE_TEST, creer_commerce
+
+
+@override_settings(STORAGES=STOCKAGE_TEST)
+class CachePagesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        sc = SuperCategory.objects.create(name="Alimentation", slug="alimentation")
+        self.categorie = Category.objects.create(name="Épicerie fine", super_categorie=sc)
+        self.store = creer_commerce(
+            "Le Comptoir", departement="haute-savoie", ville="annecy", ville_precise="Annecy",
+            descriptionpetite="Épicerie fine", categorie=self.categorie,
+        )
+        self.url = self.store.get_absolute_url()
+
+    def _get(self, url=None, **kwargs):
+        return self.client.get(url or self.url, secure=True, **kwargs)
+
+    def test_deuxieme_visite_sans_base_ni_gabarit(self):
+        premiere = self._get()
+        self.assertEqual(premiere["X-Yuumi-Cache"], "MISS")
+        seconde = self._get()
+        self.assertEqual(seconde["X-Yuumi-Cache"], "HIT")
+        self.assertEqual(seconde.mesures["gabarit_ms"], 0)
+        # Seule la session du visiteur est lue
+        self.assertLessEqual(seconde.mesures["requetes"], 1)
+        # Revalidable par le navigateur (voir revalidation.py)
+        self.assertEqual(seconde["Cache-Control"], "private, no-cache")
+
+    def test_jeton_csrf_propre_a_chaque_service(self):
+        self._get()
+        self.client.cookies.clear()
+        contenu = self._get().content.decode()
+        self.assertNotIn(MARQUEUR_CSRF, contenu)
+        self.assertRegex(contenu, r'const CSRF_TOKEN = "[A-Za-z0-9]{64}";')
+
+    def test_vue_comptee_meme_depuis_le_cache(self):
+        with patch("members.views.enregistrer_vue") as enregistrer:
+            self._get()
+            self._get()
+        self.assertEqual(enregistrer.call_count, 2)
+        self.assertEqual(enregistrer.call_args[0][0], self.store.id)
+
+    def test_invalidation_par_ville(self):
+        self._get()
+        creer_commerce("Ailleurs", departement="haute-savoie", ville="thones").save()
+        self.assertEqual(self._get()["X-Yuumi-Cache"], "HIT")
+
+        famille = ProductFamily.objects.create(store=self.store, nom="Fromages")
+        self.assertEqual(self._get()["X-Yuumi-Cache"], "MISS")
+        Product.objects.create(family=famille, nom="Reblochon")
+        self.assertContains(self._get(), "Reblochon")
+
+    def test_commerce_qui_change_de_ville(self):
+        liste = "/haute-savoie/annecy/tous-les-commerces/"
+        self.assertContains(self._get(liste), "Le Comptoir")
+        self.store.ville = "thones"
+        self.store.save()
+        self.assertNotContains(self._get(liste), "Le Comptoir")
+
+    def test_categorie_invalide_toutes_les_villes(self):
+        liste = "/haute-savoie/annecy/categories/"
+        self._get(liste)
+        self.categorie.name = "Épicerie"
+        self.categorie.save()
+        self.assertEqual(self._get(liste)["X-Yuumi-Cache"], "MISS")
+
+    def test_pages_exclues(self):
+        url = f"/haute-savoie/annecy/categorie/{self.categorie.slug}/"
+        self._get(url)
+        self.assertEqual(self._get(url, data={"utm_source": "x"})["X-Yuumi-Cache"], "HIT")
+        self.assertNotIn("X-Yuumi-Cache", self._get(url, data={"lat": "45.9", "lng": "6.1"}))
+
+        user = get_user_model().objects.create_user("cliente", password="x")
+        self.client.force_login(user)
+        self.assertNotIn("X-Yuumi-Cache", self._get(url))
+        self.assertFalse(re.search(MARQUEUR_CSRF, self._get(url).content.decode()))
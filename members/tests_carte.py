@@ -0,0 +1,82 @@
+# members/tests_carte.py
+#
+# Données de la carte (members/carte.py) : charge utile en colonnes
+# partagée par tous les visiteurs, servie compressée, en cache par
+# département et périmée par les modifications de ses commerces ; la page
+# ne porte que les favoris / commerces masqués du visiteur.
+#
+# Lancer :  python manage.py test members.tests_carte
+
+import gzip
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from members.models import Store
+from members.outils_tests import STOCKAGE_TEST, commerce_avec_catalogue
+
+URL_DONNEES = "/carte/haute-savoie/donnees.json"
+
+
+@override_settings(STORAGES=STOCKAGE_TEST)
+class DonneesCarteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = commerce_avec_catalogue(familles=0)
+        Store.objects.create(
+            nom="Sans position", ville="annecy", ville_precise="Annecy",
+            departement="haute-savoie", descriptionpetite="Épicerie",
+            categorie=self.store.categorie,
+        )
+
+    def _donnees(self, **kwargs):
+        return self.client.get(URL_DONNEES, secure=True, **kwargs)
+
+    def test_colonnes(self):
+        d = self._donnees().json()
+        self.assertEqual(d["ids"], [self.store.pk])
+        self.assertEqual((d["lat"], d["lng"]), ([45.9], [6.13]))
+        self.assertEqual(d["categories"][d["categorie"][0]]["slug"], self.store.categorie.slug)
+        # URL reconstruite comme le fait la page
+        url = d["modele_url"].replace("__ville__", d["villes"][d["ville"][0]]).replace("__slug__", d["slug"][0])
+        self.assertEqual(url, self.store.get_absolute_url())
+        self.assertEqual(d["photo"], [""])
+
+    def test_page_sans_commerces(self):
+        response = self.client.get("/carte/haute-savoie/", secure=True)
+        self.assertNotContains(response, "Le Comptoir")
+        self.assertContains(response, 'data-donnees="/carte/haute-savoie/donnees.json"')
+        self.assertContains(response, '"favoris": [], "masques": []')
+
+    def test_compression_et_cache(self):
+        identite = self._donnees()
+        compresse = self._donnees(HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(compresse["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compresse.content), identite.content)
+        self.assertIn("Accept-Encoding", compresse["Vary"])
+        self.assertTrue(compresse["ETag"].startswith("W/"))
+        # Servi depuis le cache : ni SQL ni session
+        self.assertEqual(compresse.mesures["requetes"], 0)
+
+    def test_identique_pour_tous(self):
+        anonyme = self._donnees()
+        self.client.force_login(get_user_model().objects.create_user("cliente", password="x"))
+        connecte = self._donnees()
+        self.assertEqual(connecte.content, anonyme.content)
+        self.assertEqual(connecte["ETag"], anonyme["ETag"])
+        self.assertEqual(connecte["Cache-Control"], "public, no-cache")
+
+    def test_invalidation(self):
+        self._donnees()
+        self.store.latitude = 45.912345678
+        self.store.save()
+        self.assertEqual(self._donnees().json()["lat"], [45.91235])
+
+        # Autre département : la carte en cache reste valide
+        Store.objects.create(
+            nom="Le Bouchon", ville="lyon", ville_precise="Lyon", departement="rhone",
+            descriptionpetite="Bouchon", latitude=45.76, longitude=4.83,
+            categorie=self.store.categorie,
+        )
+        self.assertEqual(self._donnees().mesures["requetes"], 0)
@@ -0,0 +1,75 @@
+# members/tests_donnees_synthetiques.py
+#
+# Jeu de données synthétique (members/donnees_synthetiques.py) et banc de
+# mesure des vues publiques (members/bench_vues.py), à petite échelle :
+# volumes demandés, champs normalement calculés par save(), statistiques
+# et index recalculés, rapport complet et sans trace en base.
+#
+# Lancer :  python manage.py test members.tests_donnees_synthetiques
+
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from members import bench_vues
+from members.donnees_synthetiques import PREFIXE, _horaires, generer
+from members.horaires import compiler_horaires
+from members.models import (
+    City, Click, PageView, Product, SearchEntry, Store, StoreDailyStats, StoreOpeningInterval,
+)
+from members.outils_tests import STOCKAGE_TEST
+
+PETIT = {"commerces": 60, "produits": 600, "vues": 2000, "clics": 300,
+         "departements": 2, "villes_par_departement": 4}
+
+
+@override_settings(STORAGES=STOCKAGE_TEST)
+class DonneesSynthetiquesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_generer(self):
+        crees = generer(**PETIT)
+        self.assertEqual(crees["commerces"], 60)
+        self.assertEqual(Store.objects.filter(slug__startswith=PREFIXE).count(), 60)
+        self.assertEqual(City.objects.count(), 8)
+        self.assertFalse(Store.objects.filter(city__isnull=True).exists())
+        self.assertEqual(Product.objects.count(), crees["produits"])
+        self.assertTrue(0 < crees["produits"] <= 600)
+        self.assertEqual((PageView.objects.count(), Click.objects.count()), (2000, 300))
+
+        # Ce que save() et les signaux auraient fait
+        self.assertTrue(StoreOpeningInterval.objects.exists())
+        self.assertFalse(Store.objects.filter(latitude__isnull=False, geo_cell="").exists())
+        self.assertTrue(SearchEntry.objects.exists())
+        self.assertTrue(StoreDailyStats.objects.exists())
+        self.assertTrue(Store.objects.filter(score_popularite__gt=0).exists())
+
+    def test_horaires_apres_minuit(self):
+        bar = Store(**_horaires("nuit"))
+        # Vendredi 18h -> samedi 2h : un seul intervalle qui franchit minuit
+        vendredi = 4 * 24 * 60
+        self.assertIn([vendredi + 18 * 60, vendredi + 24 * 60 + 2 * 60 + 1], compiler_horaires(bar))
+
+    def test_banc_de_mesure(self):
+        rapport = bench_vues.executer(passes=2, synthetique=PETIT)
+        self.assertEqual(rapport["volumes"]["commerces"], 60)
+        self.assertIn("carte_groupes", rapport["scenarios"])
+        for nom, scenario in rapport["scenarios"].items():
+            self.assertEqual(scenario["statut"], 200, nom)
+            self.assertGreater(scenario["memoire_pic_ko"], 0)
+            self.assertLessEqual(scenario["chaud"]["requetes"], scenario["froid"]["requetes"], nom)
+        # Rien ne reste en base
+        self.assertFalse(Store.objects.exists())
+
+        ecarts = bench_vues.comparer(rapport, rapport)
+        self.assertEqual(ecarts["fiche"]["froid_ms"][0], ecarts["fiche"]["froid_ms"][1])
+
+    def test_commande_bench(self):
+        sortie = StringIO()
+        call_command("bench_vues", "--synthetique", "20", "--passes", "1",
+                     "--scenario", "fiche", stdout=sortie)
+        self.assertIn("fiche", sortie.getvalue())
+        self.assertNotIn("carte_donnees", sortie.getvalue())
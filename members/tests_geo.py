@@ -0,0 +1,88 @@
+# members/tests_geo.py
+#
+# Index spatial (geohash) : encodage, préfiltre par cellules, filtre par
+# rayon, tri par proximité et rayon_km de l'agent IA.
+#
+# Lancer :  python manage.py test members.tests_geo
+
+from django.test import TestCase
+
+from members.ai_agent.search import find_matching_stores
+from members.geo import (
+    boite_englobante, cellules_couvrantes, distances_dans_rayon,
+    encoder_geohash, haversine_km, trier_par_proximite,
+)
+from members.models import Category, Store, SuperCategory
+
+# Point de référence : place de l'Hôtel de Ville d'Annecy
+LAT, LNG = 45.8992, 6.1294
+
+POINTS = {
+    "Centre": (45.8990, 6.1290),       # ~40 m
+    "Seynod": (45.8850, 6.0900),       # ~3,4 km
+    "Rumilly": (45.8660, 5.9440),      # ~14,8 km
+    "Chambéry": (45.5646, 5.9178),     # ~40 km
+}
+
+
+class GeohashTests(TestCase):
+    def test_encodage_reference(self):
+        self.assertEqual(encoder_geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+    def test_cellules_couvrent_la_boite(self):
+        boite = boite_englobante(LAT, LNG, 5)
+        cellules = set(cellules_couvrantes(boite))
+        for lat in (boite[0], LAT, boite[1]):
+            for lng in (boite[2], LNG, boite[3]):
+                self.assertIn(encoder_geohash(lat, lng), cellules)
+
+    def test_boite_trop_grande_sans_cellules(self):
+        self.assertIsNone(cellules_couvrantes(boite_englobante(LAT, LNG, 300)))
+
+
+class RayonTests(TestCase):
+    def setUp(self):
+        sc = SuperCategory.objects.create(name="Manger", slug="manger")
+        self.boulangerie = Category.objects.create(name="Boulangerie", slug="boulangerie", super_categorie=sc)
+        self.stores = {}
+        for nom, (lat, lng) in POINTS.items():
+            self.stores[nom] = Store.objects.create(
+                nom=nom, ville="Annecy", ville_precise="Annecy", departement="Haute-Savoie",
+                descriptionpetite="Test", addressemaps="1 rue du Test",
+                latitude=lat, longitude=lng, categorie=self.boulangerie,
+            )
+
+    def test_cellule_renseignee_au_save(self):
+        store = self.stores["Centre"]
+        self.assertEqual(store.geo_cell, encoder_geohash(*POINTS["Centre"]))
+        store.latitude, store.longitude = POINTS["Chambéry"]
+        store.save(update_fields=["latitude", "longitude"])
+        store.refresh_from_db()
+        self.assertEqual(store.geo_cell, encoder_geohash(*POINTS["Chambéry"]))
+
+    def test_rayon_identique_au_calcul_exhaustif(self):
+        for rayon in (1, 5, 15, 50):
+            with self.subTest(rayon=rayon):
+                attendu = {
+                    s.id for s in self.stores.values()
+                    if haversine_km(LAT, LNG, s.latitude, s.longitude) <= rayon
+                }
+                trouves = distances_dans_rayon(Store.objects.all(), LAT, LNG, rayon)
+                self.assertEqual(set(trouves), attendu)
+
+    def test_tri_par_proximite(self):
+        sans_coordonnees = Store(
+            nom="Aaa", ville="Annecy", ville_precise="Annecy", departement="Haute-Savoie",
+            descriptionpetite="Test", categorie=self.boulangerie,
+        )
+        Store.objects.bulk_create([sans_coordonnees])
+        noms = list(trier_par_proximite(Store.objects.all(), LAT, LNG).values_list("nom", flat=True))
+        self.assertEqual(noms, ["Centre", "Seynod", "Rumilly", "Chambéry", "Aaa"])
+
+    def test_rayon_km_agent_ia(self):
+        ids = set(
+            find_matching_stores(
+                ["boulangerie"], "Haute-Savoie", "Annecy", zone=(LAT, LNG, 5)
+            ).values_list("id", flat=True)
+        )
+        self.assertEqual(ids, {self.stores["Centre"].id, self.stores["Seynod"].id})
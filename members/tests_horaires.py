@@ -0,0 +1,92 @@
+# members/tests_horaires.py
+#
+# Horaires compilés : compilation, cohérence entre le badge de la fiche
+# (get_opening_status / is_open_now) et le filtre SQL (build_open_now_filter).
+#
+# Lancer :  python manage.py test members.tests_horaires
+
+from datetime import datetime, time
+
+from django.test import TestCase
+
+from members.horaires import FUSEAU, compiler_horaires, tranches_journalieres
+from members.models import Store, StoreOpeningInterval
+from members.outils_tests import creer_commerce
+from members.views import build_open_now_filter, get_opening_status, is_open_now
+
+
+def _moment(jour, heure, minute=0):
+    # 2026-10-12 est un lundi
+    return datetime(2026, 10, 12 + jour, heure, minute, tzinfo=FUSEAU)
+
+
+class CompilationTests(TestCase):
+    def test_creneaux_simples_et_fusion(self):
+        store = Store(
+            lundi_matin_ouverture=time(9), lundi_matin_fermeture=time(12),
+            lundi_apresmidi_ouverture=time(12), lundi_apresmidi_fermeture=time(19),
+        )
+        self.assertEqual(compiler_horaires(store), [[540, 1141]])
+
+    def test_creneau_incomplet_ignore(self):
+        store = Store(mardi_matin_ouverture=time(9))
+        self.assertEqual(compiler_horaires(store), [])
+
+    def test_dimanche_soir_reboucle_sur_lundi(self):
+        store = Store(dimanche_apresmidi_ouverture=time(22), dimanche_apresmidi_fermeture=time(2))
+        self.assertEqual(compiler_horaires(store), [[0, 121], [9960, 10080]])
+
+    def test_tranches_journalieres(self):
+        self.assertEqual(
+            tranches_journalieres([[1320, 1561]]),
+            [(1320, 1440), (1440, 1561)],
+        )
+
+
+class CoherenceTests(TestCase):
+    def setUp(self):
+        # Bar : lundi 22h -> mardi 2h, et mardi 10h-12h
+        self.bar = creer_commerce(
+            descriptionpetite="Bar de quartier",
+            lundi_apresmidi_ouverture=time(22), lundi_apresmidi_fermeture=time(2),
+            mardi_matin_ouverture=time(10), mardi_matin_fermeture=time(12),
+        )
+        self.sans_horaires = creer_commerce(nom="Sans horaires")
+
+    def _ouverts(self, moment):
+        return set(Store.objects.filter(build_open_now_filter(moment)).values_list("id", flat=True))
+
+    def test_table_synchronisee_au_save(self):
+        self.assertEqual(
+            list(StoreOpeningInterval.objects.filter(store=self.bar).values_list("debut", "fin")),
+            [(1320, 1440), (1440, 1561), (2040, 2161)],
+        )
+        self.bar.mardi_matin_ouverture = None
+        self.bar.save()
+        self.assertEqual(StoreOpeningInterval.objects.filter(store=self.bar).count(), 2)
+
+    def test_badge_et_filtre_coherents(self):
+        for moment, attendu in [
+            (_moment(0, 21, 59), False),
+            (_moment(0, 23, 30), True),
+            (_moment(1, 2, 0), True),     # borne de fermeture incluse
+            (_moment(1, 2, 1), False),
+            (_moment(1, 11, 0), True),
+            (_moment(6, 12, 0), False),
+        ]:
+            with self.subTest(moment=moment):
+                self.assertIs(get_opening_status(self.bar, moment)["is_open"], attendu)
+                self.assertIs(is_open_now(self.bar, moment), attendu)
+                self.assertEqual(self.bar.id in self._ouverts(moment), attendu)
+
+    def test_sans_horaires_jamais_ouvert(self):
+        self.assertIsNone(is_open_now(self.sans_horaires))
+        self.assertEqual(get_opening_status(self.sans_horaires)["label"], "Horaires non communiqués")
+        self.assertNotIn(self.sans_horaires.id, self._ouverts(_moment(0, 23, 0)))
+
+    def test_prochaine_transition(self):
+        self.assertEqual(get_opening_status(self.bar, _moment(0, 23, 0))["next_change"], "ferme à 02h")
+        self.assertEqual(get_opening_status(self.bar, _moment(1, 3, 0))["next_change"], "ouvre à 10h")
+        self.assertEqual(get_opening_status(self.bar, _moment(1, 13, 0))["next_change"], "ouvre lundi à 22h")
+        self.assertEqual(get_opening_status(self.bar, _moment(0, 8, 0))["next_change"], "ouvre à 22h")
+        self.assertEqual(get_opening_status(self.bar, _moment(6, 8, 0))["next_change"], "ouvre demain à 22h")
@@ -0,0 +1,106 @@
+# members/tests_images.py
+#
+# Pipeline d'images en arrière-plan : décodage unique, variantes, jobs
+# persistés, repli sur l'original tant que les variantes n'existent pas.
+#
+# Lancer :  python manage.py test members.tests_images
+
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from members import utils
+from members.cache_pages import versions_etiquettes
+from members.models import Category, ImageJob, SuperCategory
+from members.outils_tests import creer_commerce
+from members.tuiles import etiquette_tuiles
+from members.utils import produire_variantes
+
+MEDIA_TMP = tempfile.mkdtemp()
+
+
+def _jpeg(nom="photo.jpg", taille=(2000, 1000)):
+    buffer = io.BytesIO()
+    Image.new("RGB", taille, (255, 139, 56)).save(buffer, format="JPEG")
+    return SimpleUploadedFile(nom, buffer.getvalue(), content_type="image/jpeg")
+
+
+def _largeur(fichier):
+    with fichier.open("rb"):
+        return Image.open(fichier).width
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TMP, IMAGES_SYNCHRONE=True)
+class ImagePipelineTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_TMP, ignore_errors=True)
+
+    def test_decodage_unique_et_largeurs(self):
+        with mock.patch.object(utils.Image, "open", wraps=Image.open) as ouvrir:
+            variantes = produire_variantes(_jpeg(), [300, 1200, 600])
+        self.assertEqual(ouvrir.call_count, 1)
+        self.assertEqual(
+            {l: Image.open(io.BytesIO(data)).width for l, data in variantes.items()},
+            {1200: 1200, 600: 600, 300: 300},
+        )
+
+    def test_variantes_store_apres_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            store = creer_commerce("Le Fournil", descriptionpetite="Boulangerie", photo=_jpeg())
+        # Avant le traitement : original seul, job en attente
+        self.assertFalse(store.photo_medium)
+        self.assertEqual(ImageJob.objects.get().statut, ImageJob.EN_ATTENTE)
+        original = store.photo.name
+
+        for callback in callbacks:
+            callback()
+        store.refresh_from_db()
+        self.assertEqual(ImageJob.objects.get().statut, ImageJob.TERMINE)
+        self.assertRegex(store.photo.name, r"^store_photos/le-fournil-commerce-a-annecy.*\.webp$")
+        self.assertEqual(
+            [_largeur(store.photo), _largeur(store.photo_medium), _largeur(store.photo_small)],
+            [1200, 600, 300],
+        )
+        self.assertFalse(store.photo.storage.exists(original))
+
+    def test_tuiles_perimees_apres_conversion(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            store = creer_commerce("Le Fournil", descriptionpetite="Boulangerie", photo=_jpeg())
+        etiquette = etiquette_tuiles(store.departement)
+        avant = versions_etiquettes(cache, [etiquette])
+        for callback in callbacks:
+            callback()
+        # Les groupes de la carte pointaient vers la photo d'origine
+        self.assertNotEqual(versions_etiquettes(cache, [etiquette]), avant)
+
+    def test_image_remplacee_entre_temps(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            store = creer_commerce("Le Fournil", descriptionpetite="Boulangerie", photo=_jpeg("a.jpg"))
+        with self.captureOnCommitCallbacks(execute=True):
+            store.photo = _jpeg("b.jpg")
+            store.save()
+        for callback in callbacks:
+            callback()   # premier job : image déjà remplacée, ignoré
+        store.refresh_from_db()
+        self.assertTrue(store.photo.name.endswith(".webp"))
+        self.assertEqual(ImageJob.objects.filter(statut=ImageJob.TERMINE).count(), 2)
+
+    def test_commande_reprend_les_jobs(self):
+        sc = SuperCategory.objects.create(name="Manger", slug="manger")
+        with self.captureOnCommitCallbacks(execute=False):
+            cat = Category.objects.create(name="Pizzeria", super_categorie=sc, image=_jpeg("pizza.png"))
+        self.assertTrue(cat.image.name.endswith(".png"))
+
+        call_command("traiter_images", stdout=io.StringIO())
+        cat.refresh_from_db()
+        self.assertRegex(cat.image.name, r"^categories/pizza.*\.webp$")
+        self.assertFalse(ImageJob.objects.exclude(statut=ImageJob.TERMINE).exists())
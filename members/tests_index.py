@@ -0,0 +1,156 @@
+# members/tests_index.py
+#
+# Plans d'exécution des requêtes chaudes (index de Store, PageView, Click,
+# StoreSuggestion, voir Meta.indexes dans models.py) : chaque test exécute
+# le vrai chemin (vue ou agrégation) sur un jeu de données volumineux,
+# passe toutes ses requêtes à EXPLAIN et échoue si une grande table est
+# parcourue entièrement.
+#
+# Lancer :  python manage.py test members.tests_index
+
+import random
+import re
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from members import statistiques
+from members.models import (
+    Category, City, Click, Departement, PageView, Store, StoreSuggestion, SuperCategory,
+)
+from members.outils_tests import STOCKAGE_TEST
+
+GRANDES_TABLES = {
+    "members_store", "members_pageview", "members_click", "members_storesuggestion",
+}
+DEPARTEMENTS, VILLES, CATEGORIES = 20, 5, 8
+COMMERCES, EVENEMENTS, SUGGESTIONS = 3000, 6000, 1000
+
+
+def balayages_sequentiels(sql):
+    """Grandes tables lues entièrement par la requête, d'après EXPLAIN."""
+    with connection.cursor() as curseur:
+        if connection.vendor == "postgresql":
+            curseur.execute("EXPLAIN " + sql)
+            plan = "\n".join(ligne[0] for ligne in curseur.fetchall())
+            tables = re.findall(r"Seq Scan on (\w+)", plan)
+        else:
+            curseur.execute("EXPLAIN QUERY PLAN " + sql)
+            plan = "\n".join(ligne[-1] for ligne in curseur.fetchall())
+            # SQLite : "SCAN t" sans "USING ... INDEX" = parcours complet
+            tables = re.findall(r"^SCAN (\w+)(?:\s+AS \w+)?$", plan, re.MULTILINE)
+    return [t for t in tables if t in GRANDES_TABLES], plan
+
+
+@override_settings(STORAGES=STOCKAGE_TEST)
+class PlansTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        aleatoire = random.Random(4)
+        sc = SuperCategory.objects.create(name="Alimentation", slug="alimentation")
+        categories = [
+            Category.objects.create(name=f"Catégorie {i}", super_categorie=sc) for i in range(CATEGORIES)
+        ]
+        villes = []
+        for d in range(DEPARTEMENTS):
+            departement = Departement.objects.create(nom=f"Dep{d}", slug=f"dep{d}")
+            villes += [
+                City.objects.create(departement=departement, nom=f"Ville{d}x{v}", slug=f"ville{d}x{v}")
+                for v in range(VILLES)
+            ]
+
+        # bulk_create : pas de save(), la ville est renseignée directement
+        commerces = []
+        for i in range(COMMERCES):
+            city = villes[i % len(villes)]
+            commerces.append(Store(
+                nom=f"Commerce {i}", slug=f"commerce-{i}", city=city,
+                departement=city.departement.nom, ville=city.nom, ville_precise=city.nom,
+                categorie=categories[i % CATEGORIES], descriptionpetite="Test",
+                addressemaps="1 rue du Test",
+                latitude=45 + aleatoire.random(), longitude=6 + aleatoire.random(),
+            ))
+        Store.objects.bulk_create(commerces, batch_size=1000)
+        ids = list(Store.objects.values_list("id", flat=True))
+
+        maintenant = timezone.now()
+        PageView.objects.bulk_create([
+            PageView(
+                store_id=aleatoire.choice(ids), session_id=f"s{i % 500}",
+                timestamp=maintenant - timedelta(minutes=aleatoire.randrange(60 * 24 * 90)),
+            )
+            for i in range(EVENEMENTS)
+        ], batch_size=1000)
+        Click.objects.bulk_create([
+            Click(
+                store_id=aleatoire.choice(ids), type_click=aleatoire.choice(["site", "telephone"]),
+                created_at=maintenant - timedelta(minutes=aleatoire.randrange(60 * 24 * 90)),
+            )
+            for i in range(EVENEMENTS)
+        ], batch_size=1000)
+        StoreSuggestion.objects.bulk_create([
+            StoreSuggestion(type_suggestion="ajout", nom=f"Suggestion {i}", ip_address=f"10.0.{i // 250}.{i % 250}")
+            for i in range(SUGGESTIONS)
+        ], batch_size=1000)
+
+        # Statistiques à jour pour le planificateur, comme en production
+        with connection.cursor() as curseur:
+            curseur.execute("ANALYZE")
+
+        cls.store = Store.objects.get(slug="commerce-42")
+        cls.categorie = cls.store.categorie
+
+    def setUp(self):
+        cache.clear()
+
+    def verifier(self, appel):
+        """Exécute appel() et vérifie le plan de chacune de ses requêtes."""
+        with CaptureQueriesContext(connection) as requetes:
+            resultat = appel()
+        selects = [q["sql"] for q in requetes.captured_queries if q["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        for sql in selects:
+            tables, plan = balayages_sequentiels(sql)
+            self.assertEqual(tables, [], f"Parcours complet de {tables} :\n{sql}\n{plan}")
+        return resultat
+
+    def _get(self, url, **kwargs):
+        response = self.verifier(lambda: self.client.get(url, secure=True, **kwargs))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def _ville(self):
+        return f"/{self.store.departement.lower()}/{self.store.ville.lower()}"
+
+    def test_commerces_de_la_ville(self):
+        self._get(f"{self._ville()}/tous-les-commerces/")
+
+    def test_categorie_dans_la_ville(self):
+        self._get(f"{self._ville()}/categorie/{self.categorie.slug}/")
+
+    def test_fiche(self):
+        self._get(f"{self._ville()}/{self.store.slug}/")
+
+    def test_carte_du_departement(self):
+        self._get(f"/carte/{self.store.departement.lower()}/donnees.json")
+
+    def test_delai_des_suggestions(self):
+        response = self.verifier(lambda: self.client.post(
+            "/suggestion/nouveau/", secure=True, REMOTE_ADDR="10.0.1.7",
+        ))
+        self.assertIn(response.status_code, (400, 429))
+
+    def test_agregation_journaliere(self):
+        aujourd_hui = timezone.localdate()
+        self.verifier(lambda: statistiques.agreger(aujourd_hui - timedelta(days=7), aujourd_hui))
+
+    def test_detection_d_un_parcours_complet(self):
+        # Garde-fou du détecteur lui-même : descriptionpetite n'est pas indexée
+        tables, _plan = balayages_sequentiels(
+            """SELECT "id" FROM "members_store" WHERE "descriptionpetite" = 'Test'"""
+        )
+        self.assertEqual(tables, ["members_store"])
@@ -0,0 +1,91 @@
+# members/tests_instrumentation.py
+#
+# Mesures par requête (members/instrumentation.py) : en-tête Server-Timing,
+# compteurs SQL / cache, log JSON, et budgets de requêtes SQL par vue - un
+# N+1 introduit dans une vue doit faire échouer ces tests.
+#
+# Lancer :  python manage.py test members.tests_instrumentation
+
+import json
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from members.cache_pages import invalider_ville
+from members.instrumentation import BudgetRequetesMixin, mesurer
+from members.models import Product, ProductFamily, Store
+from members.outils_tests import STOCKAGE_TEST, commerce_avec_catalogue
+
+
+@override_settings(STORAGES=STOCKAGE_TEST)
+class MesuresTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_compteurs_sql_et_cache(self):
+        cache.set("instrumentation:present", 1)
+        with mesurer() as mesures:
+            Store.objects.count()
+            cache.get("instrumentation:present")
+            cache.get("instrumentation:absent")
+            cache.get_many(["instrumentation:present", "instrumentation:absent"])
+        self.assertEqual(mesures["requetes"], 1)
+        self.assertEqual((mesures["cache_succes"], mesures["cache_echecs"]), (2, 2))
+        # Hors mesure, rien n'est compté
+        Store.objects.count()
+        self.assertEqual(mesures["requetes"], 1)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_en_tete_et_log(self):
+        store = commerce_avec_catalogue()
+        with self.assertLogs("members.instrumentation", "INFO") as logs:
+            response = self.client.get(store.get_absolute_url(), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response["Server-Timing"], r'^sql;dur=[\d.]+;desc="\d+ requetes", cache;')
+        self.assertIn("gabarit;dur=", response["Server-Timing"])
+        ligne = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(ligne["vue"], "store_details")
+        self.assertEqual(ligne["statut"], 200)
+        self.assertEqual(ligne["requetes"], response.mesures["requetes"])
+        self.assertGreater(ligne["gabarit_ms"], 0)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_sans_en_tete_hors_debug(self):
+        store = commerce_avec_catalogue()
+        response = self.client.get(store.get_absolute_url(), secure=True)
+        self.assertNotIn("Server-Timing", response)
+        # Les mesures restent disponibles pour les tests et le log
+        self.assertGreater(response.mesures["requetes"], 0)
+
+
+@override_settings(STORAGES=STOCKAGE_TEST)
+class BudgetRequetesTests(BudgetRequetesMixin, TestCase):
+    """
+    Budgets par vue : à ajuster à la baisse quand une vue est optimisée,
+    jamais à la hausse sans comprendre pourquoi.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.store = commerce_avec_catalogue()
+
+    def test_fiche_commerce_anonyme(self):
+        response = self.client.get(self.store.get_absolute_url(), secure=True)
+        self.assertEqual(response.status_code, 200)
+        # Première visite : commerce + 4 prefetch, création de session, menu,
+        # horaires pour l'ETag (mis en cache ensuite, voir fiche.py)
+        self.assertBudgetRequetes(response, 16)
+
+    def test_cout_independant_du_catalogue(self):
+        """Pas de requête par famille ni par produit : le coût ne croît pas avec le catalogue."""
+        url = self.store.get_absolute_url()
+        self.client.get(url, secure=True)   # session et menu déjà en place ensuite
+        # Deux rendus réels : hors du cache des pages anonymes (voir cache_pages.py)
+        invalider_ville(self.store.departement, self.store.ville)
+        petit = self.client.get(url, secure=True).mesures["requetes"]
+        for f in range(5):
+            famille = ProductFamily.objects.create(store=self.store, nom=f"Autre famille {f}")
+            for p in range(10):
+                Product.objects.create(family=famille, nom=f"Autre produit {f}-{p}")
+        grand = self.client.get(url, secure=True).mesures["requetes"]
+        self.assertEqual(grand, petit)
@@ -0,0 +1,94 @@
+# members/tests_navigation.py
+#
+# Menu de navigation précalculé : contenu de l'arbre, coût par requête
+# (cache + mémo sur la requête) et invalidation par les signaux.
+#
+# Lancer :  python manage.py test members.tests_navigation
+
+import json
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+
+from members.context_processors import menu_context
+from members.models import CategorieIntermediaire, Category, SuperCategory
+from members.navigation import _cle_arbre, invalider_navigation
+from members.outils_tests import creer_commerce
+
+
+class MenuContextTests(TestCase):
+    def setUp(self):
+        invalider_navigation()
+        self.factory = RequestFactory()
+        self.manger = SuperCategory.objects.create(name="Manger", slug="manger")
+        self.boire = SuperCategory.objects.create(name="Boire", slug="boire", ordre=1)
+        self.restos = CategorieIntermediaire.objects.create(
+            name="Restaurants", slug="restaurants", super_categorie=self.manger,
+        )
+        self.pizzeria = Category.objects.create(
+            name="Pizzeria", super_categorie=self.manger, categorie_intermediaire=self.restos,
+        )
+        self.epicerie = Category.objects.create(name="Épicerie", super_categorie=self.manger)
+        self.bar = Category.objects.create(name="Bar", super_categorie=self.boire)
+        for nom, categorie in [("Da Mario", self.pizzeria), ("Chez Paul", self.epicerie)]:
+            creer_commerce(nom, categorie=categorie)
+        creer_commerce("Le Zinc", ville="Seynod", categorie=self.bar)
+
+    def _contexte(self, path="/haute-savoie/annecy/", **cookies):
+        request = self.factory.get(path)
+        request.COOKIES.update(cookies)
+        return request, menu_context(request)
+
+    def test_arbre_de_la_ville(self):
+        _, ctx = self._contexte()
+        self.assertEqual(ctx["menu_departement"], "Haute-Savoie")
+        self.assertEqual(ctx["menu_ville"], "Annecy")
+        self.assertEqual(list(ctx["menu_supercategories"]), ["Manger", "Boire"])
+        items = ctx["menu_supercategories"]["Manger"]["items"]
+        self.assertEqual([i["name"] for i in items], ["Épicerie", "Restaurants"])
+        self.assertEqual(items[1]["cats"], [{"nom": "Pizzeria", "slug": self.pizzeria.slug, "icone": ""}])
+        self.assertEqual(ctx["menu_supercategories"]["Boire"]["items"], [])
+        self.assertCountEqual(ctx["menu_categories"], ["Pizzeria", "Épicerie"])
+
+    def test_fallback_cookie(self):
+        _, ctx = self._contexte("/notre-projet/", yuumi_departement="haute-savoie", yuumi_ville="Seynod")
+        self.assertEqual(ctx["menu_ville"], "Seynod")
+        self.assertEqual(ctx["menu_supercategories"]["Boire"]["items"][0]["categorie"]["slug"], self.bar.slug)
+
+    def test_arbre_en_donnees_simples(self):
+        _, ctx = self._contexte()
+        # Ni instance de modèle ni objet Python : sérialisable tel quel
+        json.dumps(ctx["menu_supercategories"])
+
+    def test_cle_de_cache_sur_emplacement_connu(self):
+        self._contexte("/notre-projet/")   # arbre vide déjà en cache
+        with patch("members.navigation.cache.set", wraps=cache.set) as ecrire:
+            for ville in ("Nulle-Part", "x" * 500, "annecy|seynod"):
+                _, ctx = self._contexte("/notre-projet/", yuumi_departement="haute-savoie", yuumi_ville=ville)
+                self.assertEqual(ctx["menu_ville"], ville)
+                self.assertEqual(ctx["menu_supercategories"]["Boire"]["items"], [])
+            _, ctx = self._contexte("/haute-savoie/inconnue/")
+            self.assertEqual(ctx["menu_categories"], [])
+            # Villes inconnues : toutes servies par l'arbre vide, aucune clé créée
+            ecrire.assert_not_called()
+
+            self._contexte("/notre-projet/", yuumi_departement="Haute-Savoie", yuumi_ville="SEYNOD")
+        self.assertEqual([c.args[0] for c in ecrire.call_args_list], [_cle_arbre("haute-savoie", "seynod")])
+
+    def test_cache_chaud_sans_requete_sql(self):
+        self._contexte()
+        with self.assertNumQueries(0):
+            request, ctx = self._contexte()
+            self.assertIs(menu_context(request), ctx)
+
+    def test_invalidation_par_signal(self):
+        self._contexte()
+        creer_commerce("Le Comptoir", categorie=self.bar)
+        _, ctx = self._contexte()
+        self.assertEqual(ctx["menu_supercategories"]["Boire"]["items"][0]["categorie"]["slug"], self.bar.slug)
+
+        self.bar.name = "Bars"
+        self.bar.save()
+        _, ctx = self._contexte()
+        self.assertEqual(ctx["menu_supercategories"]["Boire"]["items"][0]["name"], "Bars")
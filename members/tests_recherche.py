@@ -0,0 +1,80 @@
+# members/tests_recherche.py
+#
+# Index de recherche : normalisation, maintenance par les signaux, pertinence.
+#
+# Lancer :  python manage.py test members.tests_recherche
+
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase
+
+from members.ai_agent.search import find_stores_by_description, find_stores_by_product
+from members.models import Product, ProductFamily, SearchEntry
+from members.recherche import TYPE_PRODUIT, normaliser, rechercher
+from members.outils_tests import creer_commerce
+from members.views import search_product
+
+DEPT = "Haute-Savoie"
+VILLE = "Annecy"
+
+
+def _produits(store, *noms, famille="Rayon"):
+    fam = ProductFamily.objects.create(store=store, nom=famille)
+    return [Product.objects.create(family=fam, nom=nom) for nom in noms]
+
+
+class NormalisationTests(TestCase):
+    def test_accents_mots_vides_et_pluriels(self):
+        self.assertEqual(normaliser("Foies gras & Pâtés"), normaliser("foie gras pate"))
+        self.assertEqual(normaliser("Bouquet de roses"), ["bouquet", "rose"])
+        self.assertEqual(normaliser("gâteaux"), normaliser("gateau"))
+
+
+class IndexTests(TestCase):
+    def test_maintenance_par_signaux(self):
+        store = creer_commerce("Fleurs & Co", descriptionpetite="Fleuriste de quartier")
+        produit, = _produits(store, "Bouquet de roses")
+        self.assertEqual(len(rechercher(["roses"], [TYPE_PRODUIT])), 1)
+
+        produit.nom = "Orchidée"
+        produit.save()
+        self.assertEqual(rechercher(["roses"], [TYPE_PRODUIT]), [])
+        self.assertEqual(len(rechercher(["orchidees"], [TYPE_PRODUIT])), 1)
+
+        produit.delete()
+        self.assertFalse(SearchEntry.objects.filter(type=TYPE_PRODUIT).exists())
+
+        store.descriptionpetite = "Épicerie fine"
+        store.save()
+        self.assertEqual(list(find_stores_by_description(["epicerie"], DEPT, VILLE)), [store])
+
+    def test_prefixe_et_filtre_ville(self):
+        annecy = creer_commerce("Cacao")
+        _produits(annecy, "Chocolaterie artisanale")
+        _produits(creer_commerce("Ailleurs", ville="Thônes"), "Chocolat noir")
+        self.assertEqual(list(find_stores_by_product(["chocolat"], DEPT, VILLE)), [annecy])
+
+    def test_pertinence_avant_clics(self):
+        un = creer_commerce("AAA Un produit")
+        _produits(un, "Foie gras")
+        plusieurs = creer_commerce("ZZZ Plusieurs produits")
+        _produits(plusieurs, "Foie gras entier", "Foie gras mi-cuit", famille="Foies gras")
+        self.assertEqual(list(find_stores_by_product(["foie gras"], DEPT, VILLE)), [plusieurs, un])
+
+    def test_commande_reindexer(self):
+        store = creer_commerce("Maison Martin")
+        _produits(store, "Terrine")
+        SearchEntry.objects.all().delete()
+        call_command("reindexer_recherche", stdout=StringIO())
+        self.assertEqual(list(find_stores_by_product(["terrines"], DEPT, VILLE)), [store])
+
+    def test_search_product(self):
+        store = creer_commerce("Cacao")
+        _produits(store, "Tablette chocolat noir", "Café moulu")
+        request = RequestFactory().get("/search-product/", {"q": "Chocolats", "ville": "annecy"})
+        request.user = AnonymousUser()
+        data = json.loads(search_product(request).content)
+        self.assertEqual([r["product"] for r in data["results"]], ["Tablette chocolat noir"])
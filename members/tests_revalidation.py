@@ -0,0 +1,111 @@
+# members/tests_revalidation.py
+#
+# Requêtes conditionnelles (members/revalidation.py) : ETag / Last-Modified
+# sur la fiche commerce, la carte et la recherche de produits, 304 tant que
+# rien n'a changé, nouvel ETag après modification d'un commerce, d'un
+# produit ou du compte connecté.
+#
+# Lancer :  python manage.py test members.tests_revalidation
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from members.models import Product, ProductFamily, Store, Wishlist
+from members.outils_tests import STOCKAGE_TEST, commerce_avec_catalogue
+
+
+@override_settings(STORAGES=STOCKAGE_TEST)
+class RevalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = commerce_avec_catalogue(familles=1, produits=2)
+        self.url = self.store.get_absolute_url()
+
+    def _get(self, url=None, **kwargs):
+        return self.client.get(url or self.url, secure=True, **kwargs)
+
+    def _revalider(self, url=None, data=None):
+        """Réponse complète, puis la même requête conditionnelle."""
+        self._get(url, data=data)   # cookie CSRF et menu en place ensuite
+        premiere = self._get(url, data=data)
+        self.assertEqual(premiere.status_code, 200)
+        seconde = self._get(url, data=data, HTTP_IF_NONE_MATCH=premiere["ETag"])
+        return premiere, seconde
+
+    def test_fiche_non_modifiee(self):
+        with patch("members.views.enregistrer_vue") as enregistrer:
+            premiere, seconde = self._revalider()
+        self.assertEqual(premiere["Cache-Control"], "private, no-cache")
+        self.assertIn("Last-Modified", premiere)
+        self.assertEqual(seconde.status_code, 304)
+        self.assertEqual(seconde.content, b"")
+        self.assertEqual(seconde["ETag"], premiere["ETag"])
+        # Ni rendu ni lecture du commerce, mais la vue est comptée
+        self.assertEqual(seconde.mesures["gabarit_ms"], 0)
+        self.assertLessEqual(seconde.mesures["requetes"], 1)
+        self.assertEqual(enregistrer.call_count, 3)
+
+    def test_last_modified(self):
+        self._get()
+        premiere = self._get()
+        seconde = self._get(HTTP_IF_MODIFIED_SINCE=premiere["Last-Modified"])
+        self.assertEqual(seconde.status_code, 304)
+
+    def test_fiche_modifiee(self):
+        self._get()
+        premiere = self._get()
+        self.store.descriptionpetite = "Fromagerie"
+        self.store.save()
+        seconde = self._get(HTTP_IF_NONE_MATCH=premiere["ETag"])
+        self.assertEqual(seconde.status_code, 200)
+        self.assertNotEqual(seconde["ETag"], premiere["ETag"])
+        self.assertContains(seconde, "Fromagerie")
+
+    def test_fiche_inconnue(self):
+        response = self._get("/haute-savoie/annecy/inconnu/")
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("ETag", response)
+
+    def test_carte(self):
+        ailleurs = Store.objects.create(
+            nom="Le Bouchon", ville="lyon", ville_precise="Lyon", departement="rhone",
+            descriptionpetite="Bouchon lyonnais", categorie=self.store.categorie,
+        )
+        url = "/carte/haute-savoie/donnees.json"
+        premiere, seconde = self._revalider(url)
+        self.assertEqual(seconde.status_code, 304)
+
+        # Commerce d'un autre département : la carte reste valide
+        ailleurs.descriptionpetite = "Bouchon"
+        ailleurs.save(update_fields=["descriptionpetite"])
+        self.assertEqual(self._get(url, HTTP_IF_NONE_MATCH=premiere["ETag"]).status_code, 304)
+
+        self.store.latitude = 45.8
+        self.store.save(update_fields=["latitude"])
+        self.assertEqual(self._get(url, HTTP_IF_NONE_MATCH=premiere["ETag"]).status_code, 200)
+
+    def test_recherche(self):
+        data = {"q": "produit"}
+        premiere, seconde = self._revalider("/search-product/", data)
+        self.assertEqual(seconde.status_code, 304)
+
+        famille = ProductFamily.objects.get(store=self.store)
+        Product.objects.create(family=famille, nom="Produit nouveau")
+        troisieme = self._get("/search-product/", data=data, HTTP_IF_NONE_MATCH=premiere["ETag"])
+        self.assertEqual(troisieme.status_code, 200)
+        self.assertIn("Produit nouveau", [r["product"] for r in troisieme.json()["results"]])
+
+    def test_etag_propre_au_compte(self):
+        anonyme = self._get("/search-product/", data={"q": "produit"})
+        user = get_user_model().objects.create_user("cliente", password="x")
+        self.client.force_login(user)
+        connecte, revalide = self._revalider("/search-product/", {"q": "produit"})
+        self.assertNotEqual(connecte["ETag"], anonyme["ETag"])
+        self.assertEqual(revalide.status_code, 304)
+
+        Wishlist.objects.create(user=user, name="Cadeaux")
+        response = self._get("/search-product/", data={"q": "produit"}, HTTP_IF_NONE_MATCH=connecte["ETag"])
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,139 @@
+# members/tests_sitemaps.py
+#
+# Sitemaps (members/sitemaps.py) : index et sections paginées, lastmod tiré
+# de l'historique des commerces, combinaisons ville / catégorie en cache,
+# fichiers pré-générés par generer_sitemaps puis servis tels quels.
+#
+# Lancer :  python manage.py test members.tests_sitemaps
+
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from members import sitemaps
+from members.models import Category, SuperCategory
+from members.outils_tests import STOCKAGE_TEST, creer_commerce
+
+
+def _contenu(response):
+    return b"".join(response.streaming_content) if response.streaming else response.content
+
+
+class SitemapsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sc = SuperCategory.objects.create(name="Alimentation", slug="alimentation")
+        cls.boulangerie = Category.objects.create(name="Boulangerie", super_categorie=sc)
+        cls.epicerie = Category.objects.create(name="Épicerie", super_categorie=sc)
+
+    def setUp(self):
+        cache.clear()
+        self.dossier = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.dossier, ignore_errors=True)
+        reglages = override_settings(STORAGES=STOCKAGE_TEST, SITEMAPS_ROOT=self.dossier)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+        self.stores = [
+            creer_commerce("Chez Paul", categorie=self.boulangerie),
+            creer_commerce("Le Fournil", categorie=self.boulangerie),
+            creer_commerce("Da Mario", ville="Thônes", categorie=self.epicerie),
+        ]
+
+    def test_combinaisons_en_cache(self):
+        attendu = [
+            ("Haute-Savoie", "Annecy", self.boulangerie.slug),
+            ("Haute-Savoie", "Thônes", self.epicerie.slug),
+        ]
+        self.assertEqual(sitemaps.combinaisons()["categories"], attendu)
+        with self.assertNumQueries(0):
+            self.assertEqual(sitemaps.combinaisons()["categories"], attendu)
+        self.assertEqual(
+            sitemaps.combinaisons()["super_categories"],
+            [("Haute-Savoie", "Annecy", "alimentation"), ("Haute-Savoie", "Thônes", "alimentation")],
+        )
+
+        # Nouvelle ville : l'annuaire change de version, les combinaisons aussi
+        creer_commerce("La Mie", ville="Rumilly", categorie=self.boulangerie)
+        self.assertIn(
+            ("Haute-Savoie", "Rumilly", self.boulangerie.slug), sitemaps.combinaisons()["categories"],
+        )
+
+    def test_index_et_pages(self):
+        with mock.patch.object(sitemaps.StoreSitemap, "limit", 2):
+            response = self.client.get("/sitemap.xml", secure=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-Robots-Tag"], "noindex, noodp, noarchive")
+            self.assertContains(response, "/sitemap-commerces.xml</loc>")
+            self.assertContains(response, "/sitemap-commerces.xml?p=2</loc>")
+            self.assertNotContains(response, "?p=3")
+
+            page = self.client.get("/sitemap-commerces.xml?p=2", secure=True)
+            self.assertContains(page, "/haute-savoie/th%C3%B4nes/da-mario/</loc>")
+            self.assertNotContains(page, "chez-paul")
+            # Même URL que les liens internes : une seule forme canonique
+            self.assertContains(page, f"{self.stores[2].get_absolute_url()}</loc>")
+            self.assertEqual(self.client.get("/sitemap-commerces.xml?p=3", secure=True).status_code, 404)
+        self.assertEqual(self.client.get("/sitemap-inconnue.xml", secure=True).status_code, 404)
+
+    def test_url_canonique_des_fiches(self):
+        url = self.stores[2].get_absolute_url()
+        self.assertEqual(url, "/haute-savoie/th%C3%B4nes/da-mario/")
+        # Servie telle quelle, et cible de la redirection des autres graphies
+        self.assertEqual(self.client.get(url, secure=True).status_code, 200)
+        response = self.client.get("/Haute-Savoie/Th%C3%B4nes/da-mario/", secure=True)
+        self.assertRedirects(response, url, status_code=301, fetch_redirect_response=False)
+
+    def test_lastmod_depuis_l_historique(self):
+        store = self.stores[0]
+        store.descriptionpetite = "Nouvelle description"
+        store.save()
+        derniere = store.history.latest("history_date").history_date
+
+        items = {item["pk"]: item for item in sitemaps.StoreSitemap().items()}
+        self.assertEqual(items[store.pk]["modifie_le"], derniere)
+
+        response = self.client.get("/sitemap-commerces.xml", secure=True)
+        self.assertContains(response, f"<lastmod>{timezone.localdate(derniere).isoformat()}")
+
+    def test_fichiers_pre_generes(self):
+        sortie = StringIO()
+        with mock.patch.object(sitemaps.StoreSitemap, "limit", 2):
+            call_command("generer_sitemaps", stdout=sortie)
+        self.assertIn("sitemap-commerces-2.xml : 1 URL", sortie.getvalue())
+        noms = {f.name for f in self.dossier.iterdir()}
+        self.assertIn("sitemap.xml", noms)
+        self.assertIn("sitemap-commerces-2.xml", noms)
+        self.assertFalse([nom for nom in noms if nom.endswith(".tmp")])
+
+        index = (self.dossier / "sitemap.xml").read_text()
+        self.assertIn("<loc>https://yuumi-shop.com/sitemap-commerces.xml?p=2</loc>", index)
+        self.assertIn("<lastmod>", index)
+
+        # Servis en flux, sans base de données ni calcul
+        with self.assertNumQueries(0):
+            response = self.client.get("/sitemap-commerces.xml?p=2", secure=True)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/xml")
+        self.assertIn(b"/haute-savoie/th%C3%B4nes/da-mario/</loc>", _contenu(response))
+        response.close()
+
+        # Requête conditionnelle d'un robot qui a déjà l'index
+        response = self.client.get("/sitemap.xml", secure=True)
+        self.assertContains(response, "sitemap-commerces.xml?p=2")
+        response = self.client.get(
+            "/sitemap.xml", secure=True, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"],
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # Une page qui n'existe plus disparaît du dossier
+        pages = sitemaps.generer()
+        self.assertFalse((self.dossier / "sitemap-commerces-2.xml").exists())
+        self.assertEqual(pages, len(sitemaps.SITEMAPS) + 1)
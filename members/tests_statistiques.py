@@ -0,0 +1,123 @@
+# members/tests_statistiques.py
+#
+# Agrégat journalier StoreDailyStats : comptes par jour et par type de clic,
+# recalcul idempotent, reprise incrémentale, score de popularité dérivé
+# (complet une fois par jour, puis limité aux commerces repris).
+#
+# Lancer :  python manage.py test members.tests_statistiques
+
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase
+from django.utils import timezone
+
+from members import statistiques
+from members.models import Click, PageView, Store, StoreDailyStats
+from members.statistiques import agreger_incremental, calculer_popularite
+
+
+def _a(jour, heure):
+    return timezone.make_aware(datetime.combine(jour, datetime.min.time()) + timedelta(hours=heure))
+
+
+class AgregationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = Store.objects.create(
+            nom="Le Fournil", ville="Annecy", ville_precise="Annecy",
+            departement="Haute-Savoie", descriptionpetite="Boulangerie",
+            addressemaps="1 rue du Test", latitude=45.9, longitude=6.13,
+        )
+        self.aujourd_hui = timezone.localdate()
+        self.hier = self.aujourd_hui - timedelta(days=1)
+        for heure in (8, 23):   # 23 h locale : reste dans le jour local
+            PageView.objects.create(store=self.store, session_id=f"s{heure}", timestamp=_a(self.hier, heure))
+        PageView.objects.create(store=self.store, session_id="s", timestamp=_a(self.aujourd_hui, 0))
+        Click.objects.create(store=self.store, type_click="telephone", created_at=_a(self.hier, 9))
+        Click.objects.create(store=self.store, type_click="telephone", created_at=_a(self.hier, 10))
+        Click.objects.create(store=self.store, type_click="site", created_at=_a(self.hier, 11))
+
+    def _lancer(self, *args):
+        call_command("agreger_statistiques", *args, stdout=StringIO())
+
+    def test_comptes_par_jour_et_par_type(self):
+        self._lancer()
+        hier = StoreDailyStats.objects.get(store=self.store, date=self.hier)
+        self.assertEqual(hier.vues, 2)
+        self.assertEqual(hier.clics, 3)
+        self.assertEqual(hier.clics_telephone, 2)
+        self.assertEqual(hier.clics_site, 1)
+        self.assertEqual(hier.clics_itineraire, 0)
+        jour = StoreDailyStats.objects.get(store=self.store, date=self.aujourd_hui)
+        self.assertEqual((jour.vues, jour.clics), (1, 0))
+
+    def test_relance_idempotente(self):
+        self._lancer()
+        self._lancer()
+        self._lancer("--tout")
+        self.assertEqual(StoreDailyStats.objects.count(), 2)
+        self.assertEqual(StoreDailyStats.objects.get(date=self.hier).vues, 2)
+
+    def test_reprise_incrementale(self):
+        self._lancer()
+        Click.objects.create(store=self.store, type_click="itineraire", created_at=_a(self.aujourd_hui, 1))
+        agreger_incremental()
+        jour = StoreDailyStats.objects.get(store=self.store, date=self.aujourd_hui)
+        self.assertEqual((jour.clics, jour.clics_itineraire), (1, 1))
+
+    def test_score_popularite(self):
+        autre = Store.objects.create(
+            nom="Sans clic", ville="Annecy", ville_precise="Annecy",
+            departement="Haute-Savoie", addressemaps="2 rue du Test",
+            latitude=45.9, longitude=6.13,
+        )
+        self._lancer()
+        self.store.refresh_from_db()
+        autre.refresh_from_db()
+        # Hier : (3 clics + 0,2 x 2 vues) x 0,5^(1/30) ; aujourd'hui : 0,2 x 1 vue
+        self.assertAlmostEqual(self.store.score_popularite, 3.4 * 0.5 ** (1 / 30) + 0.2, places=2)
+        self.assertEqual(autre.score_popularite, 0.0)
+        # Rien n'a changé : aucune écriture
+        self.assertEqual(calculer_popularite(), 0)
+
+    def test_score_retombe_hors_fenetre(self):
+        self._lancer()
+        StoreDailyStats.objects.update(date=F("date") - timedelta(days=365))
+        self.assertEqual(calculer_popularite(), 1)
+        self.store.refresh_from_db()
+        self.assertEqual(self.store.score_popularite, 0.0)
+
+    def test_popularite_limitee_aux_commerces_repris(self):
+        ancien = Store.objects.create(
+            nom="Ancien", ville="Annecy", ville_precise="Annecy",
+            departement="Haute-Savoie", addressemaps="3 rue du Test",
+            latitude=45.9, longitude=6.13,
+        )
+        for heure in range(4):
+            Click.objects.create(
+                store=ancien, type_click="site",
+                created_at=_a(self.aujourd_hui - timedelta(days=10), 9 + heure),
+            )
+        self._lancer()   # premier passage du jour : tout est recalculé
+        ancien.refresh_from_db()
+        attendu = round(4 * 0.5 ** (10 / 30), 3)
+        self.assertEqual(ancien.score_popularite, attendu)
+
+        # Même jour : le commerce sans ligne récente n'est plus relu
+        Store.objects.filter(pk=ancien.pk).update(score_popularite=99)
+        Click.objects.create(store=self.store, type_click="site", created_at=_a(self.aujourd_hui, 2))
+        self._lancer()
+        ancien.refresh_from_db()
+        self.store.refresh_from_db()
+        self.assertEqual(ancien.score_popularite, 99)
+        self.assertAlmostEqual(self.store.score_popularite, 3.4 * 0.5 ** (1 / 30) + 1.2, places=2)
+
+        # Nouveau jour (ou cache perdu) : recalcul complet
+        cache.delete(statistiques.CLE_POPULARITE)
+        self._lancer()
+        ancien.refresh_from_db()
+        self.assertEqual(ancien.score_popularite, attendu)
@@ -0,0 +1,108 @@
+# members/tests_tuiles.py
+#
+# Groupes de marqueurs par zoom et emprise (members/tuiles.py) : cellules
+# regroupées avec détail par catégorie, commerces seuls restitués tels
+# quels, niveaux précalculés en cache, périmés seulement quand ce qui
+# figure sur la carte change.
+#
+# Lancer :  python manage.py test members.tests_tuiles
+
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from members.models import Category, Store
+from members.outils_tests import STOCKAGE_TEST, commerce_avec_catalogue
+from members.tuiles import ZOOM_DETAIL, niveau, resume
+
+URL_GROUPES = "/carte/haute-savoie/groupes.json"
+EMPRISE = "5.9,45.7,6.7,46.4"   # ouest,sud,est,nord : Annecy et Thonon
+
+
+@override_settings(STORAGES=STOCKAGE_TEST)
+class GroupesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = commerce_avec_catalogue(familles=0)
+        autre = Category.objects.create(name="Boulangerie", super_categorie=self.store.categorie.super_categorie)
+        for i, categorie in enumerate([self.store.categorie, autre]):
+            Store.objects.create(
+                nom=f"Voisin {i}", ville="annecy", ville_precise="Annecy",
+                departement="haute-savoie", descriptionpetite="Commerce",
+                latitude=45.9 + 0.0005 * (i + 1), longitude=6.13, categorie=categorie,
+            )
+        self.seul = Store.objects.create(
+            nom="Au bord du lac", ville="thonon", ville_precise="Thonon",
+            departement="haute-savoie", descriptionpetite="Commerce",
+            latitude=46.37, longitude=6.48, categorie=autre,
+        )
+
+    def _groupes(self, z=10, bbox=EMPRISE):
+        return self.client.get(URL_GROUPES, {"z": z, "bbox": bbox}, secure=True)
+
+    def test_niveau(self):
+        commerces = [
+            {"id": 1, "lat": 45.9, "lng": 6.13, "categorie": "a"},
+            {"id": 2, "lat": 45.9001, "lng": 6.13, "categorie": "b"},
+            {"id": 3, "lat": 46.37, "lng": 6.48, "categorie": "b"},
+        ]
+        tuiles = list(niveau(commerces, 10).values())
+        groupes = [g for t in tuiles for g in t["groupes"]]
+        self.assertEqual(len(groupes), 1)
+        self.assertEqual((groupes[0]["n"], groupes[0]["categories"]), (2, {"a": 1, "b": 1}))
+        self.assertEqual([c["id"] for t in tuiles for c in t["commerces"]], [3])
+        # Zoom de détail : chaque commerce est un marqueur
+        self.assertEqual(sum(len(t["commerces"]) for t in niveau(commerces, ZOOM_DETAIL).values()), 3)
+
+    def test_groupes_de_l_emprise(self):
+        d = self._groupes().json()
+        self.assertEqual(len(d["groupes"]), 1)
+        groupe = d["groupes"][0]
+        self.assertEqual(groupe["n"], 3)
+        self.assertEqual(groupe["categories"], {self.store.categorie.slug: 2, "boulangerie": 1})
+        self.assertEqual(d["commerces"]["ids"], [self.seul.pk])
+        self.assertEqual(d["commerces"]["url"], [self.seul.get_absolute_url()])
+
+        # Emprise limitée à Annecy : le commerce de Thonon n'est pas envoyé
+        d = self._groupes(z=12, bbox="6.1,45.85,6.2,45.95").json()
+        self.assertEqual(d["commerces"]["ids"], [])
+
+    def test_parametres_invalides(self):
+        self.assertEqual(self._groupes(bbox="6.1,45.8").status_code, 400)
+        # Emprise de toute la France à un zoom de rue
+        self.assertEqual(self._groupes(z=16, bbox="-5,42,8,51").status_code, 400)
+
+    def test_cache_et_invalidation(self):
+        self._groupes()
+        self.assertEqual(self._groupes(z=10).mesures["requetes"], 0)
+
+        # Description : invisible sur la carte, les groupes restent
+        self.seul.descriptionpetite = "Autre description"
+        self.seul.save()
+        self.assertEqual(self._groupes().mesures["requetes"], 0)
+
+        # Nouvelle position : recalcul
+        self.seul.latitude, self.seul.longitude = 45.9, 6.1305
+        self.seul.save()
+        d = self._groupes().json()
+        self.assertEqual(d["groupes"][0]["n"], 4)
+        self.assertEqual(d["commerces"]["ids"], [])
+
+    def test_categorie_modifiee(self):
+        self._groupes()
+        # Une catégorie ne périme que l'étiquette globale (invalider_tout)
+        categorie = Category.objects.get(slug="boulangerie")
+        categorie.slug = "boulangerie-artisanale"
+        categorie.save()
+        d = self._groupes().json()
+        self.assertEqual(d["groupes"][0]["categories"], {self.store.categorie.slug: 2, "boulangerie-artisanale": 1})
+        self.assertIn("boulangerie-artisanale", [c["slug"] for c in resume("haute-savoie")["categories"]])
+
+    def test_page_en_mode_groupes(self):
+        url = "/carte/haute-savoie/"
+        self.assertNotContains(self.client.get(url, secure=True), "data-groupes")
+        with patch("members.views.SEUIL_GROUPES", 3):
+            response = self.client.get(url, secure=True)
+        self.assertContains(response, f'data-groupes="{URL_GROUPES}"')
+        self.assertContains(response, 'id="carte-resume"')
@@ -0,0 +1,84 @@
+# members/tests_villes.py
+#
+# Référentiel des villes (City, Departement) : rattachement des commerces
+# et mises en avant à chaque save(), graphie unique par ville, filtres des
+# pages d'une ville sur la clé étrangère (annuaire.filtre_ville) et
+# migration des chaînes existantes.
+#
+# Lancer :  python manage.py test members.tests_villes
+
+from importlib import import_module
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from members.annuaire import filtre_ville
+from members.models import City, CityCategoryHighlight, Departement, Store
+from members.outils_tests import STOCKAGE_TEST, creer_commerce
+
+
+@override_settings(STORAGES=STOCKAGE_TEST)
+class VillesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = creer_commerce("Chez Paul")
+
+    def test_rattachement_et_graphie(self):
+        autre = creer_commerce("Da Mario", departement="HAUTE-SAVOIE ", ville="annecy")
+        self.assertEqual(autre.city_id, self.store.city_id)
+        self.assertEqual((autre.departement, autre.ville), ("Haute-Savoie", "Annecy"))
+        self.assertEqual(Departement.objects.get().slug, "haute-savoie")
+        self.assertEqual(City.objects.get().slug, "annecy")
+
+        highlight = CityCategoryHighlight.objects.create(departement="haute-savoie", ville="ANNECY")
+        self.assertEqual(highlight.city_id, self.store.city_id)
+
+    def test_changement_de_ville(self):
+        self.store.ville = "Thônes"
+        self.store.save(update_fields=["ville"])
+        self.store.refresh_from_db()
+        self.assertEqual(self.store.city.slug, "thônes")
+        self.assertEqual(City.objects.count(), 2)
+
+    def test_filtre_ville(self):
+        lyon = creer_commerce("Le Bouchon", departement="Rhône", ville="Lyon")
+        thones = creer_commerce("Le Zinc", ville="Thônes")
+        self.assertEqual(filtre_ville("haute-savoie", "annecy"), {"city": self.store.city_id})
+        self.assertEqual(
+            sorted(filtre_ville("haute-savoie", "")["city__in"]),
+            sorted([self.store.city_id, thones.city_id]),
+        )
+        self.assertEqual(filtre_ville("", "LYON", "store__city"), {"store__city": lyon.city_id})
+        self.assertEqual(filtre_ville("rhône", "annecy"), {"city__in": []})
+        self.assertFalse(Store.objects.filter(**filtre_ville("", "")).exists())
+
+    def test_page_ville_sur_cle_etrangere(self):
+        creer_commerce("Le Bouchon", departement="Rhône", ville="Lyon")
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get("/haute-savoie/annecy/tous-les-commerces/", secure=True)
+        self.assertContains(response, "Chez Paul")
+        self.assertNotContains(response, "Le Bouchon")
+        sql = " ".join(q["sql"] for q in requetes.captured_queries)
+        self.assertIn('"city_id" = ', sql)
+        self.assertNotIn('"ville" LIKE', sql)
+
+    def test_migration(self):
+        migration = import_module("members.migrations.0050_city_departement")
+        Store.objects.update(city=None)
+        City.objects.all().delete()
+        Departement.objects.all().delete()
+        Store.objects.filter(pk=self.store.pk).update(ville="ANNECY")
+        autre = Store.objects.create(nom="Da Mario", ville_precise="Annecy", descriptionpetite="Test")
+        Store.objects.filter(pk=autre.pk).update(departement="haute-savoie", ville="annecy ")
+
+        migration.remplir_villes(apps, None)
+
+        city = City.objects.get()
+        self.assertEqual((city.departement.nom, city.nom), ("Haute-Savoie", "ANNECY"))
+        self.assertEqual(
+            set(Store.objects.values_list("city_id", "departement", "ville")),
+            {(city.pk, "Haute-Savoie", "ANNECY")},
+        )
@@ -0,0 +1,188 @@
+# members/tuiles.py
+#
+# Regroupement des marqueurs de la carte côté serveur, par niveau de zoom
+# (vue map_groupes, /carte/<departement>/groupes.json?z=&bbox=).
+#
+# Les données de la carte (carte.py) envoient tous les commerces du
+# département au navigateur : au-delà de quelques milliers, téléchargement
+# et rendu des marqueurs deviennent trop lourds. Pour un département dense
+# (SEUIL_GROUPES), la page demande à la place les groupes de son emprise :
+#
+# - chaque niveau de zoom est découpé en cellules de TAILLE_CELLULE pixels
+#   (projection Web Mercator, celle de Leaflet) ; les commerces d'une même
+#   cellule forment un groupe (nombre, position moyenne, emprise, nombre
+#   par catégorie pour que le client applique ses filtres), un commerce
+#   seul reste un marqueur ; à partir de ZOOM_DETAIL, plus de groupes ;
+# - les cellules sont rangées par tuile de 256 pixels : une réponse ne lit
+#   que les tuiles qui couvrent l'emprise (au plus MAX_TUILES), sa taille
+#   ne dépend pas du nombre de commerces du département ;
+# - un niveau est précalculé entièrement au premier besoin et stocké tuile
+#   par tuile dans le cache partagé, sous les versions de l'étiquette
+#   etiquette_tuiles et de l'étiquette globale : seul un changement de ce
+#   qui figure sur la carte (position, catégorie, nom, photo, ville...) ou
+#   des catégories elles-mêmes le périme (signals.py, images.py), pas une
+#   modification de description ou d'horaires.
+
+import math
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from .cache_pages import ETIQUETTE_GLOBALE, PREFIXE_ETIQUETTE, versions_etiquettes
+
+TAILLE_TUILE = 256
+TAILLE_CELLULE = 64
+ZOOM_MIN = 5
+ZOOM_DETAIL = 17
+MAX_TUILES = 64
+SEUIL_GROUPES = 1500      # commerces placés : au-delà, la page passe aux groupes
+DECIMALES = 5
+LATITUDE_MAX = 85.05112878   # limite de la projection Web Mercator
+
+PREFIXE_TUILES = "yuumi_tuiles:"
+DUREE_TUILES = 60 * 60 * 24
+
+
+def etiquette_tuiles(departement):
+    return f"{PREFIXE_ETIQUETTE}tuiles|{departement.lower()}"
+
+
+def invalider_tuiles(departement):
+    """Périme les groupes précalculés du département (positions modifiées...)."""
+    if departement:
+        cache.delete(etiquette_tuiles(departement))
+
+
+def pixel(lat, lng, z):
+    """Coordonnées en pixels Web Mercator (celles de Leaflet) au zoom z."""
+    echelle = TAILLE_TUILE * 2 ** z
+    sinus = math.sin(math.radians(max(min(lat, LATITUDE_MAX), -LATITUDE_MAX)))
+    x = (lng + 180) / 360 * echelle
+    y = (0.5 - math.log((1 + sinus) / (1 - sinus)) / (4 * math.pi)) * echelle
+    return x, y
+
+
+def _points(departement):
+    """Commerces placés du département, prêts pour les marqueurs."""
+    from .carte import construire
+
+    d = construire(departement)
+    return {
+        "categories": d["categories"],
+        "commerces": [
+            {
+                "id": d["ids"][i],
+                "lat": d["lat"][i],
+                "lng": d["lng"][i],
+                "categorie": d["categories"][d["categorie"][i]]["slug"],
+                "nom": d["nom"][i],
+                "url": d["modele_url"].replace("__ville__", d["villes"][d["ville"][i]]).replace("__slug__", d["slug"][i]),
+                "photo": default_storage.url(d["photo"][i]) if d["photo"][i] else "",
+            }
+            for i in range(len(d["ids"]))
+        ],
+    }
+
+
+def _groupe(membres):
+    lats = [m["lat"] for m in membres]
+    lngs = [m["lng"] for m in membres]
+    return {
+        "lat": round(sum(lats) / len(lats), DECIMALES),
+        "lng": round(sum(lngs) / len(lngs), DECIMALES),
+        "n": len(membres),
+        "bbox": [min(lngs), min(lats), max(lngs), max(lats)],
+        "categories": dict(Counter(m["categorie"] for m in membres)),
+    }
+
+
+def niveau(commerces, z):
+    """{(x, y): {"groupes", "commerces"}} : tuiles non vides du zoom z."""
+    par_tuile = TAILLE_TUILE // TAILLE_CELLULE
+    tuiles, cellules = {}, {}
+    for commerce in commerces:
+        x, y = pixel(commerce["lat"], commerce["lng"], z)
+        if z >= ZOOM_DETAIL:
+            tuile = tuiles.setdefault((int(x // TAILLE_TUILE), int(y // TAILLE_TUILE)), {"groupes": [], "commerces": []})
+            tuile["commerces"].append(commerce)
+        else:
+            cellules.setdefault((int(x // TAILLE_CELLULE), int(y // TAILLE_CELLULE)), []).append(commerce)
+
+    for (cx, cy), membres in cellules.items():
+        tuile = tuiles.setdefault((cx // par_tuile, cy // par_tuile), {"groupes": [], "commerces": []})
+        if len(membres) == 1:
+            tuile["commerces"].append(membres[0])
+        else:
+            tuile["groupes"].append(_groupe(membres))
+    return tuiles
+
+
+def _base(departement):
+    # L'étiquette globale en plus : une catégorie renommée ou supprimée
+    # (invalider_tout) change les slugs des tuiles et le résumé
+    etiquettes = [ETIQUETTE_GLOBALE, etiquette_tuiles(departement)]
+    globale, locale = versions_etiquettes(cache.get_many(etiquettes), etiquettes)
+    return f"{PREFIXE_TUILES}{globale}.{locale}:{departement.lower()}"
+
+
+def _calculer(base, departement):
+    points = _points(departement)
+    commerces = points["commerces"]
+    resultat = {
+        "nombre": len(commerces),
+        "categories": points["categories"],
+        "centre": [commerces[0]["lat"], commerces[0]["lng"]] if commerces else None,
+    }
+    cache.set_many({f"{base}:resume": resultat, f"{base}:points": points}, DUREE_TUILES)
+    return resultat, points
+
+
+def resume(departement):
+    """{nombre, categories, centre} des commerces placés (mode de la page, map_view)."""
+    base = _base(departement)
+    return cache.get(f"{base}:resume") or _calculer(base, departement)[0]
+
+
+def _tuiles(departement, z, coordonnees):
+    """Tuiles demandées du zoom z ; le niveau entier est calculé s'il manque."""
+    base = _base(departement)
+    cle_niveau = f"{base}:{z}"
+    cles = {f"{cle_niveau}:{x}:{y}": (x, y) for x, y in coordonnees}
+    en_cache = cache.get_many([cle_niveau, *cles])
+
+    # Le niveau liste ses tuiles non vides : une tuile évincée du cache ne
+    # passe pas pour une tuile vide
+    non_vides = en_cache.get(cle_niveau)
+    if non_vides is not None and all(c in en_cache for c, xy in cles.items() if xy in non_vides):
+        return [en_cache[c] for c, xy in cles.items() if xy in non_vides]
+
+    points = cache.get(f"{base}:points") or _calculer(base, departement)[1]
+    tuiles = niveau(points["commerces"], z)
+    cache.set_many({f"{cle_niveau}:{x}:{y}": tuile for (x, y), tuile in tuiles.items()}, DUREE_TUILES)
+    cache.set(cle_niveau, frozenset(tuiles), DUREE_TUILES)
+    return [tuiles[xy] for xy in coordonnees if xy in tuiles]
+
+
+def groupes(departement, z, ouest, sud, est, nord):
+    """
+    Groupes et commerces de l'emprise au zoom z :
+    {z, groupes: [...], commerces: {ids, lat, lng, categorie, nom, url, photo}}.
+    ValueError si l'emprise couvre plus de MAX_TUILES tuiles à ce zoom.
+    """
+    z = max(ZOOM_MIN, min(z, ZOOM_DETAIL))   # au-delà de ZOOM_DETAIL : mêmes tuiles
+    dernier = 2 ** z - 1
+    x_min, y_min = (max(int(v // TAILLE_TUILE), 0) for v in pixel(nord, ouest, z))
+    x_max, y_max = (min(int(v // TAILLE_TUILE), dernier) for v in pixel(sud, est, z))
+    if (x_max - x_min + 1) * (y_max - y_min + 1) > MAX_TUILES:
+        raise ValueError("Emprise trop grande pour ce niveau de zoom.")
+
+    coordonnees = [(x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+    resultat = {"z": z, "groupes": [], "commerces": {cle: [] for cle in ("ids", "lat", "lng", "categorie", "nom", "url", "photo")}}
+    for tuile in _tuiles(departement, z, coordonnees):
+        resultat["groupes"].extend(tuile["groupes"])
+        for commerce in tuile["commerces"]:
+            resultat["commerces"]["ids"].append(commerce["id"])
+            for cle in ("lat", "lng", "categorie", "nom", "url", "photo"):
+                resultat["commerces"][cle].append(commerce[cle])
+    return resultat
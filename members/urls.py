@@ -38,6 +38,8 @@ urlpatterns = [
     # Recherche / carte
     path("search-product/", views.search_product, name="search-product"),
     path("carte/<str:departement>/", views.map_view, name="map-view"),
+    path("carte/<str:departement>/donnees.json", views.map_data, name="map-data"),
+    path("carte/<str:departement>/groupes.json", views.map_groupes, name="map-groupes"),
 
     # Auth — login/logout définis dans TestYuumi/urls.py uniquement
     path("register/", views.register, name="register"),
@@ -93,6 +95,7 @@ urlpatterns = [
     path("recherche-intelligente/", views.testyuumi2, name="recherche-intelligente"),
     path("test-yuumi2/", RedirectView.as_view(pattern_name="recherche-intelligente", permanent=True)),
     path("agent-ia/", views.ai_search_agent, name="ai_search_agent"),
+    path("agent-ia/flux/", views.ai_search_agent_flux, name="ai_search_agent_flux"),
     path("wishlists/<int:wishlist_id>/store/<int:store_id>/toggle/", views.toggle_wishlist_store, name="toggle-wishlist-store"),
 
 
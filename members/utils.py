@@ -8,25 +8,38 @@ from django.http import Http404
 YUUMI_PLUS_WISHLIST_LIMIT = 10
 YUUMI_PLUS_UNFAVORIS_LIMIT = 10
 
+def _ouvrir_image(image_file):
+    img = Image.open(image_file)
+    if img.mode in ("RGBA", "P"):
+        return img.convert("RGBA")
+    return img.convert("RGB")
+
+
+def produire_variantes(image_file, largeurs):
+    """
+    Décode l'image UNE seule fois et produit une version WebP par largeur
+    demandée (None = taille d'origine), en réduisant progressivement : la
+    300 px est calculée depuis la 600 px, elle-même calculée depuis la
+    1200 px. Renvoie {largeur: octets WebP}.
+    """
+    img = _ouvrir_image(image_file)
+    variantes = {}
+    for largeur in sorted(set(largeurs), key=lambda l: -(l or float("inf"))):
+        if largeur and img.width > largeur:
+            img = img.resize((largeur, int(img.height * largeur / img.width)), Image.LANCZOS)
+        output = io.BytesIO()
+        img.save(output, format='WEBP', quality=80)
+        variantes[largeur] = output.getvalue()
+    return variantes
+
+
 def resize_and_convert(image_file, name, max_width=None):
     """
     Convertit une image en WebP, la redimensionne si nécessaire
     en conservant les proportions, et lui donne un nom personnalisé.
     """
-    img = Image.open(image_file)
-    if img.mode in ("RGBA", "P"):
-        img = img.convert("RGBA")
-    else:
-        img = img.convert("RGB")
-    # Redimensionner si max_width est défini et que l'image est plus large
-    if max_width and img.width > max_width:
-        ratio = max_width / img.width
-        new_height = int(img.height * ratio)
-        img = img.resize((max_width, new_height), Image.LANCZOS)
-    output = io.BytesIO()
-    img.save(output, format='WEBP', quality=80)
-    output.seek(0)
-    return ContentFile(output.read(), name=f"{name}.webp")
+    contenu = produire_variantes(image_file, [max_width])[max_width]
+    return ContentFile(contenu, name=f"{name}.webp")
 
 
 def convert_to_webp(image_file):
@@ -1,15 +1,30 @@
 import random
+import re
 import unicodedata
-from datetime import datetime
-from zoneinfo import ZoneInfo
 from django.utils import timezone
 from datetime import timedelta
 from django.utils.safestring import mark_safe
-from .utils import convert_to_webp
+from .analytics import enregistrer_clic, enregistrer_vue
+from .annuaire import departements_villes, filtre_ville
+from .cache_pages import (
+    DUREE_OUVERT, DUREE_PAGE, ETIQUETTE_CONTENU, donnees_page, etiquette_departement,
+    etiquette_ville, limiter_duree, page_anonyme,
+)
+from .carte import donnees_carte
+from .fiche import charger_commerce, elements_revalidation, lignes_catalogue, relations_utilisateur
+from .geo import filtrer_par_rayon, trier_par_proximite
+from .recherche import TYPE_PRODUIT, rechercher
+from .revalidation import revalider
+from .tuiles import SEUIL_GROUPES, etiquette_tuiles, groupes, resume as resume_carte
+from .horaires import (
+    JOURS, MINUTES_PAR_JOUR, minute_de_la_semaine,
+    est_ouvert, prochaine_fermeture, prochaine_ouverture, secondes_avant_transition,
+)
 import logging
 
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
 from django.core.exceptions import PermissionDenied
 from django.core.paginator import Paginator
 from django.contrib.auth import login
@@ -20,12 +35,11 @@ from django.templatetags.static import static
 from django.utils import timezone
 from datetime import timedelta
 from django.db.models import Q
-from .models import PageView
 import json
 
 from .models import (
     Store, ProductFamily, Product, Category,
-    StoreImage, CityCategoryHighlight, SuperCategory, StoreGalerieImage, Click, PageView, StoreSuggestion,
+    StoreImage, CityCategoryHighlight, SuperCategory, StoreGalerieImage, StoreSuggestion,
     Wishlist, WishlistStore, StoreNote,
 )
 from .forms import FamilyFormSet, ProductFormSet, RegisterForm, StoreForm, NewStoreForm, ModifStoreForm
@@ -39,52 +53,20 @@ from .utils import web_only, app_only, is_native_request, activer_premium, yuumi
 
 AI_AGENT_PUBLIC = False
 
-def is_open_now(store):
-    now = datetime.now(tz=ZoneInfo('Europe/Paris'))
-    jours = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche']
-    today = jours[now.weekday()]
-    yesterday = jours[(now.weekday() - 1) % 7]
-    current_time = now.time().replace(second=0, microsecond=0)
-
-    def check_jour(jour):
-        mo = getattr(store, f'{jour}_matin_ouverture', None)
-        mf = getattr(store, f'{jour}_matin_fermeture', None)
-        ao = getattr(store, f'{jour}_apresmidi_ouverture', None)
-        af = getattr(store, f'{jour}_apresmidi_fermeture', None)
-        return mo, mf, ao, af
-
-    mo, mf, ao, af = check_jour(today)
-
-    if mo is not None and mf is not None:
-        if mf > mo:
-            if mo <= current_time <= mf:
-                return True
-        else:
-            if current_time >= mo:
-                return True
-
-    if ao is not None and af is not None:
-        if af > ao:
-            if ao <= current_time <= af:
-                return True
-        else:
-            if current_time >= ao:
-                return True
-
-    mo_hier, mf_hier, ao_hier, af_hier = check_jour(yesterday)
-    if mo_hier is not None and mf_hier is not None and mf_hier <= mo_hier:
-        if current_time <= mf_hier:
-            return True
-    if ao_hier is not None and af_hier is not None and af_hier <= ao_hier:
-        if current_time <= af_hier:
-            return True
-
-    if mo is not None or mf is not None or ao is not None or af is not None:
-        return False
-    return None
+def is_open_now(store, moment=None):
+    """
+    True / False selon que le commerce est ouvert à l'instant (ou à moment),
+    None si aucun horaire n'a été renseigné. Lit la forme compilée des
+    horaires (Store.horaires_compiles, voir horaires.py) : recherche
+    dichotomique, plus aucun parcours champ par champ.
+    """
+    intervalles = store.horaires_compiles
+    if not intervalles:
+        return None
+    return est_ouvert(intervalles, minute_de_la_semaine(moment))
 
 
-def get_opening_status(store):
+def get_opening_status(store, moment=None):
     """
     Version enrichie de is_open_now, pensée pour le badge "Ouvert / Fermé"
     de la fiche commerce.
@@ -93,10 +75,9 @@ def get_opening_status(store):
     celle-ci renvoie un dict avec le libellé prêt à afficher et la
     prochaine transition ("ferme à 19h", "ouvre demain à 9h", etc.).
 
-    Ne remplace pas is_open_now : les deux coexistent pour ne rien casser
-    si is_open_now est utilisée ailleurs dans le projet (ex: by_category,
-    map_view, etc.). Si ce n'est pas le cas, is_open_now pourra être
-    supprimée plus tard au profit de celle-ci.
+    Les deux lisent la même forme compilée que build_open_now_filter
+    (Store.horaires_compiles) : le badge de la fiche, le filtre "ouvert" de
+    by_category et celui de l'agent IA ne peuvent plus se contredire.
 
     Retourne :
         {
@@ -105,103 +86,42 @@ def get_opening_status(store):
             "next_change": "ferme à 19h" / "ouvre à 14h" / "ouvre demain à 9h" / None,
         }
     """
-    jours = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche']
-    now = datetime.now(tz=ZoneInfo('Europe/Paris'))
-    today_idx = now.weekday()
-    current_time = now.time().replace(second=0, microsecond=0)
-
-    def format_heure(t):
-        return t.strftime('%Hh%M').replace('h00', 'h')
-
-    def get_creneaux(jour_idx):
-        """Renvoie les créneaux (ouverture, fermeture) du jour donné (matin + après-midi)."""
-        jour = jours[jour_idx % 7]
-        mo = getattr(store, f'{jour}_matin_ouverture', None)
-        mf = getattr(store, f'{jour}_matin_fermeture', None)
-        ao = getattr(store, f'{jour}_apresmidi_ouverture', None)
-        af = getattr(store, f'{jour}_apresmidi_fermeture', None)
-
-        creneaux = []
-        if mo and mf:
-            creneaux.append((mo, mf))
-        if ao and af:
-            creneaux.append((ao, af))
-        return creneaux
-
-    # 1. Aucune donnée d'horaires sur toute la semaine -> on ne dit pas "Fermé",
-    #    on dit que l'info n'a jamais été renseignée.
-    has_any_data = any(get_creneaux(i) for i in range(7))
-    if not has_any_data:
+    intervalles = store.horaires_compiles
+
+    # Aucune donnée d'horaires sur toute la semaine -> on ne dit pas "Fermé",
+    # on dit que l'info n'a jamais été renseignée.
+    if not intervalles:
         return {
             "is_open": None,
             "label": "Horaires non communiqués",
             "next_change": None,
         }
 
-    creneaux_today = get_creneaux(today_idx)
-    creneaux_yesterday = get_creneaux(today_idx - 1)
+    minute = minute_de_la_semaine(moment)
 
-    is_open = False
-    closing_time = None
+    def format_heure(minute_semaine):
+        minutes_du_jour = minute_semaine % MINUTES_PAR_JOUR
+        return f"{minutes_du_jour // 60:02d}h{minutes_du_jour % 60:02d}".replace("h00", "h")
 
-    # Créneau d'aujourd'hui en cours
-    for (o, f) in creneaux_today:
-        if f > o:
-            if o <= current_time <= f:
-                is_open = True
-                closing_time = f
-                break
-        else:
-            # créneau qui chevauche minuit (rare, ex: bar ouvert 22h-2h)
-            if current_time >= o:
-                is_open = True
-                closing_time = f
-                break
-
-    # Créneau d'hier qui chevauche minuit et court encore
-    if not is_open:
-        for (o, f) in creneaux_yesterday:
-            if f <= o and current_time <= f:
-                is_open = True
-                closing_time = f
-                break
-
-    if is_open:
-        next_change = f"ferme à {format_heure(closing_time)}" if closing_time else None
+    fermeture = prochaine_fermeture(intervalles, minute)
+    if fermeture is not None:
+        # fin d'intervalle exclue : le commerce ferme à la minute précédente
         return {
             "is_open": True,
             "label": "Ouvert en ce moment",
-            "next_change": next_change,
+            "next_change": f"ferme à {format_heure(fermeture - 1)}",
         }
 
-    # Fermé : chercher la prochaine ouverture (reste de la journée, puis jours suivants)
-    next_opening = None
-    next_opening_day_offset = None
-
-    for (o, f) in creneaux_today:
-        if o > current_time:
-            next_opening = o
-            next_opening_day_offset = 0
-            break
-
-    if next_opening is None:
-        for offset in range(1, 8):
-            creneaux = get_creneaux(today_idx + offset)
-            if creneaux:
-                next_opening = creneaux[0][0]
-                next_opening_day_offset = offset
-                break
-
-    next_change = None
-    if next_opening is not None:
-        heure = format_heure(next_opening)
-        if next_opening_day_offset == 0:
-            next_change = f"ouvre à {heure}"
-        elif next_opening_day_offset == 1:
-            next_change = f"ouvre demain à {heure}"
-        else:
-            jour_label = jours[(today_idx + next_opening_day_offset) % 7]
-            next_change = f"ouvre {jour_label} à {heure}"
+    ouverture = prochaine_ouverture(intervalles, minute)
+    decalage = ouverture // MINUTES_PAR_JOUR - minute // MINUTES_PAR_JOUR
+    heure = format_heure(ouverture)
+    if decalage == 0:
+        next_change = f"ouvre à {heure}"
+    elif decalage == 1:
+        next_change = f"ouvre demain à {heure}"
+    else:
+        jour_label = JOURS[(ouverture // MINUTES_PAR_JOUR) % 7]
+        next_change = f"ouvre {jour_label} à {heure}"
 
     return {
         "is_open": False,
@@ -210,79 +130,32 @@ def get_opening_status(store):
     }
 
 
-def build_open_now_filter():
+def build_open_now_filter(moment=None):
     """
-    Construit un objet Q() Django qui filtre les Store ouverts à l'instant présent,
-    en se basant sur le jour de la semaine réel et l'heure courante (fuseau Europe/Paris).
-
-    Gère le cas des commerces dont les horaires chevauchent minuit (ex: bar ouvert
-    22h-2h) : un tel commerce est considéré "ouvert" soit parce qu'on est dans son
-    créneau d'aujourd'hui qui déborde sur demain, soit parce qu'on est encore dans
-    son créneau d'hier qui a débordé jusqu'à maintenant.
-
-    IMPORTANT : chaque condition exige explicitement que les deux champs comparés
-    soient non-NULL (isnull=False). Sans ça, un commerce qui n'a renseigné AUCUN
-    horaire peut remonter par erreur dans certains cas limites où une comparaison
-    impliquant NULL ne se comporte pas comme on l'attend sur tous les moteurs SQL.
-    Un commerce sans horaires ne doit JAMAIS apparaître comme "ouvert".
-
-    Doit rester cohérent avec get_opening_status (vue détail), même si l'implémentation
-    diffère par nécessité : ici on compare des champs entre eux via F() pour que tout
-    se passe en SQL, alors que get_opening_status travaille en Python sur un store
-    déjà chargé.
+    Construit un objet Q() Django qui filtre les Store ouverts à l'instant présent
+    (ou à moment), fuseau Europe/Paris.
+
+    S'appuie sur la table StoreOpeningInterval (tranches d'au plus 24h, en
+    minutes de la semaine) : un commerce est ouvert à la minute M s'il possède
+    une tranche avec debut <= M < fin. Comme une tranche ne dépasse jamais une
+    journée, debut est forcément dans ]M - 1440, M] : une seule plage sur
+    l'index (debut, fin, store), au lieu des 6 branches OR sur 28 colonnes
+    nullables de la version précédente.
+
+    Les créneaux qui chevauchent minuit (ex: bar ouvert 22h-2h) et les
+    commerces sans horaires sont gérés à la compilation (voir horaires.py) :
+    un commerce sans horaires n'a aucune tranche et n'est JAMAIS "ouvert".
     """
-    from django.db.models import F
-
-    jours = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche']
-    now = datetime.now(tz=ZoneInfo('Europe/Paris'))
-    today_idx = now.weekday()
-    yesterday_idx = (today_idx - 1) % 7
-    current_time = now.time().replace(second=0, microsecond=0)
-
-    today = jours[today_idx]
-    yesterday = jours[yesterday_idx]
-
-    q = Q()
-
-    for periode in ["matin", "apresmidi"]:
-        o_field = f"{today}_{periode}_ouverture"
-        f_field = f"{today}_{periode}_fermeture"
-
-        # Créneau normal d'aujourd'hui : ouverture <= maintenant <= fermeture,
-        # et fermeture après ouverture (pas de chevauchement de minuit).
-        # isnull=False sur les deux champs : un créneau partiellement vide
-        # (ex: ouverture renseignée mais pas fermeture) ne doit pas matcher.
-        q |= Q(**{
-            f"{o_field}__isnull": False,
-            f"{f_field}__isnull": False,
-            f"{o_field}__lte": current_time,
-            f"{f_field}__gte": current_time,
-            f"{f_field}__gt": F(o_field),
-        })
+    from .models import StoreOpeningInterval
 
-        # Créneau d'aujourd'hui qui chevauche minuit (fermeture <= ouverture, ex: 22h-2h)
-        # et on est déjà dans ce créneau (après l'heure d'ouverture)
-        q |= Q(**{
-            f"{o_field}__isnull": False,
-            f"{f_field}__isnull": False,
-            f"{f_field}__lte": F(o_field),
-            f"{o_field}__lte": current_time,
-        })
-
-    for periode in ["matin", "apresmidi"]:
-        o_field = f"{yesterday}_{periode}_ouverture"
-        f_field = f"{yesterday}_{periode}_fermeture"
-
-        # Créneau d'hier qui chevauchait minuit et court encore ce matin
-        # (ex: ouvert hier 22h, ferme aujourd'hui 2h, et il est 1h du matin)
-        q |= Q(**{
-            f"{o_field}__isnull": False,
-            f"{f_field}__isnull": False,
-            f"{f_field}__lte": F(o_field),
-            f"{f_field}__gte": current_time,
-        })
+    minute = minute_de_la_semaine(moment)
+    ouverts = StoreOpeningInterval.objects.filter(
+        debut__gt=minute - MINUTES_PAR_JOUR,
+        debut__lte=minute,
+        fin__gt=minute,
+    ).values("store_id")
 
-    return q
+    return Q(pk__in=ouverts)
 
 
 def sort_key(text):
@@ -320,30 +193,17 @@ def main(request):
     if dep and ville:
         return redirect("stores", departement=dep.lower(), ville=ville.lower())
 
-    stores = Store.objects.all().values("departement", "ville").distinct()
-
-    departements_villes = {}
-    for s in stores:
-        dep = s["departement"].strip().title() if s["departement"] else ""
-        ville = s["ville"].strip().title() if s["ville"] else ""
-        if dep and ville:
-            departements_villes.setdefault(dep, set()).add(ville)
-
-    sorted_data = {
-        dep: sorted(villes, key=str.casefold)
-        for dep, villes in sorted(departements_villes.items(), key=lambda x: x[0].casefold())
-    }
-
+    # Annuaire en cache (annuaire.py) : déjà titré et trié
     return render(request, "members/main.html", {
-        "departements_villes": sorted_data,
+        "departements_villes": departements_villes(),
     })
 
 
+@page_anonyme()
 def stores(request, departement, ville):
     unfavori_ids = get_unfavori_ids(request)  # ← NOUVEAU
     stores_qs = Store.objects.filter(
-        departement__iexact=departement,
-        ville__iexact=ville,
+        **filtre_ville(departement, ville),
     ).exclude(id__in=unfavori_ids)  # ← NOUVEAU
 
     derniers_arrivants = stores_qs.order_by("-id")[:10]
@@ -359,8 +219,7 @@ def stores(request, departement, ville):
     )
 
     city_config = CityCategoryHighlight.objects.filter(
-        departement__iexact=departement,
-        ville__iexact=ville,
+        **filtre_ville(departement, ville),
     ).first()
 
     city_category_items = city_config.items.all() if city_config else []
@@ -375,27 +234,11 @@ def stores(request, departement, ville):
     })
 
 
-def haversine_km(lat1, lng1, lat2, lng2):
-    """
-    Distance à vol d'oiseau entre deux points GPS, en km (formule haversine,
-    approximation sphérique de la Terre — largement suffisante à l'échelle
-    d'une ville). Calcul en Python pur, pas de SQL : utilisé pour filtrer une
-    liste de Store déjà chargée depuis la base.
-    """
-    import math
-    R = 6371.0
-    lat1_r, lng1_r, lat2_r, lng2_r = map(math.radians, [lat1, lng1, lat2, lng2])
-    dlat = lat2_r - lat1_r
-    dlng = lng2_r - lng1_r
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_r) * math.cos(lat2_r) * math.sin(dlng / 2) ** 2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-
+@page_anonyme(parametres=("page", "ouvert"))
 def by_category(request, departement, ville, category):
     unfavori_ids = get_unfavori_ids(request)  # ← NOUVEAU
     commerces_qs = Store.objects.filter(
-        departement__iexact=departement,
-        ville__iexact=ville,
+        **filtre_ville(departement, ville),
         categorie__slug=category,
     ).exclude(id__in=unfavori_ids).select_related("categorie")  # ← NOUVEAU
 
@@ -405,35 +248,37 @@ def by_category(request, departement, ville, category):
 
     # Filtre distance : nécessite la position utilisateur (lat/lng), transmise par
     # le JS une fois la géolocalisation obtenue (voir le script de la page catégorie).
-    # Calcul en Python pur (haversine_km) sur les commerces déjà filtrés par catégorie
-    # et "ouvert maintenant" — pas de SQL exotique, le nombre de commerces par
-    # catégorie/ville reste assez restreint pour que ça reste rapide.
+    # Préfiltre SQL sur les cellules geohash (Store.geo_cell, indexé) puis distance
+    # exacte sur les seuls survivants (voir geo.py) : ne dépend plus du nombre de
+    # commerces de la catégorie, même à l'échelle d'un département.
+    # tri=proximite : les plus proches d'abord (même position, sans rayon).
     user_lat = request.GET.get("lat")
     user_lng = request.GET.get("lng")
     distance_km = request.GET.get("distance")
     distance_active = False
+    tri_proximite = False
 
-    if user_lat and user_lng and distance_km:
+    if user_lat and user_lng:
         try:
             user_lat = float(user_lat)
             user_lng = float(user_lng)
-            max_km = float(distance_km)
-            if max_km < 15:  # 15 = valeur par défaut du slider = "pas de filtre"
-                distance_active = True
-                kept_ids = []
-                for store in commerces_qs:
-                    if store.latitude is None or store.longitude is None:
-                        continue
-                    km = haversine_km(user_lat, user_lng, store.latitude, store.longitude)
-                    if km <= max_km:
-                        kept_ids.append(store.id)
-                commerces_qs = commerces_qs.filter(id__in=kept_ids)
+            if distance_km:
+                max_km = float(distance_km)
+                if max_km < 15:  # 15 = valeur par défaut du slider = "pas de filtre"
+                    distance_active = True
+                    commerces_qs = filtrer_par_rayon(commerces_qs, user_lat, user_lng, max_km)
+            if request.GET.get("tri") == "proximite":
+                tri_proximite = True
+                commerces_qs = trier_par_proximite(commerces_qs, user_lat, user_lng)
         except (TypeError, ValueError):
             pass  # paramètres invalides : on ignore le filtre distance plutôt que de planter
 
     paginator = Paginator(commerces_qs, 20)
     page_number = request.GET.get("page", 1)
     page_obj = paginator.get_page(page_number)
+    if open_now:
+        # Liste "ouvert maintenant" : exacte jusqu'à la prochaine ouverture / fermeture
+        limiter_duree(request, secondes_avant_transition(page_obj, DUREE_OUVERT))
 
     message = None
     if not commerces_qs.exists():
@@ -456,6 +301,10 @@ def by_category(request, departement, ville, category):
         extra_params += "&ouvert=1"
     if distance_active:
         extra_params += f"&lat={user_lat}&lng={user_lng}&distance={distance_km}"
+    if tri_proximite:
+        if not distance_active:
+            extra_params += f"&lat={user_lat}&lng={user_lng}"
+        extra_params += "&tri=proximite"
 
     return render(request, "members/by_category.html", {
         "ville": ville,
@@ -469,32 +318,47 @@ def by_category(request, departement, ville, category):
         "current_distance": distance_km if distance_active else None,
         "user_lat": user_lat if distance_active else None,
         "user_lng": user_lng if distance_active else None,
+        "tri_proximite": tri_proximite,
         "extra_params": extra_params,
     })
 
 
-def store_details(request, departement, ville, slug):
-    store = get_object_or_404(Store, slug=slug, departement__iexact=departement, ville__iexact=ville)
-
+def _compter_vue(request, store_id):
     session_id = request.session.session_key
     if not session_id:
         request.session.save()
         session_id = request.session.session_key
 
-    ip = get_client_ip(request)
+    # Dédoublonnage 20 s et écriture différée (voir analytics.py)
+    if not request.user.is_superuser:
+        enregistrer_vue(store_id, session_id, get_client_ip(request))
 
-    recent_view = PageView.objects.filter(
-        store=store,
-        session_id=session_id,
-        timestamp__gte=timezone.now() - timedelta(seconds=20)
-    ).exists()
-
-    if not recent_view and not request.user.is_superuser:
-        PageView.objects.create(
-            store=store,
-            session_id=session_id,
-            ip_address=ip
-        )
+
+def _vue_fiche_en_cache(request, donnees):
+    _compter_vue(request, donnees["store_id"])
+
+
+def _vue_fiche_revalidee(request, elements):
+    _compter_vue(request, elements[0])
+
+
+def _etiquettes_fiche(request, departement, ville, slug):
+    return [etiquette_ville(departement, ville)]
+
+
+# Client qui a déjà la fiche : 304 tant qu'elle n'a pas changé (revalidation.py)
+@revalider(_etiquettes_fiche, elements=elements_revalidation, sur_304=_vue_fiche_revalidee)
+@page_anonyme(sur_hit=_vue_fiche_en_cache)
+def store_details(request, departement, ville, slug):
+    # Nombre de requêtes fixe, quel que soit le catalogue (voir fiche.py)
+    store = charger_commerce(departement, ville, slug)
+
+    # Fiche servie depuis le cache des pages anonymes : la vue est comptée
+    # quand même (_vue_fiche_en_cache), et l'état "ouvert / fermé" affiché
+    # ne doit pas survivre au prochain changement d'horaire.
+    _compter_vue(request, store.id)
+    donnees_page(request, store_id=store.id)
+    limiter_duree(request, secondes_avant_transition([store], DUREE_PAGE))
 
     if request.method == "POST":
         if not request.user.is_authenticated:
@@ -533,44 +397,14 @@ def store_details(request, departement, ville, slug):
             "url": store.get_absolute_url(),
         })
 
-    is_favorite = False
-    if request.user.is_authenticated:
-        is_favorite = store in request.user.favoris.all()
-
-    is_unfavorite = False
-    if request.user.is_authenticated:
-        is_unfavorite = store in request.user.unfavoris.all()
-        
-    user_wishlists = []
-    if request.user.is_authenticated and is_premium_user(request.user):
-        wishlist_ids_with_store = set(
-            WishlistStore.objects.filter(
-                wishlist__user=request.user, store=store
-            ).values_list("wishlist_id", flat=True)
-        )
-        user_wishlists = [
-            {"id": w.id, "name": w.name, "has_store": w.id in wishlist_ids_with_store}
-            for w in request.user.wishlists.all()
-        ]
+    relations = relations_utilisateur(
+        request.user, store,
+        premium=request.user.is_authenticated and is_premium_user(request.user),
+    )
 
-    store_note_text = ""
-    if request.user.is_authenticated and is_premium_user(request.user):
-        note = StoreNote.objects.filter(user=request.user, store=store).first()
-        if note:
-            store_note_text = note.text
-        
     est_ouvert = is_open_now(store)
     opening_status = get_opening_status(store)
 
-    families_with_rows = []
-    for family in store.families.all():
-        products = list(family.products.all())
-        rows = [products[i:i+4] for i in range(0, len(products), 4)]
-        if rows:
-            while len(rows[-1]) < 4:
-                rows[-1].append(None)
-        families_with_rows.append({"family": family, "rows": rows})
-
     jours = [
         ("lundi", "Mo"), ("mardi", "Tu"), ("mercredi", "We"),
         ("jeudi", "Th"), ("vendredi", "Fr"), ("samedi", "Sa"), ("dimanche", "Su"),
@@ -588,17 +422,15 @@ def store_details(request, departement, ville, slug):
         "family_formset": family_formset,
         "product_formsets": product_formsets,
         "stores": store_data,
-        "is_favorite": is_favorite,
-        "is_unfavorite": is_unfavorite,
-        "user_wishlists": user_wishlists,
         "est_ouvert": est_ouvert,
         "opening_status": opening_status,  # ← NOUVEAU
-        "families_with_rows": families_with_rows,
+        "families_with_rows": lignes_catalogue(store),
         "opening_hours": opening_hours,
-        "store_note_text": store_note_text,
+        **relations,
     })
 
 
+@revalider(lambda request: [ETIQUETTE_CONTENU])
 def search_product(request):
     q = request.GET.get("q", "").strip()
     ville = request.GET.get("ville", "").strip()
@@ -606,16 +438,17 @@ def search_product(request):
     results = []
 
     if q:
-        qs = Product.objects.filter(
-            nom__icontains=q,
-        ).select_related("family", "family__store").exclude(
-            family__store__id__in=unfavori_ids  # ← NOUVEAU
+        # Index de recherche (recherche.py) : produits triés par pertinence
+        lignes = rechercher([q], [TYPE_PRODUIT], ville=ville)
+        exclus = set(unfavori_ids)
+        produits = Product.objects.select_related("family", "family__store").in_bulk(
+            [source_id for store_id, source_id, _, _ in lignes if store_id not in exclus]
         )
 
-        if ville:
-            qs = qs.filter(family__store__ville__iexact=ville)
-
-        for p in qs:
+        for _, source_id, _, _ in lignes:
+            p = produits.get(source_id)
+            if p is None:
+                continue
             store = p.family.store
             results.append({
                 "product": p.nom,
@@ -630,59 +463,49 @@ def search_product(request):
     return JsonResponse({"results": results})
 
 
+# Page seule : les commerces viennent de map_data (données partagées,
+# carte.py), ou de map_groupes pour un département dense (tuiles.py) ; la
+# page ne porte que ce qui est propre au visiteur.
+@revalider(lambda request, departement: [etiquette_tuiles(departement)])
 def map_view(request, departement):
-    unfavori_ids = get_unfavori_ids(request)
-    stores_qs = (
-        Store.objects
-        .filter(departement__iexact=departement)
-        .exclude(id__in=unfavori_ids)
-        .select_related("categorie__super_categorie")
-    )
-
     if request.user.is_authenticated:
         favorite_ids = list(request.user.favoris.values_list('id', flat=True))
     else:
         favorite_ids = []
 
-    store_data = []
-    for store in stores_qs:
-        if store.latitude is not None and store.longitude is not None and store.categorie:
-            store_data.append({
-                "nom": store.nom,
-                "categorie": store.categorie.slug,
-                "lat": store.latitude,
-                "lng": store.longitude,
-                "url": store.get_absolute_url(),
-                "photo": store.photo_small.url if store.photo_small else (store.photo.url if store.photo else ""),
-                "is_favorite": store.id in favorite_ids, 
-            })
-
-   # Dans views.py, remplace la requête categories dans map_view par ceci :
-
-    categories = (
-        Category.objects
-        .filter(stores__in=stores_qs)
-        .select_related("super_categorie", "categorie_intermediaire")
-        .distinct()
-        .values(
-            "slug",
-            "name",
-            "super_categorie__slug",
-            "super_categorie__name",
-            "icon_perso",
-            "categorie_intermediaire__name",
-            "categorie_intermediaire__slug",
-        )
-        .order_by("super_categorie__name", "categorie_intermediaire__name", "name")
-    )
-
+    carte = resume_carte(departement)
     return render(request, "members/map.html", {
-        "stores": store_data,
-        "categories": list(categories),
         "departement": departement,
-        "favorite_ids": favorite_ids,
+        "carte_utilisateur": {"favoris": favorite_ids, "masques": get_unfavori_ids(request)},
+        "carte_resume": carte if carte["nombre"] > SEUIL_GROUPES else None,
     })
 
+
+@revalider(lambda request, departement: [etiquette_departement(departement)], partage=True)
+def map_data(request, departement):
+    donnees = donnees_carte(departement)
+    if re.search(r"\bgzip\b", request.headers.get("Accept-Encoding", "")):
+        response = HttpResponse(donnees["gzip"], content_type="application/json")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(donnees["json"], content_type="application/json")
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+@revalider(lambda request, departement: [etiquette_tuiles(departement)], partage=True)
+def map_groupes(request, departement):
+    try:
+        z = int(request.GET["z"])
+        ouest, sud, est, nord = (float(v) for v in request.GET["bbox"].split(","))
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Paramètres attendus : z et bbox=ouest,sud,est,nord."}, status=400)
+    try:
+        resultat = groupes(departement, z, ouest, sud, est, nord)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(resultat, json_dumps_params={"separators": (",", ":")})
+
 def register(request):
     next_url = request.GET.get("next") or request.POST.get("next") or ""
     if next_url and not next_url.startswith("/"):
@@ -703,8 +526,7 @@ def register(request):
 def edit_store(request, departement, ville, slug):
     store = get_object_or_404(
         Store,
-        departement__iexact=departement,
-        ville__iexact=ville,
+        **filtre_ville(departement, ville),
         slug=slug,
     )
 
@@ -728,8 +550,7 @@ def edit_store(request, departement, ville, slug):
                         '<a href="https://squoosh.app" target="_blank">squoosh.app</a> puis réessayez.'
                     ))
                 else:
-                    webp_image = convert_to_webp(image)
-                    StoreImage.objects.create(store=store, image=webp_image)
+                    StoreImage.objects.create(store=store, image=image)
 
             for key in request.POST:
                 if key.startswith("delete_galerie_image_"):
@@ -743,8 +564,7 @@ def edit_store(request, departement, ville, slug):
                         '<a href="https://squoosh.app" target="_blank">squoosh.app</a> puis réessayez.'
                     ))
                 else:
-                    webp_image = convert_to_webp(image)
-                    StoreGalerieImage.objects.create(store=store, image=webp_image)
+                    StoreGalerieImage.objects.create(store=store, image=image)
 
             Store.objects.filter(pk=store.pk).update(horaires_updated_at=timezone.now())
             messages.success(request, "Le commerce a été mis à jour avec succès.")
@@ -938,10 +758,10 @@ def claim_store(request, store_id):
     })
 
 
+@page_anonyme()
 def categories_ville(request, departement, ville):
     stores_qs = Store.objects.filter(
-        departement__iexact=departement,
-        ville__iexact=ville,
+        **filtre_ville(departement, ville),
     ).select_related("categorie__super_categorie", "categorie__categorie_intermediaire")
 
     categories_qs = (
@@ -1028,10 +848,10 @@ def account(request):
     return render(request, "members/account.html", {"store": store})
 
 
+@page_anonyme()
 def by_super_category(request, departement, ville, super_slug):
     stores_qs = Store.objects.filter(
-        departement__iexact=departement,
-        ville__iexact=ville,
+        **filtre_ville(departement, ville),
     ).select_related("categorie__super_categorie")
 
     super_cat = get_object_or_404(SuperCategory, slug=super_slug)
@@ -1063,26 +883,12 @@ def by_super_category(request, departement, ville, super_slug):
 
 
 def changer_ville(request):
-    stores = Store.objects.all().values("departement", "ville").distinct()
-
-    departements_villes = {}
-    for s in stores:
-        dep = s["departement"].strip().title() if s["departement"] else ""
-        ville = s["ville"].strip().title() if s["ville"] else ""
-        if dep and ville:
-            departements_villes.setdefault(dep, set()).add(ville)
-
-    sorted_data = {
-        dep: sorted(villes, key=str.casefold)
-        for dep, villes in sorted(departements_villes.items(), key=lambda x: x[0].casefold())
-    }
-
     next_url = request.GET.get("next", "")
     if next_url and not next_url.startswith("/"):
         next_url = ""
 
     return render(request, "members/changer_ville.html", {
-        "departements_villes": sorted_data,
+        "departements_villes": departements_villes(),
         "next": next_url,
     })
 
@@ -1094,7 +900,7 @@ def track_click(request, store_id):
     if request.user.is_superuser:
         return JsonResponse({"ok": True})
     else:
-        Click.objects.create(store=store, type_click=type_click)
+        enregistrer_clic(store.id, type_click)
         return JsonResponse({"ok": True})
 
 
@@ -1204,38 +1010,23 @@ def delete_account(request):
 # can_use_ai_agent, is_premium_user, understand_intent, extract_search_params,
 # recommend_stores, register_ai_usage, find_matching_stores.
 
-@yuumi_plus_required
-@login_required
-def ai_search_agent(request):
+def _demande_agent_ia(request):
     """
-    Point d'entree complet de l'agent IA premium.
-
-    La ville/departement sont TOUJOURS envoyes explicitement par le
-    frontend (confirmes par l'utilisateur avant l'envoi, pre-remplis
-    depuis le cookie cote frontend mais jamais devines cote serveur).
-
-    Enchaine : verification acces -> cache -> (option) comprehension web ->
-    extraction parametres -> recherche en base par tiers de preuve (catalogue
-    / description / categorie) -> recommandation finale (intention, confiance
-    confirme/deduit, justification par resultat).
-
-    MEMOIRE CONVERSATIONNELLE : le frontend peut envoyer un champ "history"
-    (JSON, liste de tours {role, content}). Il est transmis a l'extraction
-    pour resoudre les questions de suivi ("et ce soir ?") par rapport au fil,
-    et sert a reconstruire le besoin complet pour la recommandation. Une
-    requete avec historique n'est ni lue ni ecrite dans le cache (elle depend
-    du contexte conversationnel, pas seulement de (query, ville, departement)).
+    Controles communs aux deux points d'entree de l'agent IA (reponse JSON
+    et flux SSE) : methode, acces, parametres, historique. Renvoie
+    (demande, None) si la requete est recevable, (None, JsonResponse
+    d'erreur) sinon.
     """
     if request.method != "POST":
-        return JsonResponse({"error": "Méthode non autorisée"}, status=405)
+        return None, JsonResponse({"error": "Méthode non autorisée"}, status=405)
 
     if not can_use_ai_agent(request.user):
         if not is_premium_user(request.user):
-            return JsonResponse(
+            return None, JsonResponse(
                 {"error": "Cette fonctionnalité est réservée aux comptes Premium."},
                 status=403,
             )
-        return JsonResponse({
+        return None, JsonResponse({
             "fallback_to_tree": True,
             "message": (
                 "Vous avez atteint votre quota de recherches IA pour aujourd'hui. "
@@ -1247,11 +1038,20 @@ def ai_search_agent(request):
     departement = request.POST.get("departement", "").strip()
     ville = request.POST.get("ville", "").strip()
 
+    # Position de l'utilisateur (optionnelle, envoyee par le frontend si la
+    # geolocalisation est disponible) : sert uniquement si l'extraction
+    # produit un rayon_km ("pas loin", "a 2km").
+    try:
+        user_lat = float(request.POST.get("lat", ""))
+        user_lng = float(request.POST.get("lng", ""))
+    except ValueError:
+        user_lat = user_lng = None
+
     if not user_query:
-        return JsonResponse({"error": "Requête vide."}, status=400)
+        return None, JsonResponse({"error": "Requête vide."}, status=400)
 
     if not departement or not ville:
-        return JsonResponse({
+        return None, JsonResponse({
             "error": "Ville non précisée. Veuillez confirmer une ville avant de rechercher.",
         }, status=400)
 
@@ -1279,27 +1079,90 @@ def ai_search_agent(request):
             history = []
     history = history[-16:]  # 8 echanges max (user + assistant)
 
+
+    return {
+        "user_query": user_query,
+        "departement": departement,
+        "ville": ville,
+        "user_lat": user_lat,
+        "user_lng": user_lng,
+        "history": history,
+    }, None
+
+
+def _rayon_km(params):
+    try:
+        return float(params.get("rayon_km") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _empreinte_selection(params, demande):
+    """Ce qui determine la selection des candidats (voir _selection_agent_ia)."""
+    from .ai_agent.cache import cle_parametres
+
+    return cle_parametres(params, demande["departement"], demande["ville"]), _rayon_km(params)
+
+
+def _zone_agent_ia(params, demande):
+    """Rayon : seulement si l'IA en a extrait un ET que la position est connue."""
+    rayon_km = _rayon_km(params)
+    if rayon_km > 0 and demande["user_lat"] is not None and demande["user_lng"] is not None:
+        return (demande["user_lat"], demande["user_lng"], rayon_km)
+    return None
+
+
+def _selection_agent_ia(params, demande):
+    """Candidats en base pour des parametres extraits (selectionner_candidats)."""
+    from .ai_agent.search import selectionner_candidats
+
+    return selectionner_candidats(
+        params.get("categories", []), params.get("idees_produits", []),
+        demande["departement"], demande["ville"],
+        ouvert_maintenant=bool(params.get("ouvert_maintenant", False)),
+        zone=_zone_agent_ia(params, demande),
+    )
+
+
+def _etapes_agent_ia(user, demande):
+    """
+    Pipeline de l'agent IA, etape par etape : genere des couples
+    (evenement, donnees). Le dernier est toujours ("resultat", payload), la
+    reponse finale. Avant lui peuvent passer "intention" (parametres
+    extraits) puis "candidats" (commerces trouves en base, AVANT l'appel de
+    recommandation) : le flux SSE les relaie au fil de l'eau, la vue JSON ne
+    garde que le resultat.
+    """
+    user_query = demande["user_query"]
+    departement = demande["departement"]
+    ville = demande["ville"]
+    history = demande["history"]
+
     # -----------------------------------------------------------------
-    # CACHE : meme (query, ville, departement) -> meme reponse, sans relancer
-    # les 2-3 appels LLM. Un hit ne consomme PAS de quota (reponse gratuite a
-    # servir). On ne met en cache que les reponses NON temporelles : une
-    # recherche "ouvert maintenant" depend de l'heure et n'est jamais cachee
-    # (voir cache.set plus bas). Une requete AVEC historique n'est ni lue ni
-    # ecrite dans le cache : elle depend du fil de conversation, pas seulement
-    # de (query, ville, departement). NB : un backend de cache PARTAGE entre
-    # les workers Gunicorn est necessaire pour que ce soit efficace (voir
-    # reglage CACHES dans settings).
+    # CACHE, 1er niveau : meme (query, ville, departement) -> meme reponse,
+    # sans relancer les 2-3 appels LLM. Un hit ne consomme PAS de quota
+    # (reponse gratuite a servir). Une requete AVEC historique n'est ni lue
+    # ni ecrite dans le cache : elle depend du fil de conversation, pas
+    # seulement de (query, ville, departement). Le 2e niveau (parametres
+    # extraits normalises) est plus bas, apres l'extraction ; voir
+    # ai_agent/cache.py. NB : un backend de cache PARTAGE entre les workers
+    # Gunicorn est necessaire pour que ce soit efficace (voir reglage CACHES
+    # dans settings).
     # -----------------------------------------------------------------
-    import hashlib
     from django.core.cache import cache
+    from .ai_agent.cache import (
+        DUREE_RESULTAT,
+        cle_parametres,
+        cle_requete,
+        duree_ouvert_maintenant,
+    )
 
-    cache_key = "yuumi_ai:" + hashlib.sha256(
-        f"{user_query.lower()}|{departement.lower()}|{ville.lower()}".encode("utf-8")
-    ).hexdigest()
+    cache_key = cle_requete(user_query, departement, ville)
 
     reponse_cache = cache.get(cache_key)
     if reponse_cache is not None and not history:
-        return JsonResponse(reponse_cache)
+        yield "resultat", reponse_cache
+        return
 
     # -----------------------------------------------------------------
     # ETAPE 1 : comprehension d'intention.
@@ -1308,35 +1171,65 @@ def ai_search_agent(request):
     # cet appel et extract_search_params analyse la requete brute : un appel LLM
     # de moins, moins de latence, moins de quota Mistral consomme.
     # -----------------------------------------------------------------
-    from .ai_agent.client import needs_web_search
+    from .ai_agent.client import en_parallele, needs_web_search
 
     web_search_a_ete_utilise = needs_web_search(user_query)
 
     # Quota mensuel de recherches web atteint : mode dégradé (pas de blocage total)
-    if web_search_a_ete_utilise and not can_use_web_search(request.user):
+    if web_search_a_ete_utilise and not can_use_web_search(user):
         web_search_a_ete_utilise = False
 
+    # Extraction speculative (settings.AGENT_IA_EXTRACTION_SPECULATIVE) :
+    # l'agent web, l'appel le plus lent (outil web_search), part dans le pool
+    # et ce thread fait pendant ce temps une extraction sur la requete brute
+    # et precharge les candidats correspondants (ORM : dans ce thread, jamais
+    # dans le pool). Si l'extraction finale, enrichie par l'intention web,
+    # aboutit aux memes parametres, la recherche en base est deja faite.
+    # Compromis : c'est un appel extract_search_params DE PLUS (et ses
+    # tokens) par requete web, pour ne gagner que la phase base de donnees
+    # (quelques dizaines de ms, contre ~800 ms pour l'extraction finale qui
+    # reste due). Desactivee par defaut : rien d'autre ne peut avancer sans
+    # l'intention, l'appel se fait alors directement, sans passer par le pool.
+    from django.conf import settings
+
+    selection_anticipee = None
     if web_search_a_ete_utilise:
-        intent_text = understand_intent(user_query)
+        if settings.AGENT_IA_EXTRACTION_SPECULATIVE:
+            futur_intention = en_parallele(understand_intent, user_query)
+            params_speculatifs = extract_search_params(user_query, None, history=history)
+            if params_speculatifs and not (
+                params_speculatifs.get("hors_sujet")
+                or params_speculatifs.get("categorie_absente")
+                or params_speculatifs.get("besoin_clarification")
+            ):
+                selection_anticipee = (
+                    _empreinte_selection(params_speculatifs, demande),
+                    _selection_agent_ia(params_speculatifs, demande),
+                )
+            intent_text = futur_intention.result()
+        else:
+            intent_text = understand_intent(user_query)
         if intent_text is None:
-            return JsonResponse({
+            yield "resultat", {
                 "fallback_to_tree": True,
                 "message": "La recherche intelligente est temporairement indisponible.",
-            })
+            }
+            return
     else:
         intent_text = None  # extract_search_params gere le cas None.
 
     params = extract_search_params(user_query, intent_text, history=history)
     if params is None:
-        return JsonResponse({
+        yield "resultat", {
             "fallback_to_tree": True,
             "message": "La recherche intelligente est temporairement indisponible.",
-        })
+        }
+        return
 
     # Hors-sujet detecte des l'extraction - on s'arrete ici.
     if params.get("hors_sujet"):
-        register_ai_usage(request.user, web_search_used=web_search_a_ete_utilise)
-        return JsonResponse({
+        register_ai_usage(user, web_search_used=web_search_a_ete_utilise)
+        yield "resultat", {
             "fallback_to_tree": False,
             "besoin_clarification": False,
             "hors_sujet": True,
@@ -1347,13 +1240,14 @@ def ai_search_agent(request):
             ),
             "pistes": [],
             "aucun_resultat": True,
-        })
+        }
+        return
 
     # Categorie absente : la demande a un vrai sens commercial mais aucune
     # categorie Yuumi ne la couvre.
     if params.get("categorie_absente"):
-        register_ai_usage(request.user, web_search_used=web_search_a_ete_utilise)
-        return JsonResponse({
+        register_ai_usage(user, web_search_used=web_search_a_ete_utilise)
+        yield "resultat", {
             "fallback_to_tree": False,
             "besoin_clarification": False,
             "categorie_absente": True,
@@ -1363,16 +1257,46 @@ def ai_search_agent(request):
             ),
             "pistes": [],
             "aucun_resultat": True,
-        })
+        }
+        return
 
     # Demande trop vague : on renvoie des questions de clarification.
     if params.get("besoin_clarification"):
-        return JsonResponse({
+        yield "resultat", {
             "fallback_to_tree": False,
             "besoin_clarification": True,
             "questions_clarification": params.get("questions_clarification", []),
             "message": "Pouvez-vous préciser votre demande ?",
-        })
+        }
+        return
+
+    ouvert = bool(params.get("ouvert_maintenant", False))
+    categories = params.get("categories", [])
+    idees_produits = params.get("idees_produits", [])
+
+    rayon_km = _rayon_km(params)
+
+    yield "intention", {
+        "categories": categories,
+        "idees_produits": idees_produits,
+        "ouvert_maintenant": ouvert,
+        "recherche_web": web_search_a_ete_utilise,
+    }
+
+    # -----------------------------------------------------------------
+    # CACHE, 2e niveau : une autre formulation de la meme demande ("du foie
+    # gras", "foie gras svp") donne les memes parametres normalises -> on
+    # reutilise la recommandation. L'extraction a ete payee : le quota est
+    # consomme. Memes exclusions qu'au 1er niveau (historique, rayon).
+    # -----------------------------------------------------------------
+    params_cacheables = not history and not rayon_km
+    params_key = cle_parametres(params, departement, ville)
+    if params_cacheables:
+        reponse_cache = cache.get(params_key)
+        if reponse_cache is not None:
+            register_ai_usage(user, web_search_used=web_search_a_ete_utilise)
+            yield "resultat", reponse_cache
+            return
 
     # -----------------------------------------------------------------
     # ETAPE 2 : recherche en base, par TIERS DE PREUVE.
@@ -1383,58 +1307,34 @@ def ai_search_agent(request):
     # AVANT le plafond de candidats (sinon on plafonnait a 30 puis filtrait,
     # d'ou des "aucun resultat" a tort).
     # -----------------------------------------------------------------
-    from .ai_agent.search import (
-        find_stores_by_product,
-        find_stores_by_description,
-        combine_store_querysets,
-    )
-
-    ouvert = bool(params.get("ouvert_maintenant", False))
-    categories = params.get("categories", [])
-    idees_produits = params.get("idees_produits", [])
-
-    commerces_par_categorie = find_matching_stores(
-        categories, departement, ville, ouvert_maintenant=ouvert
-    )
-    commerces_par_produit = find_stores_by_product(
-        idees_produits, departement, ville, ouvert_maintenant=ouvert
-    )
-    commerces_par_desc = find_stores_by_description(
-        idees_produits, departement, ville, ouvert_maintenant=ouvert
-    )
-
-    # Seul le catalogue donne le marqueur [CONFIRME].
-    ids_par_produit = set(commerces_par_produit.values_list("id", flat=True))
-
-    demande_produit_precis = bool(idees_produits)
-
-    if demande_produit_precis:
-        # Preuve directe = au moins un commerce trouve par catalogue OU par
-        # description. Dans ce cas on n'utilise PAS le filet "categorie", qui
-        # ferait remonter des commerces vaguement lies (bug Famille Mary).
-        preuve_directe = bool(ids_par_produit) or commerces_par_desc.exists()
-        if preuve_directe:
-            commerces_filtres = combine_store_querysets(
-                commerces_par_produit, commerces_par_desc
-            )
-            # Il existe une preuve directe (catalogue et/ou description) : le
-            # flux normal confirme/deduit suffit. Les commerces "description
-            # seule" ne sont pas [CONFIRME] -> l'IA les presentera en deduit,
-            # en s'appuyant sur la fiche. Pas besoin du message "aucune
-            # correspondance exacte".
-            produit_sans_match_confirme = False
-        else:
-            # Aucune preuve directe -> on retombe sur le filet categorie, mais
-            # l'IA devra l'annoncer honnetement et ne garder que le plausible.
-            commerces_filtres = combine_store_querysets(commerces_par_categorie)
-            produit_sans_match_confirme = True
+    # Une seule requete Store (index compris), tiers deja fusionnes,
+    # dedoublonnes et plafonnes (voir selectionner_candidats). Pour une
+    # demande de produit precis, le filet "categorie" n'est utilise QUE sans
+    # preuve directe (catalogue ou description) - sinon il ferait remonter
+    # des commerces vaguement lies (bug Famille Mary) ; l'IA devra alors
+    # l'annoncer honnetement (produit_sans_match_confirme). Deja faite si
+    # l'extraction speculative (etape 1) a produit les memes parametres.
+    if selection_anticipee is not None and selection_anticipee[0] == _empreinte_selection(params, demande):
+        selection = selection_anticipee[1]
     else:
-        # Demande de type categorie / besoin : produit (confirme) d'abord,
-        # puis categorie, pour ne jamais tronquer un match confirme.
-        commerces_filtres = combine_store_querysets(
-            commerces_par_produit, commerces_par_categorie
-        )
-        produit_sans_match_confirme = False
+        selection = _selection_agent_ia(params, demande)
+    candidats = selection["candidats"]
+    commerces_filtres = list(candidats.values())
+    # Seul le catalogue donne le marqueur [CONFIRME].
+    ids_par_produit = selection["ids_confirmes"]
+    produit_sans_match_confirme = selection["produit_sans_match_confirme"]
+
+    if commerces_filtres:
+        # Affichables tout de suite, pendant que l'IA choisit et justifie
+        yield "candidats", [
+            {
+                "id": store.id,
+                "nom": store.nom,
+                "categorie": store.categorie.name if store.categorie else "",
+                "url": store.get_absolute_url(),
+            }
+            for store in commerces_filtres
+        ]
 
     # -----------------------------------------------------------------
     # COURT-CIRCUIT LISTE VIDE : si aucun candidat ne ressort, NE PAS
@@ -1445,7 +1345,7 @@ def ai_search_agent(request):
     # adapte, sans appel LLM (gratuit, instantane).
     # -----------------------------------------------------------------
     if not commerces_filtres:
-        register_ai_usage(request.user, web_search_used=web_search_a_ete_utilise)
+        register_ai_usage(user, web_search_used=web_search_a_ete_utilise)
 
         if ouvert:
             # Distinguer "rien d'OUVERT maintenant" de "rien du tout dans
@@ -1453,7 +1353,8 @@ def ai_search_agent(request):
             # filtre horaire. Si ca renvoie des commerces, c'est juste une
             # question d'horaire, pas d'absence de commerce.
             existe_hors_horaire = find_matching_stores(
-                categories, departement, ville, ouvert_maintenant=False
+                categories, departement, ville, ouvert_maintenant=False,
+                zone=_zone_agent_ia(params, demande),
             ).exists()
             if existe_hors_horaire:
                 message = (
@@ -1483,7 +1384,8 @@ def ai_search_agent(request):
         # Pas de mise en cache : une reponse "rien d'ouvert" depend de l'heure,
         # et une reponse "rien dans la ville" peut changer des qu'un commerce
         # est ajoute -> on prefere ne pas figer ces cas vides.
-        return JsonResponse(payload)
+        yield "resultat", payload
+        return
 
     # -----------------------------------------------------------------
     # REQUETE EFFECTIVE pour la recommandation : on reconstruit le besoin
@@ -1506,10 +1408,11 @@ def ai_search_agent(request):
     )
 
     if resultat_ia is None:
-        return JsonResponse({
+        yield "resultat", {
             "fallback_to_tree": True,
             "message": "La recherche intelligente est temporairement indisponible.",
-        })
+        }
+        return
 
     # Verification de securite : on ne fait JAMAIS confiance aveuglement
     # aux ID renvoyes par l'IA. Le JSON Schema garantit le FORMAT, pas le
@@ -1528,16 +1431,15 @@ def ai_search_agent(request):
     # Premiere piste ou un ID apparait = piste retenue, les occurrences
     # suivantes du meme ID dans d'autres pistes sont silencieusement
     # ignorees.
-    ids_valides = {store.id for store in commerces_filtres}
     ids_deja_cites = set()
     pistes_valides = []
     for piste in resultat_ia.get("pistes", []):
         resultats_valides = []
         for reco in piste.get("resultats", []):
             reco_id = reco.get("id")
-            if reco_id in ids_valides and reco_id not in ids_deja_cites:
+            if reco_id in candidats and reco_id not in ids_deja_cites:
                 ids_deja_cites.add(reco_id)
-                store = next(s for s in commerces_filtres if s.id == reco_id)
+                store = candidats[reco_id]
                 resultats_valides.append({
                     "id": store.id,
                     "nom": store.nom,
@@ -1554,7 +1456,7 @@ def ai_search_agent(request):
                 "resultats": resultats_valides,
             })
 
-    register_ai_usage(request.user, web_search_used=web_search_a_ete_utilise)
+    register_ai_usage(user, web_search_used=web_search_a_ete_utilise)
 
     payload = {
         "fallback_to_tree": False,
@@ -1565,14 +1467,72 @@ def ai_search_agent(request):
         "aucun_resultat": len(pistes_valides) == 0,
     }
 
-    # Mise en cache : uniquement les reponses NON temporelles ET hors
-    # conversation. Une recherche "ouvert maintenant" depend de l'heure, une
-    # requete avec historique depend du fil -> jamais mises en cache. TTL 6h,
-    # a ajuster selon la frequence de mise a jour de ton catalogue.
-    if not ouvert and not history:
-        cache.set(cache_key, payload, 60 * 60 * 6)
+    # Mise en cache (deux niveaux) : jamais avec un historique ni avec un
+    # rayon (la reponse depend alors du fil ou de la position). Une
+    # recherche "ouvert maintenant" est gardee jusqu'a la prochaine
+    # ouverture/fermeture parmi les candidats ; les autres 6h, a ajuster
+    # selon la frequence de mise a jour du catalogue.
+    if params_cacheables:
+        duree = duree_ouvert_maintenant(commerces_filtres) if ouvert else DUREE_RESULTAT
+        if duree:
+            cache.set_many({cache_key: payload, params_key: payload}, duree)
+
+    yield "resultat", payload
+
+
+@yuumi_plus_required
+@login_required
+def ai_search_agent(request):
+    """
+    Point d'entree complet de l'agent IA premium.
+
+    La ville/departement sont TOUJOURS envoyes explicitement par le
+    frontend (confirmes par l'utilisateur avant l'envoi, pre-remplis
+    depuis le cookie cote frontend mais jamais devines cote serveur).
+
+    Enchaine : verification acces -> cache -> (option) comprehension web ->
+    extraction parametres -> recherche en base par tiers de preuve (catalogue
+    / description / categorie) -> recommandation finale (intention, confiance
+    confirme/deduit, justification par resultat).
+
+    MEMOIRE CONVERSATIONNELLE : le frontend peut envoyer un champ "history"
+    (JSON, liste de tours {role, content}). Il est transmis a l'extraction
+    pour resoudre les questions de suivi ("et ce soir ?") par rapport au fil,
+    et sert a reconstruire le besoin complet pour la recommandation. Une
+    requete avec historique n'est ni lue ni ecrite dans le cache (elle depend
+    du contexte conversationnel, pas seulement de (query, ville, departement)).
+
+    Meme pipeline que ai_search_agent_flux (voir _etapes_agent_ia), qui en
+    diffuse les etapes intermediaires ; ici, une seule reponse JSON a la fin.
+    """
+    demande, erreur = _demande_agent_ia(request)
+    if erreur is not None:
+        return erreur
+    for evenement, donnees in _etapes_agent_ia(request.user, demande):
+        if evenement == "resultat":
+            return JsonResponse(donnees)
+
+
+@yuumi_plus_required
+@login_required
+def ai_search_agent_flux(request):
+    """
+    Variante en flux (Server-Sent Events) de ai_search_agent : memes
+    controles, meme pipeline, memes reponses, mais chaque etape est poussee
+    des qu'elle est prete (event: intention, candidats, resultat). Les
+    candidats trouves en base s'affichent donc avant la fin de l'appel de
+    recommandation.
+
+    La reponse est un generateur synchrone (voir ai_agent/flux.py) : sous
+    WSGI, chaque evenement part vers le client des qu'il est produit.
+    """
+    demande, erreur = _demande_agent_ia(request)
+    if erreur is not None:
+        return erreur
+
+    from .ai_agent.flux import reponse_flux
 
-    return JsonResponse(payload)
+    return reponse_flux(_etapes_agent_ia(request.user, demande))
     
 @yuumi_plus_required
 @login_required